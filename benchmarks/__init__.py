@@ -0,0 +1,7 @@
+"""
+benchmarks
+==========
+
+Benchmarks for the rudi-dire-insp package.  These are not run as part of the test suite, run each module with
+``python -m benchmarks.<module> --help`` to see its options.
+"""
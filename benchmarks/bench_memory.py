@@ -0,0 +1,120 @@
+"""
+benchmarks.bench_memory
+=======================
+
+Measure the memory held per file manifest, before and after manifests held raw digests in ``__slots__`` classes.
+
+The previous classes are reproduced here: manifests with a ``__dict__``, and hashes held as a dict of hex strings.
+Memory is measured with :py:mod:`tracemalloc`, counting only what is allocated while building the manifests.  The
+relative paths are built beforehand and shared by both, since they are the same either way.
+"""
+
+# Imports from Python distribution
+import argparse
+import collections
+import gc
+import hashlib
+import json
+import sys
+import tracemalloc
+import typing
+
+# Imports from this project
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+
+
+class _LegacyHashes:
+    """Hashes as they were held before: an ordered dict of hex strings."""
+
+    __slots__ = ('_values',)
+
+    def __init__(self, **hex_values: str):
+        object.__setattr__(self, '_values', collections.OrderedDict(
+            (name, hex_values[name]) for name in sorted(hex_values, key=my_hashing.ALGORITHM_NAMES.index)))
+
+
+class _LegacyRawBytesManifest:
+    """A raw bytes manifest as it was before, with a ``__dict__``."""
+
+    def __init__(self, hashes: _LegacyHashes, size: int):
+        self._size = int(size)
+        self._hashes = hashes
+
+
+class _LegacyFileManifest:
+    """A file manifest as it was before, with a ``__dict__``."""
+
+    def __init__(self, relative_path: typing.Tuple[str, ...], raw_manifest: _LegacyRawBytesManifest):
+        self._relative_path = relative_path
+        self._raw_manifest = raw_manifest
+
+
+def _build_inputs(num_manifests: int) -> typing.List[typing.Tuple[typing.Tuple[str, str], typing.List[bytes]]]:
+    """Build the relative path and the raw digests of each default algorithm for a number of files."""
+    inputs = []
+    for index in range(num_manifests):
+        content = index.to_bytes(8, 'big')
+        digests = [hashlib.new(name, content).digest() for name in my_hashing.DEFAULT_ALGORITHM_NAMES]
+        inputs.append((('dir-{:05d}'.format(index // 100), 'file-{:07d}.txt'.format(index)), digests))
+    return inputs
+
+
+def build_legacy(inputs) -> typing.List[_LegacyFileManifest]:
+    """Build manifests the way they were before."""
+    names = my_hashing.DEFAULT_ALGORITHM_NAMES
+    return [
+        _LegacyFileManifest(relative_path, _LegacyRawBytesManifest(
+            _LegacyHashes(**{name: digest.hex() for (name, digest) in zip(names, digests)}), index))
+        for (index, (relative_path, digests)) in enumerate(inputs)
+    ]
+
+
+def build_current(inputs) -> typing.List[my_manifests.FileManifest]:
+    """Build manifests the way :py:meth:`rudi_dire_insp.hashing._HashAlgorithm.calculate_hashes` does."""
+    layout_key = tuple((name, hashlib.new(name).digest_size) for name in my_hashing.DEFAULT_ALGORITHM_NAMES)
+    return [
+        my_manifests.FileManifest(relative_path, my_manifests.RawBytesManifest(
+            my_hashing._hashes_from_raw(layout_key, b''.join(digests)), index))  # pylint: disable=protected-access
+        for (index, (relative_path, digests)) in enumerate(inputs)
+    ]
+
+
+def _measure(build: typing.Callable, inputs) -> int:
+    """Return the number of bytes still allocated by building manifests, once the inputs are left over."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        manifests = build(inputs)
+        (allocated, _) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del manifests
+    return allocated
+
+
+def run(num_manifests: int) -> typing.Dict[str, typing.Any]:
+    """Run the benchmark and return the results."""
+    inputs = _build_inputs(num_manifests)
+    results = {'manifests': num_manifests, 'algorithms': list(my_hashing.DEFAULT_ALGORITHM_NAMES), 'classes': {}}
+    for (name, build) in [('legacy', build_legacy), ('current', build_current)]:
+        allocated = _measure(build, inputs)
+        results['classes'][name] = {
+            'bytes': allocated,
+            'bytes_per_manifest': allocated / num_manifests,
+        }
+    results['reduction'] = results['classes']['legacy']['bytes'] / results['classes']['current']['bytes']
+    return results
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Compare the memory held per file manifest')
+    parser.add_argument('--manifests', type=int, default=100000, help='Number of manifests (default: %(default)s)')
+    args = parser.parse_args(argv)
+    json.dump(run(args.manifests), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
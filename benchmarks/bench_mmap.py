@@ -0,0 +1,93 @@
+"""
+benchmarks.bench_mmap
+=====================
+
+Compare the throughput of hashing large files through a memory mapping with reading them into a buffer.
+
+A single file is built in a temporary directory and inspected repeatedly by
+:py:class:`rudi_dire_insp.core._FileInspector`, once with the default buffered reads and once with a memory map
+threshold below the file size, with and without threaded hashing.  Timings are the best of ``--repeats`` runs, so
+the file is usually read from the page cache and the difference is the cost of copying it into the buffer.
+"""
+
+# Imports from Python distribution
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import typing
+
+# Imports from this project
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.hashing as my_hashing
+
+_BLOCK_SIZE = 1024 * 1024
+
+
+def build_file(file_path: str, size_mib: int):
+    """Build a file of the given size, with a block of random bytes repeated."""
+    block = os.urandom(_BLOCK_SIZE)
+    with open(file_path, 'wb') as output_file:
+        for _ in range(size_mib):
+            output_file.write(block)
+
+
+def _best_time(file_inspector: my_core._FileInspector, file_path: str, repeats: int) -> float:
+    """Inspect the file repeatedly and return the shortest time it took."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        file_inspector.inspect(file_path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(
+        size_mib: int,
+        repeats: int,
+        algorithms: typing.Sequence[str],
+        chunk_size: int) -> typing.Dict[str, typing.Any]:
+    """Run the benchmark and return the results."""
+    results = {
+        'size_mib': size_mib, 'repeats': repeats, 'algorithms': list(algorithms), 'chunk_size': chunk_size,
+        'paths': {}}
+    with tempfile.TemporaryDirectory(prefix='bench-mmap-') as root_path:
+        file_path = os.path.join(root_path, 'large.bin')
+        build_file(file_path, size_mib)
+        for threaded in (False, True):
+            for (name, mmap_threshold) in [('buffered', None), ('mapped', 1)]:
+                # pylint: disable=protected-access
+                file_inspector = my_core._FileInspector(
+                    root_path, chunk_size=chunk_size, threaded_hashing=threaded, algorithms=algorithms,
+                    mmap_threshold=mmap_threshold)
+                seconds = _best_time(file_inspector, file_path, repeats)
+                results['paths']['{}{}'.format(name, '-threaded' if threaded else '')] = {
+                    'seconds': seconds,
+                    'mb_per_second': size_mib * _BLOCK_SIZE / seconds / 1e6,
+                }
+    for suffix in ('', '-threaded'):
+        results['speedup' + suffix] = (
+            results['paths']['buffered' + suffix]['seconds'] / results['paths']['mapped' + suffix]['seconds'])
+    return results
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Compare hashing large files through a memory map with reading them')
+    parser.add_argument('--size', type=int, default=256, help='Size of the file in MiB (default: %(default)s)')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs of each path (default: %(default)s)')
+    parser.add_argument(
+        '--hashes', type=str, default=','.join(my_hashing.DEFAULT_ALGORITHM_NAMES),
+        help='Comma separated names of the hashing algorithms (default: %(default)s)')
+    parser.add_argument(
+        '--chunk-size', type=int, default=my_hashing.DEFAULT_CHUNK_SIZE,
+        help='Bytes hashed at a time (default: %(default)s)')
+    args = parser.parse_args(argv)
+    json.dump(run(args.size, args.repeats, args.hashes.split(','), args.chunk_size), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+benchmarks.bench_serialize
+==========================
+
+Compare the JSON Lines serialization used by the command line tool before and after
+:py:mod:`rudi_dire_insp.serializing` was introduced, and check that both produce identical bytes.
+"""
+
+# Imports from Python distribution
+import argparse
+import codecs
+import io
+import json
+import sys
+import time
+import typing
+
+# Imports from this project
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
+
+
+def build_manifests(num_manifests: int, files_per_dir: int = 100) -> typing.List[my_manifests.FileManifest]:
+    """Build manifests for small synthetic files spread over a number of directories."""
+    manifests = []
+    for index in range(num_manifests):
+        (hashes, size) = my_hashing._HashAlgorithm.calculate_hashes(  # pylint: disable=protected-access
+            io.BytesIO(index.to_bytes(4, 'big')))
+        relative_path = ('dir-{:05d}/sub'.format(index // files_per_dir), 'file-{:07d}.txt'.format(index))
+        manifests.append(my_manifests.FileManifest(relative_path, my_manifests.RawBytesManifest(hashes, size)))
+    return manifests
+
+
+def serialize_legacy(manifests: typing.Iterable[my_manifests.FileManifest], output_buffer: typing.BinaryIO):
+    """Serialize the manifests the way the command line tool used to: a dict and json.dumps per manifest."""
+    writer = codecs.getwriter('utf-8')(output_buffer)
+    for manifest in manifests:
+        data = {
+            'relative_path': manifest.relative_path,
+            'size': manifest.raw_manifest.size,
+            'hashes': manifest.raw_manifest.hashes._asdict(),
+        }
+        writer.write(json.dumps(data, sort_keys=True))
+        writer.write("\n")
+
+
+def serialize_current(manifests: typing.Iterable[my_manifests.FileManifest], output_buffer: typing.BinaryIO):
+    """Serialize the manifests with the JSON Lines writer."""
+    with my_serializing.JsonLinesWriter(output_buffer) as writer:
+        for manifest in manifests:
+            writer.write(manifest)
+
+
+def run(num_manifests: int, repeats: int) -> typing.Dict[str, typing.Any]:
+    """Run the benchmark and return the results."""
+    manifests = build_manifests(num_manifests)
+    results = {'manifests': num_manifests, 'backend': my_serializing.BACKEND_NAME, 'serializers': {}}
+    outputs = {}
+    for name, func in [('legacy', serialize_legacy), ('current', serialize_current)]:
+        best = None
+        for _ in range(repeats):
+            output_buffer = io.BytesIO()
+            start = time.perf_counter()
+            func(manifests, output_buffer)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        outputs[name] = output_buffer.getvalue()
+        results['serializers'][name] = {
+            'seconds': best,
+            'manifests_per_second': num_manifests / best,
+            'megabytes_per_second': len(outputs[name]) / best / 1e6,
+        }
+    results['identical_output'] = outputs['legacy'] == outputs['current']
+    results['speedup'] = results['serializers']['legacy']['seconds'] / results['serializers']['current']['seconds']
+    return results
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Compare JSON Lines serialization speed')
+    parser.add_argument('--manifests', type=int, default=100000, help='Number of manifests (default: %(default)s)')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs per serializer (default: %(default)s)')
+    args = parser.parse_args(argv)
+    json.dump(run(args.manifests, args.repeats), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
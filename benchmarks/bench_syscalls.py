@@ -0,0 +1,119 @@
+"""
+benchmarks.bench_syscalls
+=========================
+
+Count the file system calls made per file while inspecting a tree of small files.
+
+The previous pipeline (:py:func:`os.walk` feeding paths to :py:meth:`rudi_dire_insp.core._FileInspector.inspect`) is
+compared with :py:meth:`rudi_dire_insp.core.DirectoryInspector.inspect`, which is built on
+:py:func:`rudi_dire_insp.walking.walk_files`.  Calls are counted by wrapping the functions in the :py:mod:`os`
+module that end up as system calls, so the counts are exact for Python-level calls and independent of strace etc.
+"""
+
+# Imports from Python distribution
+import argparse
+import builtins
+import collections
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import typing
+
+# Imports from this project
+import rudi_dire_insp.core as my_core
+
+_COUNTED_FUNCTIONS = ('stat', 'lstat', 'fstat', 'open', 'scandir', 'listdir', 'readlink', 'getcwd')
+
+
+@contextlib.contextmanager
+def count_calls() -> typing.Iterator[typing.Counter]:
+    """Context manager that counts calls to file system functions while it is active."""
+    counter = collections.Counter()  # type: typing.Counter
+    originals = {}
+
+    def _wrap(module, name, label):
+        original = getattr(module, name)
+        originals[(module, name)] = original
+
+        def _counting(*args, **kwargs):
+            counter[label] += 1
+            return original(*args, **kwargs)
+        setattr(module, name, _counting)
+
+    for name in _COUNTED_FUNCTIONS:
+        if hasattr(os, name):
+            _wrap(os, name, 'os.' + name)
+    _wrap(builtins, 'open', 'open')
+    _wrap(io, 'open', 'open')
+    try:
+        yield counter
+    finally:
+        for (module, name), original in originals.items():
+            setattr(module, name, original)
+
+
+def build_tree(root_path: str, num_dirs: int, files_per_dir: int):
+    """Build a tree of small files for the benchmark."""
+    for dir_index in range(num_dirs):
+        dir_path = os.path.join(root_path, 'dir-{:04d}'.format(dir_index))
+        os.makedirs(dir_path)
+        for file_index in range(files_per_dir):
+            with open(os.path.join(dir_path, 'file-{:04d}.txt'.format(file_index)), 'wb') as output_file:
+                output_file.write(b'x' * (file_index % 64))
+
+
+def _inspect_legacy(root_path: str) -> int:
+    """Inspect the tree the way the pipeline used to: os.walk, then full path checks for every file."""
+    file_inspector = my_core._FileInspector(root_path)  # pylint: disable=protected-access
+    count = 0
+    for dir_path, _, file_names in os.walk(os.path.abspath(root_path)):
+        for file_name in file_names:
+            file_inspector.inspect(os.path.join(dir_path, file_name))
+            count += 1
+    return count
+
+
+def _inspect_scandir(root_path: str) -> int:
+    """Inspect the tree with the directory inspector."""
+    return sum(1 for _ in my_core.DirectoryInspector().inspect(root_path))
+
+
+def run(num_dirs: int, files_per_dir: int) -> typing.Dict[str, typing.Any]:
+    """Run the benchmark and return the results."""
+    results = {'num_dirs': num_dirs, 'files_per_dir': files_per_dir, 'pipelines': {}}
+    with tempfile.TemporaryDirectory(prefix='bench-syscalls-') as root_path:
+        build_tree(root_path, num_dirs, files_per_dir)
+        for name, func in [('legacy', _inspect_legacy), ('scandir', _inspect_scandir)]:
+            with count_calls() as counter:
+                start = time.perf_counter()
+                num_files = func(root_path)
+                elapsed = time.perf_counter() - start
+            total_calls = sum(counter.values())
+            results['pipelines'][name] = {
+                'files': num_files,
+                'seconds': elapsed,
+                'calls': dict(sorted(counter.items())),
+                'calls_per_file': total_calls / max(num_files, 1),
+            }
+    legacy = results['pipelines']['legacy']['calls_per_file']
+    current = results['pipelines']['scandir']['calls_per_file']
+    results['calls_per_file_reduction'] = 1.0 - (current / legacy) if legacy else 0.0
+    return results
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Count file system calls made per inspected file')
+    parser.add_argument('--dirs', type=int, default=20, help='Number of directories (default: %(default)s)')
+    parser.add_argument('--files', type=int, default=200, help='Files per directory (default: %(default)s)')
+    args = parser.parse_args(argv)
+    json.dump(run(args.dirs, args.files), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""
+benchmarks.suite
+================
+
+Reproducible benchmarks of the walk, hash and serialize stages on synthetic directory trees.
+
+Each scenario builds a tree with deterministic names and contents under a work directory, where it is kept and
+reused by later runs with the same parameters.  The scenarios are:
+
+* ``tiny-files``: 1,000,000 files of 64 bytes, 1,000 to a directory.
+* ``large-files``: 3 files of 2 GiB each.
+* ``deep-narrow``: a chain of 1,000 nested directories, each holding one 4 KiB file.
+* ``wide-flat``: 100,000 files of 1 KiB in a single directory.
+
+``--scale`` multiplies the number of files and the size of the large files, for quicker runs.
+
+Each stage runs in a fresh interpreter, so the peak resident set size reported for it is its own:
+
+* ``inspect``: :py:meth:`rudi_dire_insp.core.DirectoryInspector.inspect` over the whole tree.
+* ``hash``: :py:meth:`rudi_dire_insp.hashing._HashAlgorithm.calculate_hashes` over every file, listed beforehand.
+* ``serialize``: :py:func:`rudi_dire_insp._cli._convert_to_json_text` over the manifests of every file, made
+  beforehand.
+
+Timings are the best of ``--repeats`` runs, so after the first run files are usually read from the page cache.
+Results are written as JSON.  Save them with ``--save-baseline PATH`` and compare later runs with
+``--baseline PATH``, which adds the ratio of each throughput to the baseline and exits with status 1 if any stage
+got slower by more than ``--tolerance``.  A baseline measured at another ``--scale`` can't be compared with, so the
+results are marked with ``"comparable": false`` and the exit status is 2.
+"""
+
+# Imports from Python distribution
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+# Imports from this project
+import rudi_dire_insp._cli as my_cli
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.hashing as my_hashing
+
+SCENARIOS = {
+    'tiny-files': {'dirs': 1000, 'files_per_dir': 1000, 'file_size': 64, 'depth': 1},
+    'large-files': {'dirs': 1, 'files_per_dir': 3, 'file_size': 2 * 1024 ** 3, 'depth': 1},
+    'deep-narrow': {'dirs': 1000, 'files_per_dir': 1, 'file_size': 4096, 'depth': 1000},
+    'wide-flat': {'dirs': 1, 'files_per_dir': 100000, 'file_size': 1024, 'depth': 1},
+}
+"""Parameters of each synthetic tree: the number of directories and files in each, the size of each file, and how
+many directories are nested in each other (the rest are siblings)."""
+
+STAGES = ('inspect', 'hash', 'serialize')
+
+_MARKER_NAME = '.benchmark-tree.json'
+_BLOCK_SIZE = 1024 * 1024
+_RESULTS_VERSION = 1
+
+
+def _scaled_parameters(scenario: str, scale: float) -> typing.Dict[str, int]:
+    """Scale the parameters of a scenario, keeping at least one of everything."""
+    parameters = dict(SCENARIOS[scenario])
+    if scenario == 'large-files':
+        parameters['file_size'] = max(1, int(parameters['file_size'] * scale))
+    elif parameters['dirs'] > 1:
+        parameters['dirs'] = max(1, int(parameters['dirs'] * scale))
+        parameters['depth'] = min(parameters['depth'], parameters['dirs'])
+    else:
+        parameters['files_per_dir'] = max(1, int(parameters['files_per_dir'] * scale))
+    return parameters
+
+
+def _content_block() -> bytes:
+    """A block of pseudo-random bytes, the same on every run, that file contents are cut from."""
+    block = bytearray()
+    while len(block) < _BLOCK_SIZE:
+        block += hashlib.sha512(b'rudi-dire-insp' + len(block).to_bytes(8, 'big')).digest()
+    return bytes(block[:_BLOCK_SIZE])
+
+
+def _write_content(output_file: typing.BinaryIO, block: bytes, offset: int, size: int):
+    """Write ``size`` bytes cut from the block, starting at the offset and wrapping around."""
+    while size > 0:
+        piece = block[offset:offset + size]
+        output_file.write(piece)
+        size -= len(piece)
+        offset = 0
+
+
+def _dir_paths(root_path: str, parameters: typing.Dict[str, int]) -> typing.List[str]:
+    """List the directories of a tree, nesting the first ``depth`` of them in each other."""
+    dir_paths = []
+    parent_path = root_path
+    for index in range(parameters['dirs']):
+        if index < parameters['depth'] and parameters['depth'] > 1:
+            # Short names keep the deepest paths well within PATH_MAX
+            parent_path = os.path.join(parent_path, 'd')
+            dir_paths.append(parent_path)
+        else:
+            dir_paths.append(os.path.join(root_path, 'dir-{:06d}'.format(index)))
+    return dir_paths
+
+
+def build_tree(work_path: str, scenario: str, scale: float) -> str:
+    """Build the tree of a scenario under the work directory, unless it was already built with the same parameters.
+
+    Returns:
+        str: The path to the root of the tree.
+    """
+    parameters = _scaled_parameters(scenario, scale)
+    root_path = os.path.join(work_path, '{}-x{}'.format(scenario, scale))
+    marker_path = os.path.join(root_path, _MARKER_NAME)
+    if os.path.exists(marker_path):
+        with open(marker_path) as marker_file:
+            if json.load(marker_file) == parameters:
+                return root_path
+        raise RuntimeError("Tree at '{}' was built with other parameters, remove it first".format(root_path))
+
+    block = _content_block()
+    file_size = parameters['file_size']
+    os.makedirs(root_path, exist_ok=True)
+    file_index = 0
+    for dir_path in _dir_paths(root_path, parameters):
+        os.makedirs(dir_path, exist_ok=True)
+        for _ in range(parameters['files_per_dir']):
+            offset = (file_index * 4099) % _BLOCK_SIZE
+            with open(os.path.join(dir_path, 'file-{:07d}.bin'.format(file_index)), 'wb') as output_file:
+                _write_content(output_file, block, offset, file_size)
+            file_index += 1
+
+    # The marker is written last, so an interrupted build is redone, and is left out of the measurements
+    with open(marker_path, 'w') as marker_file:
+        json.dump(parameters, marker_file)
+    return root_path
+
+
+def _peak_rss_kib() -> int:
+    """The peak resident set size of this process so far, in KiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _list_files(root_path: str) -> typing.List[str]:
+    """List the files of a tree, leaving out the marker."""
+    file_paths = []
+    for (dir_path, _, file_names) in os.walk(root_path):
+        file_paths.extend(os.path.join(dir_path, name) for name in file_names if name != _MARKER_NAME)
+    return file_paths
+
+
+def _run_inspect(root_path: str) -> typing.Tuple[int, int]:
+    inspector = my_core.DirectoryInspector()
+    num_files = num_bytes = 0
+    for manifest in inspector.inspect(root_path):
+        if manifest.relative_path != ('', _MARKER_NAME):
+            num_files += 1
+            num_bytes += manifest.raw_manifest.size
+    return num_files, num_bytes
+
+
+def _run_hash(file_paths: typing.List[str]) -> typing.Tuple[int, int]:
+    num_bytes = 0
+    for file_path in file_paths:
+        with open(file_path, 'rb', buffering=0) as input_file:
+            (_, size) = my_hashing._HashAlgorithm.calculate_hashes(input_file)  # pylint: disable=protected-access
+        num_bytes += size
+    return len(file_paths), num_bytes
+
+
+def _run_serialize(manifests: typing.List) -> typing.Tuple[int, int]:
+    num_bytes = 0
+    for manifest in manifests:
+        num_bytes += len(my_cli._convert_to_json_text(manifest)) + 1  # pylint: disable=protected-access
+    return len(manifests), num_bytes
+
+
+def measure_stage(stage: str, root_path: str, repeats: int) -> typing.Dict[str, typing.Any]:
+    """Measure one stage on a tree in this process.
+
+    The input of the hash and serialize stages is prepared before the peak resident set size is first read, so
+    ``peak_rss_kib - start_rss_kib`` is what the stage itself added.
+    """
+    if stage == 'inspect':
+        (func, argument) = (_run_inspect, root_path)
+    elif stage == 'hash':
+        (func, argument) = (_run_hash, _list_files(root_path))
+    else:
+        manifests = [
+            manifest for manifest in my_core.DirectoryInspector().inspect(root_path)
+            if manifest.relative_path != ('', _MARKER_NAME)
+        ]
+        (func, argument) = (_run_serialize, manifests)
+
+    start_rss_kib = _peak_rss_kib()
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        (num_files, num_bytes) = func(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    best = max(best, 1e-9)
+    return {
+        'files': num_files,
+        'bytes': num_bytes,
+        'seconds': best,
+        'files_per_second': num_files / best,
+        'megabytes_per_second': num_bytes / best / 1e6,
+        'start_rss_kib': start_rss_kib,
+        'peak_rss_kib': _peak_rss_kib(),
+    }
+
+
+def _measure_in_subprocess(stage: str, root_path: str, repeats: int) -> typing.Dict[str, typing.Any]:
+    """Measure one stage in a fresh interpreter, so its peak resident set size isn't mixed with other stages."""
+    command = [sys.executable, '-m', 'benchmarks.suite', '--worker-stage', stage, '--repeats', str(repeats),
+               root_path]
+    completed = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+    return json.loads(completed.stdout.decode('utf-8'))
+
+
+def _environment() -> typing.Dict[str, typing.Any]:
+    """Describe the machine the benchmarks ran on."""
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run(work_path: str, scenarios: typing.Iterable[str], stages: typing.Iterable[str], scale: float,
+        repeats: int) -> typing.Dict[str, typing.Any]:
+    """Build the trees of the scenarios and measure each stage on them."""
+    results = {
+        'version': _RESULTS_VERSION,
+        'scale': scale,
+        'repeats': repeats,
+        'environment': _environment(),
+        'scenarios': {},
+    }  # type: typing.Dict[str, typing.Any]
+    for scenario in scenarios:
+        root_path = build_tree(work_path, scenario, scale)
+        results['scenarios'][scenario] = {
+            'parameters': _scaled_parameters(scenario, scale),
+            'stages': {stage: _measure_in_subprocess(stage, root_path, repeats) for stage in stages},
+        }
+    return results
+
+
+def compare(results: typing.Dict[str, typing.Any], baseline: typing.Dict[str, typing.Any],
+            tolerance: float) -> typing.List[str]:
+    """Add the ratio of each throughput to its baseline to the results, and list the stages that got slower.
+
+    Whether the baseline was measured at the same scale, the only case where the stages are compared, is added to the
+    results as ``comparable``.
+
+    Returns:
+        list: A description of each stage whose files per second dropped by more than the tolerance.
+    """
+    regressions = []
+    results['comparable'] = baseline.get('scale') == results['scale']
+    if not results['comparable']:
+        return regressions
+    for (scenario, scenario_results) in results['scenarios'].items():
+        baseline_stages = baseline.get('scenarios', {}).get(scenario, {}).get('stages', {})
+        for (stage, stage_results) in scenario_results['stages'].items():
+            baseline_results = baseline_stages.get(stage)
+            if not baseline_results:
+                continue
+            ratios = {
+                key: stage_results[key] / baseline_results[key]
+                for key in ('files_per_second', 'megabytes_per_second') if baseline_results[key]
+            }
+            ratios['peak_rss_kib'] = stage_results['peak_rss_kib'] / max(baseline_results['peak_rss_kib'], 1)
+            stage_results['baseline_ratios'] = ratios
+            if ratios.get('files_per_second', 1.0) < 1.0 - tolerance:
+                regressions.append('{}/{}: {:.2f}x the baseline files per second'.format(
+                    scenario, stage, ratios['files_per_second']))
+    return regressions
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Benchmark the walk, hash and serialize stages')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'rudi-dire-insp-benchmarks'),
+                        help='Directory the synthetic trees are built in and kept (default: %(default)s)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='Comma separated scenarios to run (default: %(default)s)')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help='Comma separated stages to measure (default: %(default)s)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiplier for the number of files and size of large files (default: %(default)s)')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs per stage (default: %(default)s)')
+    parser.add_argument('--output', '-o', default='-', help='Path to write the results to (default: stdout)')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Also save the results as a baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='Compare the results with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Fraction of the baseline files per second a stage may lose (default: %(default)s)')
+    parser.add_argument('--worker-stage', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('tree', nargs='?', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker_stage:
+        json.dump(measure_stage(args.worker_stage, args.tree, args.repeats), sys.stdout)
+        return 0
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    stages = [name.strip() for name in args.stages.split(',') if name.strip()]
+    unknown = sorted(set(scenarios) - set(SCENARIOS)) + sorted(set(stages) - set(STAGES))
+    if unknown:
+        parser.error('unknown scenarios or stages: {}'.format(', '.join(unknown)))
+
+    results = run(args.work_dir, scenarios, stages, args.scale, args.repeats)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.tolerance)
+        results['regressions'] = regressions
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    text = json.dumps(results, indent=2, sort_keys=True) + '\n'
+    if args.output == '-':
+        sys.stdout.write(text)
+    else:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text)
+    if not results.get('comparable', True):
+        sys.stderr.write('Error: the baseline was measured at scale {}, not {}, so nothing was compared\n'.format(
+            baseline['scale'], args.scale))
+        return 2
+    for regression in regressions:
+        sys.stderr.write('Regression: {}\n'.format(regression))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
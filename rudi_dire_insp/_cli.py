@@ -7,50 +7,285 @@ Command line interface for the project
 
 # Imports from Python distribution
 import argparse
-import codecs
-import json
+import contextlib
 import logging
+import os
+import re
+import stat
 import sys
+import time
 import typing
 
 # Imports from 3rd party
 
 # Imports from this project
+import rudi_dire_insp._cli_common as my_cli_common
+import rudi_dire_insp._commands as my_commands
+import rudi_dire_insp.caching as my_caching
+import rudi_dire_insp.checkpointing as my_checkpointing
 import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.filtering as my_filtering
+import rudi_dire_insp.hashing as my_hashing
 import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
+import rudi_dire_insp.sharding as my_sharding
+import rudi_dire_insp.stats as my_stats
 
 # Module variables
 _LOGGER = logging.getLogger(__name__)
 _DEFAULT_LOG_LEVEL = logging.WARNING
-_LOGGING_STREAM = sys.stderr
+_TIME_FORMATS = ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S')
 
 
-def _parse_cli_args():
-    """Parse the command line arguments.
+def _regex(text: str) -> str:
+    """Argument type for command line options that take a regular expression.
+
+    Args:
+          text (str): The raw option value from the command line.
+
+    Returns:
+          str: The regular expression, once known to compile.
+
+    Raises:
+          argparse.ArgumentTypeError
+    """
+    try:
+        re.compile(text)
+    except re.error as error:
+        raise argparse.ArgumentTypeError("invalid regular expression '{}': {}".format(text, error)) from error
+    return text
+
+
+def _local_time(text: str) -> float:
+    """Argument type for command line options that take a local date, or date and time.
+
+    Args:
+          text (str): The raw option value from the command line, as ``YYYY-MM-DD`` or ``YYYY-MM-DDTHH:MM:SS``.
+
+    Returns:
+          float: The time in seconds since the epoch.
+
+    Raises:
+          argparse.ArgumentTypeError
+    """
+    for time_format in _TIME_FORMATS:
+        try:
+            return time.mktime(time.strptime(text, time_format))
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError("invalid date, expected YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS: '{}'".format(text))
+
+
+def _shard(text: str) -> my_sharding.Shard:
+    """Argument type for command line options that take a shard as ``I/N``.
+
+    Args:
+          text (str): The raw option value from the command line.
+
+    Returns:
+          rudi_dire_insp.sharding.Shard: The parsed shard.
+
+    Raises:
+          argparse.ArgumentTypeError
+    """
+    try:
+        return my_sharding.Shard.parse(text)
+    except my_exceptions.ShardError as error:
+        raise argparse.ArgumentTypeError(str(error)) from error
+
+
+def _parse_cli_args(args: typing.Optional[typing.List[str]] = None):
+    """Parse the command line arguments for an inspection.
+
+    Args:
+          args (list): The arguments to parse, if not those of the process.
 
     Returns:
           object: Object produced by the argparse module's parse_args() function.
     """
     # Basic parser setup
-    parser = argparse.ArgumentParser(description="Rudimentary directory inspector")
+    parser = argparse.ArgumentParser(
+        description="Rudimentary directory inspector",
+        epilog="Also see the commands: {}, each with its own --help".format(', '.join(my_commands.COMMANDS)))
 
     # Setup mutually exclusive log levels
-    log_level_group = parser.add_mutually_exclusive_group()
-    log_level_group.add_argument('--verbose', '-v', action='store_true', help="Set log level to INFO")
-    log_level_group.add_argument('--debug', '-d', action='store_true', help="Set log level to DEBUG")
+    my_cli_common.add_log_level_args(parser)
 
     # Add input and output flags/options/args
+    my_cli_common.add_output_arg(parser, 'inspection results')
+    my_cli_common.add_format_arg(
+        parser,
+        'Format of the inspection results: JSON Lines, or the compact binary format with path and digest '
+        'indexes (default: %(default)s)')
+    my_cli_common.add_chunk_size_arg(parser)
+    my_cli_common.add_hashes_arg(
+        parser,
+        'Comma separated names of the hashing algorithms to use, from: {} (default: {})'.format(
+            ', '.join(my_hashing.ALGORITHM_NAMES), ','.join(my_hashing.DEFAULT_ALGORITHM_NAMES)))
+    my_cli_common.add_threaded_hashing_arg(parser)
+    parser.add_argument(
+        '--mmap-threshold',
+        type=my_cli_common.positive_int,
+        default=None,
+        dest='mmap_threshold',
+        metavar='BYTES',
+        help='Memory map files of at least this size and hash them in place instead of reading them.  Only safe '
+             'when no file is truncated during the inspection (default: off)')
+    parser.add_argument(
+        '--jobs',
+        '-j',
+        type=my_cli_common.positive_int,
+        default=1,
+        dest='workers',
+        metavar='N',
+        help='Number of files to inspect at the same time (default: %(default)s)')
+    parser.add_argument(
+        '--processes',
+        action='store_true',
+        dest='use_processes',
+        help='Inspect files on a pool of processes instead of threads when --jobs is greater than 1')
+    parser.add_argument(
+        '--unordered',
+        action='store_false',
+        dest='ordered',
+        help='Write manifests as soon as they are ready instead of in directory walk order')
+    my_cli_common.add_cache_arg(
+        parser,
+        'Path to a hash cache database, created if missing.  Files unchanged since they were cached are not '
+        'read again')
+    parser.add_argument(
+        '--no-hard-links',
+        action='store_false',
+        dest='hard_links',
+        help='Read every hard link to the same file, instead of reusing the hashes of the first one found')
+    parser.add_argument(
+        '--sample',
+        action='store_true',
+        dest='sampled',
+        help='Hash the size and a few fixed blocks of each file instead of all of it, for a quick fingerprint '
+             'marked as sampled.  See the upgrade command for full hashes')
+    parser.add_argument(
+        '--shard',
+        type=_shard,
+        default=None,
+        dest='shard',
+        metavar='I/N',
+        help='Only inspect the files of shard I of N, picked by a hash of their relative paths.  See the merge '
+             'command to combine the outputs of all N shards')
+    filter_group = parser.add_argument_group(
+        'filters', 'Only inspect matching files.  Glob patterns with a slash match the relative path of a file or '
+                   'directory, and those without one its name.  Excluded directories are never listed')
+    filter_group.add_argument(
+        '--include',
+        type=str,
+        action='append',
+        default=[],
+        dest='include',
+        metavar='GLOB',
+        help='Only inspect files matching this pattern, or any other given')
+    filter_group.add_argument(
+        '--exclude',
+        type=str,
+        action='append',
+        default=[],
+        dest='exclude',
+        metavar='GLOB',
+        help='Skip files and directories matching this pattern, e.g. node_modules or .git')
+    filter_group.add_argument(
+        '--include-regex',
+        type=_regex,
+        action='append',
+        default=[],
+        dest='include_regex',
+        metavar='REGEX',
+        help='Only inspect files with a relative path matching this regular expression, or any other given')
+    filter_group.add_argument(
+        '--exclude-regex',
+        type=_regex,
+        action='append',
+        default=[],
+        dest='exclude_regex',
+        metavar='REGEX',
+        help='Skip files and directories with a relative path matching this regular expression')
+    filter_group.add_argument(
+        '--min-size',
+        type=my_cli_common.positive_int,
+        default=None,
+        dest='min_size',
+        metavar='BYTES',
+        help='Skip files smaller than this')
+    filter_group.add_argument(
+        '--max-size',
+        type=my_cli_common.positive_int,
+        default=None,
+        dest='max_size',
+        metavar='BYTES',
+        help='Skip files larger than this')
+    filter_group.add_argument(
+        '--modified-after',
+        type=_local_time,
+        default=None,
+        dest='modified_after',
+        metavar='TIME',
+        help='Skip files last modified before this local date or time, as YYYY-MM-DD[THH:MM:SS]')
+    filter_group.add_argument(
+        '--modified-before',
+        type=_local_time,
+        default=None,
+        dest='modified_before',
+        metavar='TIME',
+        help='Skip files last modified at or after this local date or time, as YYYY-MM-DD[THH:MM:SS]')
     parser.add_argument(
-        '--output',
-        '-o',
+        '--directories',
         type=str,
-        default='-',
-        dest='output_path',
-        help='Output path for the inspection results')
+        default=None,
+        dest='directories_path',
+        metavar='PATH',
+        help='Also write a manifest for each directory holding files to this path, as JSON Lines, with aggregate '
+             'hashes of everything under it.  See diff --directories')
+    parser.add_argument(
+        '--checkpoint-interval',
+        type=my_cli_common.non_negative_int,
+        default=my_checkpointing.DEFAULT_CHECKPOINT_INTERVAL,
+        dest='checkpoint_interval',
+        metavar='N',
+        help='Sync the output to disk and write a checkpoint next to it every N files, when writing JSON Lines in '
+             'walk order to a file, or never if 0 (default: %(default)s)')
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        dest='resume',
+        help='Resume an inspection that was stopped from its checkpoint, appending to its output.  Starts over if '
+             'there is no checkpoint')
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        dest='stats',
+        help='Write a JSON summary of the time spent in each stage, bytes read, files and directories seen and the '
+             'slowest files to STDERR once done')
     parser.add_argument('input_path', type=str, help="The directory to inspect")
 
     # Run the parser
-    parsed_args = parser.parse_args()
+    parsed_args = parser.parse_args(args)
+    if parsed_args.sampled and parsed_args.output_format == 'binary':
+        parser.error("argument --sample: not allowed with argument --format binary")
+    if parsed_args.sampled and parsed_args.cache_path:
+        parser.error("argument --sample: not allowed with argument --cache")
+    if parsed_args.resume and parsed_args.output_path == '-':
+        parser.error("argument --resume: requires argument --output")
+    if parsed_args.resume and parsed_args.output_format == 'binary':
+        parser.error("argument --resume: not allowed with argument --format binary")
+    if parsed_args.resume and not parsed_args.ordered:
+        parser.error("argument --resume: not allowed with argument --unordered")
+    if parsed_args.resume and parsed_args.checkpoint_interval == 0:
+        parser.error("argument --resume: not allowed with argument --checkpoint-interval 0")
+    if parsed_args.directories_path and not parsed_args.ordered:
+        parser.error("argument --directories: not allowed with argument --unordered")
+    if parsed_args.directories_path and parsed_args.resume:
+        parser.error("argument --directories: not allowed with argument --resume")
+    if parsed_args.directories_path == parsed_args.output_path:
+        parser.error("argument --directories: must not be the same as argument --output")
     return parsed_args
 
 
@@ -63,56 +298,203 @@ def _convert_to_json_text(manifest: my_manifests.FileManifest):
     Returns:
           str: The resultant JSON text
     """
-    # Translate the manifest object into 'raw' data that can be processed by the json module
-    data = {
-        'relative_path': manifest.relative_path,
-        'size': manifest.raw_manifest.size,
-        'hashes': manifest.raw_manifest.hashes._asdict(),
+    # The keys are sorted to allow end-users to diff the output streams.
+    json_text = my_serializing.JsonLinesEncoder().encode(manifest)
+    return json_text[:-1]
+
+
+def _build_inspector_options(parsed_args) -> typing.Dict[str, typing.Any]:
+    """Translate the parsed command line arguments into keyword arguments for the directory inspector.
+
+    Args:
+          parsed_args (object): Object produced by the argparse module's parse_args() function.
+
+    Returns:
+          dict: Keyword arguments for :py:class:`rudi_dire_insp.core.DirectoryInspector`
+    """
+    return {
+        'algorithms': parsed_args.algorithms,
+        'chunk_size': parsed_args.chunk_size,
+        'threaded_hashing': parsed_args.threaded_hashing,
+        'workers': parsed_args.workers,
+        'use_processes': parsed_args.use_processes,
+        'ordered': parsed_args.ordered,
+        'stats': my_stats.InspectionStats() if parsed_args.stats else None,
+        'hard_links': parsed_args.hard_links,
+        'sampled': parsed_args.sampled,
+        'mmap_threshold': parsed_args.mmap_threshold,
+        'shard': parsed_args.shard,
+        'path_filter': _build_path_filter(parsed_args),
     }
 
-    # Serialize the raw data into a string.  Use key sorting to allow end-users to diff the
-    # output streams.
-    json_text = json.dumps(data, sort_keys=True)
-    return json_text
 
+def _build_path_filter(parsed_args) -> typing.Optional[my_filtering.PathFilter]:
+    """Build the filter for the files to inspect from the parsed command line arguments, or None if there is none."""
+    rules = {
+        name: getattr(parsed_args, name) for name in (
+            'include', 'exclude', 'include_regex', 'exclude_regex', 'min_size', 'max_size', 'modified_after',
+            'modified_before')}
+    if not any(value not in (None, []) for value in rules.values()):
+        return None
+    return my_filtering.PathFilter(**rules)
 
-def _run_inspection(input_path: str, output_buffer: typing.BinaryIO):
-    """Run the inspection on the given input path and write the output to the output writer."""
-    writer = codecs.getwriter('utf-8')(output_buffer)
-    inspector = my_core.DirectoryInspector()
-    counter = 0
-    for manifest in inspector.inspect(input_path):
-        _LOGGER.debug("Got this manifest from the directory inspector: %s", str(manifest))
-        json_text = _convert_to_json_text(manifest)
-        writer.write(json_text)
-        writer.write("\n")
-        counter += 1
-    _LOGGER.info("Inspection of directory '%s' produced %d manifest entries", str(input_path), counter)
 
+def _checkpoint_options(
+        input_path: str,
+        inspector_options: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+    """Collect the inspection options that change the output, which a resumed inspection must use too."""
+    # pylint: disable=protected-access
+    algorithms = my_hashing._HashAlgorithm.from_names(inspector_options.get('algorithms'))
+    shard = inspector_options.get('shard')
+    path_filter = inspector_options.get('path_filter')
+    return {
+        'root': os.path.realpath(input_path),
+        'algorithms': [algorithm.algorithm_name for algorithm in algorithms],
+        'sampled': bool(inspector_options.get('sampled')),
+        'shard': None if shard is None else str(shard),
+        'filter': None if path_filter is None else path_filter.rules,
+    }
 
-def main():
-    """Main entry point for the CLI"""
-    # Parse the command line arguments
-    parsed_args = _parse_cli_args()
 
-    # Change log levels depending on the command line options
-    if parsed_args.debug:
-        log_level = logging.DEBUG
-    elif parsed_args.verbose:
-        log_level = logging.INFO
+def _run_inspection(
+        input_path: str,
+        output_buffer: typing.BinaryIO,
+        output_format: str = 'jsonl',
+        checkpoint_path: typing.Optional[str] = None,
+        checkpoint_interval: int = my_checkpointing.DEFAULT_CHECKPOINT_INTERVAL,
+        resumed: typing.Optional[my_checkpointing.Checkpoint] = None,
+        directories_output: typing.Optional[typing.BinaryIO] = None,
+        **inspector_options):
+    """Run the inspection on the given input path and write the output to the output writer.
+
+    If a checkpoint path is given, the JSON Lines output, which must be a regular file, is synced to disk and a
+    checkpoint written to that path once per interval of manifests, then removed once the inspection completes.  If
+    resuming from a checkpoint, the output must already be cut back to what the checkpoint records (see
+    :py:func:`rudi_dire_insp.checkpointing.open_resumed_output`), and only the files after it are inspected.
+
+    If a directories output is given, the manifest of each directory is written to it as JSON Lines, as soon as the
+    directory is complete.
+
+    Any other keyword arguments are passed through to the :py:class:`rudi_dire_insp.core.DirectoryInspector`.
+    """
+    # pylint: disable=too-many-arguments,too-many-branches,too-many-locals
+    inspector = my_core.DirectoryInspector(**inspector_options)
+    stats = inspector.stats
+    log_manifests = _LOGGER.isEnabledFor(logging.DEBUG)
+    checkpoint_writer = None  # type: typing.Optional[my_checkpointing.CheckpointWriter]
+    if output_format == 'binary':
+        writer = my_serializing.BinaryManifestWriter(
+            output_buffer, inspector.algorithm_names)  # type: my_cli_common.ManifestWriter
+    elif checkpoint_path is not None:
+        writer = checkpoint_writer = my_checkpointing.CheckpointWriter(
+            output_buffer, checkpoint_path, _checkpoint_options(input_path, inspector_options), checkpoint_interval,
+            resumed)
     else:
-        log_level = None
-    if log_level:
-        logging.basicConfig(level=log_level, stream=_LOGGING_STREAM)
+        writer = my_serializing.JsonLinesWriter(output_buffer)
+    resume_after = None if resumed is None else resumed.relative_path
+    if directories_output is not None:
+        manifests = inspector.inspect_tree(input_path)  # type: typing.Iterable[my_cli_common.AnyManifest]
+    else:
+        manifests = inspector.inspect(input_path, resume_after)
+    with writer:
+        for manifest in manifests:
+            if isinstance(manifest, my_manifests.DirectoryManifest):
+                # Only the tree inspection made for a directories output yields these
+                if directories_output is not None:
+                    directories_output.write(my_serializing.encode_directory_manifest(manifest).encode('ascii'))
+                continue
+            if log_manifests:
+                _LOGGER.debug("Got this manifest from the directory inspector: %s", str(manifest))
+            if stats is not None:
+                start = time.perf_counter()
+                writer.write(manifest)
+                stats.add_stage_time('serialize', time.perf_counter() - start)
+            else:
+                writer.write(manifest)
+        if checkpoint_writer is not None:
+            checkpoint_writer.complete()
+    if directories_output is not None:
+        directories_output.flush()
+    _LOGGER.info("Inspection of directory '%s' produced %d manifest entries", str(input_path), writer.count)
 
-    # Run the inspection
-    if parsed_args.output_path == '-':
-        _run_inspection(parsed_args.input_path, sys.stdout.buffer)
+
+def _open_checkpointed_output(
+        exit_stack: contextlib.ExitStack,
+        parsed_args,
+        inspector_options: typing.Dict[str, typing.Any]) -> typing.Tuple[
+            typing.BinaryIO, typing.Optional[str], typing.Optional[my_checkpointing.Checkpoint]]:
+    """Open the output of an inspection, resuming it from its checkpoint if asked to.
+
+    Returns:
+        tuple: The output, the path to write checkpoints to if the output can be checkpointed, and the checkpoint
+        resumed from if any.
+    """
+    checkpoint_path = None
+    resumed = None
+    if parsed_args.output_path != '-' and parsed_args.checkpoint_interval > 0:
+        checkpoint_path = my_checkpointing.checkpoint_path_for(parsed_args.output_path)
+    # --resume requires --output, so there is always a checkpoint path to resume from
+    if parsed_args.resume and checkpoint_path is not None:
+        resumed = my_checkpointing.read_checkpoint(checkpoint_path)
+        if resumed is None:
+            _LOGGER.info("There is no checkpoint at '%s', starting the inspection over", checkpoint_path)
+    if resumed is not None:
+        options = _checkpoint_options(parsed_args.input_path, inspector_options)
+        output_buffer = exit_stack.enter_context(
+            my_checkpointing.open_resumed_output(parsed_args.output_path, resumed, options))
+        _LOGGER.info("Resuming the inspection after %d manifest entries, at: %s", resumed.count, resumed.relative_path)
     else:
-        with open(parsed_args.output_path, 'w+b') as output_file:
-            _run_inspection(parsed_args.input_path, output_file)
+        output_buffer = my_cli_common.open_output(exit_stack, parsed_args.output_path)
+
+    # Checkpoints rely on the output being synced to disk and in walk order
+    if checkpoint_path is not None and (
+            parsed_args.output_format != 'jsonl' or not parsed_args.ordered
+            or not stat.S_ISREG(os.fstat(output_buffer.fileno()).st_mode)):
+        checkpoint_path = None
+    return output_buffer, checkpoint_path, resumed
+
+
+def main(args: typing.Optional[typing.List[str]] = None) -> int:
+    """Main entry point for the CLI
+
+    Args:
+          args (list): The command line arguments, if not those of the process.
+
+    Returns:
+          int: The exit status.
+    """
+    if args is None:
+        args = sys.argv[1:]
+
+    # Commands other than an inspection are named by the first argument
+    if args and args[0] in my_commands.COMMANDS:
+        return my_commands.run_command(args[0], args[1:])
+
+    # Parse the command line arguments
+    parsed_args = _parse_cli_args(args)
+    my_cli_common.configure_logging(parsed_args)
+
+    # Run the inspection
+    inspector_options = _build_inspector_options(parsed_args)
+    start = time.perf_counter()
+    with contextlib.ExitStack() as exit_stack:
+        if parsed_args.cache_path:
+            cache = exit_stack.enter_context(my_caching.HashCache(parsed_args.cache_path))
+            exit_stack.callback(my_cli_common.log_cache_counters, cache)
+            inspector_options['cache'] = cache
+        (output_buffer, checkpoint_path, resumed) = _open_checkpointed_output(
+            exit_stack, parsed_args, inspector_options)
+        directories_output = None
+        if parsed_args.directories_path:
+            directories_output = my_cli_common.open_output(exit_stack, parsed_args.directories_path)
+        _run_inspection(
+            parsed_args.input_path, output_buffer, parsed_args.output_format, checkpoint_path,
+            parsed_args.checkpoint_interval, resumed, directories_output, **inspector_options)
+    if inspector_options['stats'] is not None:
+        my_cli_common.write_stats(inspector_options['stats'], time.perf_counter() - start)
+    return 0
 
 
 if __name__ == '__main__':
-    logging.basicConfig(level=_DEFAULT_LOG_LEVEL, stream=_LOGGING_STREAM)
-    main()
+    logging.basicConfig(level=_DEFAULT_LOG_LEVEL, stream=my_cli_common.LOGGING_STREAM)
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+rudi_dire_insp._cli_common
+==========================
+
+Argument types, options, logging and output helpers shared by the commands of the command line interface.
+"""
+
+# Imports from Python distribution
+import argparse
+import contextlib
+import json
+import logging
+import math
+import sys
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.caching as my_caching
+import rudi_dire_insp.checkpointing as my_checkpointing
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
+import rudi_dire_insp.stats as my_stats
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+LOGGING_STREAM = sys.stderr
+OUTPUT_FORMATS = ('jsonl', 'binary')
+PROG_NAME = 'rudi-dire-insp'
+ManifestWriter = typing.Union[
+    my_serializing.JsonLinesWriter, my_serializing.BinaryManifestWriter, my_checkpointing.CheckpointWriter]
+AnyManifest = typing.Union[my_manifests.FileManifest, my_manifests.DirectoryManifest]
+
+
+def positive_int(text: str) -> int:
+    """Argument type for command line options that only accept integers greater than zero.
+
+    Args:
+          text (str): The raw option value from the command line.
+
+    Returns:
+          int: The parsed value.
+
+    Raises:
+          argparse.ArgumentTypeError
+    """
+    try:
+        value = int(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError("invalid integer value: '{}'".format(text)) from error
+    if value < 1:
+        raise argparse.ArgumentTypeError("value must be greater than zero: '{}'".format(text))
+    return value
+
+
+def non_negative_int(text: str) -> int:
+    """Argument type for command line options that only accept integers greater than or equal to zero.
+
+    Args:
+          text (str): The raw option value from the command line.
+
+    Returns:
+          int: The parsed value.
+
+    Raises:
+          argparse.ArgumentTypeError
+    """
+    try:
+        value = int(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError("invalid integer value: '{}'".format(text)) from error
+    if value < 0:
+        raise argparse.ArgumentTypeError("value must not be negative: '{}'".format(text))
+    return value
+
+
+def positive_float(text: str) -> float:
+    """Argument type for command line options that only accept numbers greater than zero.
+
+    Args:
+          text (str): The raw option value from the command line.
+
+    Returns:
+          float: The parsed value.
+
+    Raises:
+          argparse.ArgumentTypeError
+    """
+    try:
+        value = float(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError("invalid number: '{}'".format(text)) from error
+    if math.isnan(value) or value <= 0:
+        raise argparse.ArgumentTypeError("value must be greater than zero: '{}'".format(text))
+    return value
+
+
+def algorithm_names(text: str) -> typing.Tuple[str, ...]:
+    """Argument type for command line options that take a comma separated list of hashing algorithm names.
+
+    Args:
+          text (str): The raw option value from the command line.
+
+    Returns:
+          tuple: The validated algorithm names.
+
+    Raises:
+          argparse.ArgumentTypeError
+    """
+    names = [name.strip().lower() for name in text.split(',') if name.strip()]
+    try:
+        # pylint: disable=protected-access
+        algorithms = my_hashing._HashAlgorithm.from_names(names)
+    except my_exceptions.HashError as error:
+        raise argparse.ArgumentTypeError(str(error)) from error
+    return tuple(algorithm.algorithm_name for algorithm in algorithms)
+
+
+def add_log_level_args(parser: argparse.ArgumentParser):
+    """Add the mutually exclusive log level flags to a parser."""
+    log_level_group = parser.add_mutually_exclusive_group()
+    log_level_group.add_argument('--verbose', '-v', action='store_true', help="Set log level to INFO")
+    log_level_group.add_argument('--debug', '-d', action='store_true', help="Set log level to DEBUG")
+
+
+def add_output_arg(parser: argparse.ArgumentParser, results: str):
+    """Add the --output option to a parser, naming the results written to it in its help."""
+    parser.add_argument(
+        '--output',
+        '-o',
+        type=str,
+        default='-',
+        dest='output_path',
+        help='Output path for the {}'.format(results))
+
+
+def add_format_arg(parser: argparse.ArgumentParser, help_text: str):
+    """Add the --format option to a parser, choosing from :py:data:`OUTPUT_FORMATS`."""
+    parser.add_argument(
+        '--format',
+        choices=OUTPUT_FORMATS,
+        default='jsonl',
+        dest='output_format',
+        help=help_text)
+
+
+def add_chunk_size_arg(parser: argparse.ArgumentParser, source: str = 'file'):
+    """Add the --chunk-size option to a parser, naming what is read in chunks in its help."""
+    parser.add_argument(
+        '--chunk-size',
+        type=positive_int,
+        default=my_hashing.DEFAULT_CHUNK_SIZE,
+        dest='chunk_size',
+        metavar='BYTES',
+        help='Number of bytes read from a {} at a time while hashing it (default: %(default)s)'.format(source))
+
+
+def add_hashes_arg(
+        parser: argparse.ArgumentParser,
+        help_text: str,
+        default: typing.Optional[typing.Tuple[str, ...]] = my_hashing.DEFAULT_ALGORITHM_NAMES):
+    """Add the --hashes option to a parser, taking comma separated algorithm names."""
+    parser.add_argument(
+        '--hashes',
+        type=algorithm_names,
+        default=default,
+        dest='algorithms',
+        metavar='NAMES',
+        help=help_text)
+
+
+def add_threaded_hashing_arg(parser: argparse.ArgumentParser):
+    """Add the --threaded-hashing flag to a parser."""
+    parser.add_argument(
+        '--threaded-hashing',
+        action='store_true',
+        dest='threaded_hashing',
+        help='Update each hash digest on its own thread')
+
+
+def add_cache_arg(
+        parser: argparse.ArgumentParser,
+        help_text: str = 'Path to a hash cache database, created if missing'):
+    """Add the --cache option to a parser."""
+    parser.add_argument(
+        '--cache',
+        type=str,
+        default=None,
+        dest='cache_path',
+        metavar='PATH',
+        help=help_text)
+
+
+def configure_logging(parsed_args):
+    """Change log levels depending on the command line options."""
+    if parsed_args.debug:
+        log_level = logging.DEBUG
+    elif parsed_args.verbose:
+        log_level = logging.INFO
+    else:
+        log_level = None
+    if log_level:
+        logging.basicConfig(level=log_level, stream=LOGGING_STREAM)
+
+
+def open_output(exit_stack: contextlib.ExitStack, output_path: str) -> typing.BinaryIO:
+    """Open the output path given on the command line, where ``-`` means standard output."""
+    if output_path == '-':
+        return sys.stdout.buffer
+    return exit_stack.enter_context(open(output_path, 'w+b'))
+
+
+def write_stats(stats: my_stats.InspectionStats, elapsed_seconds: float):
+    """Write the stats of an inspection to the logging stream, as one line of JSON."""
+    data = stats.as_dict()
+    data['elapsed_seconds'] = elapsed_seconds
+    LOGGING_STREAM.write(json.dumps(data, sort_keys=True) + '\n')
+    LOGGING_STREAM.flush()
+
+
+def log_cache_counters(cache: my_caching.HashCache):
+    """Log how much use was made of the hash cache."""
+    _LOGGER.info("Hash cache '%s' had %d hits and %d misses, and evicted %d entries",
+                 cache.path, cache.hits, cache.misses, cache.evictions)
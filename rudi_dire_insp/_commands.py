@@ -0,0 +1,657 @@
+"""
+rudi_dire_insp._commands
+========================
+
+The commands of the command line interface besides an inspection, each named by the first argument and with its own
+argument parser.
+"""
+
+# Imports from Python distribution
+import argparse
+import contextlib
+import itertools
+import json
+import logging
+import os
+import time
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp._cli_common as my_cli_common
+import rudi_dire_insp.archives as my_archives
+import rudi_dire_insp.caching as my_caching
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.diffing as my_diffing
+import rudi_dire_insp.duplicates as my_duplicates
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
+import rudi_dire_insp.serving as my_serving
+import rudi_dire_insp.sharding as my_sharding
+import rudi_dire_insp.stats as my_stats
+import rudi_dire_insp.watching as my_watching
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+_EXIT_DIFFERENCES = 1
+_AnyDifference = typing.Union[my_diffing.Difference, my_diffing.DirectoryDifference]
+
+COMMANDS = ('diff', 'verify', 'duplicates', 'upgrade', 'merge', 'archive', 'watch', 'serve')
+"""Names of the commands."""
+
+
+def _parse_diff_args(args: typing.List[str]):
+    """Parse the command line arguments of the diff command.
+
+    Args:
+          args (list): The arguments following the command name.
+
+    Returns:
+          object: Object produced by the argparse module's parse_args() function.
+    """
+    parser = argparse.ArgumentParser(
+        prog='{} diff'.format(my_cli_common.PROG_NAME),
+        description="Compare two inspection outputs, sorted by path, and write one JSON line per difference.  "
+                    "Exits with status 1 if there are differences.")
+    my_cli_common.add_log_level_args(parser)
+    my_cli_common.add_output_arg(parser, 'differences')
+    parser.add_argument(
+        '--no-moves',
+        action='store_false',
+        dest='detect_moves',
+        help='Report moved files as removed and added, so memory use stays constant however many files differ')
+    parser.add_argument(
+        '--directories',
+        action='store_true',
+        dest='directories',
+        help='Compare the directory manifests written by --directories instead, skipping every unchanged subtree')
+    parser.add_argument('old_path', type=str, help="The older inspection output, as JSON Lines or binary")
+    parser.add_argument('new_path', type=str, help="The newer inspection output, as JSON Lines or binary")
+    return parser.parse_args(args)
+
+
+def _parse_verify_args(args: typing.List[str]):
+    """Parse the command line arguments of the verify command.
+
+    Args:
+          args (list): The arguments following the command name.
+
+    Returns:
+          object: Object produced by the argparse module's parse_args() function.
+    """
+    parser = argparse.ArgumentParser(
+        prog='{} verify'.format(my_cli_common.PROG_NAME),
+        description="Check a directory against a stored inspection output, sorted by path, and write one JSON line "
+                    "per difference.  Only files whose size is unchanged are hashed.  Exits with status 1 if there "
+                    "are differences.")
+    my_cli_common.add_log_level_args(parser)
+    my_cli_common.add_output_arg(parser, 'differences')
+    my_cli_common.add_chunk_size_arg(parser)
+    my_cli_common.add_hashes_arg(
+        parser,
+        'Comma separated names of the stored hashes to check files with (default: sha256 if stored, '
+        'otherwise all of them)',
+        default=None)
+    my_cli_common.add_cache_arg(parser)
+    parser.add_argument('manifest_path', type=str, help="The stored inspection output, as JSON Lines or binary")
+    parser.add_argument('input_path', type=str, help="The directory to check")
+    return parser.parse_args(args)
+
+
+def _parse_duplicates_args(args: typing.List[str]):
+    """Parse the command line arguments of the duplicates command.
+
+    Args:
+          args (list): The arguments following the command name.
+
+    Returns:
+          object: Object produced by the argparse module's parse_args() function.
+    """
+    parser = argparse.ArgumentParser(
+        prog='{} duplicates'.format(my_cli_common.PROG_NAME),
+        description="Find the files with the same content in a directory, and write one JSON line per group of "
+                    "duplicates.  Files with a unique size are not read, and files with a unique sample of their "
+                    "first and last bytes are not read in full.")
+    my_cli_common.add_log_level_args(parser)
+    my_cli_common.add_output_arg(parser, 'groups of duplicates')
+    my_cli_common.add_chunk_size_arg(parser)
+    my_cli_common.add_hashes_arg(
+        parser,
+        'Comma separated names of the hashing algorithms to confirm duplicates with (default: {})'.format(
+            ','.join(my_duplicates.DEFAULT_ALGORITHM_NAMES)),
+        default=my_duplicates.DEFAULT_ALGORITHM_NAMES)
+    parser.add_argument(
+        '--sample-size',
+        type=my_cli_common.positive_int,
+        default=my_duplicates.DEFAULT_SAMPLE_SIZE,
+        dest='sample_size',
+        metavar='BYTES',
+        help='Number of bytes sampled from each end of files with the same size (default: %(default)s)')
+    parser.add_argument(
+        '--min-size',
+        type=my_cli_common.positive_int,
+        default=1,
+        dest='min_size',
+        metavar='BYTES',
+        help='Ignore files smaller than this (default: %(default)s)')
+    my_cli_common.add_cache_arg(parser)
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        dest='stats',
+        help='Write a JSON summary of the time spent in each stage and the bytes read to STDERR once done')
+    parser.add_argument('input_path', type=str, help="The directory to search")
+    return parser.parse_args(args)
+
+
+def _parse_upgrade_args(args: typing.List[str]):
+    """Parse the command line arguments of the upgrade command.
+
+    Args:
+          args (list): The arguments following the command name.
+
+    Returns:
+          object: Object produced by the argparse module's parse_args() function.
+    """
+    parser = argparse.ArgumentParser(
+        prog='{} upgrade'.format(my_cli_common.PROG_NAME),
+        description="Rewrite an inspection output made with --sample, replacing the sampled fingerprints with hashes "
+                    "of the whole content of the files.")
+    my_cli_common.add_log_level_args(parser)
+    my_cli_common.add_output_arg(parser, 'upgraded inspection results')
+    my_cli_common.add_chunk_size_arg(parser)
+    my_cli_common.add_hashes_arg(
+        parser,
+        'Comma separated names of the hashing algorithms to use (default: {})'.format(
+            ','.join(my_hashing.DEFAULT_ALGORITHM_NAMES)))
+    my_cli_common.add_cache_arg(parser)
+    parser.add_argument(
+        '--path',
+        type=str,
+        action='append',
+        default=None,
+        dest='relative_paths',
+        metavar='RELATIVE_PATH',
+        help='Only upgrade the file at this path relative to the directory, may be given more than once '
+             '(default: all files)')
+    parser.add_argument('manifest_path', type=str, help="The inspection output to upgrade, as JSON Lines")
+    parser.add_argument('input_path', type=str, help="The directory it was made from")
+    return parser.parse_args(args)
+
+
+def _parse_merge_args(args: typing.List[str]):
+    """Parse the command line arguments of the merge command.
+
+    Args:
+          args (list): The arguments following the command name.
+
+    Returns:
+          object: Object produced by the argparse module's parse_args() function.
+    """
+    parser = argparse.ArgumentParser(
+        prog='{} merge'.format(my_cli_common.PROG_NAME),
+        description="Combine the inspection outputs of every shard made with --shard into the output of the whole "
+                    "directory, sorted by path.  Fails if a shard is missing, given twice or mixed with another.  "
+                    "Outputs don't record which shard they hold or that the inspection finished, so an empty output "
+                    "is only warned about, and one cut short by a failed inspection goes unnoticed: check that "
+                    "every shard's inspection succeeded before merging.")
+    my_cli_common.add_log_level_args(parser)
+    my_cli_common.add_output_arg(parser, 'merged inspection results')
+    my_cli_common.add_format_arg(parser, 'Format of the merged inspection results (default: %(default)s)')
+    parser.add_argument(
+        '--shards',
+        type=my_cli_common.positive_int,
+        default=None,
+        dest='count',
+        metavar='N',
+        help='The number of shards the directory was split into (default: the number of shard outputs given)')
+    parser.add_argument(
+        'shard_paths',
+        type=str,
+        nargs='+',
+        metavar='shard_path',
+        help="The inspection output of a shard, as JSON Lines or binary.  Give one for every shard")
+    return parser.parse_args(args)
+
+
+def _parse_archive_args(args: typing.List[str]):
+    """Parse the command line arguments of the archive command.
+
+    Args:
+          args (list): The arguments following the command name.
+
+    Returns:
+          object: Object produced by the argparse module's parse_args() function.
+    """
+    parser = argparse.ArgumentParser(
+        prog='{} archive'.format(my_cli_common.PROG_NAME),
+        description="Inspect the files held in a tar or zip archive without extracting them, as if inspecting the "
+                    "directory it holds.  Tar archives may be compressed, and are read in a single pass.")
+    my_cli_common.add_log_level_args(parser)
+    my_cli_common.add_output_arg(parser, 'inspection results')
+    my_cli_common.add_format_arg(parser, 'Format of the inspection results (default: %(default)s)')
+    my_cli_common.add_chunk_size_arg(parser, 'member')
+    my_cli_common.add_hashes_arg(
+        parser,
+        'Comma separated names of the hashing algorithms to use (default: {})'.format(
+            ','.join(my_hashing.DEFAULT_ALGORITHM_NAMES)))
+    my_cli_common.add_threaded_hashing_arg(parser)
+    parser.add_argument(
+        '--unordered',
+        action='store_false',
+        dest='ordered',
+        help='Write manifests in archive order as soon as each member is hashed, instead of sorted by path once '
+             'the whole archive is read')
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        dest='stats',
+        help='Write a JSON summary of the inspection to STDERR once done')
+    parser.add_argument(
+        'archive_path', type=str, help="The archive to inspect, or - to read a tar archive from STDIN")
+    return parser.parse_args(args)
+
+
+def _parse_watch_args(args: typing.List[str]):
+    """Parse the command line arguments of the watch command.
+
+    Args:
+          args (list): The arguments following the command name.
+
+    Returns:
+          object: Object produced by the argparse module's parse_args() function.
+    """
+    parser = argparse.ArgumentParser(
+        prog='{} watch'.format(my_cli_common.PROG_NAME),
+        description="Inspect a directory once, then keep watching it and write an event for every file added, "
+                    "modified or removed, as JSON Lines.  Only the files that changed are hashed again.  Runs "
+                    "until interrupted.")
+    my_cli_common.add_log_level_args(parser)
+    my_cli_common.add_output_arg(parser, 'events')
+    parser.add_argument(
+        '--manifest',
+        type=str,
+        dest='manifest_path',
+        metavar='PATH',
+        help='Keep the manifests of every file as JSON Lines at this path, replaced after changes at most once per '
+             '--manifest-interval, and on exit')
+    parser.add_argument(
+        '--manifest-interval',
+        type=my_cli_common.positive_float,
+        default=my_watching.DEFAULT_WRITE_INTERVAL,
+        dest='manifest_interval',
+        metavar='SECONDS',
+        help='Least time between two writes of the --manifest file (default: %(default)s)')
+    my_cli_common.add_chunk_size_arg(parser)
+    my_cli_common.add_hashes_arg(
+        parser,
+        'Comma separated names of the hashing algorithms to use (default: {})'.format(
+            ','.join(my_hashing.DEFAULT_ALGORITHM_NAMES)))
+    parser.add_argument(
+        '--debounce',
+        type=my_cli_common.positive_float,
+        default=my_watching.DEFAULT_DEBOUNCE_SECONDS,
+        dest='debounce_seconds',
+        metavar='SECONDS',
+        help='Time without changes to a file before it is hashed again (default: %(default)s)')
+    parser.add_argument(
+        '--poll-interval',
+        type=my_cli_common.positive_float,
+        default=my_watching.DEFAULT_POLL_INTERVAL,
+        dest='poll_interval',
+        metavar='SECONDS',
+        help='Time between walks of the directory when inotify is not available (default: %(default)s)')
+    parser.add_argument(
+        '--polling',
+        action='store_false',
+        dest='use_inotify',
+        help='Find changes by walking the directory regularly, even where inotify is available')
+    parser.add_argument('input_path', type=str, help="The directory to watch")
+    return parser.parse_args(args)
+
+
+def _parse_serve_args(args: typing.List[str]):
+    """Parse the command line arguments of the serve command.
+
+    Args:
+          args (list): The arguments following the command name.
+
+    Returns:
+          object: Object produced by the argparse module's parse_args() function.
+    """
+    parser = argparse.ArgumentParser(
+        prog='{} serve'.format(my_cli_common.PROG_NAME),
+        description="Inspect a directory, or load an inspection of it, once and answer lookups of its manifests by "
+                    "path, path prefix and digest over HTTP, until interrupted.  Lookups are GET /path?path=REL, "
+                    "GET /prefix?path=REL and GET /digest?value=HEX, answered as JSON Lines.")
+    my_cli_common.add_log_level_args(parser)
+    address_group = parser.add_mutually_exclusive_group(required=True)
+    address_group.add_argument(
+        '--port',
+        type=int,
+        dest='port',
+        help='Listen on this localhost port')
+    address_group.add_argument(
+        '--socket',
+        type=str,
+        dest='socket_path',
+        metavar='PATH',
+        help='Listen on a Unix socket at this path')
+    parser.add_argument(
+        '--manifest',
+        type=str,
+        dest='manifest_path',
+        metavar='PATH',
+        help='Load the manifests from this inspection output, as JSON Lines or binary, instead of inspecting the '
+             'directory')
+    parser.add_argument(
+        '--revalidate',
+        action='store_true',
+        dest='revalidate',
+        help='Check each entry against the status of its file before answering, and hash the file again if that '
+             'changed since the inspection started.  Entries loaded with --manifest are all hashed again when first '
+             'revalidated')
+    my_cli_common.add_chunk_size_arg(parser)
+    my_cli_common.add_hashes_arg(
+        parser,
+        'Comma separated names of the hashing algorithms to inspect the directory with (default: {})'.format(
+            ','.join(my_hashing.DEFAULT_ALGORITHM_NAMES)))
+    parser.add_argument('input_path', type=str, help="The directory the manifests describe")
+    return parser.parse_args(args)
+
+
+def _manifest_data(manifest: typing.Optional[my_cli_common.AnyManifest]) -> typing.Optional[typing.Dict]:
+    """Translate a manifest into the JSON object written by an inspection, or None if there is no manifest."""
+    if manifest is None:
+        return None
+    if isinstance(manifest, my_manifests.DirectoryManifest):
+        return json.loads(my_serializing.encode_directory_manifest(manifest))
+    data = {
+        'hashes': manifest.raw_manifest.hashes._asdict(),
+        'relative_path': manifest.relative_path,
+        'size': manifest.raw_manifest.size,
+    }
+    if manifest.raw_manifest.sampled:
+        data['sampled'] = True
+    return data
+
+
+def _convert_diff_to_json_text(difference: _AnyDifference) -> str:
+    """Translates a difference into one line of JSON text, holding the manifests on each side as JSON objects.
+
+    Args:
+          difference (rudi_dire_insp.diffing.Difference): The difference to convert, or a
+              :py:class:`rudi_dire_insp.diffing.DirectoryDifference`
+
+    Returns:
+          str: The resultant JSON text
+    """
+    data = {
+        'change': difference.kind.value,
+        'relative_path': difference.relative_path,
+        'old': _manifest_data(difference.old),
+        'new': _manifest_data(difference.new),
+    }
+    return json.dumps(data, sort_keys=True)
+
+
+def _convert_group_to_json_text(group: my_duplicates.DuplicateGroup) -> str:
+    """Translates a group of duplicates into one line of JSON text.
+
+    Args:
+          group (rudi_dire_insp.duplicates.DuplicateGroup): The group to convert
+
+    Returns:
+          str: The resultant JSON text
+    """
+    data = {
+        'hashes': group.hashes._asdict(),
+        'relative_paths': group.relative_paths,
+        'size': group.size,
+    }
+    return json.dumps(data, sort_keys=True)
+
+
+def _write_differences(
+        differences: typing.Iterable[_AnyDifference],
+        output_buffer: typing.BinaryIO) -> int:
+    """Write differences as JSON Lines, and return the number of differences written."""
+    count = 0
+    for difference in differences:
+        output_buffer.write((_convert_diff_to_json_text(difference) + '\n').encode('ascii'))
+        count += 1
+    output_buffer.flush()
+    return count
+
+
+def _run_diff(parsed_args) -> int:
+    """Run the diff command, and return the exit status."""
+    with contextlib.ExitStack() as exit_stack:
+        # Both comparisons are generators, which don't read anything until the differences are written
+        if parsed_args.directories:
+            old_directories = my_serializing.read_directory_json_lines(
+                exit_stack.enter_context(open(parsed_args.old_path, 'rb')))
+            new_directories = my_serializing.read_directory_json_lines(
+                exit_stack.enter_context(open(parsed_args.new_path, 'rb')))
+            differences = my_diffing.diff_directories(
+                old_directories, new_directories, parsed_args.detect_moves)  # type: typing.Iterator[_AnyDifference]
+        else:
+            old_manifests = exit_stack.enter_context(my_diffing.open_manifests(parsed_args.old_path))
+            new_manifests = exit_stack.enter_context(my_diffing.open_manifests(parsed_args.new_path))
+            differences = my_diffing.diff_manifests(old_manifests, new_manifests, parsed_args.detect_moves)
+        output_buffer = my_cli_common.open_output(exit_stack, parsed_args.output_path)
+        count = _write_differences(differences, output_buffer)
+    _LOGGER.info("Found %d differences between '%s' and '%s'", count, parsed_args.old_path, parsed_args.new_path)
+    return _EXIT_DIFFERENCES if count else 0
+
+
+def _run_verify(parsed_args) -> int:
+    """Run the verify command, and return the exit status."""
+    with contextlib.ExitStack() as exit_stack:
+        manifests = exit_stack.enter_context(my_diffing.open_manifests(parsed_args.manifest_path))
+        cache = None
+        if parsed_args.cache_path:
+            cache = exit_stack.enter_context(my_caching.HashCache(parsed_args.cache_path))
+            exit_stack.callback(my_cli_common.log_cache_counters, cache)
+        output_buffer = my_cli_common.open_output(exit_stack, parsed_args.output_path)
+        differences = my_diffing.verify_directory(
+            parsed_args.input_path, manifests, parsed_args.algorithms, parsed_args.chunk_size, cache)
+        count = _write_differences(differences, output_buffer)
+    _LOGGER.info("Found %d differences between '%s' and '%s'",
+                 count, parsed_args.manifest_path, parsed_args.input_path)
+    return _EXIT_DIFFERENCES if count else 0
+
+
+def _run_duplicates(parsed_args) -> int:
+    """Run the duplicates command, and return the exit status."""
+    stats = my_stats.InspectionStats() if parsed_args.stats else None
+    start = time.perf_counter()
+    count = 0
+    with contextlib.ExitStack() as exit_stack:
+        cache = None
+        if parsed_args.cache_path:
+            cache = exit_stack.enter_context(my_caching.HashCache(parsed_args.cache_path))
+            exit_stack.callback(my_cli_common.log_cache_counters, cache)
+        output_buffer = my_cli_common.open_output(exit_stack, parsed_args.output_path)
+        groups = my_duplicates.find_duplicates(
+            parsed_args.input_path, algorithms=parsed_args.algorithms, sample_size=parsed_args.sample_size,
+            min_size=parsed_args.min_size, chunk_size=parsed_args.chunk_size, cache=cache, stats=stats)
+        for group in groups:
+            output_buffer.write((_convert_group_to_json_text(group) + '\n').encode('ascii'))
+            count += 1
+        output_buffer.flush()
+    _LOGGER.info("Found %d groups of duplicates in '%s'", count, parsed_args.input_path)
+    if stats is not None:
+        my_cli_common.write_stats(stats, time.perf_counter() - start)
+    return 0
+
+
+def _run_upgrade(parsed_args) -> int:
+    """Run the upgrade command, and return the exit status."""
+    relative_paths = None
+    if parsed_args.relative_paths is not None:
+        relative_paths = [os.path.split(os.path.normpath(path)) for path in parsed_args.relative_paths]
+    with contextlib.ExitStack() as exit_stack:
+        manifests = exit_stack.enter_context(my_diffing.open_manifests(parsed_args.manifest_path))
+        cache = None
+        if parsed_args.cache_path:
+            cache = exit_stack.enter_context(my_caching.HashCache(parsed_args.cache_path))
+            exit_stack.callback(my_cli_common.log_cache_counters, cache)
+        output_buffer = my_cli_common.open_output(exit_stack, parsed_args.output_path)
+        inspector = my_core.DirectoryInspector(
+            chunk_size=parsed_args.chunk_size, algorithms=parsed_args.algorithms, cache=cache)
+        with my_serializing.JsonLinesWriter(output_buffer) as writer:
+            for manifest in inspector.upgrade(parsed_args.input_path, manifests, relative_paths):
+                writer.write(manifest)
+    _LOGGER.info("Upgraded '%s' into %d manifest entries", parsed_args.manifest_path, writer.count)
+    return 0
+
+
+def _run_merge(parsed_args) -> int:
+    """Run the merge command, and return the exit status."""
+    with contextlib.ExitStack() as exit_stack:
+        shard_manifests = [
+            exit_stack.enter_context(my_diffing.open_manifests(shard_path)) for shard_path in parsed_args.shard_paths]
+        manifests = my_sharding.merge_shards(shard_manifests, parsed_args.count)
+        output_buffer = my_cli_common.open_output(exit_stack, parsed_args.output_path)
+        if parsed_args.output_format == 'binary':
+            # The binary format needs the algorithm names up front, the shards all have those of their first manifest
+            first_manifest = next(manifests, None)
+            algorithm_names = my_hashing.DEFAULT_ALGORITHM_NAMES  # type: typing.Tuple[str, ...]
+            if first_manifest is not None:
+                algorithm_names = first_manifest.raw_manifest.hashes.names
+                manifests = itertools.chain([first_manifest], manifests)
+            writer = my_serializing.BinaryManifestWriter(
+                output_buffer, algorithm_names)  # type: my_cli_common.ManifestWriter
+        else:
+            writer = my_serializing.JsonLinesWriter(output_buffer)
+        with writer:
+            for manifest in manifests:
+                writer.write(manifest)
+    _LOGGER.info("Merged %d shards into %d manifest entries", len(parsed_args.shard_paths), writer.count)
+    return 0
+
+
+def _run_archive(parsed_args) -> int:
+    """Run the archive command, and return the exit status."""
+    inspector = my_archives.ArchiveInspector(
+        chunk_size=parsed_args.chunk_size, threaded_hashing=parsed_args.threaded_hashing,
+        algorithms=parsed_args.algorithms, ordered=parsed_args.ordered,
+        stats=my_stats.InspectionStats() if parsed_args.stats else None)
+    start = time.perf_counter()
+    with contextlib.ExitStack() as exit_stack:
+        output_buffer = my_cli_common.open_output(exit_stack, parsed_args.output_path)
+        if parsed_args.output_format == 'binary':
+            writer = my_serializing.BinaryManifestWriter(
+                output_buffer, inspector.algorithm_names)  # type: my_cli_common.ManifestWriter
+        else:
+            writer = my_serializing.JsonLinesWriter(output_buffer)
+        with writer:
+            for manifest in inspector.inspect(parsed_args.archive_path):
+                writer.write(manifest)
+    _LOGGER.info("Inspection of archive '%s' produced %d manifest entries", parsed_args.archive_path, writer.count)
+    if inspector.stats is not None:
+        my_cli_common.write_stats(inspector.stats, time.perf_counter() - start)
+    return 0
+
+
+def _convert_event_to_json_text(event: my_watching.WatchEvent) -> str:
+    """Translates a watch event into one line of JSON text, holding the new manifest as a JSON object.
+
+    Args:
+          event (rudi_dire_insp.watching.WatchEvent): The event to convert
+
+    Returns:
+          str: The resultant JSON text
+    """
+    data = {
+        'event': event.kind.value,
+        'relative_path': event.relative_path,
+        'manifest': _manifest_data(event.manifest),
+    }
+    return json.dumps(data, sort_keys=True)
+
+
+def _run_watch(parsed_args) -> int:
+    """Run the watch command until interrupted, and return the exit status."""
+    watcher = my_watching.DirectoryWatcher(
+        parsed_args.input_path, chunk_size=parsed_args.chunk_size, algorithms=parsed_args.algorithms,
+        debounce_seconds=parsed_args.debounce_seconds, poll_interval=parsed_args.poll_interval,
+        use_inotify=parsed_args.use_inotify)
+    with contextlib.ExitStack() as exit_stack:
+        output_buffer = my_cli_common.open_output(exit_stack, parsed_args.output_path)
+        exit_stack.enter_context(watcher)
+        watcher.start()
+        if parsed_args.manifest_path:
+            watcher.write_manifests(parsed_args.manifest_path)
+        # Writing every manifest takes time in proportion to the number of files, so changes are gathered for a while
+        next_write = time.monotonic() + parsed_args.manifest_interval
+        unwritten = False
+        try:
+            while True:
+                events = watcher.poll(max(0.0, next_write - time.monotonic()) if unwritten else None)
+                for event in events:
+                    output_buffer.write((_convert_event_to_json_text(event) + '\n').encode('ascii'))
+                if events:
+                    output_buffer.flush()
+                    unwritten = bool(parsed_args.manifest_path)
+                if unwritten and time.monotonic() >= next_write:
+                    watcher.write_manifests(parsed_args.manifest_path)
+                    next_write = time.monotonic() + parsed_args.manifest_interval
+                    unwritten = False
+        except KeyboardInterrupt:
+            _LOGGER.info("Stopped watching '%s'", parsed_args.input_path)
+        if unwritten:
+            watcher.write_manifests(parsed_args.manifest_path)
+    return 0
+
+
+def _run_serve(parsed_args) -> int:
+    """Run the serve command until interrupted, and return the exit status."""
+    if parsed_args.manifest_path:
+        # A manifest file doesn't record when its inspection started, and files may have changed while it ran
+        with my_diffing.open_manifests(parsed_args.manifest_path) as manifests:
+            index = my_serving.ManifestIndex(manifests, parsed_args.input_path, chunk_size=parsed_args.chunk_size)
+    else:
+        current_at_ns = int(time.time() * 1e9)
+        inspector = my_core.DirectoryInspector(chunk_size=parsed_args.chunk_size, algorithms=parsed_args.algorithms)
+        index = my_serving.ManifestIndex(
+            inspector.inspect(parsed_args.input_path), parsed_args.input_path, current_at_ns,
+            chunk_size=parsed_args.chunk_size)
+    server = my_serving.make_server(
+        index, port=parsed_args.port, socket_path=parsed_args.socket_path, revalidate=parsed_args.revalidate)
+    _LOGGER.info("Serving %d manifest entries at %s", len(index), server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        _LOGGER.info("Stopped serving '%s'", parsed_args.input_path)
+    finally:
+        server.server_close()
+    return 0
+
+
+def run_command(name: str, args: typing.List[str]) -> int:
+    """Run a command, and return the exit status.
+
+    Args:
+          name (str): The name of the command, one of :py:data:`COMMANDS`.
+          args (list): The arguments following the command name.
+
+    Returns:
+          int: The exit status.
+    """
+    (parse_args, run) = {
+        'diff': (_parse_diff_args, _run_diff),
+        'verify': (_parse_verify_args, _run_verify),
+        'duplicates': (_parse_duplicates_args, _run_duplicates),
+        'upgrade': (_parse_upgrade_args, _run_upgrade),
+        'merge': (_parse_merge_args, _run_merge),
+        'archive': (_parse_archive_args, _run_archive),
+        'watch': (_parse_watch_args, _run_watch),
+        'serve': (_parse_serve_args, _run_serve),
+    }[name]
+    parsed_args = parse_args(args)
+    my_cli_common.configure_logging(parsed_args)
+    return run(parsed_args)
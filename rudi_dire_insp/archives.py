@@ -0,0 +1,214 @@
+"""
+rudi_dire_insp.archives
+=======================
+
+Inspection of the files held in tar and zip archives, without extracting them.
+
+Every member is hashed from the stream the archive module decompresses it into, exactly as a file of a directory
+would be, so the manifests of an archive can be compared with those of the directory it was made from.  A tar
+archive, compressed or not, is read in one sequential pass and can come from a pipe.  A zip archive has to be a
+file, since its index is at the end, but its members are still read in the order they are stored.
+"""
+
+# Imports from Python distribution
+import logging
+import os
+import sys
+import tarfile
+import time
+import typing
+import zipfile
+import zlib
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.stats as my_stats
+import rudi_dire_insp.walking as my_walking
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+# Errors of the archive modules and the decompressors under them, for archives that are corrupt or cut short
+_READ_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, OSError)
+
+
+def member_relative_path(name: str) -> typing.Tuple[str, str]:
+    """Translate the name of an archive member into a relative path, as held by a manifest.
+
+    Leading slashes and ``.`` components are dropped, as tar does when extracting.
+
+    Args:
+        name (str): The name of the member, with forward slashes.
+
+    Returns:
+        tuple: The relative path of the directory holding the member, and the name of the member.
+
+    Raises:
+        rudi_dire_insp.exceptions.ArchiveError
+    """
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        raise my_exceptions.ArchiveError("Archive member path is not under the archive root: {!r}".format(name))
+    return os.path.join('', *parts[:-1]), parts[-1]
+
+
+class ArchiveInspector:
+    """Inspector for the files held in a tar or zip archive."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            chunk_size: int = my_hashing.DEFAULT_CHUNK_SIZE,
+            threaded_hashing: bool = False,
+            algorithms: typing.Optional[typing.Iterable[str]] = None,
+            ordered: bool = True,
+            stats: typing.Optional[my_stats.InspectionStats] = None):
+        """Constructor
+
+        Args:
+            chunk_size (int): The maximum number of bytes read from a member at a time while hashing it.
+            threaded_hashing (bool): If true, each digest is updated on its own thread while hashing a member.
+            algorithms (iterable): Names of the hashing algorithms to use, see
+                :py:data:`rudi_dire_insp.hashing.ALGORITHM_NAMES`.  If None, the algorithms named by
+                :py:data:`rudi_dire_insp.hashing.DEFAULT_ALGORITHM_NAMES` are used.
+            ordered (bool): If true, manifests are yielded in walk order once the whole archive has been read, as
+                inspecting the extracted directory would yield them, which diffing and merging expect.  Otherwise
+                each is yielded as soon as its member has been hashed, in archive order.
+            stats (rudi_dire_insp.stats.InspectionStats): If given, timings and counters of every inspection are
+                added to these stats.
+
+        Raises:
+            rudi_dire_insp.exceptions.HashError
+        """
+        # Members are never opened by path, the current directory only stands in for the root of the file inspector
+        # pylint: disable=protected-access
+        self._file_inspector = my_core._FileInspector(
+            os.curdir, chunk_size=chunk_size, threaded_hashing=threaded_hashing, algorithms=algorithms, stats=stats)
+        self._algorithm_names = self._file_inspector._algorithm_names
+        self._ordered = ordered
+        self._stats = stats
+
+    @property
+    def stats(self) -> typing.Optional[my_stats.InspectionStats]:
+        """rudi_dire_insp.stats.InspectionStats: The stats collected by this inspector, if any."""
+        return self._stats
+
+    @property
+    def algorithm_names(self) -> typing.Tuple[str, ...]:
+        """tuple: Names of the hashing algorithms used by this inspector."""
+        return self._algorithm_names
+
+    def _inspect_member(
+            self,
+            relative_path: typing.Tuple[str, str],
+            stream: typing.IO[bytes]) -> my_manifests.FileManifest:
+        """Hash the content of a member as it streams out of the archive."""
+        if self._stats is not None:
+            start = time.perf_counter()
+        try:
+            # Member streams of both tar and zip archives are buffered readers, which can be read into a buffer
+            # pylint: disable=protected-access
+            raw_manifest = self._file_inspector._inspect_stream(typing.cast('my_hashing._ReadableStream', stream))
+        except my_exceptions.HashError as error:
+            if isinstance(error.__cause__, _READ_ERRORS):
+                raise my_exceptions.ArchiveError("Unable to read archive member {}: {}".format(
+                    relative_path, error.__cause__)) from error.__cause__
+            raise
+        file_manifest = my_manifests.FileManifest(relative_path, raw_manifest)
+        if self._stats is not None:
+            self._stats.add_file(relative_path, time.perf_counter() - start)
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Created file manifest for archive member: %s", str(file_manifest))
+        return file_manifest
+
+    def _inspect_tar(self, tar_file: tarfile.TarFile) -> typing.Iterator[my_manifests.FileManifest]:
+        """Inspect the regular files of a tar archive opened as a stream, in archive order.
+
+        A hard link member has no content of its own, it reuses the manifest of the member it links to, which a tar
+        archive always holds earlier.  Symbolic links are skipped, since their targets can't be read from a stream.
+        """
+        raw_manifests = {}  # type: typing.Dict[typing.Tuple[str, str], my_manifests.RawBytesManifest]
+        for member in tar_file:
+            if member.isfile():
+                relative_path = member_relative_path(member.name)
+                member_stream = tar_file.extractfile(member)
+                if member_stream is None:
+                    raise my_exceptions.ArchiveError("Unable to extract archive member: {}".format(member.name))
+                with member_stream as stream:
+                    file_manifest = self._inspect_member(relative_path, stream)
+                raw_manifests[relative_path] = file_manifest.raw_manifest
+            elif member.islnk():
+                relative_path = member_relative_path(member.name)
+                raw_manifest = raw_manifests.get(member_relative_path(member.linkname))
+                if raw_manifest is None:
+                    raise my_exceptions.ArchiveError(
+                        "Hard link to a member not found before it in the archive: {} -> {}".format(
+                            member.name, member.linkname))
+                file_manifest = my_manifests.FileManifest(relative_path, raw_manifest)
+                raw_manifests[relative_path] = raw_manifest
+                if self._stats is not None:
+                    self._stats.add_file(relative_path)
+            else:
+                _LOGGER.debug("Skipped archive member that isn't a regular file: %s", member.name)
+                continue
+            yield file_manifest
+
+    def _inspect_zip(self, zip_file: zipfile.ZipFile) -> typing.Iterator[my_manifests.FileManifest]:
+        """Inspect the files of a zip archive, in the order they are stored so that it is read sequentially."""
+        for info in sorted(zip_file.infolist(), key=lambda info: info.header_offset):
+            if info.is_dir():
+                continue
+            relative_path = member_relative_path(info.filename)
+            with zip_file.open(info) as stream:
+                file_manifest = self._inspect_member(relative_path, stream)
+            yield file_manifest
+
+    def _inspect_archive(self, path: str) -> typing.Iterator[my_manifests.FileManifest]:
+        """Open the archive at the path, or standard input for ``-``, and inspect its members in archive order."""
+        if path == '-':
+            # The stream mode reads each member once, in order, and never seeks
+            with tarfile.open(fileobj=sys.stdin.buffer, mode='r|*') as tar_file:
+                yield from self._inspect_tar(tar_file)
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zip_file:
+                yield from self._inspect_zip(zip_file)
+        else:
+            with tarfile.open(path, mode='r|*') as tar_file:
+                yield from self._inspect_tar(tar_file)
+
+    def inspect(self, path: str) -> typing.Iterator[my_manifests.FileManifest]:
+        """Inspect the files held in the archive at the given path, without extracting them.
+
+        Tar archives may be compressed with gzip, bzip2 or lzma, which is detected from their content, and may be
+        read from standard input by giving ``-`` as the path.  Only regular files get manifests, with relative
+        paths from the root of the archive.  If a member is stored more than once, as appending to a tar archive
+        does, only the last one is yielded in walk order, as extracting would keep it.  Unordered, each is yielded.
+
+        Args:
+            path (str): The path to the archive, or ``-`` for a tar archive on standard input.
+
+        Yields:
+            rudi_dire_insp.manifests.FileManifest: The manifest of each file in the archive.
+
+        Raises:
+            rudi_dire_insp.exceptions.ArchiveError
+            rudi_dire_insp.exceptions.HashError
+        """
+        manifests = self._inspect_archive(path)
+        try:
+            if not self._ordered:
+                yield from manifests
+                return
+            # Only the manifests are held until the end, never the content of any member
+            by_key = {
+                my_walking.relative_path_key(manifest.relative_path): manifest
+                for manifest in manifests}  # type: typing.Dict[bytes, my_manifests.FileManifest]
+            for key in sorted(by_key):
+                yield by_key[key]
+        except _READ_ERRORS as error:
+            raise my_exceptions.ArchiveError("Unable to read archive '{}': {}".format(path, error)) from error
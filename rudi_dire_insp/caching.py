@@ -0,0 +1,289 @@
+"""
+rudi_dire_insp.caching
+======================
+
+Persistent cache of file hashes, so that unchanged files don't need to be read again when a directory is
+re-inspected.
+"""
+
+# Imports from Python distribution
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_COMMIT_INTERVAL = 1000
+"""Default number of cache writes batched into a single database transaction."""
+
+_RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+"""Files changed this recently (in nanoseconds) aren't cached, since a later change might not alter their mtime."""
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS file_hashes (
+        dev INTEGER NOT NULL,
+        ino INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        ctime_ns INTEGER NOT NULL,
+        root TEXT NOT NULL,
+        hashes TEXT NOT NULL,
+        generation INTEGER NOT NULL,
+        PRIMARY KEY (dev, ino)
+    )""",
+    """CREATE INDEX IF NOT EXISTS file_hashes_by_root ON file_hashes (root, generation)""",
+    """CREATE TABLE IF NOT EXISTS cache_info (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )""",
+)
+
+
+def cache_key(stat_result: os.stat_result) -> typing.Tuple[int, int, int, int, int]:
+    """Build the cache key for a file from its status.
+
+    Args:
+        stat_result (os.stat_result): The status of the file, e.g. from :py:func:`os.stat`.
+
+    Returns:
+        tuple: (st_dev, st_ino, st_size, st_mtime_ns, st_ctime_ns)
+    """
+    return (stat_result.st_dev, stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns,
+            stat_result.st_ctime_ns)
+
+
+# pylint: disable=too-many-instance-attributes
+class HashCache:
+    """An on-disk cache of file hashes, keyed by the status of each file.
+
+    A file is identified by its device and inode numbers.  The cached hashes are only used when the size,
+    modification time and status change time of the file still match the ones recorded with them.
+
+    Each inspection run marks the entries it uses.  Once a run over a root directory completes, entries for that
+    root which weren't used belong to files that no longer exist, and :py:meth:`evict_unused` removes them.
+
+    Instances are safe to share between threads.  Use as a context manager, or call :py:meth:`close` when done.
+    """
+
+    def __init__(self, path: str, commit_interval: int = DEFAULT_COMMIT_INTERVAL):
+        """Constructor
+
+        Args:
+            path (str): Path to the cache database file.  It is created if it doesn't exist.
+            commit_interval (int): Number of cache writes batched into each database transaction.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        self._path = path
+        self._commit_interval = max(1, int(commit_interval))
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        try:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+            self._connection.commit()
+        except sqlite3.Error as error:
+            raise my_exceptions.CacheError("Unable to open hash cache at '{}'".format(path)) from error
+        _LOGGER.debug("Opened hash cache at %s", path)
+
+    @property
+    def path(self) -> str:
+        """str: Path to the cache database file."""
+        return self._path
+
+    @property
+    def hits(self) -> int:
+        """int: Number of lookups that found usable hashes."""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """int: Number of lookups that didn't find usable hashes."""
+        return self._misses
+
+    @property
+    def evictions(self) -> int:
+        """int: Number of entries removed because their files no longer exist."""
+        return self._evictions
+
+    def begin_run(self) -> int:
+        """Start a new inspection run, so entries used from now on can be told apart from stale ones.
+
+        Returns:
+            int: The generation number of the new run.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        with self._lock:
+            try:
+                row = self._connection.execute("SELECT value FROM cache_info WHERE name = 'generation'").fetchone()
+                self._generation = (row[0] if row else 0) + 1
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO cache_info (name, value) VALUES ('generation', ?)", (self._generation,))
+                self._connection.commit()
+                self._pending_writes = 0
+            except sqlite3.Error as error:
+                raise my_exceptions.CacheError("Unable to start a run in the hash cache") from error
+        return self._generation
+
+    def lookup(
+            self,
+            stat_result: os.stat_result,
+            algorithm_names: typing.Iterable[str]) -> typing.Optional[my_hashing.Hashes]:
+        """Look up the cached hashes for a file.
+
+        Args:
+            stat_result (os.stat_result): The current status of the file.
+            algorithm_names (iterable): The names of the hashing algorithms needed.
+
+        Returns:
+            rudi_dire_insp.hashing.Hashes: The cached hashes for all of the algorithms, or None if the cache can't
+            provide them all for the file in its current state.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        (dev, ino, size, mtime_ns, ctime_ns) = cache_key(stat_result)
+        with self._lock:
+            try:
+                row = self._connection.execute(
+                    "SELECT size, mtime_ns, ctime_ns, hashes FROM file_hashes WHERE dev = ? AND ino = ?",
+                    (dev, ino)).fetchone()
+                hashes = None
+                if row is not None and tuple(row[0:3]) == (size, mtime_ns, ctime_ns):
+                    hex_values = json.loads(row[3])
+                    if all(name in hex_values for name in algorithm_names):
+                        hashes = my_hashing.Hashes(**{name: hex_values[name] for name in algorithm_names})
+                        self._connection.execute(
+                            "UPDATE file_hashes SET generation = ? WHERE dev = ? AND ino = ?",
+                            (self._generation, dev, ino))
+                        self._count_write()
+            except (sqlite3.Error, ValueError) as error:
+                raise my_exceptions.CacheError("Unable to read from the hash cache") from error
+            if hashes is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return hashes
+
+    def store(self, stat_result: os.stat_result, hashes: my_hashing.Hashes, root: str):
+        """Record the hashes calculated for a file.
+
+        Files that were modified too recently to be told apart from a later modification are not recorded.
+
+        Args:
+            stat_result (os.stat_result): The status of the file taken before its content was read.
+            hashes (rudi_dire_insp.hashing.Hashes): The hashes of the file content.
+            root (str): The real path of the root directory being inspected.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        key = cache_key(stat_result)
+        racy_threshold_ns = int(time.time() * 1e9) - _RACY_WINDOW_NS
+        if max(key[3], key[4]) >= racy_threshold_ns:
+            _LOGGER.debug("Not caching hashes for recently changed file with key %s", str(key))
+            return
+        # pylint: disable=protected-access
+        hashes_text = json.dumps(hashes._asdict(), separators=(',', ':'))
+        with self._lock:
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO file_hashes "
+                    "(dev, ino, size, mtime_ns, ctime_ns, root, hashes, generation) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    key + (root, hashes_text, self._generation))
+                self._count_write()
+            except sqlite3.Error as error:
+                raise my_exceptions.CacheError("Unable to write to the hash cache") from error
+
+    def evict_unused(self, root: str) -> int:
+        """Remove the entries for the root directory that weren't used during the current run.
+
+        Only call this after the whole root directory has been inspected, otherwise entries for files that simply
+        weren't reached yet are removed too.
+
+        Args:
+            root (str): The real path of the root directory that was inspected.
+
+        Returns:
+            int: The number of entries removed.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        with self._lock:
+            try:
+                cursor = self._connection.execute(
+                    "DELETE FROM file_hashes WHERE root = ? AND generation < ?", (root, self._generation))
+                self._connection.commit()
+                self._pending_writes = 0
+            except sqlite3.Error as error:
+                raise my_exceptions.CacheError("Unable to evict entries from the hash cache") from error
+            evicted = max(cursor.rowcount, 0)
+            self._evictions += evicted
+        _LOGGER.debug("Evicted %d unused entries for root %s from the hash cache", evicted, root)
+        return evicted
+
+    def flush(self):
+        """Commit any batched writes to the database.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        with self._lock:
+            try:
+                self._connection.commit()
+            except sqlite3.Error as error:
+                raise my_exceptions.CacheError("Unable to write to the hash cache") from error
+            self._pending_writes = 0
+
+    def close(self):
+        """Commit any batched writes and close the database.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        self.flush()
+        with self._lock:
+            self._connection.close()
+        _LOGGER.debug("Closed hash cache at %s with %d hits, %d misses and %d evictions",
+                      self._path, self._hits, self._misses, self._evictions)
+
+    def _count_write(self):
+        """Count a write, committing once enough have been batched up.  Must be called holding the lock."""
+        self._pending_writes += 1
+        if self._pending_writes >= self._commit_interval:
+            self._connection.commit()
+            self._pending_writes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        raise TypeError("'{}' objects can't be pickled".format(type(self).__name__))
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} path="{}", hits={}, misses={}, evictions={}>'.format(
+            class_name, self._path, self._hits, self._misses, self._evictions)
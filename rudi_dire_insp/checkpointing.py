@@ -0,0 +1,290 @@
+"""
+rudi_dire_insp.checkpointing
+============================
+
+Checkpoints of long inspections written to a file, so that an inspection can be resumed where it was stopped.
+
+Since manifests are written in walk order, a checkpoint only needs the relative path of the last manifest written
+and the size of the output at that point: every directory and file walked before it is complete.  A checkpoint is
+written once per interval of manifests, after the output is synced to disk, so the output always holds at least
+everything the checkpoint records.  Resuming cuts the output back to that size and walks on after that path.
+"""
+
+# Imports from Python distribution
+import json
+import logging
+import os
+import tempfile
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+CHECKPOINT_SUFFIX = '.checkpoint'
+"""Suffix added to the path of an output to get the path of its checkpoint."""
+
+DEFAULT_CHECKPOINT_INTERVAL = 10000
+"""Default number of manifests written between checkpoints."""
+
+_CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+    """The progress of an inspection at the time its output was last synced to disk."""
+
+    __slots__ = ('_relative_path', '_offset', '_count', '_options')
+
+    def __init__(
+            self,
+            relative_path: typing.Tuple[str, ...],
+            offset: int,
+            count: int,
+            options: typing.Dict[str, typing.Any]):
+        """Constructor
+
+        Args:
+            relative_path (tuple): The relative path of the last manifest written.
+            offset (int): The size of the output once that manifest was written.
+            count (int): The number of manifests written.
+            options (dict): The inspection options that change the output, which a resumed inspection must use too.
+        """
+        self._relative_path = tuple(relative_path)
+        self._offset = offset
+        self._count = count
+        self._options = options
+
+    @property
+    def relative_path(self) -> typing.Tuple[str, ...]:
+        """tuple: The relative path of the last manifest written."""
+        return self._relative_path
+
+    @property
+    def offset(self) -> int:
+        """int: The size of the output once the last manifest was written."""
+        return self._offset
+
+    @property
+    def count(self) -> int:
+        """int: The number of manifests written."""
+        return self._count
+
+    @property
+    def options(self) -> typing.Dict[str, typing.Any]:
+        """dict: The inspection options that change the output."""
+        return self._options
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} relative_path={}, offset={}, count={}>'.format(
+            class_name, self._relative_path, self._offset, self._count)
+
+
+def checkpoint_path_for(output_path: str) -> str:
+    """Get the path of the checkpoint written alongside an output."""
+    return output_path + CHECKPOINT_SUFFIX
+
+
+def read_checkpoint(path: str) -> typing.Optional[Checkpoint]:
+    """Read a checkpoint from a file.
+
+    Args:
+        path (str): The path to the checkpoint file.
+
+    Returns:
+        Checkpoint: The checkpoint, or None if there is no checkpoint file.
+
+    Raises:
+        rudi_dire_insp.exceptions.CheckpointError
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as checkpoint_file:
+            data = json.load(checkpoint_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as error:
+        raise my_exceptions.CheckpointError("Unable to read checkpoint: {}".format(path)) from error
+    try:
+        if data['version'] != _CHECKPOINT_VERSION:
+            raise my_exceptions.CheckpointError("Unsupported checkpoint version {!r}: {}".format(data['version'], path))
+        checkpoint = Checkpoint(data['relative_path'], data['offset'], data['count'], data['options'])
+    except (KeyError, TypeError) as error:
+        raise my_exceptions.CheckpointError("Malformed checkpoint: {}".format(path)) from error
+    if len(checkpoint.relative_path) != 2 or not isinstance(checkpoint.offset, int) or checkpoint.offset < 0:
+        raise my_exceptions.CheckpointError("Malformed checkpoint: {}".format(path))
+    return checkpoint
+
+
+def write_checkpoint(path: str, checkpoint: Checkpoint):
+    """Write a checkpoint to a file, replacing any previous one in a single step.
+
+    The checkpoint is written to a temporary file in the same directory and synced before it replaces the previous
+    one, so a crash leaves either of them complete.
+
+    Args:
+        path (str): The path to the checkpoint file.
+        checkpoint (Checkpoint): The checkpoint to write.
+
+    Raises:
+        rudi_dire_insp.exceptions.CheckpointError
+    """
+    data = {
+        'version': _CHECKPOINT_VERSION,
+        'relative_path': list(checkpoint.relative_path),
+        'offset': checkpoint.offset,
+        'count': checkpoint.count,
+        'options': checkpoint.options,
+    }
+    (dir_path, file_name) = os.path.split(os.path.abspath(path))
+    try:
+        (handle, temp_path) = tempfile.mkstemp(prefix=file_name + '.', dir=dir_path)
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as temp_file:
+                json.dump(data, temp_file, sort_keys=True)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    except OSError as error:
+        raise my_exceptions.CheckpointError("Unable to write checkpoint: {}".format(path)) from error
+
+
+# pylint: disable=too-many-instance-attributes
+class CheckpointWriter:
+    """Writes manifests to a JSON Lines output, with a checkpoint once per interval of manifests.
+
+    Use as a context manager.  Once the inspection completes, call :py:meth:`complete` to remove the checkpoint, it
+    is only needed to resume an inspection that didn't complete.
+    """
+
+    def __init__(
+            self,
+            output_file: typing.BinaryIO,
+            checkpoint_path: str,
+            options: typing.Dict[str, typing.Any],
+            interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+            resumed: typing.Optional[Checkpoint] = None):
+        """Constructor
+
+        Args:
+            output_file (typing.BinaryIO): The output file, opened for writing at the end of what was written before
+                if resuming.  It must be a regular file, which can be synced to disk.
+            checkpoint_path (str): The path to write the checkpoint to.
+            options (dict): The inspection options that change the output, recorded in the checkpoint.
+            interval (int): The number of manifests written between checkpoints.
+            resumed (Checkpoint): The checkpoint the inspection was resumed from, if any.
+        """
+        self._output_file = output_file
+        self._checkpoint_path = checkpoint_path
+        self._options = options
+        self._interval = interval
+        self._writer = my_serializing.JsonLinesWriter(output_file)
+        self._count = 0 if resumed is None else resumed.count
+        self._last_checkpoint_count = self._count
+        self._relative_path = None  # type: typing.Optional[typing.Tuple[str, ...]]
+
+    @property
+    def count(self) -> int:
+        """int: The number of manifests in the output, including those written before resuming."""
+        return self._count
+
+    def write(self, manifest: my_manifests.FileManifest):
+        """Write a manifest, and a checkpoint if an interval of manifests was written since the last one.
+
+        Raises:
+            rudi_dire_insp.exceptions.CheckpointError
+        """
+        self._writer.write(manifest)
+        self._count += 1
+        self._relative_path = manifest.relative_path
+        if self._count - self._last_checkpoint_count >= self._interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Sync the output to disk, then write a checkpoint of everything written so far.
+
+        Raises:
+            rudi_dire_insp.exceptions.CheckpointError
+        """
+        if self._relative_path is None:
+            return
+        self._writer.flush()
+        try:
+            os.fsync(self._output_file.fileno())
+        except OSError as error:
+            raise my_exceptions.CheckpointError("Unable to sync the output to disk") from error
+        checkpoint = Checkpoint(self._relative_path, self._output_file.tell(), self._count, self._options)
+        write_checkpoint(self._checkpoint_path, checkpoint)
+        self._last_checkpoint_count = self._count
+        _LOGGER.debug("Wrote checkpoint: %s", str(checkpoint))
+
+    def complete(self):
+        """Flush the output and remove the checkpoint, once the inspection has completed.
+
+        Raises:
+            rudi_dire_insp.exceptions.CheckpointError
+        """
+        self._writer.flush()
+        try:
+            os.remove(self._checkpoint_path)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            raise my_exceptions.CheckpointError(
+                "Unable to remove checkpoint: {}".format(self._checkpoint_path)) from error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._writer.flush()
+
+
+def open_resumed_output(
+        output_path: str,
+        checkpoint: Checkpoint,
+        options: typing.Dict[str, typing.Any]) -> typing.BinaryIO:
+    """Open an output to resume writing it after a checkpoint, dropping anything written after the checkpoint.
+
+    Args:
+        output_path (str): The path to the output.
+        checkpoint (Checkpoint): The checkpoint written alongside the output.
+        options (dict): The inspection options that change the output, which must be those of the checkpoint.
+
+    Returns:
+        typing.BinaryIO: The output, opened for writing at the end of what the checkpoint records.
+
+    Raises:
+        rudi_dire_insp.exceptions.CheckpointError
+    """
+    if options != checkpoint.options:
+        raise my_exceptions.CheckpointError(
+            "The inspection can't be resumed with other options than {}: {}".format(
+                json.dumps(checkpoint.options, sort_keys=True), json.dumps(options, sort_keys=True)))
+    try:
+        size = os.stat(output_path).st_size
+    except OSError as error:
+        raise my_exceptions.CheckpointError("Unable to find the output to resume: {}".format(output_path)) from error
+    if size < checkpoint.offset:
+        raise my_exceptions.CheckpointError(
+            "The output is shorter than its checkpoint records, {} < {} bytes: {}".format(
+                size, checkpoint.offset, output_path))
+    try:
+        output_file = open(output_path, 'r+b')  # pylint: disable=consider-using-with
+    except OSError as error:
+        raise my_exceptions.CheckpointError("Unable to resume writing the output: {}".format(output_path)) from error
+    try:
+        output_file.truncate(checkpoint.offset)
+        output_file.seek(checkpoint.offset)
+    except OSError as error:
+        output_file.close()
+        raise my_exceptions.CheckpointError("Unable to resume writing the output: {}".format(output_path)) from error
+    return output_file
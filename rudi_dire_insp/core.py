@@ -6,16 +6,31 @@ Core stuff
 """
 
 # Imports from Python distribution
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import itertools
 import logging
+import mmap
 import os
+import threading
+import time
 import typing
 
 # Imports from 3rd party
 
 # Imports from this project
+import rudi_dire_insp.caching as my_caching
 import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.files as my_files
+import rudi_dire_insp.filtering as my_filtering
 import rudi_dire_insp.hashing as my_hashing
 import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.sharding as my_sharding
+import rudi_dire_insp.stats as my_stats
+import rudi_dire_insp.trees as my_trees
+import rudi_dire_insp.walking as my_walking
 
 # Module variables
 _LOGGER = logging.getLogger(__name__)
@@ -34,24 +49,80 @@ def _raise_if_bad_root_directory(path: str):
         raise my_exceptions.DirInspectionError("Root directory path exists, but is not a directory: {}".format(path))
 
 
-# pylint: disable=no-self-use,too-few-public-methods
+# pylint: disable=no-self-use,too-few-public-methods,too-many-instance-attributes
 class _FileInspector:
     """Inspector for a file."""
 
-    def __init__(self, root_dir_path: str):
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            root_dir_path: str,
+            chunk_size: int = my_hashing.DEFAULT_CHUNK_SIZE,
+            threaded_hashing: bool = False,
+            algorithms: typing.Optional[typing.Iterable[str]] = None,
+            cache: typing.Optional[my_caching.HashCache] = None,
+            cancel_event: typing.Optional[threading.Event] = None,
+            stats: typing.Optional[my_stats.InspectionStats] = None,
+            hard_links: typing.Optional[my_files.HardLinkMap] = None,
+            sampled: bool = False,
+            mmap_threshold: typing.Optional[int] = None):
         """Constructor
 
         Args:
             root_dir_path (str): The path to the root of the directory structure that contains the file
                 being inspected.  This is the "root" in terms of the overall set of files and directories
                 being inspected, not necessarily the absolute path to the root of the file system etc.
+            chunk_size (int): The maximum number of bytes read from a file at a time while hashing it.
+            threaded_hashing (bool): If true, each digest is updated on its own thread while hashing a file.
+            algorithms (iterable): Names of the hashing algorithms to use, see
+                :py:data:`rudi_dire_insp.hashing.ALGORITHM_NAMES`.  If None, the algorithms named by
+                :py:data:`rudi_dire_insp.hashing.DEFAULT_ALGORITHM_NAMES` are used.
+            cache (rudi_dire_insp.caching.HashCache): If given, hashes are looked up in this cache before a file
+                is opened, and hashes calculated for files are stored in it.
+            cancel_event (threading.Event): If given, reading of file content stops with an error as soon as this
+                event is set.
+            stats (rudi_dire_insp.stats.InspectionStats): If given, timings and counters for each file inspected
+                are added to these stats.
+            hard_links (rudi_dire_insp.files.HardLinkMap): If given, files with other hard links already inspected
+                through this map aren't read again, and files with several links are added to it.
+            sampled (bool): If true, files are given sampled fingerprints instead of hashes of all of their content,
+                see :py:meth:`rudi_dire_insp.hashing._HashAlgorithm.calculate_sampled_hashes`.  The cache is not
+                used for them, since it holds full hashes.
+            mmap_threshold (int): If given, files of at least this many bytes are memory mapped and hashed in place
+                instead of being read into a buffer, unless they can't be mapped or there is a cancel event.
 
         Raises:
             rudi_dire_insp.exceptions.DirInspectionError
+            rudi_dire_insp.exceptions.HashError
         """
         _raise_if_bad_root_directory(root_dir_path)
+        # pylint: disable=protected-access
+        my_hashing._raise_if_bad_chunk_size(chunk_size)
         self._root_dir_path = root_dir_path
         self._real_root_dir_path = os.path.realpath(self._root_dir_path)
+        self._chunk_size = chunk_size
+        self._threaded_hashing = threaded_hashing
+        self._algorithms = my_hashing._HashAlgorithm.from_names(algorithms)
+        self._algorithm_names = tuple(algorithm.algorithm_name for algorithm in self._algorithms)
+        self._cache = None if sampled else cache
+        self._cancel_event = cancel_event
+        self._stats = stats
+        self._hard_links = hard_links
+        self._sampled = sampled
+        self._mmap_threshold = mmap_threshold
+        # Files that fit in one chunk, and wouldn't be mapped, are read whole through a raw file descriptor
+        self._small_file_size = chunk_size if mmap_threshold is None else min(chunk_size, mmap_threshold - 1)
+        self._digest_templates = my_hashing._DigestTemplates(self._algorithms)
+
+    def __getstate__(self):
+        # The cache, cancel event, stats and hard links can't cross process boundaries, copies sent to worker
+        # processes go without them
+        state = dict(self.__dict__)
+        state['_cache'] = None
+        state['_cancel_event'] = None
+        state['_stats'] = None
+        state['_hard_links'] = None
+        return state
 
     def _raise_if_not_sub_path(self, path: str):
         """Raises an exception of the given path is not a sub path of the root directory path being inspected.
@@ -69,73 +140,587 @@ class _FileInspector:
                 "File path is not a child of the root directory path '{}' : '{}'".format(
                     self._root_dir_path, path))
 
-    def _inspect_stream(self, stream: typing.BinaryIO) -> my_manifests.RawBytesManifest:
+    def _inspect_stream(self, stream: 'my_hashing._ReadableStream') -> my_manifests.RawBytesManifest:
         """Inspects the given byte stream and returns an incomplete manifest entry for it.
 
         Args:
-            stream (typing.BinaryIO): The binary input representing the file content being inspected.
+            stream (_ReadableStream): The binary input representing the file content being inspected.
 
         Returns:
             rudi_dire_insp.manifests.FileManifest
         """
         # pylint: disable=protected-access
-        (hashes, size) = my_hashing._HashAlgorithm.calculate_hashes(stream)
+        (hashes, size) = my_hashing._HashAlgorithm.calculate_hashes(
+            stream, chunk_size=self._chunk_size, threaded=self._threaded_hashing, algorithms=self._algorithms,
+            stats=self._stats)
         manifest = my_manifests.RawBytesManifest(hashes, size)
 
         if _LOGGER.isEnabledFor(logging.DEBUG):
             _LOGGER.debug("Created raw bytes manifest for byte stream: %s", str(manifest))
         return manifest
 
-    def inspect(self, path: str) -> my_manifests.FileManifest:
-        """Inspect the file at the given path and returns a manifest entry for it.
+    def _map_if_large(self, input_file: typing.BinaryIO) -> typing.Optional[mmap.mmap]:
+        """Memory map the open file if it is at least as large as the threshold, and it can be mapped."""
+        # Hashing a mapping can't be interrupted part way through, so cancellable inspections always read
+        if self._mmap_threshold is None or self._cancel_event is not None:
+            return None
+        size = os.fstat(input_file.fileno()).st_size
+        if size < max(self._mmap_threshold, 1):
+            return None
+        return my_files.map_file(input_file)
+
+    def _inspect_mapping(self, mapping: mmap.mmap) -> my_manifests.RawBytesManifest:
+        """Hash the memory mapped content of a file in place and return an incomplete manifest entry for it."""
+        # pylint: disable=protected-access
+        (hashes, size) = my_hashing._HashAlgorithm.calculate_mapped_hashes(
+            mapping, chunk_size=self._chunk_size, threaded=self._threaded_hashing, algorithms=self._algorithms,
+            stats=self._stats)
+        return my_manifests.RawBytesManifest(hashes, size)
+
+    def _fingerprint_file(self, input_file: typing.BinaryIO) -> my_manifests.RawBytesManifest:
+        """Calculate a sampled fingerprint of an open file and return an incomplete manifest entry for it."""
+        size = os.fstat(input_file.fileno()).st_size
+        # pylint: disable=protected-access
+        hashes = my_hashing._HashAlgorithm.calculate_sampled_hashes(
+            input_file, size, algorithms=self._algorithms, stats=self._stats)
+        return my_manifests.RawBytesManifest(hashes, size, sampled=True)
+
+    def _validate_file_path(self, path: str) -> str:
+        """Verify the path points to a file under the root directory path.
 
         Args:
-            path (str): The path on the file system to inspect.  Must be a child of the root directory path
-                used as a parameter to the constructor of this class.
+            path (str): The path on the file system to verify.
 
         Returns:
-            rudi_dire_insp.manifests.FileManifest
+            str: The absolute version of the path.
+
+        Raises:
+            rudi_dire_insp.exceptions.FileInspectionError
         """
-        # Verify the path points to a file
         abs_path = os.path.abspath(path)
         if not os.path.exists(abs_path):
             raise my_exceptions.FileInspectionError("File at path does not exist: {}".format(abs_path))
         if not os.path.isfile(abs_path):
             raise my_exceptions.FileInspectionError("Path does not point to a file: {}".format(abs_path))
         self._raise_if_not_sub_path(path)
+        return abs_path
+
+    def _check_cache(
+            self,
+            file_entry: my_walking._FileEntry) -> typing.Tuple[
+                typing.Optional[os.stat_result], typing.Optional[my_manifests.FileManifest]]:
+        """Look up the file in the hash cache, if there is one.
+
+        Args:
+            file_entry (rudi_dire_insp.walking._FileEntry): The file to look up.
+
+        Returns:
+            tuple: The status of the file (or None if there is no cache) and the manifest built from the cached
+            hashes (or None if the cache couldn't provide them).
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        if self._cache is None:
+            return None, None
+        if self._stats is not None:
+            start = time.perf_counter()
+        stat_result = file_entry.stat()
+        hashes = self._cache.lookup(stat_result, self._algorithm_names)
+        if self._stats is not None:
+            self._stats.add_stage_time('cache', time.perf_counter() - start)
+        if hashes is None:
+            return stat_result, None
+        raw_manifest = my_manifests.RawBytesManifest(hashes, stat_result.st_size)
+        return stat_result, my_manifests.FileManifest(file_entry.relative_path, raw_manifest)
+
+    def _check_known(
+            self,
+            file_entry: my_walking._FileEntry) -> typing.Tuple[
+                typing.Optional[os.stat_result], typing.Optional[my_manifests.FileManifest]]:
+        """Look up the file among the hard links already inspected, then in the hash cache.
+
+        Args:
+            file_entry (rudi_dire_insp.walking._FileEntry): The file to look up.
+
+        Returns:
+            tuple: The status of the file (or None if there is neither a hard link map nor a cache) and the manifest
+            of the file (or None if it has to be read, see :py:meth:`_update_known`).
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        if self._hard_links is None:
+            return self._check_cache(file_entry)
+        stat_result = file_entry.stat()
+        future = self._hard_links.lookup(stat_result)
+        if future is not None:
+            # Another link may still be being inspected, in which case this waits for it
+            raw_manifest = future.result()
+            if raw_manifest is not None:
+                return stat_result, my_manifests.FileManifest(file_entry.relative_path, raw_manifest)
+        try:
+            (_, file_manifest) = self._check_cache(file_entry)
+        except BaseException:
+            self._hard_links.release(stat_result, None)
+            raise
+        if file_manifest is not None:
+            self._hard_links.release(stat_result, file_manifest.raw_manifest)
+        return stat_result, file_manifest
+
+    def _update_known(
+            self,
+            stat_result: os.stat_result,
+            file_manifest: typing.Optional[my_manifests.FileManifest]):
+        """Remember the manifest of a file that had to be read, for its other hard links and in the hash cache.
+
+        Must be called for every file :py:meth:`_check_known` returned a status but no manifest for, with None if
+        reading the file failed, so that other links to it don't wait for it forever.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        if self._hard_links is not None:
+            self._hard_links.release(stat_result, None if file_manifest is None else file_manifest.raw_manifest)
+        if file_manifest is not None:
+            self._update_cache(stat_result, file_manifest)
+
+    def _update_cache(self, stat_result: os.stat_result, file_manifest: my_manifests.FileManifest):
+        """Store the hashes in the file manifest in the hash cache, if there is one.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+        """
+        if self._cache is not None:
+            if self._stats is not None:
+                start = time.perf_counter()
+            self._cache.store(stat_result, file_manifest.raw_manifest.hashes, self._real_root_dir_path)
+            if self._stats is not None:
+                self._stats.add_stage_time('cache', time.perf_counter() - start)
 
-        # Build the manifest
-        with open(abs_path, 'rb') as input_file:
-            raw_manifest = self._inspect_stream(input_file)
-            relative_path = os.path.relpath(abs_path, self._root_dir_path)
-            rel_path_as_tuple = os.path.split(relative_path)
-            file_manifest = my_manifests.FileManifest(rel_path_as_tuple, raw_manifest)
+    def _inspect_small_file(
+            self,
+            file_entry: my_walking._FileEntry) -> typing.Optional[my_manifests.RawBytesManifest]:
+        """Read a file no larger than one chunk whole, and hash it from memory.
+
+        A raw file descriptor is used, with none of the file object or buffering layers, and the digests are copied
+        from templates.  For trees of tiny files, those costs are most of the cost of inspecting each file.
+
+        Returns:
+            rudi_dire_insp.manifests.RawBytesManifest: The manifest, or None if the file is larger than one chunk,
+            or grew past its size since it was found, so it has to be read in chunks.
+
+        Raises:
+            rudi_dire_insp.exceptions.HashError
+        """
+        size = file_entry.stat().st_size
+        if size > self._small_file_size:
+            return None
+        if self._cancel_event is not None and self._cancel_event.is_set():
+            # As reading through a cancellable reader would fail
+            raise my_exceptions.HashError("Error calculating hashes") from my_exceptions.FileInspectionError(
+                "Inspection was cancelled")
+        if self._stats is not None:
+            start = time.perf_counter()
+        file_descriptor = os.open(file_entry.path, my_files.SMALL_FILE_FLAGS)
+        try:
+            if self._stats is not None:
+                self._stats.add_stage_time('open', time.perf_counter() - start)
+                start = time.perf_counter()
+            try:
+                data = my_files.read_small_file(file_descriptor, size)
+            except OSError as error:
+                raise my_exceptions.HashError("Error calculating hashes") from error
+        finally:
+            os.close(file_descriptor)
+        if len(data) > size:
+            return None
+        if self._stats is not None:
+            self._stats.add_stage_time('read', time.perf_counter() - start)
+        hashes = self._digest_templates.calculate_hashes(data, self._stats)
+        return my_manifests.RawBytesManifest(hashes, len(data))
+
+    def _inspect_content(self, file_entry: my_walking._FileEntry) -> my_manifests.FileManifest:
+        """Read and hash the content of the file, ignoring any hash cache."""
+        if not self._sampled:
+            raw_manifest = self._inspect_small_file(file_entry)
+            if raw_manifest is not None:
+                return my_manifests.FileManifest(file_entry.relative_path, raw_manifest)
+        if self._stats is not None:
+            start = time.perf_counter()
+        # The hashing reads in chunks of its own, so skip the buffered IO layer.
+        with open(file_entry.path, 'rb', buffering=0) as input_file:
+            if self._stats is not None:
+                self._stats.add_stage_time('open', time.perf_counter() - start)
+            mapping = None if self._sampled else self._map_if_large(input_file)
+            if self._sampled:
+                raw_manifest = self._fingerprint_file(input_file)
+            elif mapping is not None:
+                with mapping:
+                    raw_manifest = self._inspect_mapping(mapping)
+            elif self._cancel_event is not None:
+                raw_manifest = self._inspect_stream(my_files.CancellableReader(input_file, self._cancel_event))
+            else:
+                raw_manifest = self._inspect_stream(input_file)
+        return my_manifests.FileManifest(file_entry.relative_path, raw_manifest)
+
+    def inspect_entry(self, file_entry: my_walking._FileEntry) -> my_manifests.FileManifest:
+        """Inspect a file found by :py:func:`rudi_dire_insp.walking.walk_files` and return a manifest entry for it.
+
+        The entry has already been verified to be a file under the root directory, so unlike :py:meth:`inspect`
+        no further checks are made on its path.  If there is a hard link map or a hash cache, they are checked before
+        the file is opened.
+
+        Args:
+            file_entry (rudi_dire_insp.walking._FileEntry): The file to inspect.
+
+        Returns:
+            rudi_dire_insp.manifests.FileManifest
+        """
+        if self._stats is not None:
+            start = time.perf_counter()
+        (stat_result, file_manifest) = self._check_known(file_entry)
+        if file_manifest is None:
+            try:
+                file_manifest = self._inspect_content(file_entry)
+            finally:
+                if stat_result is not None:
+                    self._update_known(stat_result, file_manifest)
+        if self._stats is not None:
+            self._stats.add_file(file_entry.relative_path, time.perf_counter() - start)
 
         if _LOGGER.isEnabledFor(logging.DEBUG):
-            _LOGGER.debug("Created file manifest for file %s : %s", abs_path, str(file_manifest))
+            _LOGGER.debug("Created file manifest for file %s : %s", file_entry.path, str(file_manifest))
 
         return file_manifest
 
+    def inspect(self, path: str) -> my_manifests.FileManifest:
+        """Inspect the file at the given path and returns a manifest entry for it.
+
+        If there is a hash cache, it is checked before the file is opened.
+
+        Args:
+            path (str): The path on the file system to inspect.  Must be a child of the root directory path
+                used as a parameter to the constructor of this class.
+
+        Returns:
+            rudi_dire_insp.manifests.FileManifest
+        """
+        abs_path = self._validate_file_path(path)
+        relative_path = os.path.relpath(abs_path, self._root_dir_path)
+        # pylint: disable=protected-access
+        file_entry = my_walking._FileEntry(abs_path, os.path.split(relative_path))
+        return self.inspect_entry(file_entry)
+
+
+def _raise_if_bad_workers(workers: int):
+    """Raise an exception if the number of workers can't be used to size a worker pool
+
+    Args:
+          workers (int): Candidate number of workers.
+    Raises:
+        rudi_dire_insp.exceptions.DirInspectionError
+    """
+    if isinstance(workers, bool) or not isinstance(workers, int) or workers < 1:
+        raise my_exceptions.DirInspectionError("Number of workers must be a positive integer: {!r}".format(workers))
+
+
+def _map_ordered(
+        submit: typing.Callable[[typing.Any], concurrent.futures.Future],
+        items: typing.Iterable,
+        max_pending: int) -> typing.Iterator:
+    """Submit work for each of the items, yielding the results in the same order as the items.
 
-# pylint: disable=no-self-use,too-few-public-methods
+    Only ``max_pending`` items are submitted ahead of the result being waited on, so memory use is bounded no matter
+    how many items there are.
+
+    Args:
+        submit (Callable): Submits the work for an item, returning the future for its result.
+        items (iterable): The items to submit work for.
+        max_pending (int): The maximum number of items with results not yet yielded.
+    """
+    pending = collections.deque()  # type: typing.Deque[concurrent.futures.Future]
+    try:
+        for item in items:
+            pending.append(submit(item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _map_unordered(
+        submit: typing.Callable[[typing.Any], concurrent.futures.Future],
+        items: typing.Iterable,
+        max_pending: int) -> typing.Iterator:
+    """Submit work for each of the items, yielding each result as soon as it is ready.
+
+    Only ``max_pending`` items are submitted at any one time, so memory use is bounded no matter how many items
+    there are.
+
+    Args:
+        submit (Callable): Submits the work for an item, returning the future for its result.
+        items (iterable): The items to submit work for.
+        max_pending (int): The maximum number of items with results not yet yielded.
+    """
+    pending = set()  # type: typing.Set[concurrent.futures.Future]
+    try:
+        for item in items:
+            pending.add(submit(item))
+            if len(pending) >= max_pending:
+                (done, pending) = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            (done, pending) = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _update_known_when_done(
+        file_inspector: _FileInspector,
+        stat_result: os.stat_result,
+        future: concurrent.futures.Future):
+    """Future callback that remembers the hashes from an inspected file, or that it couldn't be inspected, see
+    :py:meth:`_FileInspector._update_known`."""
+    if future.cancelled() or future.exception() is not None:
+        file_manifest = None
+    else:
+        file_manifest = future.result()
+    try:
+        # pylint: disable=protected-access
+        file_inspector._update_known(stat_result, file_manifest)
+    except my_exceptions.CacheError as error:
+        _LOGGER.warning("Unable to store hashes in the cache: %s", str(error))
+
+
+def _submit_inspection(
+        executor: concurrent.futures.Executor,
+        file_inspector: _FileInspector,
+        file_entry: my_walking._FileEntry) -> concurrent.futures.Future:
+    """Submit the inspection of a file to an executor."""
+    return executor.submit(file_inspector.inspect_entry, file_entry)
+
+
+def _submit_w_local_lookups(
+        executor: concurrent.futures.Executor,
+        file_inspector: _FileInspector,
+        file_entry: my_walking._FileEntry) -> concurrent.futures.Future:
+    """Submit the inspection of a file to an executor, handling hard links and the hash cache on the calling thread.
+
+    This is used for process pools, since neither can be shared with the worker processes.  Files already known are
+    returned as already completed futures without involving the executor at all.
+    """
+    # pylint: disable=protected-access
+    (stat_result, file_manifest) = file_inspector._check_known(file_entry)
+    if file_manifest is not None:
+        future = concurrent.futures.Future()  # type: concurrent.futures.Future
+        future.set_result(file_manifest)
+        return future
+    future = executor.submit(file_inspector.inspect_entry, file_entry)
+    if stat_result is not None:
+        future.add_done_callback(functools.partial(_update_known_when_done, file_inspector, stat_result))
+    return future
+
+
+def _next_batch(items: typing.Iterator, max_size: int) -> typing.List:
+    """Take up to ``max_size`` items from the iterator, returning an empty list once it is exhausted."""
+    return list(itertools.islice(items, max_size))
+
+
+# pylint: disable=no-self-use,too-few-public-methods,too-many-instance-attributes
 class DirectoryInspector:
     """Inspector for the top-most directory being inspected."""
 
-    def __init__(self):
-        """Constructor"""
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            chunk_size: int = my_hashing.DEFAULT_CHUNK_SIZE,
+            threaded_hashing: bool = False,
+            workers: int = 1,
+            use_processes: bool = False,
+            ordered: bool = True,
+            algorithms: typing.Optional[typing.Iterable[str]] = None,
+            cache: typing.Optional[my_caching.HashCache] = None,
+            stats: typing.Optional[my_stats.InspectionStats] = None,
+            hard_links: bool = True,
+            sampled: bool = False,
+            mmap_threshold: typing.Optional[int] = None,
+            shard: typing.Optional[my_sharding.Shard] = None,
+            path_filter: typing.Optional[my_filtering.PathFilter] = None):
+        """Constructor
 
-    def inspect(self, path: str) -> typing.Iterable[my_manifests.FileManifest]:
+        Args:
+            chunk_size (int): The maximum number of bytes read from a file at a time while hashing it.  Memory used
+                for hashing stays at about this size no matter how large the inspected files are.
+            threaded_hashing (bool): If true, each digest is updated on its own thread while hashing a file.  This
+                pays off for files larger than the chunk size on machines with spare cores.
+            workers (int): The number of files inspected at the same time.  When greater than one, files are
+                inspected on a pool of this many workers.
+            use_processes (bool): If true, the worker pool uses processes instead of threads.
+            ordered (bool): If true, manifests are yielded in the order the files were found while walking the
+                directory.  Otherwise they are yielded as soon as each file has been inspected.  Only relevant when
+                there is more than one worker.
+            algorithms (iterable): Names of the hashing algorithms to use, see
+                :py:data:`rudi_dire_insp.hashing.ALGORITHM_NAMES`.  If None, the algorithms named by
+                :py:data:`rudi_dire_insp.hashing.DEFAULT_ALGORITHM_NAMES` are used.  Only these algorithms are
+                calculated, and only they appear in the hashes of the resulting manifests.
+            cache (rudi_dire_insp.caching.HashCache): If given, hashes are looked up in this cache before each file
+                is opened, and hashes calculated for files are stored in it.  Once a directory has been completely
+                inspected, entries for files under it that no longer exist are evicted from the cache.
+            stats (rudi_dire_insp.stats.InspectionStats): If given, timings and counters of every inspection are
+                added to these stats.
+            hard_links (bool): If true, a file with several hard links is only read once per inspection, and its
+                manifest reused for its other links.  This takes the status of every file, and memory for up to
+                :py:data:`rudi_dire_insp.files.DEFAULT_MAX_HARD_LINKS` manifests of files with links still to be seen.
+            sampled (bool): If true, files are given sampled fingerprints of their size and a few fixed blocks of
+                their content instead of hashes of all of it.  This takes about the same time whatever the size of
+                the files, but only detects changes that touch the size or a sampled block.  The manifests are
+                marked as sampled, and :py:meth:`upgrade` replaces them with full hashes.  Can't be used with a
+                cache.
+            mmap_threshold (int): If given, files of at least this many bytes are memory mapped and their pages
+                handed straight to the digests, instead of being copied into a buffer by reads.  Files that can't be
+                mapped are read as usual, as are all files inspected by :py:meth:`ainspect`.  A file truncated by
+                another process while it is being hashed this way kills the process with SIGBUS, so only use this
+                on trees that aren't being written to.
+            shard (rudi_dire_insp.sharding.Shard): If given, only the files that belong to this shard are inspected,
+                see :py:func:`rudi_dire_insp.sharding.merge_shards` to combine the outputs of every shard.  The
+                cache isn't evicted from after inspecting a shard, since it didn't see the other files.
+            path_filter (rudi_dire_insp.filtering.PathFilter): If given, only the files it matches are inspected, and
+                the directories it prunes are never listed.  Files are matched before they are opened.  The cache
+                isn't evicted from after a filtered inspection either.
+
+        Raises:
+            rudi_dire_insp.exceptions.DirInspectionError
+            rudi_dire_insp.exceptions.HashError
+        """
+        # pylint: disable=protected-access
+        my_hashing._raise_if_bad_chunk_size(chunk_size)
+        _raise_if_bad_workers(workers)
+        if sampled and cache is not None:
+            raise my_exceptions.DirInspectionError("A hash cache can't be used for sampled fingerprints")
+        if mmap_threshold is not None and (
+                isinstance(mmap_threshold, bool) or not isinstance(mmap_threshold, int) or mmap_threshold < 1):
+            raise my_exceptions.DirInspectionError(
+                "Memory map threshold must be a positive integer: {!r}".format(mmap_threshold))
+        self._chunk_size = chunk_size
+        self._threaded_hashing = threaded_hashing
+        self._workers = workers
+        self._use_processes = use_processes
+        self._ordered = ordered
+        self._algorithm_names = tuple(
+            algorithm.algorithm_name for algorithm in my_hashing._HashAlgorithm.from_names(algorithms))
+        self._cache = cache
+        self._stats = stats
+        self._hard_links = hard_links
+        self._sampled = sampled
+        self._mmap_threshold = mmap_threshold
+        self._shard = shard
+        self._path_filter = path_filter
+
+    @property
+    def stats(self) -> typing.Optional[my_stats.InspectionStats]:
+        """rudi_dire_insp.stats.InspectionStats: The stats collected by this inspector, if any."""
+        return self._stats
+
+    @property
+    def algorithm_names(self) -> typing.Tuple[str, ...]:
+        """tuple: Names of the hashing algorithms used by this inspector."""
+        return self._algorithm_names
+
+    def _new_file_inspector(
+            self,
+            path: str,
+            sampled: typing.Optional[bool] = None,
+            **extra_options) -> _FileInspector:
+        """Create a file inspector for the root directory at the path, configured like this inspector.
+
+        Hard links are only tracked within a single inspection, since files may have changed between them.
+        """
+        return _FileInspector(
+            path,
+            chunk_size=self._chunk_size,
+            threaded_hashing=self._threaded_hashing,
+            algorithms=self._algorithm_names,
+            cache=self._cache,
+            stats=self._stats,
+            hard_links=my_files.HardLinkMap() if self._hard_links else None,
+            sampled=self._sampled if sampled is None else sampled,
+            mmap_threshold=self._mmap_threshold,
+            **extra_options)
+
+    def _walk(
+            self,
+            path: str,
+            resume_after: typing.Optional[typing.Tuple[str, ...]] = None) -> typing.Generator[
+                my_walking._FileEntry, None, None]:
+        """Walk the directory at the path, yielding the entries of the files this inspector inspects."""
+        walk = my_walking.walk_files(path, self._stats, resume_after, self._path_filter)
+        file_entries = walk  # type: typing.Iterator[my_walking._FileEntry]
+        if self._shard is not None:
+            file_entries = (
+                file_entry for file_entry in file_entries if self._shard.contains(file_entry.relative_path))
+        if self._stats is not None:
+            file_entries = self._stats.timed('walk', file_entries)
+        try:
+            yield from file_entries
+        finally:
+            # Closing the filters above doesn't close the walk they take their entries from
+            walk.close()
+
+    def _evicts_cache(self) -> bool:
+        """Check whether unused cache entries can be evicted after inspecting a whole directory, if there is a cache."""
+        return self._shard is None and self._path_filter is None
+
+    def _inspect_in_pool(
+            self,
+            file_inspector: _FileInspector,
+            file_entries: typing.Iterable[my_walking._FileEntry]) -> typing.Iterator[my_manifests.FileManifest]:
+        """Inspect the files on a pool of workers, yielding manifests as configured for this inspector."""
+        if self._use_processes:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self._workers)  # type: concurrent.futures.Executor
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._workers, thread_name_prefix='file-inspector')
+        if self._use_processes and (self._cache is not None or self._hard_links):
+            submit = functools.partial(_submit_w_local_lookups, executor, file_inspector)
+        else:
+            submit = functools.partial(_submit_inspection, executor, file_inspector)
+        map_func = _map_ordered if self._ordered else _map_unordered
+        with executor:
+            for file_manifest in map_func(submit, file_entries, self._workers * 4):
+                # Worker processes can't add to the stats, so at least count their files here
+                if self._use_processes and self._stats is not None:
+                    self._stats.add_file(file_manifest.relative_path)
+                yield file_manifest
+
+    def inspect(
+            self,
+            path: str,
+            resume_after: typing.Optional[typing.Tuple[str, ...]] = None) -> typing.Iterable[
+                my_manifests.FileManifest]:
         """Inspect the directory and its contents, starting at the given path.
 
         Acts as a Python generator (yielding manifests as return values)
 
         Args:
             path (str): The path to the directory on the file system to inspect.
+            resume_after (tuple): If given, an earlier inspection is resumed after the file with this relative path,
+                the last one it yielded in walk order.  Only the files after it are inspected, and unused cache
+                entries aren't evicted since the files before it weren't seen.
 
         Yields:
             rudi_dire_insp.manifests.FileManifest: FileManifest for a file within the path inspected.
 
         Raises:
+            rudi_dire_insp.exceptions.CacheError
             rudi_dire_insp.exceptions.DirInspectionError
             rudi_dire_insp.exceptions.FileInspectionError
             rudi_dire_insp.exceptions.HashError
@@ -144,12 +729,161 @@ class DirectoryInspector:
         _raise_if_bad_root_directory(path)
 
         # Create a file inspector
-        file_inspector = _FileInspector(path)
+        file_inspector = self._new_file_inspector(path)
+        if self._cache is not None:
+            self._cache.begin_run()
 
         # Walk the directory and yield manifests
-        abs_path = os.path.abspath(path)
-        for dir_path, _, file_names in os.walk(abs_path):
-            for file_name in file_names:
-                file_path = os.path.join(dir_path, file_name)
-                file_manifest = file_inspector.inspect(file_path)
+        file_entries = self._walk(path, resume_after)
+        if self._workers > 1:
+            yield from self._inspect_in_pool(file_inspector, file_entries)
+        else:
+            for file_entry in file_entries:
+                file_manifest = file_inspector.inspect_entry(file_entry)
                 yield file_manifest
+
+        # Only now that every file has been seen is it safe to drop the cache entries that weren't used
+        if self._cache is not None and self._evicts_cache() and resume_after is None:
+            self._cache.evict_unused(os.path.realpath(path))
+
+    def inspect_tree(self, path: str) -> typing.Iterator[
+            typing.Union[my_manifests.FileManifest, my_manifests.DirectoryManifest]]:
+        """Inspect the directory like :py:meth:`inspect`, also yielding a manifest for each directory holding files.
+
+        Each directory manifest aggregates the manifests of every file under it, see
+        :py:class:`rudi_dire_insp.manifests.DirectoryManifest`, and is yielded as soon as the last of them has been,
+        so the root directory comes last.  The file manifests must come in walk order, so this can't be used by an
+        unordered inspector with more than one worker.
+
+        Args:
+            path (str): The path to the directory on the file system to inspect.
+
+        Yields:
+            rudi_dire_insp.manifests.FileManifest or rudi_dire_insp.manifests.DirectoryManifest
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+            rudi_dire_insp.exceptions.DirInspectionError
+            rudi_dire_insp.exceptions.FileInspectionError
+            rudi_dire_insp.exceptions.HashError
+        """
+        if not self._ordered and self._workers > 1:
+            raise my_exceptions.DirInspectionError("Directory manifests need the files inspected in walk order")
+        return my_trees.aggregate_directories(self.inspect(path))
+
+    def upgrade(
+            self,
+            path: str,
+            manifests: typing.Iterable[my_manifests.FileManifest],
+            relative_paths: typing.Optional[typing.Iterable[typing.Tuple[str, ...]]] = None) -> typing.Iterator[
+                my_manifests.FileManifest]:
+        """Replace sampled fingerprints with hashes of the whole content of the files, as an inspection would give.
+
+        Files are inspected one at a time with the hashing algorithms, chunk size and cache of this inspector,
+        whether or not it makes sampled fingerprints itself.
+
+        Args:
+            path (str): The path to the directory the manifests were made from.
+            manifests (iterable): The manifests to upgrade.
+            relative_paths (iterable): If given, only the sampled manifests of files with these relative paths are
+                upgraded.
+
+        Yields:
+            rudi_dire_insp.manifests.FileManifest: Each of the manifests, in the same order, with full hashes if it
+            was upgraded and unchanged otherwise.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+            rudi_dire_insp.exceptions.DirInspectionError
+            rudi_dire_insp.exceptions.FileInspectionError
+            rudi_dire_insp.exceptions.HashError
+        """
+        _raise_if_bad_root_directory(path)
+        file_inspector = self._new_file_inspector(path, sampled=False)
+        if relative_paths is not None:
+            relative_paths = set(tuple(relative_path) for relative_path in relative_paths)
+        for manifest in manifests:
+            if manifest.raw_manifest.sampled and (relative_paths is None or manifest.relative_path in relative_paths):
+                manifest = file_inspector.inspect(os.path.join(path, *manifest.relative_path))
+            yield manifest
+
+    # pylint: disable=too-many-locals
+    async def ainspect(
+            self,
+            path: str,
+            max_pending: typing.Optional[int] = None) -> typing.AsyncIterator[my_manifests.FileManifest]:
+        """Inspect the directory and its contents from asyncio code, starting at the given path.
+
+        Acts as an asynchronous generator, yielding manifests as soon as each file has been inspected, so they are
+        not in walk order.  Walking the directory, reading files and hashing them all happen on a private thread
+        pool, leaving the event loop and its default executor free.
+
+        If the consumer stops early (or is cancelled), files not yet started are abandoned and reading of files in
+        progress stops at the next chunk.  The generator only returns once the work already running on its thread
+        pool is done, and the walk closed.
+
+        Args:
+            path (str): The path to the directory on the file system to inspect.
+            max_pending (int): The maximum number of files being inspected at the same time.  Defaults to the number
+                of workers this inspector was created with.
+
+        Yields:
+            rudi_dire_insp.manifests.FileManifest: FileManifest for a file within the path inspected.
+
+        Raises:
+            rudi_dire_insp.exceptions.CacheError
+            rudi_dire_insp.exceptions.DirInspectionError
+            rudi_dire_insp.exceptions.FileInspectionError
+            rudi_dire_insp.exceptions.HashError
+        """
+        # Verify function args
+        _raise_if_bad_root_directory(path)
+        if max_pending is None:
+            max_pending = self._workers
+        _raise_if_bad_workers(max_pending)
+
+        loop = asyncio.get_event_loop()
+        cancel_event = threading.Event()
+        file_inspector = self._new_file_inspector(path, cancel_event=cancel_event)
+        # One extra thread, so walking never has to wait behind the files being inspected
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_pending + 1, thread_name_prefix='async-inspector')
+        file_entries = self._walk(path)
+        # The files being inspected, to the work running them on the thread pool
+        pending = {}  # type: typing.Dict[asyncio.Future, concurrent.futures.Future]
+        walk_batch = None  # type: typing.Optional[concurrent.futures.Future]
+        try:
+            if self._cache is not None:
+                await loop.run_in_executor(executor, self._cache.begin_run)
+
+            walk_finished = False
+            while True:
+                # Top up the files being inspected
+                while not walk_finished and len(pending) < max_pending:
+                    walk_batch = executor.submit(_next_batch, file_entries, max_pending - len(pending))
+                    batch = await asyncio.wrap_future(walk_batch)
+                    walk_finished = not batch
+                    for file_entry in batch:
+                        inspection = executor.submit(file_inspector.inspect_entry, file_entry)
+                        pending[asyncio.wrap_future(inspection)] = inspection
+                if not pending:
+                    break
+
+                (done, _) = await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    del pending[future]
+                    yield future.result()
+
+            # Only now that every file has been seen is it safe to drop the cache entries that weren't used
+            if self._cache is not None and self._evicts_cache():
+                await loop.run_in_executor(executor, self._cache.evict_unused, os.path.realpath(path))
+        finally:
+            cancel_event.set()
+            # Files not started yet are dropped, and the walk can only be closed once no batch of it is being taken
+            running = [
+                future for future in itertools.chain(pending.values(), [walk_batch])
+                if future is not None and not future.cancel()]
+            if running:
+                await asyncio.wait([asyncio.wrap_future(future) for future in running])
+            file_entries.close()
+            executor.shutdown(wait=False)
@@ -0,0 +1,541 @@
+"""
+rudi_dire_insp.diffing
+======================
+
+Comparison of file manifests, either between two inspections or between a stored inspection and a live directory.
+
+Both sides are streamed and merged by relative path, relying on the order in which
+:py:func:`rudi_dire_insp.walking.walk_files` finds files (see :py:func:`rudi_dire_insp.walking.relative_path_key`).
+Memory use therefore depends on the number of differences found, not on the number of files compared.
+"""
+
+# Imports from Python distribution
+import collections
+import contextlib
+import enum
+import logging
+import os
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.caching as my_caching
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.files as my_files
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
+import rudi_dire_insp.walking as my_walking
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+_VERIFY_ALGORITHM_NAME = 'sha256'
+
+
+class DiffKind(enum.Enum):
+    """Kinds of difference found between two sets of file manifests."""
+
+    ADDED = 'added'
+    """A file only in the new set"""
+
+    REMOVED = 'removed'
+    """A file only in the old set"""
+
+    CHANGED = 'changed'
+    """A file at the same path in both sets, with different contents"""
+
+    MOVED = 'moved'
+    """A file only in the old set, and one with the same contents only in the new set"""
+
+
+class Difference:
+    """A difference found between two sets of file manifests."""
+
+    __slots__ = ('_kind', '_relative_path', '_old', '_new')
+
+    def __init__(
+            self,
+            kind: DiffKind,
+            relative_path: typing.Tuple[str, ...],
+            old: typing.Optional[my_manifests.FileManifest],
+            new: typing.Optional[my_manifests.FileManifest]):
+        """Constructor
+
+        Args:
+            kind (DiffKind): The kind of difference.
+            relative_path (tuple): The relative path of the file in the new set, or in the old set if it was removed.
+            old (rudi_dire_insp.manifests.FileManifest): The manifest in the old set, if there is one.
+            new (rudi_dire_insp.manifests.FileManifest): The manifest in the new set, if there is one and it was
+                calculated.
+        """
+        self._kind = kind
+        self._relative_path = relative_path
+        self._old = old
+        self._new = new
+
+    @property
+    def kind(self) -> DiffKind:
+        """DiffKind: The kind of difference."""
+        return self._kind
+
+    @property
+    def relative_path(self) -> typing.Tuple[str, ...]:
+        """tuple: The relative path of the file in the new set, or in the old set if it was removed."""
+        return self._relative_path
+
+    @property
+    def old(self) -> typing.Optional[my_manifests.FileManifest]:
+        """rudi_dire_insp.manifests.FileManifest: The manifest in the old set, None for added files."""
+        return self._old
+
+    @property
+    def new(self) -> typing.Optional[my_manifests.FileManifest]:
+        """rudi_dire_insp.manifests.FileManifest: The manifest in the new set.  None for removed files, and for
+        files in a live directory that didn't need hashing to tell that they differ."""
+        return self._new
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} kind={}, relative_path={}, old={}, new={}>'.format(
+            class_name, self._kind.value, self._relative_path, self._old, self._new)
+
+
+class DirectoryDifference:
+    """A difference found between the directory manifests of two trees, see :py:func:`diff_directories`."""
+
+    __slots__ = ('_kind', '_relative_path', '_old', '_new')
+
+    def __init__(
+            self,
+            kind: DiffKind,
+            relative_path: str,
+            old: typing.Optional[my_manifests.DirectoryManifest],
+            new: typing.Optional[my_manifests.DirectoryManifest]):
+        """Constructor
+
+        Args:
+            kind (DiffKind): The kind of difference, which is about the whole subtree under the directory.
+            relative_path (str): The relative path of the directory in the new tree, or in the old tree if it was
+                removed.
+            old (rudi_dire_insp.manifests.DirectoryManifest): The manifest in the old tree, if there is one.
+            new (rudi_dire_insp.manifests.DirectoryManifest): The manifest in the new tree, if there is one.
+        """
+        self._kind = kind
+        self._relative_path = relative_path
+        self._old = old
+        self._new = new
+
+    @property
+    def kind(self) -> DiffKind:
+        """DiffKind: The kind of difference."""
+        return self._kind
+
+    @property
+    def relative_path(self) -> str:
+        """str: The relative path of the directory in the new tree, or in the old tree if it was removed."""
+        return self._relative_path
+
+    @property
+    def old(self) -> typing.Optional[my_manifests.DirectoryManifest]:
+        """rudi_dire_insp.manifests.DirectoryManifest: The manifest in the old tree, None for added directories."""
+        return self._old
+
+    @property
+    def new(self) -> typing.Optional[my_manifests.DirectoryManifest]:
+        """rudi_dire_insp.manifests.DirectoryManifest: The manifest in the new tree, None for removed directories."""
+        return self._new
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} kind={}, relative_path={}, old={}, new={}>'.format(
+            class_name, self._kind.value, self._relative_path, self._old, self._new)
+
+
+def _in_path_order(items: typing.Iterable, side: str) -> typing.Iterator[typing.Tuple[bytes, typing.Any]]:
+    """Pair each item with its relative path key, checking that the keys strictly increase.
+
+    Raises:
+        rudi_dire_insp.exceptions.ManifestFormatError
+    """
+    last_key = None
+    for item in items:
+        key = my_walking.relative_path_key(item.relative_path)
+        if last_key is not None and key <= last_key:
+            raise my_exceptions.ManifestFormatError(
+                "The {} manifests are not sorted by relative path, at: {}".format(side, item.relative_path))
+        last_key = key
+        yield key, item
+
+
+def _merge_by_path(old_items: typing.Iterable, new_items: typing.Iterable) -> typing.Iterator[typing.Tuple]:
+    """Merge two streams sorted by relative path, yielding a pair of the items at each path, None for a missing one.
+
+    Raises:
+        rudi_dire_insp.exceptions.ManifestFormatError: If either stream isn't sorted.
+    """
+    old_iter = _in_path_order(old_items, 'old')
+    new_iter = _in_path_order(new_items, 'new')
+    old_next = next(old_iter, None)
+    new_next = next(new_iter, None)
+    while old_next is not None or new_next is not None:
+        if new_next is not None and (old_next is None or new_next[0] < old_next[0]):
+            yield None, new_next[1]
+            new_next = next(new_iter, None)
+        elif old_next is not None and (new_next is None or old_next[0] < new_next[0]):
+            yield old_next[1], None
+            old_next = next(old_iter, None)
+        elif old_next is not None and new_next is not None:
+            # Both sides are at the same path
+            yield old_next[1], new_next[1]
+            old_next = next(old_iter, None)
+            new_next = next(new_iter, None)
+
+
+def _common_names(old_hashes: my_hashing.Hashes, new_hashes: my_hashing.Hashes) -> typing.Tuple[str, ...]:
+    """Find the algorithms two sets of hashes were both calculated with.
+
+    Raises:
+        rudi_dire_insp.exceptions.DiffError: If there are none, so the contents can't be compared.
+    """
+    new_names = set(new_hashes.names)
+    names = tuple(name for name in old_hashes.names if name in new_names)
+    if not names:
+        raise my_exceptions.DiffError("No hashing algorithm in common between {} and {}".format(
+            ', '.join(old_hashes.names), ', '.join(new_hashes.names)))
+    return names
+
+
+def _same_content(old: my_manifests.FileManifest, new: my_manifests.FileManifest) -> bool:
+    """Tell whether two manifests describe the same contents, using the hashes they have in common.
+
+    Raises:
+        rudi_dire_insp.exceptions.DiffError: If only one of them is a sampled fingerprint.
+    """
+    old_raw = old.raw_manifest
+    new_raw = new.raw_manifest
+    if old_raw.sampled != new_raw.sampled:
+        raise my_exceptions.DiffError("Can't compare a sampled fingerprint with full hashes: {}".format(
+            new.relative_path))
+    if old_raw.size != new_raw.size:
+        return False
+    old_hashes = old_raw.hashes
+    new_hashes = new_raw.hashes
+    names = _common_names(old_hashes, new_hashes)
+    return old_hashes.values_for(names) == new_hashes.values_for(names)
+
+
+def _prepend(item, iterator: typing.Iterator) -> typing.Iterator:
+    """Yield the item, then everything from the iterator."""
+    yield item
+    yield from iterator
+
+
+def diff_manifests(
+        old_manifests: typing.Iterable[my_manifests.FileManifest],
+        new_manifests: typing.Iterable[my_manifests.FileManifest],
+        detect_moves: bool = True) -> typing.Iterator[Difference]:
+    """Compare two sets of file manifests, each sorted by relative path as the directory inspector produces them.
+
+    Changed files are reported as soon as they are found.  To detect moves, files only found on one side are held
+    back, keyed by their contents, until a match turns up on the other side or both sides are exhausted.  Those
+    left unmatched are reported last, in path order.
+
+    Args:
+        old_manifests (iterable): The manifests of the old set.
+        new_manifests (iterable): The manifests of the new set.
+        detect_moves (bool): If false, files only found on one side are reported as added or removed straight
+            away, so memory use doesn't depend on the number of differences either.
+
+    Yields:
+        Difference: Each difference found.
+
+    Raises:
+        rudi_dire_insp.exceptions.DiffError: If two manifests have no hashing algorithm in common.
+        rudi_dire_insp.exceptions.ManifestFormatError: If either set isn't sorted by relative path.
+    """
+    # pylint: disable=too-many-branches,too-many-locals
+    old_manifests = iter(old_manifests)
+    new_manifests = iter(new_manifests)
+
+    # Files are paired up as moves by the hashes that both sets have, judging by their first manifests
+    first_old = next(old_manifests, None)
+    first_new = next(new_manifests, None)
+    move_names = ()  # type: typing.Tuple[str, ...]
+    if detect_moves and first_old is not None and first_new is not None:
+        move_names = _common_names(first_old.raw_manifest.hashes, first_new.raw_manifest.hashes)
+    else:
+        detect_moves = False
+    if first_old is not None:
+        old_manifests = _prepend(first_old, old_manifests)
+    if first_new is not None:
+        new_manifests = _prepend(first_new, new_manifests)
+
+    # Unmatched files from each side, keyed by size and hash values
+    unmatched = {
+        DiffKind.REMOVED: collections.OrderedDict(),
+        DiffKind.ADDED: collections.OrderedDict(),
+    }  # type: typing.Dict[DiffKind, typing.Dict[typing.Tuple, typing.List[my_manifests.FileManifest]]]
+
+    for (old, new) in _merge_by_path(old_manifests, new_manifests):
+        if old is not None and new is not None:
+            if not _same_content(old, new):
+                yield Difference(DiffKind.CHANGED, new.relative_path, old, new)
+            continue
+        (kind, manifest) = (DiffKind.ADDED, new) if old is None else (DiffKind.REMOVED, old)
+        if not detect_moves:
+            yield Difference(kind, manifest.relative_path, old, new)
+            continue
+
+        raw_manifest = manifest.raw_manifest
+        try:
+            content_key = (raw_manifest.size, raw_manifest.hashes.values_for(move_names))
+        except KeyError as error:
+            raise my_exceptions.DiffError(
+                "Manifest lacks the hashes {}: {}".format(', '.join(move_names), manifest)) from error
+        other_kind = DiffKind.REMOVED if kind is DiffKind.ADDED else DiffKind.ADDED
+        matches = unmatched[other_kind].get(content_key)
+        if matches:
+            match = matches.pop(0)
+            if not matches:
+                del unmatched[other_kind][content_key]
+            (old, new) = (match, manifest) if kind is DiffKind.ADDED else (manifest, match)
+            yield Difference(DiffKind.MOVED, new.relative_path, old, new)
+        else:
+            unmatched[kind].setdefault(content_key, []).append(manifest)
+
+    leftovers = []
+    for (kind, manifests_by_content) in unmatched.items():
+        for manifests in manifests_by_content.values():
+            for manifest in manifests:
+                (old, new) = (None, manifest) if kind is DiffKind.ADDED else (manifest, None)
+                leftovers.append(Difference(kind, manifest.relative_path, old, new))
+    leftovers.sort(key=lambda difference: my_walking.relative_path_key(difference.relative_path))
+    yield from leftovers
+
+
+def _same_directory(old: my_manifests.DirectoryManifest, new: my_manifests.DirectoryManifest) -> bool:
+    """Tell whether two directory manifests describe the same tree, using the hashes they have in common.
+
+    Raises:
+        rudi_dire_insp.exceptions.DiffError: If only one of them aggregates sampled fingerprints.
+    """
+    if old.sampled != new.sampled:
+        raise my_exceptions.DiffError("Can't compare sampled fingerprints with full hashes: {}".format(
+            new.relative_path))
+    if (old.size, old.file_count) != (new.size, new.file_count):
+        return False
+    names = _common_names(old.hashes, new.hashes)
+    return old.hashes.values_for(names) == new.hashes.values_for(names)
+
+
+def _index_directories(
+        directories: typing.Iterable[my_manifests.DirectoryManifest]) -> typing.Tuple[
+            typing.Dict[str, my_manifests.DirectoryManifest], typing.Dict[str, typing.List[str]]]:
+    """Index directory manifests by relative path, and the relative paths of sub directories by their parent's."""
+    by_path = {}  # type: typing.Dict[str, my_manifests.DirectoryManifest]
+    sub_dirs = collections.defaultdict(list)  # type: typing.Dict[str, typing.List[str]]
+    for directory in directories:
+        by_path[directory.relative_path] = directory
+        if directory.relative_path:
+            sub_dirs[os.path.dirname(directory.relative_path)].append(directory.relative_path)
+    return by_path, sub_dirs
+
+
+def _pair_moved_directories(
+        one_sided: typing.List[typing.Tuple[DiffKind, my_manifests.DirectoryManifest]],
+        old_by_path: typing.Dict[str, my_manifests.DirectoryManifest],
+        new_by_path: typing.Dict[str, my_manifests.DirectoryManifest]) -> typing.Tuple[
+            typing.List[DirectoryDifference], typing.List[typing.Tuple[DiffKind, my_manifests.DirectoryManifest]]]:
+    """Pair up the removed and added subtrees with the same contents as moves.
+
+    Args:
+        one_sided (list): The subtrees only on one side, with the kind of difference each is.
+        old_by_path (dict): The directory manifests of the old tree by relative path, which must not be empty.
+        new_by_path (dict): The directory manifests of the new tree by relative path, which must not be empty.
+
+    Returns:
+        tuple: The moves, and the subtrees left only on one side with the kind of difference each is.
+
+    Raises:
+        rudi_dire_insp.exceptions.DiffError: If the two trees have no hashing algorithm in common.
+    """
+    move_names = _common_names(next(iter(old_by_path.values())).hashes, next(iter(new_by_path.values())).hashes)
+    # Keyed by size, file count and hash values
+    unmatched = {
+        DiffKind.REMOVED: collections.OrderedDict(),
+        DiffKind.ADDED: collections.OrderedDict(),
+    }  # type: typing.Dict[DiffKind, typing.Dict[typing.Tuple, typing.List[my_manifests.DirectoryManifest]]]
+    for (kind, directory) in one_sided:
+        content_key = (directory.size, directory.file_count, directory.hashes.values_for(move_names))
+        unmatched[kind].setdefault(content_key, []).append(directory)
+    moves = []
+    for (content_key, removed) in list(unmatched[DiffKind.REMOVED].items()):
+        added = unmatched[DiffKind.ADDED].get(content_key, [])
+        while removed and added:
+            (removed_dir, added_dir) = (removed.pop(0), added.pop(0))
+            moves.append(DirectoryDifference(DiffKind.MOVED, added_dir.relative_path, removed_dir, added_dir))
+    left = [
+        (kind, directory) for (kind, directories_by_content) in unmatched.items()
+        for directories in directories_by_content.values() for directory in directories]
+    return moves, left
+
+
+def diff_directories(
+        old_directories: typing.Iterable[my_manifests.DirectoryManifest],
+        new_directories: typing.Iterable[my_manifests.DirectoryManifest],
+        detect_moves: bool = True) -> typing.Iterator[DirectoryDifference]:
+    """Compare two trees by the manifests of their directories, skipping every subtree whose root is unchanged.
+
+    The comparison starts at the root directories and only descends into directories that differ, so once the
+    manifests are indexed it takes time proportional to the number of changed directories, not to the number of
+    directories or files in the trees.  A changed directory is reported along with all of its ancestors.  A
+    subtree only on one side is reported once, at its root, and not descended into.  To detect moves, subtrees only
+    on one side are paired up by their contents, which directory manifests describe wherever the subtree is.
+
+    Args:
+        old_directories (iterable): The directory manifests of the old tree, in any order.
+        new_directories (iterable): The directory manifests of the new tree, in any order.
+        detect_moves (bool): If false, subtrees only on one side are always reported as added or removed.
+
+    Yields:
+        DirectoryDifference: Each difference found, changed directories first, parents before their sub
+        directories, then moved, added and removed subtrees in path order.
+
+    Raises:
+        rudi_dire_insp.exceptions.DiffError: If two manifests have no hashing algorithm in common.
+    """
+    # pylint: disable=too-many-locals
+    (old_by_path, old_sub_dirs) = _index_directories(old_directories)
+    (new_by_path, new_sub_dirs) = _index_directories(new_directories)
+
+    # Subtrees only on one side, with the kind of difference each is
+    one_sided = []  # type: typing.List[typing.Tuple[DiffKind, my_manifests.DirectoryManifest]]
+    pending = [''] if '' in old_by_path or '' in new_by_path else []
+    while pending:
+        relative_path = pending.pop()
+        old = old_by_path.get(relative_path)
+        new = new_by_path.get(relative_path)
+        if old is None:
+            if new is not None:
+                one_sided.append((DiffKind.ADDED, new))
+        elif new is None:
+            one_sided.append((DiffKind.REMOVED, old))
+        elif not _same_directory(old, new):
+            yield DirectoryDifference(DiffKind.CHANGED, relative_path, old, new)
+            # Popped from the end, so push the sub directories in reverse order
+            sub_dir_paths = set(old_sub_dirs.get(relative_path, ())) | set(new_sub_dirs.get(relative_path, ()))
+            pending.extend(sorted(sub_dir_paths, key=os.fsencode, reverse=True))
+
+    leftovers = []  # type: typing.List[DirectoryDifference]
+    if detect_moves and one_sided and old_by_path and new_by_path:
+        (leftovers, one_sided) = _pair_moved_directories(one_sided, old_by_path, new_by_path)
+    for (kind, directory) in one_sided:
+        (old, new) = (None, directory) if kind is DiffKind.ADDED else (directory, None)
+        leftovers.append(DirectoryDifference(kind, directory.relative_path, old, new))
+    leftovers.sort(key=lambda difference: os.fsencode(difference.relative_path))
+    yield from leftovers
+
+
+def verify_directory(
+        root_path: str,
+        manifests: typing.Iterable[my_manifests.FileManifest],
+        algorithms: typing.Optional[typing.Iterable[str]] = None,
+        chunk_size: int = my_hashing.DEFAULT_CHUNK_SIZE,
+        cache: typing.Optional[my_caching.HashCache] = None) -> typing.Iterator[Difference]:
+    """Check a live directory against stored file manifests, sorted by relative path.
+
+    Files are only hashed when they are in both the directory and the manifests with the same size.  Files only in
+    the directory are reported as added without being read, so moves aren't detected.  Files stored with a sampled
+    fingerprint are checked with a sampled fingerprint.
+
+    Args:
+        root_path (str): The path to the directory to check.
+        manifests (iterable): The stored manifests.
+        algorithms (iterable): Names of the hashing algorithms to check files with.  They must all be in the stored
+            manifests.  If None, SHA256 is used if stored, otherwise all stored algorithms are.
+        chunk_size (int): The maximum number of bytes read from a file at a time while hashing it.
+        cache (rudi_dire_insp.caching.HashCache): If given, hashes are looked up in this cache before a file is
+            opened.  A new run of the cache is started, so the entries used are marked as current.
+
+    Yields:
+        Difference: Each difference found, in path order.  The old manifest is the stored one.
+
+    Raises:
+        rudi_dire_insp.exceptions.DiffError: If a stored manifest lacks the hashes to check its file with.
+        rudi_dire_insp.exceptions.ManifestFormatError: If the stored manifests aren't sorted by relative path.
+        rudi_dire_insp.exceptions.FileInspectionError: If the directory holds something that can't be inspected.
+        rudi_dire_insp.exceptions.CacheError
+    """
+    if cache is not None:
+        cache.begin_run()
+    if algorithms is not None:
+        # pylint: disable=protected-access
+        algorithms = tuple(algorithm.algorithm_name for algorithm in my_hashing._HashAlgorithm.from_names(algorithms))
+    file_inspectors = {}  # type: typing.Dict[typing.Tuple[typing.Tuple[str, ...], bool], my_core._FileInspector]
+
+    for (old, file_entry) in _merge_by_path(manifests, my_walking.walk_files(root_path)):
+        if file_entry is None:
+            yield Difference(DiffKind.REMOVED, old.relative_path, old, None)
+        elif old is None:
+            yield Difference(DiffKind.ADDED, file_entry.relative_path, None, None)
+        elif file_entry.stat().st_size != old.raw_manifest.size:
+            yield Difference(DiffKind.CHANGED, old.relative_path, old, None)
+        else:
+            names = _verify_names(old.raw_manifest.hashes, algorithms)
+            inspector_key = (names, old.raw_manifest.sampled)
+            file_inspector = file_inspectors.get(inspector_key)
+            if file_inspector is None:
+                # pylint: disable=protected-access
+                file_inspector = file_inspectors[inspector_key] = my_core._FileInspector(
+                    root_path, chunk_size=chunk_size, algorithms=names, cache=cache, hard_links=my_files.HardLinkMap(),
+                    sampled=old.raw_manifest.sampled)
+            new = file_inspector.inspect_entry(file_entry)
+            if not _same_content(old, new):
+                yield Difference(DiffKind.CHANGED, old.relative_path, old, new)
+
+
+def _verify_names(
+        stored_hashes: my_hashing.Hashes,
+        algorithms: typing.Optional[typing.Tuple[str, ...]]) -> typing.Tuple[str, ...]:
+    """Pick the algorithms to check a file against its stored hashes with.
+
+    Raises:
+        rudi_dire_insp.exceptions.DiffError
+    """
+    stored_names = stored_hashes.names
+    if algorithms is None:
+        if _VERIFY_ALGORITHM_NAME in stored_names:
+            return (_VERIFY_ALGORITHM_NAME,)
+        return stored_names
+    missing_names = [name for name in algorithms if name not in stored_names]
+    if missing_names:
+        raise my_exceptions.DiffError("Stored manifest lacks the hashes {}".format(', '.join(missing_names)))
+    return algorithms
+
+
+@contextlib.contextmanager
+def open_manifests(path: str) -> typing.Iterator[typing.Iterator[my_manifests.FileManifest]]:
+    """Open a file of manifests written by the command line tool, in either of its formats.
+
+    Args:
+        path (str): The path to the file.
+
+    Yields:
+        iterator: The manifests in the file, in the order they were written for JSON Lines, or sorted by relative
+        path for the binary format.
+
+    Raises:
+        rudi_dire_insp.exceptions.ManifestFormatError
+    """
+    with open(path, 'rb') as manifest_file:
+        # pylint: disable=protected-access
+        is_binary = manifest_file.read(len(my_manifests._BINARY_MAGIC)) == my_manifests._BINARY_MAGIC
+        if not is_binary:
+            manifest_file.seek(0)
+            yield my_serializing.read_json_lines(manifest_file)
+            return
+    with my_manifests.BinaryManifestReader(path) as reader:
+        yield reader.iter_by_path()
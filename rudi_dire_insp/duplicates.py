@@ -0,0 +1,251 @@
+"""
+rudi_dire_insp.duplicates
+=========================
+
+Finding of files with duplicate content, reading as little of each file as it takes to tell them apart.
+
+Files are first grouped by the size already known from walking the directory, and files with a unique size are
+never opened.  The remaining candidates larger than two samples are told apart by a sample of their first and last
+bytes, and only files whose sizes and samples still collide are read in full and hashed.
+"""
+
+# Imports from Python distribution
+import collections
+import hashlib
+import logging
+import time
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.caching as my_caching
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.files as my_files
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.stats as my_stats
+import rudi_dire_insp.walking as my_walking
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_ALGORITHM_NAMES = ('sha256',)
+"""Names of the hashing algorithms that duplicates are confirmed with when none are explicitly requested."""
+
+DEFAULT_SAMPLE_SIZE = 4 * 1024
+"""Default number of bytes sampled from each end of a candidate file."""
+
+_SAMPLE_DIGEST_SIZE = 16
+
+
+class DuplicateGroup:
+    """A group of files with the same content."""
+
+    __slots__ = ('_size', '_hashes', '_relative_paths', '_file_count')
+
+    def __init__(
+            self,
+            size: int,
+            hashes: my_hashing.Hashes,
+            relative_paths: typing.Iterable[typing.Tuple[str, ...]],
+            file_count: typing.Optional[int] = None):
+        """Constructor
+
+        Args:
+            size (int): The size of each file, in bytes.
+            hashes (rudi_dire_insp.hashing.Hashes): The hashes of the content of each file.
+            relative_paths (iterable): The relative path of each file, in walk order.
+            file_count (int): The number of distinct files the paths lead to, which is less than the number of paths
+                when some are hard links to the same file.  If None, each path is taken to be a distinct file.
+        """
+        self._size = size
+        self._hashes = hashes
+        self._relative_paths = tuple(relative_paths)
+        self._file_count = len(self._relative_paths) if file_count is None else file_count
+
+    @property
+    def size(self) -> int:
+        """int: The size of each file, in bytes."""
+        return self._size
+
+    @property
+    def hashes(self) -> my_hashing.Hashes:
+        """rudi_dire_insp.hashing.Hashes: The hashes of the content of each file."""
+        return self._hashes
+
+    @property
+    def relative_paths(self) -> typing.Tuple[typing.Tuple[str, ...], ...]:
+        """tuple: The relative path of each file, in walk order."""
+        return self._relative_paths
+
+    @property
+    def file_count(self) -> int:
+        """int: The number of distinct files, counting the hard links to the same file once."""
+        return self._file_count
+
+    @property
+    def wasted_size(self) -> int:
+        """int: The number of bytes taken up by all but one of the distinct files.  Hard links take up none."""
+        return self._size * (self._file_count - 1)
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} size={}, hashes={}, relative_paths={}, file_count={}>'.format(
+            class_name, self._size, str(self._hashes), self._relative_paths, self._file_count)
+
+
+def _raise_if_bad_size(name: str, value: int, minimum: int):
+    """Raise an exception if the size is not an integer of at least the minimum.
+
+    Raises:
+        rudi_dire_insp.exceptions.DirInspectionError
+    """
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise my_exceptions.DirInspectionError(
+            "{} must be an integer of at least {}: {!r}".format(name, minimum, value))
+
+
+def _sample_key(
+        file_entry: my_walking._FileEntry,
+        size: int,
+        sample_size: int,
+        stats: typing.Optional[my_stats.InspectionStats]) -> bytes:
+    """Digest the first and last bytes of a file, which is larger than two samples.
+
+    The digest is only used to rule out files that can't be duplicates, so a fast one will do.
+
+    Raises:
+        rudi_dire_insp.exceptions.FileInspectionError
+    """
+    if stats is not None:
+        start = time.perf_counter()
+    try:
+        with open(file_entry.path, 'rb', buffering=0) as input_file:
+            head = input_file.read(sample_size)
+            input_file.seek(size - sample_size)
+            tail = input_file.read(sample_size)
+    except OSError as error:
+        raise my_exceptions.FileInspectionError("Unable to sample file: {}".format(file_entry.path)) from error
+    if stats is not None:
+        stats.add_hashing(time.perf_counter() - start, len(head) + len(tail), {})
+    digest = hashlib.blake2b(head, digest_size=_SAMPLE_DIGEST_SIZE)
+    digest.update(tail)
+    return digest.digest()
+
+
+def _group_by_size(
+        root_path: str,
+        min_size: int,
+        stats: typing.Optional[my_stats.InspectionStats]) -> typing.Dict[int, typing.List[my_walking._FileEntry]]:
+    """Walk the directory, grouping the files of at least the minimum size by their size."""
+    # pylint: disable=protected-access
+    entries_by_size = collections.defaultdict(list)  # type: typing.Dict[int, typing.List[my_walking._FileEntry]]
+    file_entries = my_walking.walk_files(root_path, stats)  # type: typing.Iterator[my_walking._FileEntry]
+    if stats is not None:
+        file_entries = stats.timed('walk', file_entries)
+    for file_entry in file_entries:
+        stat_result = file_entry.stat()
+        if stat_result.st_size >= min_size:
+            # Drop the directory entry, only the status is needed from here on
+            entries_by_size[stat_result.st_size].append(
+                my_walking._FileEntry(file_entry.path, file_entry.relative_path, stat_result=stat_result))
+    return entries_by_size
+
+
+def _file_key(file_entry: my_walking._FileEntry) -> typing.Tuple[int, int]:
+    """Identify the file that an entry leads to, which is the same for all of the hard links to it."""
+    stat_result = file_entry.stat()
+    return stat_result.st_dev, stat_result.st_ino
+
+
+def _group_by_file(
+        file_entries: typing.Iterable[my_walking._FileEntry]) -> typing.Dict[
+            typing.Tuple[int, int], typing.List[my_walking._FileEntry]]:
+    """Group the entries by the file they lead to, so hard links to the same file end up together, in walk order."""
+    links_by_file = collections.OrderedDict()  # type: typing.Dict[typing.Tuple[int, int], typing.List]
+    for file_entry in file_entries:
+        links_by_file.setdefault(_file_key(file_entry), []).append(file_entry)
+    return links_by_file
+
+
+def find_duplicates(
+        root_path: str,
+        algorithms: typing.Optional[typing.Iterable[str]] = None,
+        sample_size: int = DEFAULT_SAMPLE_SIZE,
+        min_size: int = 1,
+        chunk_size: int = my_hashing.DEFAULT_CHUNK_SIZE,
+        cache: typing.Optional[my_caching.HashCache] = None,
+        stats: typing.Optional[my_stats.InspectionStats] = None) -> typing.Iterator[DuplicateGroup]:
+    """Find the groups of files with the same content under a directory.
+
+    The whole directory is walked before anything is read, holding an entry for each file of at least the minimum
+    size.  Files are then only read as far as it takes to tell them apart: not at all if their size is unique,
+    ``2 * sample_size`` bytes if their sample is, and in full otherwise.
+
+    Hard links to the same file are not duplicates of each other, since they share its storage.  Only one of them is
+    read, and they are only reported along with copies of the file held elsewhere.
+
+    Args:
+        root_path (str): The path to the directory to search.
+        algorithms (iterable): Names of the hashing algorithms that files are confirmed to be duplicates with, see
+            :py:data:`rudi_dire_insp.hashing.ALGORITHM_NAMES`.  If None, :py:data:`DEFAULT_ALGORITHM_NAMES` are
+            used.
+        sample_size (int): The number of bytes sampled from each end of files.  Files no larger than two samples
+            are read in full straight away.
+        min_size (int): Files smaller than this are ignored.  Empty files are ignored by default.
+        chunk_size (int): The maximum number of bytes read from a file at a time while hashing it.
+        cache (rudi_dire_insp.caching.HashCache): If given, hashes are looked up in this cache before a file is
+            read in full, and hashes calculated for files are stored in it.
+        stats (rudi_dire_insp.stats.InspectionStats): If given, timings and counters of the search are added to
+            these stats.  Only the files read in full are counted as inspected.
+
+    Yields:
+        DuplicateGroup: Each group of two or more files with the same content, largest files first.
+
+    Raises:
+        rudi_dire_insp.exceptions.CacheError
+        rudi_dire_insp.exceptions.DirInspectionError
+        rudi_dire_insp.exceptions.FileInspectionError
+        rudi_dire_insp.exceptions.HashError
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    _raise_if_bad_size('Sample size', sample_size, 1)
+    _raise_if_bad_size('Minimum size', min_size, 0)
+    if algorithms is None:
+        algorithms = DEFAULT_ALGORITHM_NAMES
+    # pylint: disable=protected-access
+    file_inspector = my_core._FileInspector(
+        root_path, chunk_size=chunk_size, algorithms=algorithms, cache=cache, stats=stats,
+        hard_links=my_files.HardLinkMap())
+
+    entries_by_size = _group_by_size(root_path, min_size, stats)
+    for size in sorted(entries_by_size, reverse=True):
+        # Hard links to the same file are only read once, and only files with other links are candidates
+        links_by_file = _group_by_file(entries_by_size.pop(size))
+        if len(links_by_file) < 2:
+            continue
+        file_entries = [links[0] for links in links_by_file.values()]
+
+        # Rule out what can be ruled out by sampling, unless the sample would be the whole file anyway
+        if size > 2 * sample_size:
+            entries_by_sample = collections.OrderedDict()  # type: typing.Dict[bytes, typing.List]
+            for file_entry in file_entries:
+                key = _sample_key(file_entry, size, sample_size, stats)
+                entries_by_sample.setdefault(key, []).append(file_entry)
+            candidate_groups = [entries for entries in entries_by_sample.values() if len(entries) > 1]
+        else:
+            candidate_groups = [file_entries]
+
+        for candidates in candidate_groups:
+            entries_by_content = collections.OrderedDict()  # type: typing.Dict[typing.Tuple, typing.List]
+            for file_entry in candidates:
+                raw_manifest = file_inspector.inspect_entry(file_entry).raw_manifest
+                entries_by_content.setdefault((raw_manifest.size, raw_manifest.hashes), []).append(file_entry)
+            for ((content_size, hashes), content_entries) in entries_by_content.items():
+                if len(content_entries) > 1:
+                    relative_paths = sorted(
+                        (link.relative_path for file_entry in content_entries
+                         for link in links_by_file[_file_key(file_entry)]),
+                        key=my_walking.relative_path_key)
+                    yield DuplicateGroup(content_size, hashes, relative_paths, len(content_entries))
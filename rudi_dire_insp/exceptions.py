@@ -20,3 +20,31 @@ class FileInspectionError(RudiDireInspException):
 
 class HashError(RudiDireInspException):
     """An exception raised during the calculation or verification of a cryptographic hash."""
+
+
+class CacheError(RudiDireInspException):
+    """An exception raised while reading or writing the persistent hash cache."""
+
+
+class ManifestFormatError(RudiDireInspException):
+    """An exception raised when manifests can't be written in, or read from, a serialized format."""
+
+
+class DiffError(RudiDireInspException):
+    """An exception raised while comparing manifests, or verifying a directory against them."""
+
+
+class ShardError(RudiDireInspException):
+    """An exception raised for a shard that can't be used, or while merging the outputs of shards."""
+
+
+class CheckpointError(RudiDireInspException):
+    """An exception raised while writing a checkpoint of an inspection, or resuming an inspection from one."""
+
+
+class ArchiveError(RudiDireInspException):
+    """An exception raised while reading the members of an archive being inspected."""
+
+
+class WatchError(RudiDireInspException):
+    """An exception raised while watching a directory for changes."""
@@ -0,0 +1,183 @@
+"""
+rudi_dire_insp.files
+====================
+
+Reading of the files being inspected, and sharing of their manifests between hard links.
+"""
+
+# Imports from Python distribution
+import collections
+import concurrent.futures
+import logging
+import mmap
+import os
+import threading
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+SMALL_FILE_FLAGS = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+"""Flags to open files read whole with :py:func:`read_small_file`."""
+
+DEFAULT_MAX_HARD_LINKS = 64 * 1024
+"""Default maximum number of files with several hard links whose manifests are remembered at once."""
+
+
+def read_small_file(file_descriptor: int, size: int) -> bytes:
+    """Read a file through its descriptor to its end, or to one byte past its size if it grew.
+
+    Reads may return fewer bytes than asked for before the end of the file, e.g. when interrupted by a signal, so
+    only an empty read is taken as the end.
+
+    Args:
+        file_descriptor (int): The file descriptor, open for reading at the start of the file.
+        size (int): The size of the file when it was found.
+
+    Returns:
+        bytes: The content of the file, more than ``size`` bytes long if it grew.
+    """
+    chunks = []
+    num_read = 0
+    while num_read <= size:
+        chunk = os.read(file_descriptor, size + 1 - num_read)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        num_read += len(chunk)
+    return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+
+def map_file(input_file: typing.BinaryIO) -> typing.Optional[mmap.mmap]:
+    """Map the whole of an open file into memory read-only, advising the kernel that it will be read sequentially.
+
+    Args:
+        input_file (typing.BinaryIO): The file, opened for reading.
+
+    Returns:
+        mmap.mmap: The mapping, or None if the file can't be mapped (it is empty, special, or on a file system that
+        refuses to map it).
+    """
+    try:
+        mapping = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError) as error:
+        _LOGGER.debug("Unable to map file %s, reading it instead: %s", getattr(input_file, 'name', '?'), str(error))
+        return None
+    # Neither the advice nor the method to give it are available everywhere
+    advice = getattr(mmap, 'MADV_SEQUENTIAL', None)
+    if advice is not None and hasattr(mapping, 'madvise'):
+        try:
+            mapping.madvise(advice)
+        except OSError:
+            pass
+    return mapping
+
+
+# pylint: disable=too-few-public-methods
+class CancellableReader:
+    """Wraps a binary stream so that reading from it fails once an event has been set."""
+
+    def __init__(self, stream: 'my_hashing._ReadableStream', cancel_event: threading.Event):
+        """Constructor
+
+        Args:
+            stream (_ReadableStream): The stream to read from.
+            cancel_event (threading.Event): The event that stops further reads when set.
+        """
+        self._stream = stream
+        self._cancel_event = cancel_event
+
+    def readinto(self, buffer) -> typing.Optional[int]:
+        """Read from the stream into the buffer, like :py:meth:`io.RawIOBase.readinto`.
+
+        Raises:
+            rudi_dire_insp.exceptions.FileInspectionError: If the event has been set.
+        """
+        if self._cancel_event.is_set():
+            raise my_exceptions.FileInspectionError("Inspection was cancelled")
+        return self._stream.readinto(buffer)
+
+
+class HardLinkMap:
+    """Manifests of files with more than one hard link, kept until every other link has been looked up.
+
+    The first link looked up claims the file, and the others get a future of the manifest calculated for it, so
+    links inspected at the same time still only read the file once.  Only files whose status says they have more
+    than one link are remembered, and each is forgotten once as many more of its links have been looked up as it
+    has other links.  Links outside the inspected directory are never seen though, so the number of files
+    remembered is also capped, forgetting the oldest first.
+
+    Instances are safe to use from several threads at once.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_HARD_LINKS):
+        """Constructor
+
+        Args:
+            max_entries (int): The maximum number of files remembered at once.
+        """
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        # The future manifest and number of links not yet looked up of each file, keyed by device and inode numbers
+        self._entries = collections.OrderedDict()  # type: collections.OrderedDict[typing.Tuple[int, int], typing.List]
+        # The futures of files claimed and not yet released, whether or not they are still remembered
+        self._claims = {}  # type: typing.Dict[typing.Tuple[int, int], concurrent.futures.Future]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, stat_result: os.stat_result) -> typing.Optional[concurrent.futures.Future]:
+        """Look up the file with the given status, claiming it if it has other links and none were looked up yet.
+
+        Returns:
+            concurrent.futures.Future: The future manifest of the file, resolved to None if inspecting it through
+            another link failed.  None if the file has no other links or wasn't known, in which case it may have
+            been claimed and :py:meth:`release` must be called once it has been inspected.
+        """
+        if stat_result.st_nlink < 2:
+            return None
+        key = (stat_result.st_dev, stat_result.st_ino)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] < 1:
+                    del self._entries[key]
+                return entry[0]
+            future = self._claims.get(key)
+            if future is not None:
+                return future
+            future = self._claims[key] = concurrent.futures.Future()
+            if self._max_entries > 0:
+                if len(self._entries) >= self._max_entries:
+                    self._entries.popitem(last=False)
+                self._entries[key] = [future, stat_result.st_nlink - 1]
+            return None
+
+    def release(
+            self,
+            stat_result: os.stat_result,
+            raw_manifest: typing.Optional[my_manifests.RawBytesManifest]):
+        """Resolve the claim on the file with the given status, if it has one.
+
+        Args:
+            stat_result (os.stat_result): The status of the file.
+            raw_manifest (rudi_dire_insp.manifests.RawBytesManifest): The manifest of the file, or None if it
+                couldn't be inspected.
+        """
+        if stat_result.st_nlink < 2:
+            return
+        key = (stat_result.st_dev, stat_result.st_ino)
+        with self._lock:
+            future = self._claims.pop(key, None)
+            if raw_manifest is None:
+                self._entries.pop(key, None)
+        if future is not None:
+            future.set_result(raw_manifest)
@@ -0,0 +1,209 @@
+"""
+rudi_dire_insp.filtering
+========================
+
+Rules for which files of a directory are inspected, applied while walking it.
+
+Directories matching an exclusion rule are pruned from the walk, so nothing under them is ever listed.  Files are
+matched by their relative paths first, then by the size and modification time from their status, which the walk
+usually has already, so no file is opened to decide whether it is inspected.
+"""
+
+# Imports from Python distribution
+import fnmatch
+import logging
+import os
+import re
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.exceptions as my_exceptions
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+
+def _posix_path(rel_dir_path: str, name: str) -> str:
+    """Join a relative directory path and a name with forward slashes, whatever the platform."""
+    if not rel_dir_path:
+        return name
+    return '/'.join(rel_dir_path.split(os.sep) + [name])
+
+
+def _compile_globs(globs: typing.Iterable[str]) -> typing.Tuple[
+        typing.Optional[typing.Pattern], typing.Optional[typing.Pattern]]:
+    """Compile glob patterns into one regex matching names, and one matching whole relative paths.
+
+    Patterns without a slash are matched against names, and patterns with one against whole relative paths.
+    """
+    name_patterns = []
+    path_patterns = []
+    for glob in globs:
+        if '/' in glob.strip('/'):
+            path_patterns.append(fnmatch.translate(glob.strip('/')))
+        else:
+            name_patterns.append(fnmatch.translate(glob.strip('/')))
+    name_regex = re.compile('|'.join(name_patterns)) if name_patterns else None
+    path_regex = re.compile('|'.join(path_patterns)) if path_patterns else None
+    return name_regex, path_regex
+
+
+def _compile_regexes(regexes: typing.Iterable[str]) -> typing.Optional[typing.Pattern]:
+    """Compile regular expressions into one, searched for in whole relative paths.
+
+    Raises:
+        rudi_dire_insp.exceptions.DirInspectionError
+    """
+    patterns = []
+    for regex in regexes:
+        try:
+            re.compile(regex)
+        except re.error as error:
+            raise my_exceptions.DirInspectionError(
+                "Invalid regular expression {!r}: {}".format(regex, error)) from error
+        patterns.append('(?:{})'.format(regex))
+    return re.compile('|'.join(patterns)) if patterns else None
+
+
+def _raise_if_bad_limit(name: str, value: typing.Optional[float], types: typing.Tuple[type, ...]):
+    """Raise an exception if the limit of a range is neither None nor a number of the expected types.
+
+    Raises:
+        rudi_dire_insp.exceptions.DirInspectionError
+    """
+    if value is not None and (isinstance(value, bool) or not isinstance(value, types) or value < 0):
+        raise my_exceptions.DirInspectionError("{} must be a number of at least 0: {!r}".format(name, value))
+
+
+# pylint: disable=too-many-instance-attributes
+class PathFilter:
+    """Rules for which files of a directory are inspected, and which directories are pruned from the walk.
+
+    Glob patterns are matched as by :py:mod:`fnmatch`, against the relative path of each file or directory with
+    forward slashes if they contain a slash themselves, otherwise against its name alone, so ``node_modules`` or
+    ``*.tmp`` match at any depth.  Regular expressions are searched for anywhere in the relative path with forward
+    slashes.
+
+    A file is inspected if it matches at least one inclusion rule (or there are none), no exclusion rule, and the
+    size and modification time ranges.  A directory is pruned if it matches an exclusion rule, inclusion rules
+    only apply to files.
+    """
+
+    __slots__ = (
+        '_rules', '_include_name', '_include_path', '_include_regex', '_exclude_name', '_exclude_path',
+        '_exclude_regex', '_min_size', '_max_size', '_modified_after', '_modified_before')
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            include: typing.Iterable[str] = (),
+            exclude: typing.Iterable[str] = (),
+            include_regex: typing.Iterable[str] = (),
+            exclude_regex: typing.Iterable[str] = (),
+            min_size: typing.Optional[int] = None,
+            max_size: typing.Optional[int] = None,
+            modified_after: typing.Optional[float] = None,
+            modified_before: typing.Optional[float] = None):
+        """Constructor
+
+        Args:
+            include (iterable): Glob patterns of the files to inspect.
+            exclude (iterable): Glob patterns of the files not to inspect, and the directories to prune.
+            include_regex (iterable): Regular expressions for the relative paths of the files to inspect.
+            exclude_regex (iterable): Regular expressions for the relative paths of the files not to inspect, and
+                the directories to prune.
+            min_size (int): If given, files smaller than this many bytes are not inspected.
+            max_size (int): If given, files larger than this many bytes are not inspected.
+            modified_after (float): If given, files last modified before this time, in seconds since the epoch, are
+                not inspected.
+            modified_before (float): If given, files last modified at or after this time, in seconds since the
+                epoch, are not inspected.
+
+        Raises:
+            rudi_dire_insp.exceptions.DirInspectionError
+        """
+        self._rules = {
+            'include': list(include),
+            'exclude': list(exclude),
+            'include_regex': list(include_regex),
+            'exclude_regex': list(exclude_regex),
+            'min_size': min_size,
+            'max_size': max_size,
+            'modified_after': modified_after,
+            'modified_before': modified_before,
+        }  # type: typing.Dict[str, typing.Any]
+        _raise_if_bad_limit('Minimum size', min_size, (int,))
+        _raise_if_bad_limit('Maximum size', max_size, (int,))
+        _raise_if_bad_limit('Modified after', modified_after, (int, float))
+        _raise_if_bad_limit('Modified before', modified_before, (int, float))
+
+        (self._include_name, self._include_path) = _compile_globs(self._rules['include'])
+        (self._exclude_name, self._exclude_path) = _compile_globs(self._rules['exclude'])
+        self._include_regex = _compile_regexes(self._rules['include_regex'])
+        self._exclude_regex = _compile_regexes(self._rules['exclude_regex'])
+        self._min_size = min_size
+        self._max_size = max_size
+        self._modified_after = modified_after
+        self._modified_before = modified_before
+
+    @property
+    def rules(self) -> typing.Dict[str, typing.Any]:
+        """dict: The rules of this filter, by the name of the constructor argument they were given as."""
+        return dict(self._rules)
+
+    @property
+    def needs_stat(self) -> bool:
+        """bool: True if files are also matched by their status, not only by their paths."""
+        return any(limit is not None for limit in (
+            self._min_size, self._max_size, self._modified_after, self._modified_before))
+
+    def _excluded(self, name: str, path: str) -> bool:
+        """Check whether a file or directory matches an exclusion rule."""
+        return bool(
+            (self._exclude_name is not None and self._exclude_name.match(name))
+            or (self._exclude_path is not None and self._exclude_path.match(path))
+            or (self._exclude_regex is not None and self._exclude_regex.search(path)))
+
+    def _included(self, name: str, path: str) -> bool:
+        """Check whether a file matches an inclusion rule, or there are none."""
+        if self._include_name is None and self._include_path is None and self._include_regex is None:
+            return True
+        return bool(
+            (self._include_name is not None and self._include_name.match(name))
+            or (self._include_path is not None and self._include_path.match(path))
+            or (self._include_regex is not None and self._include_regex.search(path)))
+
+    def prunes_dir(self, rel_parent_path: str, name: str) -> bool:
+        """Check whether a directory is pruned from the walk.
+
+        Args:
+            rel_parent_path (str): The relative path of the directory holding the directory.
+            name (str): The name of the directory.
+        """
+        return self._excluded(name, _posix_path(rel_parent_path, name))
+
+    def matches_path(self, relative_path: typing.Tuple[str, ...]) -> bool:
+        """Check whether a file is inspected, judging by its relative path only."""
+        (rel_dir_path, name) = relative_path
+        path = _posix_path(rel_dir_path, name)
+        return self._included(name, path) and not self._excluded(name, path)
+
+    def matches_stat(self, stat_result: os.stat_result) -> bool:
+        """Check whether a file is inspected, judging by its size and modification time only."""
+        if self._min_size is not None and stat_result.st_size < self._min_size:
+            return False
+        if self._max_size is not None and stat_result.st_size > self._max_size:
+            return False
+        if self._modified_after is not None and stat_result.st_mtime < self._modified_after:
+            return False
+        if self._modified_before is not None and stat_result.st_mtime >= self._modified_before:
+            return False
+        return True
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        rules = ', '.join(
+            '{}={!r}'.format(name, value) for (name, value) in self._rules.items() if value not in (None, []))
+        return '<{} {}>'.format(class_name, rules)
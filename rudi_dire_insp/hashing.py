@@ -9,23 +9,537 @@ Utility plumbing for calculating cryptographic hashes.
 import collections
 import enum
 import hashlib
+import io
 import logging
+import queue
+import struct
+import threading
+import time
 import typing
 
 # Imports from 3rd party
 
 # Imports from this project
 import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.stats as my_stats
 
 # Module variables
 _LOGGER = logging.getLogger(__name__)
 
-Hashes = collections.namedtuple("Hashes", ['md5', 'sha1', 'sha256', 'sha384', 'sha512'])
-"""A set of hex string values for hashes calculated from the same binary dataset.
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+"""Default number of bytes read from a byte stream per chunk when calculating hashes."""
 
-The string containing the hex value for each is available via an object attribute of
-the same name.
-"""
+DEFAULT_ALGORITHM_NAMES = ('md5', 'sha1', 'sha256', 'sha384', 'sha512')
+"""Names of the hashing algorithms used when none are explicitly requested."""
+
+SAMPLE_BLOCK_SIZE = 4 * 1024
+"""Number of bytes in each block sampled for a sampled fingerprint."""
+
+SAMPLE_BLOCKS = 16
+"""Number of blocks sampled for a sampled fingerprint between the head and tail blocks."""
+
+_SAMPLE_SIZE_PREFIX = struct.Struct('<Q')
+
+if typing.TYPE_CHECKING:
+    # Protocol is only in typing from Python 3.8, and is only needed by the type checker
+    import typing_extensions
+
+    # pylint: disable=too-few-public-methods
+    class _ReadableStream(typing_extensions.Protocol):
+        """A binary stream that can be read into a buffer, like :py:class:`io.RawIOBase`."""
+
+        def readinto(self, buffer: bytearray) -> typing.Optional[int]:
+            """Read into the buffer, returning the number of bytes read, with 0 at the end of the stream."""
+
+
+# pylint: disable=too-few-public-methods
+class _HashesLayout:
+    """Where the digest of each algorithm sits in the raw bytes held by :py:class:`Hashes`.
+
+    Layouts are shared by every instance holding digests of the same algorithms and sizes, see
+    :py:func:`_layout_for`.
+    """
+
+    __slots__ = ('key', 'names', 'slices', 'hex_slices', 'positions')
+
+    def __init__(self, key: typing.Tuple[typing.Tuple[str, int], ...]):
+        """Constructor
+
+        Args:
+            key (tuple): The name and digest size of each algorithm, in the order of the digests.
+        """
+        self.key = key
+        self.names = tuple(name for (name, _) in key)
+        slices = []
+        offset = 0
+        for (_, size) in key:
+            slices.append((offset, offset + size))
+            offset += size
+        self.slices = tuple(slices)
+        self.hex_slices = tuple((2 * begin, 2 * end) for (begin, end) in slices)
+        self.positions = {name: position for (position, name) in enumerate(self.names)}
+
+
+_LAYOUTS = {}  # type: typing.Dict[typing.Tuple[typing.Tuple[str, int], ...], _HashesLayout]
+
+
+def _layout_for(key: typing.Tuple[typing.Tuple[str, int], ...]) -> _HashesLayout:
+    """Return the shared layout for digests with the given names and sizes, in that order."""
+    layout = _LAYOUTS.get(key)
+    if layout is None:
+        layout = _LAYOUTS.setdefault(key, _HashesLayout(key))
+    return layout
+
+
+class Hashes:
+    """A set of hash values calculated from the same binary dataset.
+
+    The string containing the hex value for each is available via an object attribute of
+    the same name.  Only the algorithms that were actually calculated are present, see :py:attr:`names`.
+
+    The digests are held as raw bytes, all in a single bytes object, and hex values are only made when asked for.
+    The names and positions of the digests are shared between instances, so each one only costs about the size of
+    its digests.
+
+    Instances are immutable, and behave like the named tuple they replaced: the values of the default algorithms can
+    be given positionally, in the order of :py:data:`DEFAULT_ALGORITHM_NAMES`, and values can be indexed and unpacked
+    in the order of :py:attr:`names`.
+    """
+
+    __slots__ = ('_layout', '_raw')
+
+    # Declared for the type checker, which would otherwise take the slots' types from __getattr__
+    _layout: _HashesLayout
+    _raw: bytes
+
+    def __init__(self, *values: str, **hex_values: str):
+        """Constructor
+
+        Args:
+            *values (str): The hex values of the hashes of the default algorithms, in the order of
+                :py:data:`DEFAULT_ALGORITHM_NAMES`.
+            **hex_values (str): The hex value of each hash, keyed by the name of the algorithm that calculated it.
+
+        Raises:
+            TypeError: If there are more values than default algorithms, or a value is given both ways.
+            rudi_dire_insp.exceptions.HashError
+        """
+        if len(values) > len(DEFAULT_ALGORITHM_NAMES):
+            raise TypeError("{} takes at most {} positional hash values ({} given)".format(
+                type(self).__name__, len(DEFAULT_ALGORITHM_NAMES), len(values)))
+        for (name, value) in zip(DEFAULT_ALGORITHM_NAMES, values):
+            if name in hex_values:
+                raise TypeError("{} got multiple values for '{}'".format(type(self).__name__, name))
+            hex_values[name] = value
+        if not hex_values:
+            raise my_exceptions.HashError("At least one hash value is required")
+        for name in hex_values:
+            if name not in _ALGORITHM_ORDINALS:
+                # Let the lookup by name raise the usual error
+                _HashAlgorithm.from_names([name])
+        names = sorted(hex_values, key=_ALGORITHM_ORDINALS.__getitem__)
+        try:
+            digests = [bytes.fromhex(hex_values[name]) for name in names]
+        except (TypeError, ValueError) as error:
+            raise my_exceptions.HashError("Hash values must be hex strings: {!r}".format(hex_values)) from error
+        _init_hashes(self, _layout_for(tuple(zip(names, map(len, digests)))), b''.join(digests))
+
+    @property
+    def names(self) -> typing.Tuple[str, ...]:
+        """tuple: The names of the algorithms with values in this set, in a stable order."""
+        return self._layout.names
+
+    def values_for(self, names: typing.Iterable[str]) -> typing.Tuple[str, ...]:
+        """Return the hex values for the named algorithms, in the same order as the names.
+
+        Raises:
+            KeyError: If there is no value for one of the names.
+        """
+        hex_text = self._raw.hex()
+        layout = self._layout
+        hex_slices = layout.hex_slices
+        positions = layout.positions
+        values = []
+        for name in names:
+            (begin, end) = hex_slices[positions[name]]
+            values.append(hex_text[begin:end])
+        return tuple(values)
+
+    def digests_for(self, names: typing.Iterable[str]) -> typing.Tuple[bytes, ...]:
+        """Return the raw digests for the named algorithms, in the same order as the names.
+
+        Raises:
+            KeyError: If there is no value for one of the names.
+        """
+        layout = self._layout
+        slices = layout.slices
+        positions = layout.positions
+        raw = self._raw
+        digests = []
+        for name in names:
+            (begin, end) = slices[positions[name]]
+            digests.append(raw[begin:end])
+        return tuple(digests)
+
+    def _asdict(self) -> typing.Dict[str, str]:
+        """Return a new dict mapping each algorithm name to its hex value, like ``namedtuple._asdict()``."""
+        names = self._layout.names
+        return collections.OrderedDict(zip(names, self.values_for(names)))
+
+    def __getattr__(self, name: str) -> str:
+        try:
+            if name.startswith('_'):
+                raise KeyError(name)
+            return self.values_for((name,))[0]
+        except KeyError:
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name)) from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'{}' object is immutable".format(type(self).__name__))
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self.values_for(self._layout.names))
+
+    def __getitem__(self, index):
+        return self.values_for(self._layout.names)[index]
+
+    def __len__(self) -> int:
+        return len(self._layout.names)
+
+    def __eq__(self, other):
+        if not isinstance(other, Hashes):
+            return NotImplemented
+        # Layouts are shared, so equal ones are the same object
+        return self._layout is other._layout and self._raw == other._raw
+
+    def __hash__(self):
+        return hash((self._layout.key, self._raw))
+
+    def __reduce__(self):
+        return (_hashes_from_raw, (self._layout.key, self._raw))
+
+    def __copy__(self):
+        # Immutable, so a copy may as well be the same object (like tuples)
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '{}({})'.format(class_name, ', '.join('{}={!r}'.format(*item) for item in self._asdict().items()))
+
+
+def _init_hashes(hashes: Hashes, layout: _HashesLayout, raw: bytes):
+    """Set the fields of a new :py:class:`Hashes`, which are otherwise read-only."""
+    object.__setattr__(hashes, '_layout', layout)
+    object.__setattr__(hashes, '_raw', raw)
+
+
+def _hashes_from_raw(key: typing.Tuple[typing.Tuple[str, int], ...], raw: bytes) -> Hashes:
+    """Create a :py:class:`Hashes` from digests already joined together, without any checks.
+
+    Args:
+        key (tuple): The name and digest size of each algorithm, in the order of the digests.  The names must be in
+            the order of the algorithms' ordinals, as :py:attr:`Hashes.names` are.
+        raw (bytes): The digests joined together.
+
+    Returns:
+        rudi_dire_insp.hashing.Hashes
+    """
+    hashes = Hashes.__new__(Hashes)
+    _init_hashes(hashes, _layout_for(key), bytes(raw))
+    return hashes
+
+
+def _raise_if_bad_chunk_size(chunk_size: int):
+    """Raise an exception if the chunk size is not usable for reading byte streams.
+
+    Args:
+        chunk_size (int): Candidate number of bytes to read per chunk.
+
+    Raises:
+        rudi_dire_insp.exceptions.HashError
+    """
+    if isinstance(chunk_size, bool) or not isinstance(chunk_size, int) or chunk_size < 1:
+        raise my_exceptions.HashError("Chunk size must be a positive integer: {!r}".format(chunk_size))
+
+
+def _read_samples(stream: typing.BinaryIO, size: int) -> bytes:
+    """Read the bytes that a sampled fingerprint is calculated from.
+
+    These are the size of the content, then a block at its head, :py:data:`SAMPLE_BLOCKS` blocks evenly spaced
+    after it and a block at its tail, each of :py:data:`SAMPLE_BLOCK_SIZE` bytes.  Content no larger than all of the
+    blocks together is read in full instead.  The sampling is fixed, so fingerprints of the same content always
+    match.
+
+    Args:
+        stream (typing.BinaryIO): The source for the binary data, which must be seekable.
+        size (int): The size of the content.
+
+    Returns:
+        bytes: The size and the samples, joined together.
+    """
+    num_blocks = SAMPLE_BLOCKS + 2
+    if size <= num_blocks * SAMPLE_BLOCK_SIZE:
+        spans = [(0, size)]
+    else:
+        last_offset = size - SAMPLE_BLOCK_SIZE
+        spans = [(last_offset * index // (num_blocks - 1), SAMPLE_BLOCK_SIZE) for index in range(num_blocks)]
+    parts = [_SAMPLE_SIZE_PREFIX.pack(size)]
+    for (offset, length) in spans:
+        stream.seek(offset)
+        parts.append(stream.read(length))
+    return b''.join(parts)
+
+
+class _CountDownLatch:
+    """Synchronization aid that lets a thread wait until a number of other threads are done with something."""
+
+    def __init__(self, count: int):
+        """Constructor
+
+        Args:
+            count (int): The number of times :py:meth:`count_down` must be invoked before waiters are released.
+        """
+        self._count = count
+        self._condition = threading.Condition()
+
+    def count_down(self):
+        """Decrement the count, releasing all waiting threads when it reaches zero."""
+        with self._condition:
+            self._count -= 1
+            if self._count <= 0:
+                self._condition.notify_all()
+
+    def wait(self):
+        """Block until the count reaches zero."""
+        with self._condition:
+            while self._count > 0:
+                self._condition.wait()
+
+
+class _DigestWorker:
+    """Feeds chunks of bytes to a single digest on a dedicated thread.
+
+    Chunks are processed in the order they are submitted, so the digest sees the same byte sequence as it would
+    if it were updated on the calling thread.
+    """
+
+    def __init__(self, digest):
+        """Constructor
+
+        Args:
+            digest (hashlib.Digest): The digest updated by this worker.
+        """
+        self.digest = digest
+        self.error = None  # type: typing.Optional[Exception]
+        self._queue = queue.Queue()  # type: queue.Queue
+        self._thread = threading.Thread(target=self._run, name='digest-{}'.format(digest.name), daemon=True)
+        self._thread.start()
+
+    def submit(self, chunk: memoryview, latch: _CountDownLatch):
+        """Queue a chunk for the digest, counting down the latch once the digest has been updated with it."""
+        self._queue.put((chunk, latch))
+
+    def stop(self):
+        """Let the worker finish all submitted chunks and wait for its thread to exit."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        """Thread body: update the digest with each submitted chunk until told to stop."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            (chunk, latch) = item
+            try:
+                if self.error is None:
+                    self.digest.update(chunk)
+            # pylint: disable=broad-except
+            except Exception as error:
+                self.error = error
+            finally:
+                latch.count_down()
+
+
+class _TimedDigest:
+    """Wraps a digest, adding up the time spent updating it.  Only used when stats are being collected."""
+
+    __slots__ = ('_digest', 'seconds')
+
+    def __init__(self, digest):
+        """Constructor, wrapping the given digest."""
+        self._digest = digest
+        self.seconds = 0.0
+
+    @property
+    def name(self) -> str:
+        """str: The name of the wrapped digest."""
+        return self._digest.name
+
+    def update(self, data):
+        """Update the wrapped digest with the data, timing it."""
+        start = time.perf_counter()
+        self._digest.update(data)
+        self.seconds += time.perf_counter() - start
+
+    def digest(self) -> bytes:
+        """Return the value of the wrapped digest."""
+        return self._digest.digest()
+
+
+class _TimedReader:
+    """Wraps a binary stream, adding up the time spent reading it.  Only used when stats are being collected."""
+
+    __slots__ = ('_stream', 'seconds')
+
+    def __init__(self, stream: '_ReadableStream'):
+        """Constructor, wrapping the given stream."""
+        self._stream = stream
+        self.seconds = 0.0
+
+    def readinto(self, buffer) -> typing.Optional[int]:
+        """Read into the buffer from the wrapped stream, timing it."""
+        start = time.perf_counter()
+        count = self._stream.readinto(buffer)
+        self.seconds += time.perf_counter() - start
+        return count
+
+
+def _update_digests(stream: '_ReadableStream', digests: typing.Iterable, buffer: bytearray) -> int:
+    """Read the stream to its end through the buffer, updating each of the digests with every chunk read.
+
+    Args:
+        stream (_ReadableStream): The source for the binary data.
+        digests (iterable): The digests to update.
+        buffer (bytearray): The buffer reused for every read.  Its length is the chunk size.
+
+    Returns:
+        int: The number of bytes read.
+    """
+    digests = tuple(digests)
+    chunk_size = len(buffer)
+    num_read = 0
+    with memoryview(buffer) as buffer_view:
+        while True:
+            count = stream.readinto(buffer)
+            if not count:
+                break
+            num_read += count
+            chunk = buffer_view if count == chunk_size else buffer_view[:count]
+            for digest in digests:
+                digest.update(chunk)
+    return num_read
+
+
+def _update_digests_threaded(stream: '_ReadableStream', digests: typing.Iterable, chunk_size: int) -> int:
+    """Read the stream to its end, updating each of the digests on its own thread.
+
+    Each chunk is read once and shared by all of the digest threads.  Two buffers are used in turn, so the next
+    chunk is read while the digests are still working on the current one.  Content that fits in a single chunk is
+    hashed on the calling thread, since handing it off would cost more than it saves.
+
+    Args:
+        stream (_ReadableStream): The source for the binary data.
+        digests (iterable): The digests to update.
+        chunk_size (int): The maximum number of bytes to read from the stream at a time.
+
+    Returns:
+        int: The number of bytes read.
+    """
+    digests = tuple(digests)
+    buffers = (bytearray(chunk_size), bytearray(chunk_size))
+
+    # Read the first chunk before deciding whether any threads are needed
+    count = stream.readinto(buffers[0])
+    if not count:
+        return 0
+    if count < chunk_size:
+        with memoryview(buffers[0]) as buffer_view:
+            for digest in digests:
+                digest.update(buffer_view[:count])
+        return count + _update_digests(stream, digests, buffers[1])
+
+    # Hand chunks to the workers, waiting for a buffer to be released by all of them before refilling it
+    workers = [_DigestWorker(digest) for digest in digests]
+    latches = [None, None]  # type: typing.List[typing.Optional[_CountDownLatch]]
+    num_read = 0
+    index = 0
+    try:
+        while count:
+            num_read += count
+            latch = _CountDownLatch(len(workers))
+            chunk = memoryview(buffers[index])[:count]
+            for worker in workers:
+                worker.submit(chunk, latch)
+            latches[index] = latch
+
+            index = 1 - index
+            pending_latch = latches[index]
+            if pending_latch is not None:
+                pending_latch.wait()
+            count = stream.readinto(buffers[index])
+    finally:
+        for worker in workers:
+            worker.stop()
+
+    for worker in workers:
+        if worker.error is not None:
+            raise worker.error
+    return num_read
+
+
+def _update_digests_mapped(view: memoryview, digests: typing.Iterable, chunk_size: int) -> int:
+    """Update each of the digests with every chunk of bytes already in memory, such as a memory mapped file.
+
+    The chunks are slices of the view, so no bytes are copied.  Each chunk is given to every digest before moving on
+    to the next, while its pages are still in the CPU caches.
+
+    Args:
+        view (memoryview): The bytes to hash.
+        digests (iterable): The digests to update.
+        chunk_size (int): The number of bytes given to each digest at a time.
+
+    Returns:
+        int: The number of bytes hashed.
+    """
+    digests = tuple(digests)
+    size = len(view)
+    for offset in range(0, size, chunk_size):
+        # Release each slice straight away, since a memory map can't be closed while slices of it exist
+        with view[offset:offset + chunk_size] as chunk:
+            for digest in digests:
+                digest.update(chunk)
+    return size
+
+
+def _update_digests_mapped_threaded(view: memoryview, digests: typing.Iterable) -> int:
+    """Update each of the digests on its own thread with all of the bytes already in memory at once.
+
+    Args:
+        view (memoryview): The bytes to hash.
+        digests (iterable): The digests to update.
+
+    Returns:
+        int: The number of bytes hashed.
+    """
+    workers = [_DigestWorker(digest) for digest in digests]
+    latch = _CountDownLatch(len(workers))
+    try:
+        for worker in workers:
+            worker.submit(view, latch)
+        latch.wait()
+    finally:
+        # Once stopped, the workers hold no reference to the view
+        for worker in workers:
+            worker.stop()
+
+    for worker in workers:
+        if worker.error is not None:
+            raise worker.error
+    return len(view)
 
 
 # pylint: disable=too-few-public-methods,unnecessary-lambda
@@ -47,6 +561,27 @@ class _HashAlgorithm(enum.Enum):
     SHA512 = (5, lambda: hashlib.sha512())
     """SHA512 algorithm"""
 
+    SHA224 = (6, lambda: hashlib.sha224())
+    """SHA224 algorithm"""
+
+    BLAKE2B = (7, lambda: hashlib.blake2b())
+    """BLAKE2b algorithm (64 byte digest)"""
+
+    BLAKE2S = (8, lambda: hashlib.blake2s())
+    """BLAKE2s algorithm (32 byte digest)"""
+
+    SHA3_224 = (9, lambda: hashlib.sha3_224())
+    """SHA3-224 algorithm"""
+
+    SHA3_256 = (10, lambda: hashlib.sha3_256())
+    """SHA3-256 algorithm"""
+
+    SHA3_384 = (11, lambda: hashlib.sha3_384())
+    """SHA3-384 algorithm"""
+
+    SHA3_512 = (12, lambda: hashlib.sha3_512())
+    """SHA3-512 algorithm"""
+
     def __init__(self, ordinal: int, digest_constructor: typing.Callable):
         """Constructor
 
@@ -72,12 +607,91 @@ class _HashAlgorithm(enum.Enum):
         digest = self._digest_constructor()
         return digest
 
+    def __reduce_ex__(self, protocol):
+        # Pickle by name, since the values hold digest constructors that can't be pickled
+        return getattr, (type(self), self.name)
+
+    @property
+    def algorithm_name(self) -> str:
+        """str: The name of the algorithm, as used for the attributes of :py:class:`Hashes`."""
+        return self.name.lower()
+
+    @staticmethod
+    def from_names(names: typing.Optional[typing.Iterable[str]] = None) -> typing.Tuple['_HashAlgorithm', ...]:
+        """Look up the algorithms with the given names.
+
+        Args:
+            names (iterable): Names of the algorithms, e.g. ``['sha256', 'blake2b']``.  Case and duplicates are
+                ignored.  If None, the algorithms named by :py:data:`DEFAULT_ALGORITHM_NAMES` are used.
+
+        Returns:
+            tuple: The algorithms, ordered by their ordinal numbers.
+
+        Raises:
+            rudi_dire_insp.exceptions.HashError
+        """
+        if names is None:
+            names = DEFAULT_ALGORITHM_NAMES
+        algorithms = set()
+        for name in names:
+            try:
+                algorithms.add(_HashAlgorithm[str(name).upper()])
+            except KeyError as error:
+                raise my_exceptions.HashError("Unsupported hash algorithm '{}', expected one of: {}".format(
+                    name, ', '.join(ALGORITHM_NAMES))) from error
+        if not algorithms:
+            raise my_exceptions.HashError("At least one hash algorithm is required")
+        # pylint: disable=protected-access
+        return tuple(sorted(algorithms, key=lambda algorithm: algorithm._ordinal))
+
     @staticmethod
-    def calculate_hashes(stream: typing.BinaryIO) -> typing.Tuple[Hashes, int]:
+    def _new_digests(
+            algorithms: typing.Optional[typing.Iterable['_HashAlgorithm']],
+            stats: typing.Optional[my_stats.InspectionStats]) -> typing.Dict['_HashAlgorithm', typing.Any]:
+        """Create a digest for each of the algorithms, timed if there are stats, ordered by the algorithms' ordinals.
+
+        If no algorithms are given, those named by :py:data:`DEFAULT_ALGORITHM_NAMES` are used.
+        """
+        if algorithms is None:
+            algorithms = _HashAlgorithm.from_names()
+        digests = collections.OrderedDict()
+        # pylint: disable=protected-access
+        for digest_enum in sorted(set(algorithms), key=lambda algorithm: algorithm._ordinal):
+            digest = digest_enum._new_digest()
+            digests[digest_enum] = digest if stats is None else _TimedDigest(digest)
+        return digests
+
+    @staticmethod
+    def _hashes_from_digests(digests: typing.Dict['_HashAlgorithm', typing.Any]) -> Hashes:
+        """Build the hashes from digests created by :py:meth:`_new_digests`, once they have been fed everything."""
+        # The order of the digests already matches the algorithms' ordinals
+        raw_digests = [digest.digest() for digest in digests.values()]
+        layout_key = tuple(
+            (digest_enum.algorithm_name, len(raw_digest)) for digest_enum, raw_digest in zip(digests, raw_digests))
+        return _hashes_from_raw(layout_key, b''.join(raw_digests))
+
+    @staticmethod
+    def calculate_hashes(
+            stream: '_ReadableStream',
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            threaded: bool = False,
+            algorithms: typing.Optional[typing.Iterable['_HashAlgorithm']] = None,
+            stats: typing.Optional[my_stats.InspectionStats] = None) -> typing.Tuple[Hashes, int]:
         """Calculate the hashes for the content at tha path
 
+        The stream is read in chunks into preallocated buffers that are reused for the whole stream, so the memory
+        used does not depend on the size of the content being hashed.
+
         Args:
-            stream (typing.BinaryIO): The source for the binary data to calculate the hashes from.
+            stream (_ReadableStream): The source for the binary data to calculate the hashes from.
+            chunk_size (int): The maximum number of bytes to read from the stream at a time.
+            threaded (bool): If true, update each digest on its own thread.  All of the digests share each chunk
+                read from the stream, so the time taken for large content approaches that of the slowest digest
+                rather than the sum of all of them.
+            algorithms (iterable): The algorithms to calculate hashes with.  If None, the algorithms named by
+                :py:data:`DEFAULT_ALGORITHM_NAMES` are used.  Digests are only created for these algorithms.
+            stats (rudi_dire_insp.stats.InspectionStats): If given, the time spent reading the stream and updating
+                each digest is added to these stats.
 
         Returns:
             tuple: A tuple consisting of (:py:class:`rudi_dire_insp.hashing.Hashes`, :py:class:`int`)
@@ -86,31 +700,27 @@ class _HashAlgorithm(enum.Enum):
             rudi_dire_insp.exceptions.HashError
         """
         _LOGGER.debug("Begin calculating hashes using a byte stream reader")
-        # Setup all the digests
-        digests = {}
-        for digest_enum in _HashAlgorithm:
-            # pylint: disable=protected-access
-            digests[digest_enum] = digest_enum._new_digest()
+        _raise_if_bad_chunk_size(chunk_size)
+
+        # Setup the digests for the requested algorithms only
+        digests = _HashAlgorithm._new_digests(algorithms, stats)
+        timed_reader = None if stats is None else _TimedReader(stream)
+        source = stream if timed_reader is None else timed_reader  # type: _ReadableStream
 
         # Read the stream and update the digests on the way
-        num_read = 0
         try:
-            while True:
-                buffer = stream.read()
-                if buffer:
-                    num_read += len(buffer)
-                    for digest in digests.values():
-                        digest.update(buffer)
-                else:
-                    break
+            if threaded:
+                num_read = _update_digests_threaded(source, digests.values(), chunk_size)
+            else:
+                num_read = _update_digests(source, digests.values(), bytearray(chunk_size))
         except Exception as error:
             raise my_exceptions.HashError("Error calculating hashes") from error
 
-        # Return the hex values for the accumulated digests
-        hashes_params = {}
-        for digest_enum, digest in digests.items():
-            hashes_params[digest_enum.name.lower()] = digest.hexdigest()
-        hashes = Hashes(**hashes_params)
+        if stats is not None and timed_reader is not None:
+            stats.add_hashing(timed_reader.seconds, num_read, {
+                digest_enum.algorithm_name: digest.seconds for digest_enum, digest in digests.items()
+            })
+        hashes = _HashAlgorithm._hashes_from_digests(digests)
 
         if _LOGGER.isEnabledFor(logging.DEBUG):
             _LOGGER.debug("Calculated these hashes using a byte stream reader: %s", str(hashes))
@@ -118,3 +728,151 @@ class _HashAlgorithm(enum.Enum):
 
         _LOGGER.debug("Finished calculating hashes using a byte stream reader")
         return hashes, num_read
+
+    @staticmethod
+    def calculate_mapped_hashes(
+            buffer,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            threaded: bool = False,
+            algorithms: typing.Optional[typing.Iterable['_HashAlgorithm']] = None,
+            stats: typing.Optional[my_stats.InspectionStats] = None) -> typing.Tuple[Hashes, int]:
+        """Calculate the hashes for content that can be accessed in place, such as a memory mapped file.
+
+        The digests are given slices of the content instead of copies of it read into a buffer.  For a memory mapped
+        file, reading happens as the pages are first touched by the digests, so with stats the time spent reading is
+        counted as time spent hashing.
+
+        Args:
+            buffer (object): The content, as any object supporting the buffer protocol (e.g. :py:class:`mmap.mmap`).
+                No views of it remain once this returns.
+            chunk_size (int): The number of bytes given to each digest at a time.
+            threaded (bool): If true, update each digest on its own thread, each with all of the content at once.
+            algorithms (iterable): The algorithms to calculate hashes with, as for :py:meth:`calculate_hashes`.
+            stats (rudi_dire_insp.stats.InspectionStats): If given, the time spent updating each digest is added to
+                these stats.
+
+        Returns:
+            tuple: A tuple consisting of (:py:class:`rudi_dire_insp.hashing.Hashes`, :py:class:`int`)
+
+        Raises:
+            rudi_dire_insp.exceptions.HashError
+        """
+        _raise_if_bad_chunk_size(chunk_size)
+        digests = _HashAlgorithm._new_digests(algorithms, stats)
+        try:
+            with memoryview(buffer) as view:
+                if threaded and len(view) > chunk_size:
+                    num_read = _update_digests_mapped_threaded(view, digests.values())
+                else:
+                    num_read = _update_digests_mapped(view, digests.values(), chunk_size)
+        except Exception as error:
+            raise my_exceptions.HashError("Error calculating hashes") from error
+
+        if stats is not None:
+            stats.add_hashing(0.0, num_read, {
+                digest_enum.algorithm_name: digest.seconds for digest_enum, digest in digests.items()
+            })
+        return _HashAlgorithm._hashes_from_digests(digests), num_read
+
+    @staticmethod
+    def calculate_sampled_hashes(
+            stream: typing.BinaryIO,
+            size: int,
+            algorithms: typing.Optional[typing.Iterable['_HashAlgorithm']] = None,
+            stats: typing.Optional[my_stats.InspectionStats] = None) -> Hashes:
+        """Calculate a sampled fingerprint of the content of a seekable stream.
+
+        Only the size and fixed samples of the content are hashed (see :py:func:`_read_samples`), so the time taken
+        hardly depends on the size of the content, but changes that miss every sample go unnoticed.  The hashes are
+        not those of the content, and only match other sampled fingerprints.
+
+        Args:
+            stream (typing.BinaryIO): The source for the binary data, which must be seekable.
+            size (int): The size of the content.
+            algorithms (iterable): The algorithms to calculate hashes with, as for :py:meth:`calculate_hashes`.
+            stats (rudi_dire_insp.stats.InspectionStats): If given, the time spent reading the samples and updating
+                each digest is added to these stats.
+
+        Returns:
+            rudi_dire_insp.hashing.Hashes
+
+        Raises:
+            rudi_dire_insp.exceptions.HashError
+        """
+        if stats is not None:
+            start = time.perf_counter()
+        try:
+            samples = _read_samples(stream, size)
+        except Exception as error:
+            raise my_exceptions.HashError("Error reading samples") from error
+        if stats is not None:
+            stats.add_stage_time('read', time.perf_counter() - start)
+        (hashes, _) = _HashAlgorithm.calculate_hashes(
+            io.BytesIO(samples), chunk_size=len(samples), algorithms=algorithms, stats=stats)
+        return hashes
+
+
+class _DigestTemplates:
+    """Digests with nothing fed to them yet, one per algorithm, copied to hash content that is already in memory.
+
+    Copying a template skips looking up and constructing each digest, and the layout of the hashes is worked out
+    once, so the cost of hashing a small file comes down to that of its digests.
+    """
+
+    __slots__ = ('_algorithms', '_templates', '_layout_key')
+
+    def __init__(self, algorithms: typing.Optional[typing.Iterable[_HashAlgorithm]] = None):
+        """Constructor
+
+        Args:
+            algorithms (iterable): The algorithms to calculate hashes with, as for
+                :py:meth:`_HashAlgorithm.calculate_hashes`.
+        """
+        digests = _HashAlgorithm._new_digests(algorithms, None)
+        self._algorithms = tuple(digests)
+        self._templates = tuple(digests.values())
+        self._layout_key = tuple(
+            (digest_enum.algorithm_name, digest.digest_size) for (digest_enum, digest) in digests.items())
+
+    def __reduce__(self):
+        # Digests can't be pickled, so copies sent to worker processes make their own
+        return type(self), (self._algorithms,)
+
+    def calculate_hashes(self, data: bytes, stats: typing.Optional[my_stats.InspectionStats] = None) -> Hashes:
+        """Calculate the hashes of content held in memory.
+
+        Args:
+            data (bytes): The content.
+            stats (rudi_dire_insp.stats.InspectionStats): If given, the time spent updating each digest is added to
+                these stats.
+
+        Returns:
+            rudi_dire_insp.hashing.Hashes
+        """
+        raw_digests = []
+        if stats is None:
+            for template in self._templates:
+                digest = template.copy()
+                digest.update(data)
+                raw_digests.append(digest.digest())
+        else:
+            hash_seconds = {}
+            for (digest_enum, template) in zip(self._algorithms, self._templates):
+                start = time.perf_counter()
+                digest = template.copy()
+                digest.update(data)
+                raw_digests.append(digest.digest())
+                hash_seconds[digest_enum.algorithm_name] = time.perf_counter() - start
+            stats.add_hashing(0.0, len(data), hash_seconds)
+        return _hashes_from_raw(self._layout_key, b''.join(raw_digests))
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} algorithms={}>'.format(class_name, [name for (name, _) in self._layout_key])
+
+
+ALGORITHM_NAMES = tuple(algorithm.algorithm_name for algorithm in _HashAlgorithm)
+"""Names of all the hashing algorithms that can be requested."""
+
+# pylint: disable=protected-access
+_ALGORITHM_ORDINALS = {algorithm.algorithm_name: algorithm._ordinal for algorithm in _HashAlgorithm}
@@ -2,50 +2,101 @@
 rudi_dire_insp.manifests
 ========================
 
-Manifests for files and directories
+Manifests for files and directories.
+
+Also home to the reader of the compact binary manifest format, whose writer is
+:py:class:`rudi_dire_insp.serializing.BinaryManifestWriter`.  All integers in the format are little-endian, and
+offsets count from the start of the file.  A file holds, in this order:
+
+* A header: the magic bytes ``RDIMANIF``, the format version and the number of hashing algorithms, then the name
+  and digest size of each algorithm.
+* The records, one per file and all the same size: the offset and length of the relative path in the string table,
+  the size of the file, then the raw digest of each algorithm.
+* The string table: each relative path, encoded as by :py:func:`rudi_dire_insp.walking.relative_path_key`.
+* The path index: the record numbers ordered by relative path key.
+* The digest index: the record numbers ordered by the first 8 bytes of the digest of one algorithm, SHA256 where
+  it was calculated.
+* A fixed size trailer locating the sections above, ending in the magic bytes ``RDIMEND``.
+
+Every section is written sequentially, so the format can be written to a pipe.  The trailer is only written once
+all manifests are, so a truncated file is detected when it is opened.
 """
 
 # Imports from Python distribution
-import copy
 import logging
+import mmap
+import os
+import struct
 import typing
 
 # Imports from 3rd party
 
 # Imports from this project
+import rudi_dire_insp.exceptions as my_exceptions
 import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.walking as my_walking
 
 # Module variables
 _LOGGER = logging.getLogger(__name__)
 
+_BINARY_MAGIC = b'RDIMANIF'
+_BINARY_END_MAGIC = b'RDIMEND\0'
+_BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct('<8sHH')
+"""Magic bytes, format version and number of algorithms."""
+_BINARY_ALGORITHM = struct.Struct('<16sH')
+"""Name and digest size of an algorithm."""
+_BINARY_RECORD = struct.Struct('<QIQ')
+"""Offset and length of the relative path in the string table, and size of the file.  The digests follow."""
+_BINARY_INDEX_ENTRY = struct.Struct('<I')
+"""Record number held by an entry of the path and digest indexes."""
+_BINARY_TRAILER = struct.Struct('<QQQQQQH6x8s')
+"""Offsets of the records, string table, path index and digest index, the number of records and the length of the
+string table, the position of the indexed algorithm in the header and the end magic bytes."""
+_BINARY_NO_DIGEST_INDEX = 0xFFFF
+_BINARY_DIGEST_PREFIX_SIZE = 8
+_BINARY_MAX_RECORDS = 2 ** 32 - 1
+
 
 # pylint: disable=too-few-public-methods
 class RawBytesManifest:
     """A manifest for a set of raw bytes."""
 
-    def __init__(self, hashes: my_hashing.Hashes, size: int):
+    __slots__ = ('_size', '_hashes', '_sampled')
+
+    def __init__(self, hashes: my_hashing.Hashes, size: int, sampled: bool = False):
         """Constructor
 
         Args:
             hashes (rudi_dire_insp.hashing.Hashes): Hashes of the bytes represented by this manifest.
             size (int): Total number of bytes processed to make the manifest
+            sampled (bool): If true, the hashes are a sampled fingerprint of the bytes rather than hashes of all of
+                them, see :py:meth:`rudi_dire_insp.hashing._HashAlgorithm.calculate_sampled_hashes`.
         """
         # Init private fields
         self._size = int(size)
         self._hashes = hashes
+        self._sampled = bool(sampled)
 
     @property
     def hashes(self) -> my_hashing.Hashes:
-        """rudi_dire_insp.hashing.Hashes: A defensive copy of the hashes in this manifest."""
-        return copy.copy(self._hashes)
+        """rudi_dire_insp.hashing.Hashes: The hashes in this manifest, which are immutable."""
+        return self._hashes
 
     @property
     def size(self) -> int:
         """int: Total number of bytes processed to create this manifest."""
         return self._size
 
+    @property
+    def sampled(self) -> bool:
+        """bool: Whether the hashes are a sampled fingerprint, which only matches other sampled fingerprints."""
+        return self._sampled
+
     def __repr__(self):
         class_name = type(self).__name__
+        if self._sampled:
+            return '<{} hashes={}, size={}, sampled=True>' .format(class_name, self._hashes, self._size)
         return '<{} hashes={}, size={}>' .format(class_name, self._hashes, self._size)
 
     def __str__(self):
@@ -56,6 +107,8 @@ class RawBytesManifest:
 class FileManifest:
     """A manifest for an individual file."""
 
+    __slots__ = ('_relative_path', '_raw_manifest')
+
     def __init__(self, relative_path: typing.Tuple[str, ...], raw_manifest: RawBytesManifest):
         """Constructor
 
@@ -88,3 +141,304 @@ class FileManifest:
 
     def __str__(self):
         return self.__repr__()
+
+
+# pylint: disable=too-few-public-methods
+class DirectoryManifest:
+    """A manifest for a directory, aggregating the manifests of every file under it.
+
+    The hashes are of a Merkle tree: each is calculated over the name, size and digest of every file directly in the
+    directory and the name, size, file count and digest of every sub directory, in name order.  Two directories have
+    the same hashes if and only if (barring collisions) they hold the same names with the same contents at every
+    depth, wherever they are, so a comparison can skip a whole subtree when the hashes of its root match.  Directories
+    without any files under them are left out, as git does.
+    """
+
+    __slots__ = ('_relative_path', '_hashes', '_size', '_file_count', '_sampled')
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            relative_path: str,
+            hashes: my_hashing.Hashes,
+            size: int,
+            file_count: int,
+            sampled: bool = False):
+        """Constructor
+
+        Warning:
+              You should not instantiate this class directly.  Instances of it should be retrieved by invoking
+              :py:meth:`rudi_dire_insp.core.DirectoryInspector.inspect_tree`.
+        Args:
+            relative_path (str): The relative path to the directory, ``''`` for the root directory being inspected.
+            hashes (rudi_dire_insp.hashing.Hashes): The aggregate hashes of the directory, one per algorithm of the
+                file manifests under it.
+            size (int): The total size of the files under the directory, at any depth.
+            file_count (int): The number of files under the directory, at any depth.
+            sampled (bool): If true, some of the files under the directory only have sampled fingerprints.
+        """
+        self._relative_path = relative_path
+        self._hashes = hashes
+        self._size = int(size)
+        self._file_count = int(file_count)
+        self._sampled = bool(sampled)
+
+    @property
+    def relative_path(self) -> str:
+        """str: Relative path for the directory within the inspected directory, ``''`` for the root."""
+        return self._relative_path
+
+    @property
+    def hashes(self) -> my_hashing.Hashes:
+        """rudi_dire_insp.hashing.Hashes: The aggregate hashes of the directory, which are immutable."""
+        return self._hashes
+
+    @property
+    def size(self) -> int:
+        """int: Total size of the files under the directory."""
+        return self._size
+
+    @property
+    def file_count(self) -> int:
+        """int: Number of files under the directory."""
+        return self._file_count
+
+    @property
+    def sampled(self) -> bool:
+        """bool: Whether some of the files under the directory only have sampled fingerprints."""
+        return self._sampled
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} relative_path="{}", hashes={}, size={}, file_count={}{}>'.format(
+            class_name, self._relative_path, self._hashes, self._size, self._file_count,
+            ', sampled=True' if self._sampled else '')
+
+    def __str__(self):
+        return self.__repr__()
+
+
+# pylint: disable=too-many-instance-attributes
+class BinaryManifestReader:
+    """Random access to the file manifests in a binary manifest file, through a read-only memory map.
+
+    Nothing is read up front besides the header and trailer, so opening a file is fast whatever its size, and
+    manifests are only built when asked for.  Lookups by relative path or by digest use binary searches of the
+    indexes stored in the file.
+
+    Use as a context manager, or call :py:meth:`close` once done.
+    """
+
+    def __init__(self, path: str):
+        """Constructor
+
+        Args:
+            path (str): The path to the binary manifest file.
+
+        Raises:
+            rudi_dire_insp.exceptions.ManifestFormatError: If the file isn't a complete binary manifest file.
+        """
+        self._path = path
+        with open(path, 'rb') as manifest_file:
+            file_size = os.fstat(manifest_file.fileno()).st_size
+            if file_size < _BINARY_HEADER.size + _BINARY_TRAILER.size:
+                raise my_exceptions.ManifestFormatError("Not a binary manifest file: {}".format(path))
+            # The map stays valid once the file is closed
+            self._map = mmap.mmap(manifest_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_layout(file_size)
+        except (my_exceptions.ManifestFormatError, struct.error, UnicodeDecodeError) as error:
+            self._map.close()
+            if isinstance(error, my_exceptions.ManifestFormatError):
+                raise
+            raise my_exceptions.ManifestFormatError("Corrupt binary manifest file: {}".format(path)) from error
+
+    def _read_layout(self, file_size: int):
+        """Read the header and trailer, and check that the sections they describe fit in the file."""
+        # pylint: disable=too-many-locals
+        (magic, version, num_algorithms) = _BINARY_HEADER.unpack_from(self._map, 0)
+        if magic != _BINARY_MAGIC:
+            raise my_exceptions.ManifestFormatError("Not a binary manifest file: {}".format(self._path))
+        if version != _BINARY_VERSION:
+            raise my_exceptions.ManifestFormatError(
+                "Unsupported binary manifest version {}: {}".format(version, self._path))
+        (records_offset, record_count, strings_offset, strings_length, path_index_offset, digest_index_offset,
+         digest_index_position, end_magic) = _BINARY_TRAILER.unpack_from(self._map, file_size - _BINARY_TRAILER.size)
+        if end_magic != _BINARY_END_MAGIC:
+            raise my_exceptions.ManifestFormatError("Truncated binary manifest file: {}".format(self._path))
+
+        names = []
+        digest_fields = []
+        digest_offset = _BINARY_RECORD.size
+        for position in range(num_algorithms):
+            (raw_name, digest_size) = _BINARY_ALGORITHM.unpack_from(
+                self._map, _BINARY_HEADER.size + position * _BINARY_ALGORITHM.size)
+            name = raw_name.rstrip(b'\0').decode('ascii')
+            names.append(name)
+            digest_fields.append((name, digest_offset, digest_offset + digest_size))
+            digest_offset += digest_size
+        if (not names or set(names) - set(my_hashing.ALGORITHM_NAMES)
+                or names != sorted(names, key=my_hashing.ALGORITHM_NAMES.index)):
+            raise my_exceptions.ManifestFormatError(
+                "Unsupported hash algorithms {} in binary manifest file: {}".format(names, self._path))
+
+        self._names = tuple(names)
+        self._digest_fields = tuple(digest_fields)
+        self._layout_key = tuple((name, end - begin) for (name, begin, end) in digest_fields)
+        self._record_size = digest_offset
+        self._records_offset = records_offset
+        self._count = record_count
+        self._strings_offset = strings_offset
+        self._path_index_offset = path_index_offset
+        self._digest_index_offset = digest_index_offset
+        if digest_index_position == _BINARY_NO_DIGEST_INDEX:
+            self._digest_index_field = None
+        else:
+            self._digest_index_field = digest_fields[digest_index_position]
+
+        index_size = record_count * _BINARY_INDEX_ENTRY.size
+        if (records_offset + record_count * self._record_size > strings_offset
+                or strings_offset + strings_length > path_index_offset
+                or path_index_offset + index_size > digest_index_offset
+                or digest_index_offset + index_size > file_size - _BINARY_TRAILER.size):
+            raise my_exceptions.ManifestFormatError("Corrupt binary manifest file: {}".format(self._path))
+
+    @property
+    def algorithm_names(self) -> typing.Tuple[str, ...]:
+        """tuple: The names of the hashing algorithms held for each file."""
+        return self._names
+
+    @property
+    def indexed_algorithm_name(self) -> typing.Optional[str]:
+        """str: The name of the algorithm whose digests can be looked up with :py:meth:`find_digest`."""
+        if self._digest_index_field is None:
+            return None
+        return self._digest_index_field[0]
+
+    def _record_offset(self, record_number: int) -> int:
+        return self._records_offset + record_number * self._record_size
+
+    def _path_key_at(self, record_offset: int) -> bytes:
+        (string_offset, string_length, _) = _BINARY_RECORD.unpack_from(self._map, record_offset)
+        start = self._strings_offset + string_offset
+        return self._map[start:start + string_length]
+
+    def _manifest_at(self, record_offset: int) -> FileManifest:
+        (string_offset, string_length, size) = _BINARY_RECORD.unpack_from(self._map, record_offset)
+        start = self._strings_offset + string_offset
+        relative_path = tuple(os.fsdecode(element) for element in self._map[start:start + string_length].split(b'\0'))
+        # The digests are stored in the order of the algorithms' ordinals, as Hashes holds them
+        raw_digests = self._map[record_offset + _BINARY_RECORD.size:record_offset + self._record_size]
+        # pylint: disable=protected-access
+        hashes = my_hashing._hashes_from_raw(self._layout_key, raw_digests)
+        return FileManifest(relative_path, RawBytesManifest(hashes, size))
+
+    def _index_entry(self, index_offset: int, position: int) -> int:
+        return _BINARY_INDEX_ENTRY.unpack_from(self._map, index_offset + position * _BINARY_INDEX_ENTRY.size)[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, record_number: int) -> FileManifest:
+        """Build the manifest held by a record, in the order the records were written."""
+        if record_number < 0:
+            record_number += self._count
+        if not 0 <= record_number < self._count:
+            raise IndexError("Record number out of range: {}".format(record_number))
+        return self._manifest_at(self._record_offset(record_number))
+
+    def __iter__(self) -> typing.Iterator[FileManifest]:
+        for record_number in range(self._count):
+            yield self._manifest_at(self._record_offset(record_number))
+
+    def iter_by_path(self) -> typing.Iterator[FileManifest]:
+        """Iterate over the manifests in the order of :py:func:`rudi_dire_insp.walking.relative_path_key`.
+
+        Yields:
+            rudi_dire_insp.manifests.FileManifest: The manifest of each file.
+        """
+        for position in range(self._count):
+            record_number = self._index_entry(self._path_index_offset, position)
+            yield self._manifest_at(self._record_offset(record_number))
+
+    def find_path(self, relative_path: typing.Tuple[str, ...]) -> typing.Optional[FileManifest]:
+        """Look up the manifest of the file at a relative path.
+
+        Args:
+            relative_path (tuple): The relative path, as held by :py:attr:`FileManifest.relative_path`.
+
+        Returns:
+            rudi_dire_insp.manifests.FileManifest: The manifest of the file, or None if there isn't one.
+        """
+        key = my_walking.relative_path_key(relative_path)
+        (low, high) = (0, self._count)
+        while low < high:
+            middle = (low + high) // 2
+            record_offset = self._record_offset(self._index_entry(self._path_index_offset, middle))
+            middle_key = self._path_key_at(record_offset)
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return self._manifest_at(record_offset)
+        return None
+
+    def find_digest(self, digest: typing.Union[str, bytes]) -> typing.List[FileManifest]:
+        """Look up the manifests of all files with a digest of the indexed algorithm.
+
+        Args:
+            digest (str or bytes): The digest, either raw or as a hex string.
+
+        Returns:
+            list: The manifests of the files with the digest, in record order.  Empty if there are none.
+
+        Raises:
+            rudi_dire_insp.exceptions.ManifestFormatError: If the file has no digest index, or the digest is a string
+                that isn't hexadecimal.
+        """
+        if self._digest_index_field is None:
+            raise my_exceptions.ManifestFormatError("No digest index in binary manifest file: {}".format(self._path))
+        if isinstance(digest, str):
+            try:
+                digest = bytes.fromhex(digest)
+            except ValueError as error:
+                raise my_exceptions.ManifestFormatError("Digest isn't a hex string: {!r}".format(digest)) from error
+        (_, begin, end) = self._digest_index_field
+        prefix = digest[:_BINARY_DIGEST_PREFIX_SIZE]
+        prefix_end = begin + _BINARY_DIGEST_PREFIX_SIZE
+
+        # Find the first index entry whose prefix isn't less than the one looked up
+        (low, high) = (0, self._count)
+        while low < high:
+            middle = (low + high) // 2
+            record_offset = self._record_offset(self._index_entry(self._digest_index_offset, middle))
+            if self._map[record_offset + begin:record_offset + prefix_end] < prefix:
+                low = middle + 1
+            else:
+                high = middle
+
+        # The index is only ordered by prefix, so check the full digest of every entry sharing it
+        record_numbers = []
+        for position in range(low, self._count):
+            record_number = self._index_entry(self._digest_index_offset, position)
+            record_offset = self._record_offset(record_number)
+            if self._map[record_offset + begin:record_offset + prefix_end] != prefix:
+                break
+            if self._map[record_offset + begin:record_offset + end] == digest:
+                record_numbers.append(record_number)
+        return [self._manifest_at(self._record_offset(record_number)) for record_number in sorted(record_numbers)]
+
+    def close(self):
+        """Release the memory map."""
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} path="{}", count={}>'.format(class_name, self._path, self._count)
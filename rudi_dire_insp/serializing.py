@@ -0,0 +1,456 @@
+"""
+rudi_dire_insp.serializing
+==========================
+
+Serialization of manifests for output streams.
+
+The JSON Lines output is produced from precompiled templates with the keys already in sorted order, rather than by
+building a dict per manifest and having :py:func:`json.dumps` sort it.  The bytes produced are identical to
+``json.dumps(data, sort_keys=True)`` with its default separators and ``ensure_ascii=True``.
+
+The compact binary output is described in :py:mod:`rudi_dire_insp.manifests`, next to its reader.
+"""
+
+# Imports from Python distribution
+import array
+import json
+import json.encoder
+import logging
+import shutil
+import sys
+import tempfile
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.walking as my_walking
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 256 * 1024
+"""Default number of bytes of output collected before they are written to the underlying stream."""
+
+_STRING_TABLE_SPOOL_SIZE = 16 * 1024 * 1024
+"""Number of bytes of the binary string table held in memory before it is spooled to a temporary file."""
+
+_INDEXED_ALGORITHM_NAME = 'sha256'
+
+
+def _select_string_encoder() -> typing.Tuple[str, typing.Callable[[str], str]]:
+    """Pick the fastest available function that encodes a string exactly as :py:func:`json.dumps` does.
+
+    The C accelerator of the standard library's JSON encoder is an optional part of Python builds, so fall back to
+    the pure Python version if it is missing.  Third party encoders such as orjson are not candidates, since they
+    don't escape non-ASCII characters the same way and so can't produce identical output.
+
+    Returns:
+        tuple: The name of the backend and the encoding function.
+    """
+    c_encoder = getattr(json.encoder, 'c_encode_basestring_ascii', None)
+    if c_encoder is not None:
+        return 'json-c', c_encoder
+    return 'json-python', json.encoder.py_encode_basestring_ascii
+
+
+(BACKEND_NAME, _encode_string) = _select_string_encoder()
+"""The name of the string encoding backend in use."""
+
+
+def _hashes_template(
+        names: typing.Tuple[str, ...],
+        sampled: bool = False) -> typing.Tuple[str, typing.Tuple[str, ...]]:
+    """Build the %-format template for a JSON Lines record holding hashes with the given algorithm names.
+
+    Args:
+        names (tuple): The names of the algorithms, in any order.
+        sampled (bool): If true, the record is marked as holding a sampled fingerprint.
+
+    Returns:
+        tuple: The template, taking the hash hex values in sorted name order, then the encoded relative path
+        elements joined together, then the size.  Also the names in the order the template expects them.
+    """
+    sorted_names = tuple(sorted(names))
+    hash_fields = ', '.join('{}: "%s"'.format(_encode_string(name)) for name in sorted_names)
+    sampled_field = ', "sampled": true' if sampled else ''
+    template = '{"hashes": {' + hash_fields + '}, "relative_path": [%s]' + sampled_field + ', "size": %d}\n'
+    return template, sorted_names
+
+
+# pylint: disable=too-few-public-methods
+class JsonLinesEncoder:
+    """Encodes file manifests as JSON Lines text.
+
+    Templates are cached per set of hash algorithm names, and the encoding of the directory part of relative paths
+    is remembered between consecutive manifests, since files from the same directory are usually seen together.
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self._templates = {}  # type: typing.Dict[typing.Tuple, typing.Tuple[str, typing.Tuple[str, ...]]]
+        self._last_dir_part = None  # type: typing.Optional[str]
+        self._last_dir_part_text = ''
+
+    def encode(self, manifest: my_manifests.FileManifest) -> str:
+        """Encode the manifest as one line of JSON text, including the trailing newline.
+
+        Args:
+            manifest (rudi_dire_insp.manifests.FileManifest): The manifest to encode.
+
+        Returns:
+            str: The JSON text, which only contains ASCII characters.
+        """
+        raw_manifest = manifest.raw_manifest
+        hashes = raw_manifest.hashes
+        template_key = (hashes.names, raw_manifest.sampled)
+        try:
+            (template, sorted_names) = self._templates[template_key]
+        except KeyError:
+            (template, sorted_names) = self._templates[template_key] = _hashes_template(*template_key)
+
+        relative_path = manifest.relative_path
+        if len(relative_path) == 2:
+            dir_part = relative_path[0]
+            if dir_part != self._last_dir_part:
+                self._last_dir_part = dir_part
+                self._last_dir_part_text = _encode_string(dir_part)
+            path_text = self._last_dir_part_text + ', ' + _encode_string(relative_path[1])
+        else:
+            path_text = ', '.join(_encode_string(element) for element in relative_path)
+
+        values = hashes.values_for(sorted_names) + (path_text, raw_manifest.size)
+        return template % values
+
+
+class JsonLinesWriter:
+    """Writes file manifests to a binary stream as JSON Lines, in large batches.
+
+    Use as a context manager, or call :py:meth:`flush` once done, to make sure all output reaches the stream.
+    """
+
+    def __init__(self, output_buffer: typing.BinaryIO, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        """Constructor
+
+        Args:
+            output_buffer (typing.BinaryIO): The stream to write to.
+            buffer_size (int): The number of bytes collected before they are written to the stream.
+        """
+        self._output_buffer = output_buffer
+        self._buffer_size = buffer_size
+        self._encoder = JsonLinesEncoder()
+        self._pending = []  # type: typing.List[str]
+        self._pending_size = 0
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        """int: The number of manifests written so far."""
+        return self._count
+
+    def write(self, manifest: my_manifests.FileManifest):
+        """Write a manifest as one line of JSON.
+
+        Args:
+            manifest (rudi_dire_insp.manifests.FileManifest): The manifest to write.
+        """
+        text = self._encoder.encode(manifest)
+        self._pending.append(text)
+        self._pending_size += len(text)
+        self._count += 1
+        if self._pending_size >= self._buffer_size:
+            self._write_pending()
+
+    def flush(self):
+        """Write everything collected so far to the stream, and flush it."""
+        self._write_pending()
+        self._output_buffer.flush()
+
+    def _write_pending(self):
+        """Write everything collected so far to the stream."""
+        if self._pending:
+            # The text is pure ASCII, so encoding it as such gives the same bytes as UTF-8, only faster
+            self._output_buffer.write(''.join(self._pending).encode('ascii'))
+            self._pending = []
+            self._pending_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+def read_json_lines(input_buffer: typing.BinaryIO) -> typing.Iterator[my_manifests.FileManifest]:
+    """Read back file manifests written as JSON Lines, one at a time.
+
+    Args:
+        input_buffer (typing.BinaryIO): The stream to read from.
+
+    Yields:
+        rudi_dire_insp.manifests.FileManifest: The manifest on each non-blank line, in the order of the lines.
+
+    Raises:
+        rudi_dire_insp.exceptions.ManifestFormatError: If a line doesn't hold a file manifest.
+    """
+    for (line_number, line) in enumerate(input_buffer, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line.decode('utf-8'))
+            hashes = my_hashing.Hashes(**data['hashes'])
+            sampled = data.get('sampled', False)
+            if not isinstance(sampled, bool):
+                raise TypeError("Expected a boolean for sampled: {!r}".format(sampled))
+            manifest = my_manifests.FileManifest(
+                tuple(data['relative_path']), my_manifests.RawBytesManifest(hashes, data['size'], sampled))
+        except (ValueError, KeyError, TypeError, my_exceptions.HashError) as error:
+            raise my_exceptions.ManifestFormatError("Invalid manifest on line {}".format(line_number)) from error
+        yield manifest
+
+
+def encode_directory_manifest(manifest: my_manifests.DirectoryManifest) -> str:
+    """Encode a directory manifest as one line of JSON text, including the trailing newline.
+
+    Directories are few next to files, so unlike file manifests these are simply encoded by :py:func:`json.dumps`,
+    with sorted keys.  The relative path is a single string, which tells the two kinds of lines apart.
+
+    Args:
+        manifest (rudi_dire_insp.manifests.DirectoryManifest): The manifest to encode.
+
+    Returns:
+        str: The JSON text, which only contains ASCII characters.
+    """
+    data = {
+        'file_count': manifest.file_count,
+        'hashes': manifest.hashes._asdict(),
+        'relative_path': manifest.relative_path,
+        'size': manifest.size,
+    }
+    if manifest.sampled:
+        data['sampled'] = True
+    return json.dumps(data, sort_keys=True) + '\n'
+
+
+def read_directory_json_lines(input_buffer: typing.BinaryIO) -> typing.Iterator[my_manifests.DirectoryManifest]:
+    """Read back directory manifests written as JSON Lines, one at a time.
+
+    Args:
+        input_buffer (typing.BinaryIO): The stream to read from.
+
+    Yields:
+        rudi_dire_insp.manifests.DirectoryManifest: The manifest on each non-blank line, in the order of the lines.
+
+    Raises:
+        rudi_dire_insp.exceptions.ManifestFormatError: If a line doesn't hold a directory manifest.
+    """
+    for (line_number, line) in enumerate(input_buffer, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line.decode('utf-8'))
+            if not isinstance(data['relative_path'], str) or not isinstance(data.get('sampled', False), bool):
+                raise TypeError("Not a directory manifest: {!r}".format(data))
+            manifest = my_manifests.DirectoryManifest(
+                data['relative_path'], my_hashing.Hashes(**data['hashes']), data['size'], data['file_count'],
+                data.get('sampled', False))
+        except (ValueError, KeyError, TypeError, my_exceptions.HashError) as error:
+            raise my_exceptions.ManifestFormatError(
+                "Invalid directory manifest on line {}".format(line_number)) from error
+        yield manifest
+
+
+# pylint: disable=too-many-instance-attributes
+class BinaryManifestWriter:
+    """Writes file manifests to a binary stream in the compact binary format.
+
+    Records are written as manifests arrive, while the relative paths are collected in a temporary file that spills
+    to disk once large.  Only 12 bytes per record are kept in memory: the length of its path key and the first 8
+    bytes of its indexed digest, which are enough to build the indexes.  The path index costs nothing when the
+    manifests arrive in path order, as the directory inspector produces them by default.  Otherwise the path keys
+    are kept in memory from the first manifest out of order on.
+
+    Use as a context manager, or call :py:meth:`close` once done.  The indexes and trailer are only written by a
+    successful close, so the output of a failed run can't be mistaken for a complete one.
+    """
+
+    def __init__(
+            self,
+            output_buffer: typing.BinaryIO,
+            algorithm_names: typing.Iterable[str],
+            buffer_size: int = DEFAULT_BUFFER_SIZE):
+        """Constructor
+
+        Args:
+            output_buffer (typing.BinaryIO): The stream to write to.  It doesn't need to be seekable.
+            algorithm_names (iterable): The names of the hashing algorithms every manifest will hold.
+            buffer_size (int): The number of bytes collected before they are written to the stream.
+
+        Raises:
+            rudi_dire_insp.exceptions.HashError: If an algorithm name isn't supported.
+        """
+        # pylint: disable=protected-access
+        algorithms = my_hashing._HashAlgorithm.from_names(algorithm_names)
+        self._names = tuple(algorithm.algorithm_name for algorithm in algorithms)
+        digest_sizes = tuple(algorithm._new_digest().digest_size for algorithm in algorithms)
+        if _INDEXED_ALGORITHM_NAME in self._names:
+            self._indexed_position = self._names.index(_INDEXED_ALGORITHM_NAME)
+        else:
+            self._indexed_position = 0
+        self._digest_prefixes = array.array('Q')
+
+        self._output_buffer = output_buffer
+        self._buffer_size = buffer_size
+        self._pending = []  # type: typing.List[bytes]
+        self._pending_size = 0
+        self._offset = 0
+        self._count = 0
+        self._closed = False
+
+        # Outlives the constructor, and is closed by close() once copied to the stream
+        # pylint: disable=consider-using-with
+        self._strings = tempfile.SpooledTemporaryFile(max_size=_STRING_TABLE_SPOOL_SIZE)
+        self._strings_length = 0
+        self._last_path_key = b''
+        self._key_lengths = array.array('I')
+        self._path_keys = None  # type: typing.Optional[typing.List[bytes]]
+
+        self._append(my_manifests._BINARY_HEADER.pack(
+            my_manifests._BINARY_MAGIC, my_manifests._BINARY_VERSION, len(self._names)))
+        for (name, digest_size) in zip(self._names, digest_sizes):
+            self._append(my_manifests._BINARY_ALGORITHM.pack(name.encode('ascii'), digest_size))
+        self._records_offset = self._offset + self._pending_size
+
+    @property
+    def count(self) -> int:
+        """int: The number of manifests written so far."""
+        return self._count
+
+    def write(self, manifest: my_manifests.FileManifest):
+        """Write the record of a manifest.
+
+        Args:
+            manifest (rudi_dire_insp.manifests.FileManifest): The manifest to write.
+
+        Raises:
+            rudi_dire_insp.exceptions.ManifestFormatError: If the manifest doesn't hold hashes for exactly the
+                algorithms given to the constructor, holds a sampled fingerprint, or the format's limit on the
+                number of records is reached.
+        """
+        # pylint: disable=protected-access
+        if self._count >= my_manifests._BINARY_MAX_RECORDS:
+            raise my_exceptions.ManifestFormatError("Too many manifests for the binary format")
+        raw_manifest = manifest.raw_manifest
+        if raw_manifest.sampled:
+            raise my_exceptions.ManifestFormatError("Sampled fingerprints can't be written in the binary format")
+        hashes = raw_manifest.hashes
+        if hashes.names != self._names:
+            raise my_exceptions.ManifestFormatError("Expected hashes for {} but got {}".format(
+                ', '.join(self._names), ', '.join(hashes.names)))
+        digests = hashes.digests_for(self._names)
+
+        path_key = my_walking.relative_path_key(manifest.relative_path)
+        if self._path_keys is not None:
+            self._path_keys.append(path_key)
+        elif path_key < self._last_path_key:
+            self._path_keys = self._read_path_keys()
+            self._path_keys.append(path_key)
+        self._last_path_key = path_key
+
+        self._append(my_manifests._BINARY_RECORD.pack(self._strings_length, len(path_key), raw_manifest.size))
+        self._append(b''.join(digests))
+        self._strings.write(path_key)
+        self._strings_length += len(path_key)
+        self._key_lengths.append(len(path_key))
+        self._digest_prefixes.append(int.from_bytes(
+            digests[self._indexed_position][:my_manifests._BINARY_DIGEST_PREFIX_SIZE], 'big'))
+        self._count += 1
+
+    def _read_path_keys(self) -> typing.List[bytes]:
+        """Read back the path keys of the records written so far from the string table."""
+        self._strings.seek(0)
+        table = self._strings.read()
+        path_keys = []
+        start = 0
+        for length in self._key_lengths:
+            path_keys.append(table[start:start + length])
+            start += length
+        return path_keys
+
+    def _append(self, data: bytes):
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= self._buffer_size:
+            self._write_pending()
+
+    def _write_pending(self):
+        """Write everything collected so far to the stream."""
+        if self._pending:
+            self._output_buffer.write(b''.join(self._pending))
+            self._offset += self._pending_size
+            self._pending = []
+            self._pending_size = 0
+
+    def flush(self):
+        """Write the records collected so far to the stream, and flush it."""
+        self._write_pending()
+        self._output_buffer.flush()
+
+    def close(self):
+        """Write the string table, the indexes and the trailer, then flush the stream.
+
+        Nothing can be written afterwards.
+        """
+        # pylint: disable=protected-access
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._write_pending()
+            strings_offset = self._offset
+            self._strings.seek(0)
+            shutil.copyfileobj(self._strings, self._output_buffer)
+        finally:
+            self._strings.close()
+        self._offset += self._strings_length
+
+        path_index_offset = self._offset
+        if self._path_keys is None:
+            path_index = array.array('I', range(self._count))
+        else:
+            path_index = array.array('I', sorted(range(self._count), key=self._path_keys.__getitem__))
+            self._path_keys = None
+        self._write_index(path_index)
+
+        digest_index_offset = self._offset
+        prefixes = self._digest_prefixes
+        self._write_index(array.array('I', sorted(range(self._count), key=prefixes.__getitem__)))
+        self._digest_prefixes = array.array('Q')
+        self._key_lengths = array.array('I')
+
+        self._append(my_manifests._BINARY_TRAILER.pack(
+            self._records_offset, self._count, strings_offset, self._strings_length, path_index_offset,
+            digest_index_offset, self._indexed_position, my_manifests._BINARY_END_MAGIC))
+        self.flush()
+
+    def _write_index(self, index: array.array):
+        """Write an index of record numbers as little-endian integers."""
+        if sys.byteorder != 'little':
+            index.byteswap()
+        data = index.tobytes()
+        self._output_buffer.write(data)
+        self._offset += len(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave the output without a trailer, so it can't be mistaken for a complete manifest file
+            self.flush()
+            self._strings.close()
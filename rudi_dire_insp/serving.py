@@ -0,0 +1,450 @@
+"""
+rudi_dire_insp.serving
+======================
+
+A local service answering lookups over an index of manifests held in memory, by path, path prefix and digest.
+
+The index is built once, by inspecting a directory or loading an inspection output, so each lookup is a dictionary
+access or a binary search rather than an inspection.  It is served over HTTP, on a localhost port or a Unix socket,
+and answers in the JSON Lines format of an inspection:
+
+* ``GET /path?path=a/b.txt`` answers with the manifest of the file, or status 404 if there is none.
+* ``GET /prefix?path=a`` answers with the manifests of every file under the directory, in walk order.
+* ``GET /digest?value=HEX`` answers with the manifests of every file with that digest, of any algorithm.
+
+An entry may be revalidated before answering.  Its file is checked with a single call to :py:func:`os.stat`, and only
+hashed again if its status changed since the index was built, or since its last revalidation.
+"""
+
+# Imports from Python distribution
+import bisect
+import http.server
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import threading
+import typing
+import urllib.parse
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
+import rudi_dire_insp.walking as my_walking
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+_LOCALHOST = '127.0.0.1'
+_CONTENT_TYPE = 'application/x-ndjson'
+
+_CLOCK_MARGIN_NS = 10 ** 9
+"""How far behind the clock file change times may be, since file systems keep them with a coarser clock."""
+
+_Signature = typing.Tuple[int, int, int, int]
+"""The size, modification and change times in nanoseconds, and inode number of a file."""
+
+_Entry = typing.Tuple[bytes, my_manifests.FileManifest, typing.Optional[_Signature]]
+"""The path, manifest and signature known for an entry of the index, as taken to revalidate it."""
+
+
+def _signature(stat_result: os.stat_result) -> _Signature:
+    return stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ctime_ns, stat_result.st_ino
+
+
+def _path_bytes(relative_path: typing.Tuple[str, ...]) -> bytes:
+    """Join a relative path into the bytes prefix lookups search, where everything under a directory is contiguous."""
+    return os.fsencode(os.path.join(*relative_path))
+
+
+# pylint: disable=too-many-instance-attributes
+class ManifestIndex:
+    """Manifests of the files of a directory, indexed by path and by digest.
+
+    Lookups are safe from several threads at once, and files are only read with the lock released.  Revalidation
+    needs the path to the directory the manifests describe, and the time they were known to be current: a file whose
+    status changed since then is hashed again when it is first revalidated.  Status changes can't be backdated,
+    unlike modification times, so they are used for this first check.
+    """
+
+    def __init__(
+            self,
+            manifests: typing.Iterable[my_manifests.FileManifest],
+            root_path: typing.Optional[str] = None,
+            current_at_ns: typing.Optional[int] = None,
+            chunk_size: int = my_hashing.DEFAULT_CHUNK_SIZE):
+        """Constructor
+
+        Args:
+            manifests (iterable): The manifests to index.
+            root_path (str): The path to the directory the manifests describe, needed to revalidate entries.
+            current_at_ns (int): The time in nanoseconds since the epoch when the manifests were known to be current,
+                which is when their inspection started rather than when it finished.  If None, every entry is hashed
+                again when first revalidated.
+            chunk_size (int): The maximum number of bytes read from a file at a time while hashing it again.
+
+        Raises:
+            rudi_dire_insp.exceptions.ManifestFormatError: If the manifests don't all have the same hashing
+                algorithms.
+        """
+        self._root_path = root_path
+        self._current_at_ns = current_at_ns
+        self._chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._by_path = {}  # type: typing.Dict[bytes, my_manifests.FileManifest]
+        self._by_digest = {}  # type: typing.Dict[bytes, typing.List[bytes]]
+        self._signatures = {}  # type: typing.Dict[bytes, _Signature]
+        self._algorithm_names = None  # type: typing.Optional[typing.Tuple[str, ...]]
+        self._file_inspector = None  # type: typing.Optional[my_core._FileInspector]
+        for manifest in manifests:
+            names = manifest.raw_manifest.hashes.names
+            if self._algorithm_names is None:
+                self._algorithm_names = names
+            elif names != self._algorithm_names:
+                raise my_exceptions.ManifestFormatError(
+                    "The manifests don't all have the same hashing algorithms, at: {}".format(manifest.relative_path))
+            path = _path_bytes(manifest.relative_path)
+            if path in self._by_path:
+                self._unindex_digests(path)
+            self._by_path[path] = manifest
+            self._index_digests(path, manifest)
+        self._sorted_paths = sorted(self._by_path)
+
+    @property
+    def root_path(self) -> typing.Optional[str]:
+        """str: The path to the directory the manifests describe, if entries can be revalidated."""
+        return self._root_path
+
+    def __len__(self) -> int:
+        return len(self._by_path)
+
+    def _index_digests(self, path: bytes, manifest: my_manifests.FileManifest):
+        hashes = manifest.raw_manifest.hashes
+        for digest in hashes.digests_for(hashes.names):
+            self._by_digest.setdefault(digest, []).append(path)
+
+    def _unindex_digests(self, path: bytes):
+        hashes = self._by_path[path].raw_manifest.hashes
+        for digest in hashes.digests_for(hashes.names):
+            paths = self._by_digest[digest]
+            paths.remove(path)
+            if not paths:
+                del self._by_digest[digest]
+
+    def _remove(self, path: bytes):
+        self._unindex_digests(path)
+        del self._by_path[path]
+        self._signatures.pop(path, None)
+        del self._sorted_paths[bisect.bisect_left(self._sorted_paths, path)]
+
+    def _get_file_inspector(self, root_path: str) -> my_core._FileInspector:
+        """Get the inspector that files are hashed again with, creating it on first use."""
+        with self._lock:
+            if self._file_inspector is None:
+                # pylint: disable=protected-access
+                self._file_inspector = my_core._FileInspector(
+                    root_path, chunk_size=self._chunk_size, algorithms=self._algorithm_names)
+            return self._file_inspector
+
+    def _take_entries(self, paths: typing.Iterable[bytes]) -> typing.List[_Entry]:
+        """Take the manifest and known signature of the entry at each path.  Only called with the lock held."""
+        return [(path, self._by_path[path], self._signatures.get(path)) for path in paths]
+
+    def _revalidate(
+            self,
+            root_path: str,
+            entry: _Entry) -> typing.Tuple[typing.Optional[my_manifests.FileManifest], typing.Optional[_Signature]]:
+        """Check an entry against the status of its file, hashing the file again if that changed.
+
+        Only called without the lock held, so that other lookups aren't held up while files are read.
+
+        Returns:
+            tuple: The manifest of the file and the signature of its status, both None if the file is gone.
+        """
+        (path, manifest, known_signature) = entry
+        abs_path = os.path.join(root_path, os.fsdecode(path))
+        try:
+            stat_result = os.stat(abs_path)
+        except FileNotFoundError:
+            return None, None
+        if not stat.S_ISREG(stat_result.st_mode):
+            return None, None
+        signature = _signature(stat_result)
+        if known_signature is None and self._current_at_ns is not None:
+            # Unchanged since the manifests were current, so the manifest is still that of the file
+            if (stat_result.st_size == manifest.raw_manifest.size
+                    and stat_result.st_ctime_ns < self._current_at_ns - _CLOCK_MARGIN_NS):
+                known_signature = signature
+        if signature == known_signature:
+            return manifest, signature
+        (rel_dir_path, name) = manifest.relative_path
+        # pylint: disable=protected-access
+        file_entry = my_walking._FileEntry(abs_path, (rel_dir_path, name), stat_result=stat_result)
+        new_manifest = self._get_file_inspector(root_path).inspect_entry(file_entry)
+        _LOGGER.debug("Hashed again, as its status changed: %s", abs_path)
+        return new_manifest, signature
+
+    def _update(
+            self,
+            entry: _Entry,
+            new_manifest: typing.Optional[my_manifests.FileManifest],
+            signature: typing.Optional[_Signature]):
+        """Swap in the result of revalidating an entry, or remove it if its file is gone, with the lock held."""
+        (path, manifest, _) = entry
+        if self._by_path.get(path) is not manifest:
+            # Another lookup revalidated the entry meanwhile, with a result at least as recent
+            return
+        if new_manifest is None or signature is None:
+            self._remove(path)
+            return
+        if new_manifest is not manifest:
+            self._unindex_digests(path)
+            self._by_path[path] = new_manifest
+            self._index_digests(path, new_manifest)
+        self._signatures[path] = signature
+
+    def _answer(self, entries: typing.List[_Entry], revalidate: bool) -> typing.List[my_manifests.FileManifest]:
+        """Get the manifests of the entries taken from the index, revalidating each if asked to, in walk order.
+
+        Files are checked and hashed again without the lock held, which is only taken again to update the index.
+        """
+        if revalidate:
+            root_path = self._root_path
+            if root_path is None:
+                raise my_exceptions.FileInspectionError("Entries can't be revalidated without the root directory")
+            results = [self._revalidate(root_path, entry) for entry in entries]
+            with self._lock:
+                for (entry, (new_manifest, signature)) in zip(entries, results):
+                    self._update(entry, new_manifest, signature)
+            manifests = [manifest for (manifest, _) in results if manifest is not None]
+        else:
+            manifests = [manifest for (_, manifest, _) in entries]
+        if len(manifests) > 1:
+            manifests.sort(key=lambda manifest: my_walking.relative_path_key(manifest.relative_path))
+        return manifests
+
+    def lookup_path(self, rel_path: str, revalidate: bool = False) -> typing.Optional[my_manifests.FileManifest]:
+        """Get the manifest of the file at a relative path.
+
+        Args:
+            rel_path (str): The relative path of the file, from the root directory.
+            revalidate (bool): If true, the entry is checked against the file first.
+
+        Returns:
+            rudi_dire_insp.manifests.FileManifest: The manifest, None if there is no such file.
+
+        Raises:
+            rudi_dire_insp.exceptions.FileInspectionError
+            rudi_dire_insp.exceptions.HashError
+        """
+        path = os.fsencode(os.path.normpath(rel_path))
+        with self._lock:
+            if path not in self._by_path:
+                return None
+            entries = self._take_entries([path])
+        manifests = self._answer(entries, revalidate)
+        return manifests[0] if manifests else None
+
+    def lookup_prefix(self, rel_dir_path: str, revalidate: bool = False) -> typing.List[my_manifests.FileManifest]:
+        """Get the manifests of every file under a directory, or of every file if the relative path is empty.
+
+        Args:
+            rel_dir_path (str): The relative path of the directory, from the root directory.
+            revalidate (bool): If true, the entries are checked against their files first.
+
+        Returns:
+            list: The manifests found, in walk order.
+
+        Raises:
+            rudi_dire_insp.exceptions.FileInspectionError
+            rudi_dire_insp.exceptions.HashError
+        """
+        prefix = os.fsencode(os.path.join(os.path.normpath(rel_dir_path), '')) if rel_dir_path else b''
+        with self._lock:
+            begin = bisect.bisect_left(self._sorted_paths, prefix)
+            end = begin
+            while end < len(self._sorted_paths) and self._sorted_paths[end].startswith(prefix):
+                end += 1
+            entries = self._take_entries(self._sorted_paths[begin:end])
+        return self._answer(entries, revalidate)
+
+    def lookup_digest(self, hex_value: str, revalidate: bool = False) -> typing.List[my_manifests.FileManifest]:
+        """Get the manifests of every file with a digest, of any of the hashing algorithms.
+
+        Args:
+            hex_value (str): The digest, in hexadecimal.
+            revalidate (bool): If true, the entries are checked against their files first, and those whose content
+                changed are left out.
+
+        Returns:
+            list: The manifests found, in walk order.
+
+        Raises:
+            ValueError: If the digest isn't hexadecimal.
+            rudi_dire_insp.exceptions.FileInspectionError
+            rudi_dire_insp.exceptions.HashError
+        """
+        digest = bytes.fromhex(hex_value)
+        with self._lock:
+            entries = self._take_entries(self._by_digest.get(digest, ()))
+        manifests = self._answer(entries, revalidate)
+        if revalidate:
+            manifests = [
+                manifest for manifest in manifests
+                if digest in manifest.raw_manifest.hashes.digests_for(manifest.raw_manifest.hashes.names)]
+        return manifests
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} root_path="{}", files={}>'.format(class_name, self._root_path, len(self._by_path))
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Answers the lookups of one connection, with the index and settings of its server."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        if self.connection.family == socket.AF_INET:
+            # Lookups are small, so don't let an answer wait on the acknowledgement of the previous one
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Encoders remember the last directory encoded, so each connection gets its own
+        self._encoder = my_serializing.JsonLinesEncoder()
+
+    def _send(self, status: int, body: bytes, content_type: str = _CONTENT_TYPE):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send(status, (json.dumps({'error': message}) + '\n').encode('ascii'), 'application/json')
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer a lookup."""
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        index = self.server.index
+        revalidate = self.server.revalidate
+        if 'revalidate' in query:
+            revalidate = query['revalidate'][-1].lower() in ('1', 'true', 'yes')
+        try:
+            if url.path == '/path' and 'path' in query:
+                manifest = index.lookup_path(query['path'][-1], revalidate)
+                if manifest is None:
+                    self._send_error(404, "No such file: {}".format(query['path'][-1]))
+                    return
+                manifests = [manifest]
+            elif url.path == '/prefix':
+                manifests = index.lookup_prefix(query.get('path', [''])[-1], revalidate)
+            elif url.path == '/digest' and 'value' in query:
+                manifests = index.lookup_digest(query['value'][-1], revalidate)
+            else:
+                self._send_error(400, "Unknown lookup, expected /path?path=, /prefix?path= or /digest?value=")
+                return
+        except ValueError as error:
+            self._send_error(400, str(error))
+            return
+        except (my_exceptions.FileInspectionError, my_exceptions.HashError, OSError) as error:
+            # Revalidating may fail on the file, e.g. if it can no longer be read
+            self._send_error(500, str(error))
+            return
+        self._send(200, ''.join(self._encoder.encode(manifest) for manifest in manifests).encode('ascii'))
+
+    def address_string(self) -> str:
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix socket'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        _LOGGER.debug("%s: %s", self.address_string(), format % args)
+
+
+class _TcpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Answers lookups on a localhost port, on a thread per connection."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int, index: ManifestIndex, revalidate: bool):
+        """Constructor
+
+        Args:
+            port (int): The localhost port to listen on, 0 for any free port.
+            index (ManifestIndex): The index to look manifests up in.
+            revalidate (bool): If true, entries are revalidated before answering, unless a lookup asks otherwise.
+        """
+        super().__init__((_LOCALHOST, port), _RequestHandler)
+        self.index = index
+        self.revalidate = revalidate
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answers lookups on a Unix socket, on a thread per connection."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, index: ManifestIndex, revalidate: bool):
+        """Constructor
+
+        Args:
+            socket_path (str): The path of the Unix socket to listen on.
+            index (ManifestIndex): The index to look manifests up in.
+            revalidate (bool): If true, entries are revalidated before answering, unless a lookup asks otherwise.
+        """
+        super().__init__(socket_path, _RequestHandler)
+        self.index = index
+        self.revalidate = revalidate
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+def make_server(
+        index: ManifestIndex,
+        port: typing.Optional[int] = None,
+        socket_path: typing.Optional[str] = None,
+        revalidate: bool = False) -> socketserver.BaseServer:
+    """Create a server answering lookups over the index, either on a localhost port or on a Unix socket.
+
+    Call ``serve_forever()`` on the server to answer lookups, and ``server_close()`` once done.
+
+    Args:
+        index (ManifestIndex): The index to look manifests up in.
+        port (int): The localhost port to listen on, 0 for any free port.
+        socket_path (str): The path of the Unix socket to listen on, instead of a port.  A socket left at the path
+            is replaced.
+        revalidate (bool): If true, entries are revalidated before answering, unless a lookup asks otherwise with
+            ``revalidate=0``.
+
+    Returns:
+        socketserver.BaseServer: The server, bound and listening.
+
+    Raises:
+        rudi_dire_insp.exceptions.FileInspectionError: If entries are to be revalidated, but the index has no root
+            directory.
+        OSError: If the server can't listen at the address.
+    """
+    if revalidate and index.root_path is None:
+        raise my_exceptions.FileInspectionError("Entries can't be revalidated without the root directory")
+    if port is not None and socket_path is None:
+        return _TcpServer(port, index, revalidate)
+    if port is not None or socket_path is None:
+        raise ValueError("Exactly one of a port and a socket path must be given")
+    try:
+        if stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)
+    except FileNotFoundError:
+        pass
+    return _UnixServer(socket_path, index, revalidate)
@@ -0,0 +1,200 @@
+"""
+rudi_dire_insp.sharding
+=======================
+
+Deterministic splitting of the files of a directory into shards, and merging of the manifests of every shard.
+
+A file belongs to the shard picked by a stable hash of its relative path, so any number of hosts sharing a mount
+can each inspect a disjoint, similarly sized subset of a tree without coordinating, and a merge can tell which shard
+every manifest came from.  Every shard still walks the whole tree, but only reads the files that belong to it.
+"""
+
+# Imports from Python distribution
+import hashlib
+import heapq
+import logging
+import operator
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.walking as my_walking
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+_SHARD_DIGEST_SIZE = 8
+
+
+def shard_index(relative_path: typing.Tuple[str, ...], count: int) -> int:
+    """Find the shard a file belongs to.
+
+    The index only depends on the relative path and the number of shards, so it is the same on every host and in
+    every run.
+
+    Args:
+        relative_path (tuple): The relative path of the file, as held by
+            :py:attr:`rudi_dire_insp.manifests.FileManifest.relative_path`.
+        count (int): The number of shards.
+
+    Returns:
+        int: The index of the shard, from 0 to ``count - 1``.
+    """
+    digest = hashlib.blake2b(my_walking.relative_path_key(relative_path), digest_size=_SHARD_DIGEST_SIZE).digest()
+    return int.from_bytes(digest, 'big') % count
+
+
+class Shard:
+    """One of a number of disjoint subsets of the files of a directory."""
+
+    __slots__ = ('_index', '_count')
+
+    def __init__(self, index: int, count: int):
+        """Constructor
+
+        Args:
+            index (int): The index of the shard, from 0 to ``count - 1``.
+            count (int): The number of shards the files are split into.
+
+        Raises:
+            rudi_dire_insp.exceptions.ShardError
+        """
+        for value in (index, count):
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise my_exceptions.ShardError("Shard index and count must be integers: {!r}/{!r}".format(index, count))
+        if count < 1 or not 0 <= index < count:
+            raise my_exceptions.ShardError("Shard index must be from 0 to {}: {}".format(count - 1, index))
+        self._index = index
+        self._count = count
+
+    @classmethod
+    def parse(cls, text: str) -> 'Shard':
+        """Parse a shard given as ``I/N``, where ``I`` counts from 1 to ``N``.
+
+        Args:
+            text (str): The text to parse.
+
+        Returns:
+            Shard
+
+        Raises:
+            rudi_dire_insp.exceptions.ShardError
+        """
+        (number_text, _, count_text) = text.partition('/')
+        try:
+            (number, count) = (int(number_text), int(count_text))
+        except ValueError as error:
+            raise my_exceptions.ShardError("Shard must be given as I/N, e.g. 1/4: {!r}".format(text)) from error
+        if count < 1 or not 1 <= number <= count:
+            raise my_exceptions.ShardError("Shard must be from 1/N to N/N: {!r}".format(text))
+        return cls(number - 1, count)
+
+    @property
+    def index(self) -> int:
+        """int: The index of the shard, from 0 to ``count - 1``."""
+        return self._index
+
+    @property
+    def count(self) -> int:
+        """int: The number of shards the files are split into."""
+        return self._count
+
+    def contains(self, relative_path: typing.Tuple[str, ...]) -> bool:
+        """Check whether the file with the relative path belongs to this shard."""
+        return self._count == 1 or shard_index(relative_path, self._count) == self._index
+
+    def __eq__(self, other):
+        if not isinstance(other, Shard):
+            return NotImplemented
+        return (self._index, self._count) == (other._index, other._count)
+
+    def __hash__(self):
+        return hash((self._index, self._count))
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} index={}, count={}>'.format(class_name, self._index, self._count)
+
+    def __str__(self):
+        return '{}/{}'.format(self._index + 1, self._count)
+
+
+def _checked_shard(
+        manifests: typing.Iterable[my_manifests.FileManifest],
+        input_number: int,
+        count: int,
+        claimed: typing.Dict[int, int]) -> typing.Iterator[typing.Tuple[bytes, my_manifests.FileManifest]]:
+    """Pair each manifest of one input with its path key, checking that they are sorted and from a single shard.
+
+    The shard of the input is claimed by its first manifest, so that no other input can hold the same shard.
+
+    Raises:
+        rudi_dire_insp.exceptions.ManifestFormatError
+        rudi_dire_insp.exceptions.ShardError
+    """
+    index = None
+    last_key = None
+    for manifest in manifests:
+        key = my_walking.relative_path_key(manifest.relative_path)
+        manifest_index = shard_index(manifest.relative_path, count)
+        if index is None:
+            if manifest_index in claimed:
+                raise my_exceptions.ShardError("Inputs {} and {} both hold shard {}/{}".format(
+                    claimed[manifest_index] + 1, input_number + 1, manifest_index + 1, count))
+            claimed[manifest_index] = input_number
+            index = manifest_index
+        elif manifest_index != index:
+            raise my_exceptions.ShardError(
+                "Input {} holds files of more than one of {} shards, at: {}.  Are some shards missing, or from a "
+                "different number of shards?".format(input_number + 1, count, manifest.relative_path))
+        if last_key is not None and key <= last_key:
+            raise my_exceptions.ManifestFormatError(
+                "Input {} is not sorted by relative path, at: {}".format(input_number + 1, manifest.relative_path))
+        last_key = key
+        yield key, manifest
+
+
+def merge_shards(
+        shard_manifests: typing.Sequence[typing.Iterable[my_manifests.FileManifest]],
+        count: typing.Optional[int] = None) -> typing.Iterator[my_manifests.FileManifest]:
+    """Merge the manifests of every shard of an inspection into the manifests of the whole directory.
+
+    Each input must hold the manifests of one shard in walk order, as the directory inspector produces them by
+    default.  The merge streams, holding one manifest per input at a time.
+
+    Every input is checked to only hold files of a single shard, and no two inputs to hold the same shard.  With one
+    input per shard, that proves none is missing or given twice.  Inputs don't record which shard they hold or that
+    their inspection finished though.  An input without any manifests can't be told apart from a missing one, which
+    is only logged, and an input cut short by a failed inspection can't be detected at all.
+
+    Args:
+        shard_manifests (sequence): The manifests of each shard, one iterable per shard, in any order.
+        count (int): The number of shards the directory was split into.  If given, it must match the number of
+            inputs.
+
+    Yields:
+        rudi_dire_insp.manifests.FileManifest: Each manifest of every shard, in walk order.
+
+    Raises:
+        rudi_dire_insp.exceptions.ManifestFormatError
+        rudi_dire_insp.exceptions.ShardError
+    """
+    num_inputs = len(shard_manifests)
+    if num_inputs < 1:
+        raise my_exceptions.ShardError("There are no shards to merge")
+    if count is not None and count != num_inputs:
+        raise my_exceptions.ShardError("Expected the outputs of {} shards, got {}".format(count, num_inputs))
+
+    claimed = {}  # type: typing.Dict[int, int]
+    inputs = [
+        _checked_shard(manifests, input_number, num_inputs, claimed)
+        for (input_number, manifests) in enumerate(shard_manifests)]
+    for (_, manifest) in heapq.merge(*inputs, key=operator.itemgetter(0)):
+        yield manifest
+
+    if len(claimed) < num_inputs:
+        _LOGGER.warning("%d of %d shards have no files, and can't be checked for being the right shards",
+                        num_inputs - len(claimed), num_inputs)
@@ -0,0 +1,169 @@
+"""
+rudi_dire_insp.stats
+====================
+
+Timings and counters collected while inspecting a directory, to find out where the time of a run goes.
+
+Collection is opt-in: pass an :py:class:`InspectionStats` to :py:class:`rudi_dire_insp.core.DirectoryInspector`.
+Without one, the only cost left on the hot path is a check for None per file.
+"""
+
+# Imports from Python distribution
+import heapq
+import logging
+import threading
+import time
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SLOWEST_COUNT = 10
+"""Default number of slowest files remembered."""
+
+STAGE_NAMES = ('walk', 'cache', 'open', 'read', 'hash', 'serialize')
+"""Names of the stages timed: listing directories, looking up and storing cached hashes, opening files, reading
+them, updating digests and writing the output."""
+
+
+# pylint: disable=too-many-instance-attributes
+class InspectionStats:
+    """Cumulative timings and counters of an inspection.
+
+    Times are summed over all of the threads doing the work, so with more than one worker they can add up to more
+    than the time the inspection took.  With a process pool, the work done in worker processes isn't timed, and
+    only the walk, cache and serialize stages are.
+
+    Instances are safe to update from several threads at once.
+    """
+
+    def __init__(self, slowest_count: int = DEFAULT_SLOWEST_COUNT):
+        """Constructor
+
+        Args:
+            slowest_count (int): The number of slowest files to remember.
+        """
+        self._lock = threading.Lock()
+        self._slowest_count = slowest_count
+        self._stage_seconds = dict.fromkeys(STAGE_NAMES, 0.0)  # type: typing.Dict[str, float]
+        self._hash_seconds = {}  # type: typing.Dict[str, float]
+        self._bytes_read = 0
+        self._files = 0
+        self._directories = 0
+        # A min-heap of (seconds, sequence number, relative path), so the fastest of the slowest is dropped first
+        self._slowest = []  # type: typing.List[typing.Tuple[float, int, typing.Tuple[str, ...]]]
+
+    @property
+    def stage_seconds(self) -> typing.Dict[str, float]:
+        """dict: The cumulative time spent in each stage, keyed by the names in :py:data:`STAGE_NAMES`."""
+        with self._lock:
+            return dict(self._stage_seconds)
+
+    @property
+    def hash_seconds(self) -> typing.Dict[str, float]:
+        """dict: The cumulative time spent updating the digests of each hashing algorithm, keyed by its name."""
+        with self._lock:
+            return dict(self._hash_seconds)
+
+    @property
+    def bytes_read(self) -> int:
+        """int: The number of bytes read from files."""
+        return self._bytes_read
+
+    @property
+    def files(self) -> int:
+        """int: The number of files inspected."""
+        return self._files
+
+    @property
+    def directories(self) -> int:
+        """int: The number of directories listed."""
+        return self._directories
+
+    @property
+    def slowest_files(self) -> typing.List[typing.Tuple[typing.Tuple[str, ...], float]]:
+        """list: The relative path and inspection time of the slowest files, slowest first."""
+        with self._lock:
+            slowest = sorted(self._slowest, reverse=True)
+        return [(relative_path, seconds) for (seconds, _, relative_path) in slowest]
+
+    def add_stage_time(self, stage: str, seconds: float):
+        """Add time spent in one of the stages named in :py:data:`STAGE_NAMES`."""
+        with self._lock:
+            self._stage_seconds[stage] += seconds
+
+    def add_hashing(self, read_seconds: float, num_read: int, hash_seconds: typing.Dict[str, float]):
+        """Add the time spent reading and hashing some content.
+
+        Args:
+            read_seconds (float): The time spent reading the content.
+            num_read (int): The number of bytes read.
+            hash_seconds (dict): The time spent updating the digest of each algorithm, keyed by its name.
+        """
+        with self._lock:
+            self._stage_seconds['read'] += read_seconds
+            self._bytes_read += num_read
+            for (name, seconds) in hash_seconds.items():
+                self._hash_seconds[name] = self._hash_seconds.get(name, 0.0) + seconds
+                self._stage_seconds['hash'] += seconds
+
+    def add_file(self, relative_path: typing.Tuple[str, ...], seconds: typing.Optional[float] = None):
+        """Count a file as inspected, taking the given time if it is known."""
+        with self._lock:
+            self._files += 1
+            if seconds is None or self._slowest_count < 1:
+                return
+            item = (seconds, self._files, relative_path)
+            if len(self._slowest) < self._slowest_count:
+                heapq.heappush(self._slowest, item)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    def add_directory(self):
+        """Count a directory as listed."""
+        with self._lock:
+            self._directories += 1
+
+    def timed(self, stage: str, items: typing.Iterable) -> typing.Iterator:
+        """Iterate over the items, adding the time taken to produce each of them to a stage.
+
+        Args:
+            stage (str): The name of the stage, see :py:data:`STAGE_NAMES`.
+            items (iterable): The items, usually from a generator doing the work being timed.
+
+        Yields:
+            object: Each of the items.
+        """
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_stage_time(stage, time.perf_counter() - start)
+                return
+            self.add_stage_time(stage, time.perf_counter() - start)
+            yield item
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        """Return the timings and counters as a dict of JSON compatible values."""
+        return {
+            'files': self._files,
+            'directories': self._directories,
+            'bytes_read': self._bytes_read,
+            'stage_seconds': self.stage_seconds,
+            'hash_seconds': self.hash_seconds,
+            'slowest_files': [
+                {'relative_path': relative_path, 'seconds': seconds}
+                for (relative_path, seconds) in self.slowest_files
+            ],
+        }
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} files={}, directories={}, bytes_read={}>'.format(
+            class_name, self._files, self._directories, self._bytes_read)
@@ -0,0 +1,204 @@
+"""
+rudi_dire_insp.trees
+====================
+
+Aggregation of file manifests into Merkle-style manifests of the directories holding them.
+
+The aggregate is built bottom-up from file manifests in walk order (see
+:py:func:`rudi_dire_insp.walking.relative_path_key`), as they are produced.  The files directly in a directory are
+walked together, in name order, so they are fed to its digests straight away.  Everything under a directory ``d``
+has a relative path starting with ``d/``, so once the walk reaches a directory that sorts after all of those, the
+directory is complete.  Only the directories still open are held in memory, each with the manifests of its complete
+sub directories, never the manifests of files.
+"""
+
+# Imports from Python distribution
+import heapq
+import logging
+import os
+import struct
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.walking as my_walking
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+_FILE_ENTRY = b'F'
+_DIRECTORY_ENTRY = b'D'
+_ENTRY_COUNTS = struct.Struct('<QQ')
+"""Size and number of files of an entry of a directory, which a file counts as one of."""
+
+
+def _end_key(rel_dir_path: str) -> typing.Optional[bytes]:
+    """Build the key every file under the directory sorts before, None for the root which everything is under."""
+    if not rel_dir_path:
+        return None
+    # Paths under the directory start with its path and a separator, and b'0' is the byte after b'/'
+    return os.fsencode(rel_dir_path) + bytes([os.fsencode(os.sep)[0] + 1])
+
+
+def _entry_header(kind: bytes, name: str, size: int, file_count: int) -> bytes:
+    """Encode what every digest of a directory is fed for one of its entries, before the entry's own digest."""
+    return kind + os.fsencode(name) + b'\0' + _ENTRY_COUNTS.pack(size, file_count)
+
+
+class _OpenDirectory:
+    """A directory whose files are still being aggregated."""
+
+    __slots__ = ('rel_dir_path', 'digests', 'names', 'size', 'file_count', 'sampled', 'sub_dirs')
+
+    def __init__(self, rel_dir_path: str, algorithms: typing.Tuple[my_hashing._HashAlgorithm, ...]):
+        self.rel_dir_path = rel_dir_path
+        # pylint: disable=protected-access
+        self.digests = my_hashing._HashAlgorithm._new_digests(algorithms, None)
+        self.names = tuple(algorithm.algorithm_name for algorithm in self.digests)
+        self.size = 0
+        self.file_count = 0
+        self.sampled = False
+        self.sub_dirs = []  # type: typing.List[typing.Tuple[str, my_manifests.DirectoryManifest]]
+
+    def add_entry(self, kind: bytes, name: str, size: int, file_count: int, hashes: my_hashing.Hashes):
+        """Feed an entry to every digest, with its digest of the same algorithm."""
+        header = _entry_header(kind, name, size, file_count)
+        for (digest, raw_digest) in zip(self.digests.values(), hashes.digests_for(self.names)):
+            digest.update(header)
+            digest.update(raw_digest)
+        self.size += size
+        self.file_count += file_count
+
+    def close(self) -> my_manifests.DirectoryManifest:
+        """Feed the sub directories to the digests in name order, and build the manifest of the directory."""
+        for (name, sub_dir) in sorted(self.sub_dirs, key=lambda item: os.fsencode(item[0])):
+            self.add_entry(_DIRECTORY_ENTRY, name, sub_dir.size, sub_dir.file_count, sub_dir.hashes)
+            self.sampled = self.sampled or sub_dir.sampled
+        # pylint: disable=protected-access
+        hashes = my_hashing._HashAlgorithm._hashes_from_digests(self.digests)
+        return my_manifests.DirectoryManifest(self.rel_dir_path, hashes, self.size, self.file_count, self.sampled)
+
+
+class DirectoryAggregator:
+    """Builds the manifest of every directory holding files from the file manifests of a walk.
+
+    Feed it every file manifest in walk order with :py:meth:`add`, then call :py:meth:`finish`.  Each returns the
+    manifests of the directories it completed, sub directories before the directories holding them.
+    """
+
+    __slots__ = ('_algorithms', '_names', '_open', '_pending', '_last_key', '_file_dir_path')
+
+    def __init__(self):
+        """Constructor"""
+        self._algorithms = None  # type: typing.Optional[typing.Tuple[my_hashing._HashAlgorithm, ...]]
+        self._names = ()  # type: typing.Tuple[str, ...]
+        self._open = {}  # type: typing.Dict[str, _OpenDirectory]
+        self._pending = []  # type: typing.List[typing.Tuple[bytes, str]]
+        self._last_key = None  # type: typing.Optional[bytes]
+        self._file_dir_path = None  # type: typing.Optional[str]
+
+    def _open_directory(
+            self,
+            rel_dir_path: str,
+            algorithms: typing.Tuple[my_hashing._HashAlgorithm, ...]) -> _OpenDirectory:
+        """Find the open directory at the path, opening it and any of its ancestors that aren't open yet."""
+        directory = self._open.get(rel_dir_path)
+        if directory is None:
+            if rel_dir_path:
+                self._open_directory(os.path.dirname(rel_dir_path), algorithms)
+            directory = self._open[rel_dir_path] = _OpenDirectory(rel_dir_path, algorithms)
+            end_key = _end_key(rel_dir_path)
+            if end_key is not None:
+                heapq.heappush(self._pending, (end_key, rel_dir_path))
+        return directory
+
+    def _close(self, rel_dir_path: str) -> my_manifests.DirectoryManifest:
+        """Close the open directory at the path, adding its manifest to the directory holding it."""
+        directory_manifest = self._open.pop(rel_dir_path).close()
+        if rel_dir_path:
+            (parent_path, name) = os.path.split(rel_dir_path)
+            self._open[parent_path].sub_dirs.append((name, directory_manifest))
+        return directory_manifest
+
+    def add(self, manifest: my_manifests.FileManifest) -> typing.List[my_manifests.DirectoryManifest]:
+        """Aggregate the manifest of the next file of the walk.
+
+        Args:
+            manifest (rudi_dire_insp.manifests.FileManifest): The manifest of the file.
+
+        Returns:
+            list: The manifests of the directories that are complete now that the walk has reached this file.
+
+        Raises:
+            rudi_dire_insp.exceptions.ManifestFormatError: If the manifests aren't in walk order, or don't all have
+                the same hashing algorithms.
+        """
+        key = my_walking.relative_path_key(manifest.relative_path)
+        if self._last_key is not None and key <= self._last_key:
+            raise my_exceptions.ManifestFormatError(
+                "The manifests are not sorted by relative path, at: {}".format(manifest.relative_path))
+        self._last_key = key
+        raw_manifest = manifest.raw_manifest
+        algorithms = self._algorithms
+        if algorithms is None:
+            # pylint: disable=protected-access
+            algorithms = self._algorithms = my_hashing._HashAlgorithm.from_names(raw_manifest.hashes.names)
+            self._names = raw_manifest.hashes.names
+        elif raw_manifest.hashes.names != self._names:
+            raise my_exceptions.ManifestFormatError(
+                "The manifests don't all have the same hashing algorithms, at: {}".format(manifest.relative_path))
+
+        (rel_dir_path, name) = manifest.relative_path
+        completed = []
+        if rel_dir_path != self._file_dir_path:
+            self._file_dir_path = rel_dir_path
+            dir_key = os.fsencode(rel_dir_path)
+            while self._pending and self._pending[0][0] <= dir_key:
+                completed.append(self._close(heapq.heappop(self._pending)[1]))
+        directory = self._open_directory(rel_dir_path, algorithms)
+        directory.add_entry(_FILE_ENTRY, name, raw_manifest.size, 1, raw_manifest.hashes)
+        directory.sampled = directory.sampled or raw_manifest.sampled
+        return completed
+
+    def finish(self) -> typing.List[my_manifests.DirectoryManifest]:
+        """Complete every directory still open, once all file manifests were added.
+
+        Returns:
+            list: The manifests of the directories completed, ending with the root directory.  Empty if no file
+            manifest was added.
+        """
+        completed = [self._close(heapq.heappop(self._pending)[1]) for _ in range(len(self._pending))]
+        if '' in self._open:
+            completed.append(self._close(''))
+        return completed
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} open={}>'.format(class_name, len(self._open))
+
+
+def aggregate_directories(
+        manifests: typing.Iterable[my_manifests.FileManifest]) -> typing.Iterator[typing.Union[
+            my_manifests.FileManifest, my_manifests.DirectoryManifest]]:
+    """Pass file manifests in walk order through, along with the manifest of each directory as it completes.
+
+    Each directory manifest is yielded as soon as every file under it has been, so the root directory comes last.
+
+    Args:
+        manifests (iterable): The file manifests, in walk order.
+
+    Yields:
+        rudi_dire_insp.manifests.FileManifest or rudi_dire_insp.manifests.DirectoryManifest
+
+    Raises:
+        rudi_dire_insp.exceptions.ManifestFormatError
+    """
+    aggregator = DirectoryAggregator()
+    for manifest in manifests:
+        yield from aggregator.add(manifest)
+        yield manifest
+    yield from aggregator.finish()
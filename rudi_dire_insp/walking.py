@@ -0,0 +1,204 @@
+"""
+rudi_dire_insp.walking
+======================
+
+Walking of directory trees, built directly on :py:func:`os.scandir`.
+
+Files are produced in a stable order: sorted by the byte sequence of their relative path, with the directory part
+of the path compared before the file name (see :py:func:`relative_path_key`).  Outputs of separate inspections of
+the same tree can therefore be compared or merged as sorted streams.
+"""
+
+# Imports from Python distribution
+import heapq
+import logging
+import os
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.filtering as my_filtering
+import rudi_dire_insp.stats as my_stats
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+
+def relative_path_key(relative_path: typing.Tuple[str, ...]) -> bytes:
+    """Build the key that orders relative paths the same way as the directory walker does.
+
+    Args:
+        relative_path (tuple): The relative path of a file, as held by
+            :py:attr:`rudi_dire_insp.manifests.FileManifest.relative_path`.
+
+    Returns:
+        bytes: The path elements encoded for the file system and joined by NUL bytes.
+    """
+    return b'\0'.join(os.fsencode(element) for element in relative_path)
+
+
+# pylint: disable=too-few-public-methods
+class _FileEntry:
+    """A file found while walking a directory tree, already checked to be a file under the root directory."""
+
+    __slots__ = ('path', 'relative_path', '_dir_entry', '_stat_result')
+
+    def __init__(
+            self,
+            path: str,
+            relative_path: typing.Tuple[str, str],
+            dir_entry: typing.Optional[os.DirEntry] = None,
+            stat_result: typing.Optional[os.stat_result] = None):
+        """Constructor
+
+        Args:
+            path (str): The absolute path to the file.
+            relative_path (tuple): The path relative to the root directory, split into its directory part and file
+                name (as :py:func:`os.path.split` would).
+            dir_entry (os.DirEntry): The entry the file was found as, whose cached status information is reused.
+            stat_result (os.stat_result): The status of the file, if already known.
+        """
+        self.path = path
+        self.relative_path = relative_path
+        self._dir_entry = dir_entry
+        self._stat_result = stat_result
+
+    def stat(self) -> os.stat_result:
+        """Return the status of the file, following symbolic links.  Only the first call makes a system call."""
+        if self._stat_result is None:
+            if self._dir_entry is not None:
+                self._stat_result = self._dir_entry.stat()
+            else:
+                self._stat_result = os.stat(self.path)
+        return self._stat_result
+
+    def __reduce__(self):
+        # Directory entries can't be pickled, so ship any status already fetched instead
+        return type(self), (self.path, self.relative_path, None, self._stat_result)
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} path="{}", relative_path={}>'.format(class_name, self.path, self.relative_path)
+
+
+def _check_symlink(dir_entry: os.DirEntry, real_root_path: str, root_path: str):
+    """Verify that a symbolic link found during the walk points to a file under the root directory.
+
+    Raises:
+        rudi_dire_insp.exceptions.FileInspectionError
+    """
+    real_path = os.path.realpath(dir_entry.path)
+    if not os.path.exists(real_path):
+        raise my_exceptions.FileInspectionError("File at path does not exist: {}".format(dir_entry.path))
+    if not os.path.isfile(real_path):
+        raise my_exceptions.FileInspectionError("Path does not point to a file: {}".format(dir_entry.path))
+    if real_path != real_root_path and not real_path.startswith(os.path.join(real_root_path, '')):
+        raise my_exceptions.FileInspectionError(
+            "File path is not a child of the root directory path '{}' : '{}'".format(root_path, dir_entry.path))
+
+
+def _skips_sub_dir(sub_dir_key: bytes, resume_dir_key: bytes) -> bool:
+    """Check whether every file under a directory comes before the directory a walk resumes in.
+
+    That is the case if the directory comes first and isn't a prefix of the other, since then every path under it
+    differs from the other at the same byte.
+    """
+    return sub_dir_key < resume_dir_key and not resume_dir_key.startswith(sub_dir_key)
+
+
+def _matches_stat(path_filter: typing.Optional[my_filtering.PathFilter], dir_entry: os.DirEntry) -> bool:
+    """Check whether the filter matches the status of a file, only taking the status if it needs it.
+
+    The directory entry caches the status, so the file inspector gets it for free later on.
+    """
+    if path_filter is None or not path_filter.needs_stat:
+        return True
+    return path_filter.matches_stat(dir_entry.stat())
+
+
+def walk_files(
+        root_path: str,
+        stats: typing.Optional[my_stats.InspectionStats] = None,
+        resume_after: typing.Optional[typing.Tuple[str, ...]] = None,
+        path_filter: typing.Optional[my_filtering.PathFilter] = None) -> typing.Generator[_FileEntry, None, None]:
+    """Walk the directory tree under the root path, yielding an entry for each file.
+
+    Directories are listed once each with :py:func:`os.scandir`, and the file type information it provides is used
+    instead of checking each path again.  Symbolic links to directories are not followed, so every directory listed
+    is known to be under the root and only symbolic links to files need their real paths checked.  Like
+    :py:func:`os.walk`, directories that can't be listed are skipped, with a warning logged for each.
+
+    Files are yielded in the order given by :py:func:`relative_path_key`.  Directories waiting to be listed are
+    kept in a heap ordered by their relative paths, which keeps memory use proportional to the number of
+    directories seen but not yet listed.
+
+    A walk can be resumed after a file, as if it had been stopped there.  Directories holding only files that come
+    before it are never listed, only the ancestors of its directory are listed again to find the directories after
+    them.
+
+    Args:
+        root_path (str): The path to the root directory of the tree.
+        stats (rudi_dire_insp.stats.InspectionStats): If given, each directory listed is counted in these stats.
+        resume_after (tuple): If given, only the files that come after the file with this relative path are yielded.
+        path_filter (rudi_dire_insp.filtering.PathFilter): If given, directories it prunes are never listed, and
+            only the files it matches are yielded.  Files are matched by their paths before their status is taken.
+
+    Yields:
+        _FileEntry: An entry for each file in the tree.
+
+    Raises:
+        rudi_dire_insp.exceptions.FileInspectionError: If an entry is neither a directory nor a file, or is a
+            symbolic link that doesn't resolve to a file under the root directory.
+    """
+    # pylint: disable=too-many-branches,too-many-locals
+    abs_root_path = os.path.abspath(root_path)
+    real_root_path = os.path.realpath(abs_root_path)
+
+    # The keys of the directory and of the file resumed after
+    resume_keys = None  # type: typing.Optional[typing.Tuple[bytes, bytes]]
+    if resume_after is not None:
+        resume_keys = (os.fsencode(resume_after[0]), relative_path_key(resume_after))
+
+    pending_dirs = [(b'', '', abs_root_path)]  # type: typing.List[typing.Tuple[bytes, str, str]]
+    while pending_dirs:
+        (dir_key, rel_dir_path, abs_dir_path) = heapq.heappop(pending_dirs)
+        try:
+            with os.scandir(abs_dir_path) as dir_iter:
+                dir_entries = sorted(dir_iter, key=lambda dir_entry: os.fsencode(dir_entry.name))
+        except OSError as error:
+            # Like os.walk, directories that can't be listed are skipped
+            _LOGGER.warning("Skipping directory that can't be listed: %s : %s", abs_dir_path, str(error))
+            continue
+        if stats is not None:
+            stats.add_directory()
+        # Files of directories before the one resumed in were all seen already, only their sub directories may not be
+        skip_keys = resume_keys if resume_keys is not None and dir_key <= resume_keys[0] else None
+
+        for dir_entry in dir_entries:
+            if dir_entry.is_dir(follow_symlinks=False):
+                rel_sub_dir_path = os.path.join(rel_dir_path, dir_entry.name)
+                sub_dir_key = os.fsencode(rel_sub_dir_path)
+                if skip_keys is not None and _skips_sub_dir(sub_dir_key, skip_keys[0]):
+                    continue
+                if path_filter is not None and path_filter.prunes_dir(rel_dir_path, dir_entry.name):
+                    continue
+                heapq.heappush(pending_dirs, (sub_dir_key, rel_sub_dir_path, dir_entry.path))
+            elif skip_keys is not None and (
+                    dir_key < skip_keys[0] or relative_path_key((rel_dir_path, dir_entry.name)) <= skip_keys[1]):
+                continue
+            elif path_filter is not None and not path_filter.matches_path((rel_dir_path, dir_entry.name)):
+                continue
+            elif dir_entry.is_file(follow_symlinks=False):
+                if _matches_stat(path_filter, dir_entry):
+                    yield _FileEntry(dir_entry.path, (rel_dir_path, dir_entry.name), dir_entry)
+            elif dir_entry.is_symlink():
+                # Like os.walk, links to directories are neither followed nor reported
+                if dir_entry.is_dir():
+                    continue
+                _check_symlink(dir_entry, real_root_path, root_path)
+                if _matches_stat(path_filter, dir_entry):
+                    yield _FileEntry(dir_entry.path, (rel_dir_path, dir_entry.name), dir_entry)
+            else:
+                raise my_exceptions.FileInspectionError("Path does not point to a file: {}".format(dir_entry.path))
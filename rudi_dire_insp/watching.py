@@ -0,0 +1,586 @@
+"""
+rudi_dire_insp.watching
+=======================
+
+Long-running watching of a directory, keeping the manifests of its files current as they change.
+
+The directory is inspected once, into an index of the manifest and status of every file keyed by relative path.
+From then on only the paths reported as changed are looked at again, and a file is only hashed again if its status
+changed.  Changes are found through Linux inotify, called through :py:mod:`ctypes`, or by comparing the status of
+every file on each of a regular series of walks where inotify isn't available.
+
+Each changed path is debounced: it is only looked at once no change was reported for it for a while, so a file
+rewritten many times in a burst is hashed once at the end of it.  A file changing without ever pausing is still looked
+at once it has been pending for :py:data:`_MAX_DELAY_FACTOR` times that long.
+"""
+
+# Imports from Python distribution
+import ctypes
+import ctypes.util
+import enum
+import errno
+import logging
+import os
+import select
+import stat
+import struct
+import tempfile
+import time
+import typing
+
+# Imports from 3rd party
+
+# Imports from this project
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
+import rudi_dire_insp.walking as my_walking
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DEBOUNCE_SECONDS = 1.0
+"""Default time without changes to a path before it is looked at again."""
+
+DEFAULT_POLL_INTERVAL = 5.0
+"""Default time between walks of the directory when changes are found by polling."""
+
+DEFAULT_WRITE_INTERVAL = 60.0
+"""Default least time between two writes of every manifest, which takes time in proportion to the number of files."""
+
+_MAX_DELAY_FACTOR = 10
+
+# Flags and event masks from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_DONT_FOLLOW = 0x02000000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+    | _IN_ONLYDIR | _IN_DONT_FOLLOW)
+_INOTIFY_EVENT = struct.Struct('iIII')
+"""Watch descriptor, mask, cookie and length of the name that follows."""
+_INOTIFY_READ_SIZE = 64 * 1024
+
+_Signature = typing.Tuple[int, int, int]
+"""The size, modification time in nanoseconds and inode number of a file, which change when it is written."""
+_Manifest = my_manifests.FileManifest
+# pylint: disable=protected-access
+_Entry = my_walking._FileEntry
+
+
+def _signature(stat_result: os.stat_result) -> _Signature:
+    return stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino
+
+
+def _is_under(rel_path: str, rel_dir_path: str) -> bool:
+    """Check whether a relative path is a directory's, or under it.  Everything is under the root, ``''``."""
+    return not rel_dir_path or rel_path == rel_dir_path or rel_path.startswith(os.path.join(rel_dir_path, ''))
+
+
+class WatchEventKind(enum.Enum):
+    """Kinds of change to the files of a watched directory."""
+
+    ADDED = 'added'
+    """A file that wasn't there before"""
+
+    MODIFIED = 'modified'
+    """A file whose contents changed"""
+
+    REMOVED = 'removed'
+    """A file that is no longer there"""
+
+
+class WatchEvent:
+    """A change to a file of a watched directory."""
+
+    __slots__ = ('_kind', '_relative_path', '_manifest')
+
+    def __init__(
+            self,
+            kind: WatchEventKind,
+            relative_path: typing.Tuple[str, str],
+            manifest: typing.Optional[my_manifests.FileManifest]):
+        """Constructor
+
+        Args:
+            kind (WatchEventKind): The kind of change.
+            relative_path (tuple): The relative path of the file.
+            manifest (rudi_dire_insp.manifests.FileManifest): The new manifest of the file, None if it was removed.
+        """
+        self._kind = kind
+        self._relative_path = relative_path
+        self._manifest = manifest
+
+    @property
+    def kind(self) -> WatchEventKind:
+        """WatchEventKind: The kind of change."""
+        return self._kind
+
+    @property
+    def relative_path(self) -> typing.Tuple[str, str]:
+        """tuple: The relative path of the file."""
+        return self._relative_path
+
+    @property
+    def manifest(self) -> typing.Optional[my_manifests.FileManifest]:
+        """rudi_dire_insp.manifests.FileManifest: The new manifest of the file, None if it was removed."""
+        return self._manifest
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} kind={}, relative_path={}, manifest={}>'.format(
+            class_name, self._kind.value, self._relative_path, self._manifest)
+
+
+class _InotifyNotifier:
+    """Reports the relative paths that changed under a directory through Linux inotify.
+
+    Every directory of the tree gets a watch, added as directories are created or moved in.  A full event queue is
+    reported as a change to the root, ``''``, since events were lost.
+    """
+
+    def __init__(self, root_path: str):
+        """Constructor
+
+        Raises:
+            rudi_dire_insp.exceptions.WatchError: If inotify isn't available, or there are too many directories to
+                watch.
+        """
+        library_name = ctypes.util.find_library('c')
+        try:
+            libc = ctypes.CDLL(library_name, use_errno=True)
+            self._init1 = libc.inotify_init1
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+        except (OSError, AttributeError) as error:
+            raise my_exceptions.WatchError("inotify is not available: {}".format(error)) from error
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self._fd = self._init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise my_exceptions.WatchError("Unable to start inotify: {}".format(os.strerror(ctypes.get_errno())))
+        self._root_path = root_path
+        self._dirs_by_wd = {}  # type: typing.Dict[int, str]
+        try:
+            self._watch_tree('')
+        except BaseException:
+            self.close()
+            raise
+
+    def _watch_tree(self, rel_dir_path: str):
+        """Add a watch to the directory and every directory under it, ignoring those that vanished meanwhile."""
+        abs_dir_path = os.path.join(self._root_path, rel_dir_path)
+        watch_descriptor = self._add_watch(self._fd, os.fsencode(abs_dir_path), _WATCH_MASK)
+        if watch_descriptor < 0:
+            error_number = ctypes.get_errno()
+            if error_number in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise my_exceptions.WatchError("Unable to watch directory '{}': {}".format(
+                abs_dir_path, os.strerror(error_number)))
+        self._dirs_by_wd[watch_descriptor] = rel_dir_path
+        try:
+            with os.scandir(abs_dir_path) as dir_iter:
+                sub_dir_names = [entry.name for entry in dir_iter if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for name in sub_dir_names:
+            self._watch_tree(os.path.join(rel_dir_path, name))
+
+    def _unwatch_tree(self, rel_dir_path: str):
+        """Drop the watches of a directory moved away, and of every directory under it."""
+        for (watch_descriptor, watched_path) in list(self._dirs_by_wd.items()):
+            if _is_under(watched_path, rel_dir_path):
+                del self._dirs_by_wd[watch_descriptor]
+                self._rm_watch(self._fd, watch_descriptor)
+
+    def wait(self, timeout: typing.Optional[float]) -> typing.List[str]:
+        """Wait for changes, for at most the timeout in seconds or forever if None.
+
+        Returns:
+            list: The relative paths of the files and directories that changed, empty if none did in time.
+
+        Raises:
+            rudi_dire_insp.exceptions.WatchError
+        """
+        (readable, _, _) = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        changed = []
+        while True:
+            try:
+                data = os.read(self._fd, _INOTIFY_READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                (watch_descriptor, mask, _, name_length) = _INOTIFY_EVENT.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + _INOTIFY_EVENT.size:offset + _INOTIFY_EVENT.size + name_length]
+                                   .rstrip(b'\0'))
+                offset += _INOTIFY_EVENT.size + name_length
+                changed.extend(self._handle_event(watch_descriptor, mask, name))
+        return changed
+
+    def _handle_event(self, watch_descriptor: int, mask: int, name: str) -> typing.List[str]:
+        """Translate an event into the relative paths it changed, keeping the watches up to date."""
+        if mask & _IN_Q_OVERFLOW:
+            _LOGGER.warning("The inotify event queue overflowed, the whole directory will be checked again")
+            return ['']
+        if mask & _IN_IGNORED:
+            self._dirs_by_wd.pop(watch_descriptor, None)
+            return []
+        rel_dir_path = self._dirs_by_wd.get(watch_descriptor)
+        if rel_dir_path is None or not name:
+            return []
+        rel_path = os.path.join(rel_dir_path, name)
+        if mask & _IN_ISDIR:
+            if mask & (_IN_CREATE | _IN_MOVED_TO):
+                self._watch_tree(rel_path)
+            elif mask & _IN_MOVED_FROM:
+                self._unwatch_tree(rel_path)
+        return [rel_path]
+
+    def close(self):
+        """Stop watching."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} root_path="{}", watches={}>'.format(class_name, self._root_path, len(self._dirs_by_wd))
+
+
+class _PollingNotifier:
+    """Reports the relative paths that changed under a directory by comparing the status of every file per walk.
+
+    Each walk is compared with the previous one rather than with the index, so a file that stopped changing is
+    reported once, and then left to settle.
+    """
+
+    def __init__(self, root_path: str, signatures: typing.Dict[typing.Tuple[str, str], _Signature], interval: float):
+        """Constructor
+
+        Args:
+            root_path (str): The path to the directory watched.
+            signatures (dict): The status of each file found by the first walk, by relative path.
+            interval (float): The time between walks, in seconds.
+        """
+        self._root_path = root_path
+        self._signatures = dict(signatures)
+        self._interval = interval
+        self._next_walk = time.monotonic() + interval
+
+    def _walk(self) -> typing.Dict[typing.Tuple[str, str], _Signature]:
+        signatures = {}
+        try:
+            for file_entry in my_walking.walk_files(self._root_path):
+                try:
+                    signatures[file_entry.relative_path] = _signature(file_entry.stat())
+                except OSError:
+                    continue
+        except (OSError, my_exceptions.FileInspectionError) as error:
+            # Leave the previous walk in place, the next one will find the changes
+            _LOGGER.warning("Unable to walk '%s' for changes: %s", self._root_path, error)
+            return self._signatures
+        return signatures
+
+    def wait(self, timeout: typing.Optional[float]) -> typing.List[str]:
+        """Wait for the next walk, or for at most the timeout in seconds if that comes first.
+
+        Returns:
+            list: The relative paths of the files that changed since the previous walk, empty if there was no walk.
+        """
+        delay = max(0.0, self._next_walk - time.monotonic())
+        if timeout is not None and timeout < delay:
+            time.sleep(timeout)
+            return []
+        time.sleep(delay)
+        self._next_walk = time.monotonic() + self._interval
+        signatures = self._walk()
+        changed = [
+            os.path.join(*relative_path) for (relative_path, signature) in signatures.items()
+            if self._signatures.get(relative_path) != signature]
+        changed.extend(
+            os.path.join(*relative_path) for relative_path in self._signatures if relative_path not in signatures)
+        self._signatures = signatures
+        return changed
+
+    def close(self):
+        """Stop watching."""
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} root_path="{}", interval={}>'.format(class_name, self._root_path, self._interval)
+
+
+# pylint: disable=too-many-instance-attributes
+class DirectoryWatcher:
+    """Keeps the manifests of the files of a directory current as they change.
+
+    Call :py:meth:`start` to inspect the directory, then :py:meth:`poll` or :py:meth:`watch` for the changes from
+    then on.  Use as a context manager, or call :py:meth:`close` once done.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            root_path: str,
+            chunk_size: int = my_hashing.DEFAULT_CHUNK_SIZE,
+            algorithms: typing.Optional[typing.Iterable[str]] = None,
+            debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS,
+            poll_interval: float = DEFAULT_POLL_INTERVAL,
+            use_inotify: bool = True):
+        """Constructor
+
+        Args:
+            root_path (str): The path to the directory to watch.
+            chunk_size (int): The maximum number of bytes read from a file at a time while hashing it.
+            algorithms (iterable): Names of the hashing algorithms to use, see
+                :py:data:`rudi_dire_insp.hashing.ALGORITHM_NAMES`.  If None, the algorithms named by
+                :py:data:`rudi_dire_insp.hashing.DEFAULT_ALGORITHM_NAMES` are used.
+            debounce_seconds (float): The time without changes to a path before it is looked at again.
+            poll_interval (float): The time between walks of the directory, if changes are found by polling.
+            use_inotify (bool): If true, changes are found through inotify where it is available, and by polling
+                otherwise.  If false, they are always found by polling.
+
+        Raises:
+            rudi_dire_insp.exceptions.DirInspectionError
+            rudi_dire_insp.exceptions.HashError
+        """
+        for (name, value) in (('Debounce time', debounce_seconds), ('Poll interval', poll_interval)):
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                raise my_exceptions.DirInspectionError("{} must be a positive number: {!r}".format(name, value))
+        self._file_inspector = my_core._FileInspector(root_path, chunk_size=chunk_size, algorithms=algorithms)
+        self._root_path = root_path
+        self._debounce_seconds = debounce_seconds
+        self._poll_interval = poll_interval
+        self._use_inotify = use_inotify
+        self._index = {}  # type: typing.Dict[typing.Tuple[str, str], typing.Tuple[_Signature, _Manifest]]
+        # The times each pending path was first and last reported as changed
+        self._pending = {}  # type: typing.Dict[str, typing.Tuple[float, float]]
+        self._notifier = None  # type: typing.Optional[typing.Union[_InotifyNotifier, _PollingNotifier]]
+
+    @property
+    def notifier_name(self) -> typing.Optional[str]:
+        """str: How changes are found, ``inotify`` or ``polling``, or None before :py:meth:`start`."""
+        if self._notifier is None:
+            return None
+        return 'inotify' if isinstance(self._notifier, _InotifyNotifier) else 'polling'
+
+    def manifests(self) -> typing.List[my_manifests.FileManifest]:
+        """Get the current manifest of every file, in walk order."""
+        keys = sorted(self._index, key=my_walking.relative_path_key)
+        return [self._index[key][1] for key in keys]
+
+    def start(self):
+        """Inspect the whole directory, and start finding changes.
+
+        Watching starts before the walk, so nothing that changes during it is missed.
+
+        Raises:
+            rudi_dire_insp.exceptions.FileInspectionError
+            rudi_dire_insp.exceptions.HashError
+            rudi_dire_insp.exceptions.WatchError
+        """
+        if self._use_inotify:
+            try:
+                self._notifier = _InotifyNotifier(self._root_path)
+            except my_exceptions.WatchError as error:
+                _LOGGER.warning("Finding changes by polling every %s seconds instead: %s", self._poll_interval, error)
+        for file_entry in my_walking.walk_files(self._root_path):
+            signature = _signature(file_entry.stat())
+            self._index[file_entry.relative_path] = (signature, self._file_inspector.inspect_entry(file_entry))
+        if self._notifier is None:
+            self._notifier = _PollingNotifier(
+                self._root_path, {key: signature for (key, (signature, _)) in self._index.items()},
+                self._poll_interval)
+        _LOGGER.info("Watching %d files in '%s' with %s", len(self._index), self._root_path, self.notifier_name)
+
+    def _next_due(self) -> typing.Optional[float]:
+        """Find when the next pending path is due to be looked at, None if there are none."""
+        if not self._pending:
+            return None
+        max_delay = self._debounce_seconds * _MAX_DELAY_FACTOR
+        return min(
+            min(last + self._debounce_seconds, first + max_delay) for (first, last) in self._pending.values())
+
+    def poll(self, timeout: typing.Optional[float] = None) -> typing.List[WatchEvent]:
+        """Wait for changes, then look at the paths that are due and return the events for them.
+
+        Args:
+            timeout (float): The longest time to wait in seconds, or None to wait until some path is due.
+
+        Returns:
+            list: The events for the paths that were due, in path order.  May be empty, if the files changed back or
+            only their status did, or if the timeout came first.
+
+        Raises:
+            rudi_dire_insp.exceptions.WatchError
+        """
+        if self._notifier is None:
+            raise my_exceptions.WatchError("The watcher hasn't been started")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            due = self._next_due()
+            wait_until = due if deadline is None or (due is not None and due < deadline) else deadline
+            changed = self._notifier.wait(None if wait_until is None else max(0.0, wait_until - now))
+            now = time.monotonic()
+            for rel_path in changed:
+                (first, _) = self._pending.get(rel_path, (now, now))
+                self._pending[rel_path] = (first, now)
+            due = self._next_due()
+            if due is not None and due <= now:
+                return self._process_due(now)
+            if deadline is not None and now >= deadline:
+                return []
+
+    def watch(self) -> typing.Iterator[WatchEvent]:
+        """Yield every change from now on, forever.
+
+        Yields:
+            WatchEvent: Each change, as soon as it is due.
+
+        Raises:
+            rudi_dire_insp.exceptions.WatchError
+        """
+        while True:
+            yield from self.poll()
+
+    def _process_due(self, now: float) -> typing.List[WatchEvent]:
+        """Look at every pending path that is due, and return the events for them."""
+        max_delay = self._debounce_seconds * _MAX_DELAY_FACTOR
+        due_paths = [
+            rel_path for (rel_path, (first, last)) in self._pending.items()
+            if last + self._debounce_seconds <= now or first + max_delay <= now]
+        events = {}  # type: typing.Dict[typing.Tuple[str, str], WatchEvent]
+        # Parents first, so a directory looked at as a whole covers the paths under it
+        for rel_path in sorted(due_paths, key=os.fsencode):
+            del self._pending[rel_path]
+            for event in self._reconcile(rel_path):
+                events[event.relative_path] = event
+        return [events[key] for key in sorted(events, key=my_walking.relative_path_key)]
+
+    def _found_files(self, rel_path: str) -> typing.Optional[typing.Dict[typing.Tuple[str, str], _Entry]]:
+        """Find the files now at a relative path: the file itself, or every file under a directory.
+
+        Returns:
+            dict: The entries of the files found by relative path, or None if they couldn't be listed.
+        """
+        abs_path = os.path.join(self._root_path, rel_path)
+        try:
+            stat_result = os.lstat(abs_path)
+        except (FileNotFoundError, NotADirectoryError):
+            return {}
+        except OSError as error:
+            _LOGGER.warning("Unable to check '%s' for changes: %s", abs_path, error)
+            return None
+        if stat.S_ISDIR(stat_result.st_mode):
+            found = {}
+            try:
+                for file_entry in my_walking.walk_files(abs_path):
+                    (rel_dir_path, name) = file_entry.relative_path
+                    relative_path = (os.path.join(rel_path, rel_dir_path) if rel_dir_path else rel_path, name)
+                    found[relative_path] = my_walking._FileEntry(file_entry.path, relative_path)
+            except (OSError, my_exceptions.FileInspectionError) as error:
+                _LOGGER.warning("Unable to check '%s' for changes: %s", abs_path, error)
+                return None
+            return found
+        if stat.S_ISREG(stat_result.st_mode) or (stat.S_ISLNK(stat_result.st_mode) and os.path.isfile(abs_path)):
+            relative_path = os.path.split(rel_path)
+            return {relative_path: my_walking._FileEntry(abs_path, relative_path)}
+        return {}
+
+    def _reconcile(self, rel_path: str) -> typing.List[WatchEvent]:
+        """Bring the index up to date with the files now at a relative path, and return the events for them."""
+        found = self._found_files(rel_path)
+        if found is None:
+            return []
+        # Even a file found at the path may have replaced a directory whose files are still in the index
+        known = [key for key in self._index if _is_under(os.path.join(*key), rel_path)]
+
+        events = []
+        for relative_path in known:
+            if relative_path not in found and relative_path in self._index:
+                del self._index[relative_path]
+                events.append(WatchEvent(WatchEventKind.REMOVED, relative_path, None))
+        for (relative_path, file_entry) in found.items():
+            event = self._rehash(relative_path, file_entry)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _rehash(self, relative_path: typing.Tuple[str, str], file_entry: my_walking._FileEntry) -> typing.Optional[
+            WatchEvent]:
+        """Hash a file again if its status changed, and return the event for it if its contents did."""
+        try:
+            signature = _signature(file_entry.stat())
+            (old_signature, old_manifest) = self._index.get(relative_path, (None, None))
+            if signature == old_signature:
+                return None
+            manifest = self._file_inspector.inspect_entry(file_entry)
+            if _signature(os.stat(file_entry.path)) != signature:
+                # Still being written, look at it again once it settles
+                now = time.monotonic()
+                self._pending[os.path.join(*relative_path)] = (now, now)
+        except (OSError, my_exceptions.FileInspectionError, my_exceptions.HashError) as error:
+            _LOGGER.warning("Unable to inspect '%s', it is left as it was: %s", file_entry.path, error)
+            return None
+        self._index[relative_path] = (signature, manifest)
+        if old_manifest is None:
+            return WatchEvent(WatchEventKind.ADDED, relative_path, manifest)
+        if (old_manifest.raw_manifest.size, old_manifest.raw_manifest.hashes) == (
+                manifest.raw_manifest.size, manifest.raw_manifest.hashes):
+            return None
+        return WatchEvent(WatchEventKind.MODIFIED, relative_path, manifest)
+
+    def write_manifests(self, output_path: str):
+        """Write the current manifest of every file to a file as JSON Lines, replacing it in a single step.
+
+        Args:
+            output_path (str): The path to write to.
+
+        Raises:
+            rudi_dire_insp.exceptions.WatchError
+        """
+        (dir_path, file_name) = os.path.split(os.path.abspath(output_path))
+        try:
+            (handle, temp_path) = tempfile.mkstemp(prefix=file_name + '.', dir=dir_path)
+            try:
+                with os.fdopen(handle, 'wb') as temp_file:
+                    with my_serializing.JsonLinesWriter(temp_file) as writer:
+                        for manifest in self.manifests():
+                            writer.write(manifest)
+                os.replace(temp_path, output_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        except OSError as error:
+            raise my_exceptions.WatchError("Unable to write manifests: {}".format(output_path)) from error
+
+    def close(self):
+        """Stop finding changes."""
+        if self._notifier is not None:
+            self._notifier.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return '<{} root_path="{}", files={}, pending={}, notifier={}>'.format(
+            class_name, self._root_path, len(self._index), len(self._pending), self.notifier_name)
@@ -7,10 +7,17 @@ Note:
 """
 
 # Core python imports
+import argparse
 import codecs
+import http.client
 import io
 import json
 import logging
+import os
+import socket
+import tarfile
+import threading
+import time
 import typing
 
 # 3rd party imports
@@ -20,8 +27,13 @@ import testfixtures
 
 # Imports of code-under-test
 import rudi_dire_insp._cli as my_cli
+import rudi_dire_insp._cli_common as my_cli_common
 import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
 import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serving as my_serving
+import rudi_dire_insp.watching as my_watching
 
 # Module variables
 _LOGGER = logging.getLogger(__name__)
@@ -107,3 +119,422 @@ def test_run_inspection(tmp_path, cli_json_schema):
     testfixtures.compare(expected_json_objects, found_json_objects)
 
     _LOGGER.debug("Finished test")
+
+
+def test_run_inspection_w_chunk_size(tmp_path, cli_json_schema):
+    """Test that the chunk size used for reading files doesn't change the inspection output"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, _ = build_test_directory(tmp_path, num_manifests=3)
+
+    found_json_objects = []
+    for chunk_size in [1, 3, my_hashing.DEFAULT_CHUNK_SIZE]:
+        found_bytes_buffer = io.BytesIO()
+        my_cli._run_inspection(root_directory_path, found_bytes_buffer, chunk_size=chunk_size)
+        found_text_lines = io.StringIO(codecs.decode(found_bytes_buffer.getvalue(), encoding='utf-8')).readlines()
+        found_json_objects.append(_translate_to_sorted_json_objects(found_text_lines, cli_json_schema))
+
+    testfixtures.compare(found_json_objects[0], found_json_objects[1])
+    testfixtures.compare(found_json_objects[0], found_json_objects[2])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_run_inspection_w_algorithms(tmp_path, cli_json_schema):
+    """Test that only the requested hashes are written to the output"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, expected_manifests = build_test_directory(tmp_path, num_manifests=2)
+    algorithms = my_cli_common.algorithm_names('sha256, BLAKE2B')
+    assert ('sha256', 'blake2b') == algorithms
+
+    found_bytes_buffer = io.BytesIO()
+    my_cli._run_inspection(root_directory_path, found_bytes_buffer, algorithms=algorithms)
+    found_text_lines = io.StringIO(codecs.decode(found_bytes_buffer.getvalue(), encoding='utf-8')).readlines()
+    found_json_objects = _translate_to_sorted_json_objects(found_text_lines, cli_json_schema)
+
+    assert len(expected_manifests) == len(found_json_objects)
+    for expected_manifest, json_object in zip(expected_manifests, found_json_objects):
+        assert {'sha256', 'blake2b'} == set(json_object['hashes'].keys())
+        assert expected_manifest.raw_manifest.hashes.sha256 == json_object['hashes']['sha256']
+
+    with pytest.raises(argparse.ArgumentTypeError):
+        my_cli_common.algorithm_names('sha256,whirlpool')
+
+    _LOGGER.debug("Finished test")
+
+
+def test_run_inspection_w_binary_format(tmp_path):
+    """Test that the binary output holds the same manifests as the JSON Lines output"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, expected_manifests = build_test_directory(tmp_path, num_manifests=3)
+
+    manifest_path = tmp_path / 'manifests.bin'
+    with open(str(manifest_path), 'wb') as output_file:
+        my_cli._run_inspection(root_directory_path, output_file, 'binary', algorithms=('sha256', 'md5'))
+
+    with my_manifests.BinaryManifestReader(str(manifest_path)) as reader:
+        assert ('md5', 'sha256') == reader.algorithm_names
+        assert len(expected_manifests) == len(reader)
+        for expected_manifest in expected_manifests:
+            found_manifest = reader.find_path(expected_manifest.relative_path)
+            assert expected_manifest.raw_manifest.size == found_manifest.raw_manifest.size
+            assert expected_manifest.raw_manifest.hashes.sha256 == found_manifest.raw_manifest.hashes.sha256
+
+    _LOGGER.debug("Finished test")
+
+
+def test_diff_and_verify_commands(tmp_path):
+    """Test the diff and verify commands end to end, through the main entry point"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, _ = build_test_directory(tmp_path, num_manifests=3)
+    old_path = str(tmp_path / 'old.jsonl')
+    new_path = str(tmp_path / 'new.bin')
+    diff_path = str(tmp_path / 'diff.jsonl')
+    assert 0 == my_cli.main(['-o', old_path, root_directory_path])
+    assert 0 == my_cli.main(['verify', '-o', diff_path, old_path, root_directory_path])
+    assert b'' == (tmp_path / 'diff.jsonl').read_bytes()
+
+    (tmp_path / 'root-dir' / 'test-1.txt').rename(tmp_path / 'root-dir' / 'renamed.txt')
+    assert 0 == my_cli.main(['--format', 'binary', '-o', new_path, root_directory_path])
+    assert 1 == my_cli.main(['diff', '-o', diff_path, old_path, new_path])
+    found_lines = (tmp_path / 'diff.jsonl').read_text().splitlines()
+    assert 1 == len(found_lines)
+    difference = json.loads(found_lines[0])
+    assert 'moved' == difference['change']
+    assert ['', 'renamed.txt'] == difference['relative_path'] == difference['new']['relative_path']
+    assert ['', 'test-1.txt'] == difference['old']['relative_path']
+    assert difference['old']['hashes'] == difference['new']['hashes']
+
+    assert 1 == my_cli.main(['verify', '-o', diff_path, old_path, root_directory_path])
+    found_changes = [json.loads(line)['change'] for line in (tmp_path / 'diff.jsonl').read_text().splitlines()]
+    assert ['added', 'removed'] == found_changes
+
+    _LOGGER.debug("Finished test")
+
+
+def test_stats_option(tmp_path, monkeypatch):
+    """Test that --stats writes a JSON summary of the inspection to the logging stream"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, expected_manifests = build_test_directory(tmp_path, num_manifests=3)
+    logging_stream = io.StringIO()
+    monkeypatch.setattr(my_cli_common, 'LOGGING_STREAM', logging_stream)
+    assert 0 == my_cli.main(['--stats', '--hashes', 'sha256', '-o', str(tmp_path / 'out.jsonl'), root_directory_path])
+
+    stats = json.loads(logging_stream.getvalue())
+    assert len(expected_manifests) == stats['files']
+    assert 1 == stats['directories']
+    assert ['sha256'] == list(stats['hash_seconds'])
+    assert 0.0 < stats['stage_seconds']['serialize']
+    assert 0.0 < stats['elapsed_seconds']
+
+    _LOGGER.debug("Finished test")
+
+
+def test_duplicates_command(tmp_path, monkeypatch):
+    """Test the duplicates command end to end, through the main entry point"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, _ = build_test_directory(tmp_path, num_manifests=3)
+    (tmp_path / 'root-dir' / 'copy.txt').write_text("hello world 2")
+    logging_stream = io.StringIO()
+    monkeypatch.setattr(my_cli_common, 'LOGGING_STREAM', logging_stream)
+    output_path = tmp_path / 'duplicates.jsonl'
+    assert 0 == my_cli.main(['duplicates', '--stats', '-o', str(output_path), root_directory_path])
+
+    found_groups = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert 1 == len(found_groups)
+    assert [['', 'copy.txt'], ['', 'test-2.txt']] == found_groups[0]['relative_paths']
+    assert len("hello world 2") == found_groups[0]['size']
+    assert ['sha256'] == list(found_groups[0]['hashes'])
+    assert 0 < json.loads(logging_stream.getvalue())['bytes_read']
+
+    _LOGGER.debug("Finished test")
+
+
+def test_sample_option_and_upgrade_command(tmp_path, cli_json_schema):
+    """Test that --sample marks its output as sampled, and that the upgrade command gives the full hashes"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, expected_manifests = build_test_directory(tmp_path, num_manifests=3)
+    sampled_path = str(tmp_path / 'sampled.jsonl')
+    upgraded_path = tmp_path / 'upgraded.jsonl'
+    full_path = tmp_path / 'full.jsonl'
+    assert 0 == my_cli.main(['--sample', '-o', sampled_path, root_directory_path])
+    sampled_objects = _translate_to_sorted_json_objects(
+        (tmp_path / 'sampled.jsonl').read_text().splitlines(), cli_json_schema)
+    assert len(expected_manifests) == len(sampled_objects)
+    assert all(json_object['sampled'] for json_object in sampled_objects)
+    assert 0 == my_cli.main(['verify', '-o', str(tmp_path / 'diff.jsonl'), sampled_path, root_directory_path])
+
+    assert 0 == my_cli.main(['upgrade', '--path', 'test-1.txt', '-o', str(upgraded_path), sampled_path,
+                             root_directory_path])
+    assert 1 == sum('sampled' not in json.loads(line) for line in upgraded_path.read_text().splitlines())
+    assert 0 == my_cli.main(['upgrade', '-o', str(upgraded_path), sampled_path, root_directory_path])
+    assert 0 == my_cli.main(['-o', str(full_path), root_directory_path])
+    assert full_path.read_bytes() == upgraded_path.read_bytes()
+
+    with pytest.raises(SystemExit):
+        my_cli.main(['--sample', '--format', 'binary', root_directory_path])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_shard_option_and_merge_command(tmp_path):
+    """Test that the outputs of --shard merge back into the output of the whole directory"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, _ = build_test_directory(tmp_path, num_manifests=9)
+    full_path = tmp_path / 'full.jsonl'
+    merged_path = tmp_path / 'merged.jsonl'
+    shard_paths = [str(tmp_path / 'shard-{}.bin'.format(number)) for number in (1, 2)]
+    assert 0 == my_cli.main(['-o', str(full_path), root_directory_path])
+    for (number, shard_path) in enumerate(shard_paths, 1):
+        assert 0 == my_cli.main(['--shard', '{}/2'.format(number), '--format', 'binary', '-o', shard_path,
+                                 root_directory_path])
+
+    assert 0 == my_cli.main(['merge', '--shards', '2', '-o', str(merged_path)] + shard_paths)
+    assert full_path.read_bytes() == merged_path.read_bytes()
+    assert 0 == my_cli.main(['merge', '--format', 'binary', '-o', str(tmp_path / 'merged.bin')] + shard_paths)
+    assert 0 == my_cli.main(['diff', '-o', str(tmp_path / 'diff.jsonl'), str(full_path), str(tmp_path / 'merged.bin')])
+
+    with pytest.raises(my_exceptions.ShardError):
+        my_cli.main(['merge', '--shards', '3', '-o', str(merged_path)] + shard_paths)
+    with pytest.raises(SystemExit):
+        my_cli.main(['--shard', '3/2', root_directory_path])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_resume_option(tmp_path, monkeypatch):
+    """Test that an inspection stopped part way is resumed from its checkpoint, giving the same output"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, _ = build_test_directory(tmp_path, num_manifests=9)
+    full_path = tmp_path / 'full.jsonl'
+    output_path = tmp_path / 'out.jsonl'
+    checkpoint_path = tmp_path / 'out.jsonl.checkpoint'
+    assert 0 == my_cli.main(['-o', str(full_path), root_directory_path])
+    assert not (tmp_path / 'full.jsonl.checkpoint').exists()
+
+    # Stop the inspection with an error after a few files
+    original_inspect_entry = my_core._FileInspector.inspect_entry
+    calls = []
+
+    def _failing_inspect_entry(self, file_entry):
+        calls.append(file_entry.relative_path)
+        if len(calls) > 5:
+            raise RuntimeError("Simulated kill")
+        return original_inspect_entry(self, file_entry)
+
+    def _counting_inspect_entry(self, file_entry):
+        calls.append(file_entry.relative_path)
+        return original_inspect_entry(self, file_entry)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(my_core._FileInspector, 'inspect_entry', _failing_inspect_entry)
+        with pytest.raises(RuntimeError):
+            my_cli.main(['--checkpoint-interval', '2', '-o', str(output_path), root_directory_path])
+    assert 4 == json.loads(checkpoint_path.read_text())['count']
+
+    # Other options can't resume it, the same ones only inspect the files after the checkpoint
+    with pytest.raises(my_exceptions.CheckpointError):
+        my_cli.main(['--resume', '--hashes', 'md5', '-o', str(output_path), root_directory_path])
+    calls.clear()
+    with monkeypatch.context() as patch:
+        patch.setattr(my_core._FileInspector, 'inspect_entry', _counting_inspect_entry)
+        assert 0 == my_cli.main(['--resume', '--checkpoint-interval', '5', '-o', str(output_path), root_directory_path])
+    assert [('', 'test-{}.txt'.format(index)) for index in range(4, 10)] == calls
+    assert full_path.read_bytes() == output_path.read_bytes()
+    assert not checkpoint_path.exists()
+
+    with pytest.raises(SystemExit):
+        my_cli.main(['--resume', '--format', 'binary', '-o', str(output_path), root_directory_path])
+    with pytest.raises(SystemExit):
+        my_cli.main(['--resume', '--checkpoint-interval', '0', '-o', str(output_path), root_directory_path])
+
+    # An interval of 0 turns checkpoints off
+    calls.clear()
+    with monkeypatch.context() as patch:
+        patch.setattr(my_core._FileInspector, 'inspect_entry', _failing_inspect_entry)
+        with pytest.raises(RuntimeError):
+            my_cli.main(['--checkpoint-interval', '0', '-o', str(output_path), root_directory_path])
+    assert not checkpoint_path.exists()
+
+    _LOGGER.debug("Finished test")
+
+
+def test_filter_options(tmp_path):
+    """Test that the filter options skip files and directories, and are validated"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, _ = build_test_directory(tmp_path, num_manifests=3)
+    (tmp_path / 'root-dir' / '.git').mkdir()
+    (tmp_path / 'root-dir' / '.git' / 'HEAD').write_text('ref')
+    (tmp_path / 'root-dir' / 'big.txt').write_text('x' * 100)
+    os.utime(str(tmp_path / 'root-dir' / 'test-0.txt'), (0, 0))
+    output_path = tmp_path / 'out.jsonl'
+
+    assert 0 == my_cli.main([
+        '--exclude', '.git', r'--exclude-regex=-3\.txt$', '--max-size', '50', '--modified-after', '2000-01-01',
+        '-o', str(output_path), root_directory_path])
+    found_paths = [json.loads(line)['relative_path'] for line in output_path.read_text().splitlines()]
+    assert [['', 'test-1.txt'], ['', 'test-2.txt']] == found_paths
+
+    assert 0 == my_cli.main(['--include', '*.txt', '--min-size', '50', '-o', str(output_path), root_directory_path])
+    found_paths = [json.loads(line)['relative_path'] for line in output_path.read_text().splitlines()]
+    assert [['', 'big.txt']] == found_paths
+
+    for bad_args in (['--include-regex', '('], ['--modified-before', 'yesterday']):
+        with pytest.raises(SystemExit):
+            my_cli.main(bad_args + [root_directory_path])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_archive_command(tmp_path):
+    """Test that inspecting an archive gives the same output as inspecting the directory it was made from"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, _ = build_test_directory(tmp_path, num_manifests=5)
+    (tmp_path / 'root-dir' / 'sub').mkdir()
+    (tmp_path / 'root-dir' / 'sub' / 'nested.txt').write_text('nested')
+    archive_path = tmp_path / 'root.tar.gz'
+    with tarfile.open(str(archive_path), 'w:gz') as tar_file:
+        tar_file.add(root_directory_path, arcname='.')
+    full_path = tmp_path / 'full.jsonl'
+    archive_output_path = tmp_path / 'archive.jsonl'
+
+    assert 0 == my_cli.main(['-o', str(full_path), root_directory_path])
+    assert 0 == my_cli.main(['archive', '-o', str(archive_output_path), str(archive_path)])
+    assert full_path.read_bytes() == archive_output_path.read_bytes()
+    assert 0 == my_cli.main(['archive', '--format', 'binary', '-o', str(tmp_path / 'archive.bin'), str(archive_path)])
+    assert 0 == my_cli.main(['diff', '-o', str(tmp_path / 'diff.jsonl'), str(full_path), str(tmp_path / 'archive.bin')])
+
+    with pytest.raises(my_exceptions.ArchiveError):
+        my_cli.main(['archive', str(full_path)])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_directories_option(tmp_path):
+    """Test that --directories writes directory manifests, which diff --directories compares"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, _ = build_test_directory(tmp_path, num_manifests=3)
+    (tmp_path / 'root-dir' / 'sub').mkdir()
+    (tmp_path / 'root-dir' / 'sub' / 'nested.txt').write_text('nested')
+    full_path = tmp_path / 'full.jsonl'
+    files_path = tmp_path / 'files.jsonl'
+    old_path = tmp_path / 'old-dirs.jsonl'
+    new_path = tmp_path / 'new-dirs.jsonl'
+    diff_path = tmp_path / 'diff.jsonl'
+
+    assert 0 == my_cli.main(['-o', str(full_path), root_directory_path])
+    assert 0 == my_cli.main(['--directories', str(old_path), '-o', str(files_path), root_directory_path])
+    assert full_path.read_bytes() == files_path.read_bytes()
+    directories = [json.loads(line) for line in old_path.read_text().splitlines()]
+    assert [('sub', 1), ('', 5)] == [(data['relative_path'], data['file_count']) for data in directories]
+
+    assert 0 == my_cli.main(['diff', '--directories', '-o', str(diff_path), str(old_path), str(old_path)])
+    (tmp_path / 'root-dir' / 'sub' / 'nested.txt').write_text('changed')
+    assert 0 == my_cli.main(['--directories', str(new_path), '-o', str(files_path), root_directory_path])
+    assert 1 == my_cli.main(['diff', '--directories', '-o', str(diff_path), str(old_path), str(new_path)])
+    changes = [json.loads(line) for line in diff_path.read_text().splitlines()]
+    assert [('changed', ''), ('changed', 'sub')] == [(change['change'], change['relative_path']) for change in changes]
+    assert 1 == changes[1]['new']['file_count']
+
+    for bad_args in (['--unordered'], ['--resume', '-o', str(files_path)], ['-o', str(old_path)]):
+        with pytest.raises(SystemExit):
+            my_cli.main(bad_args + ['--directories', str(old_path), root_directory_path])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_watch_command(tmp_path, monkeypatch):
+    """Test that the watch command writes an event per change and keeps the manifest file current until interrupted"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, _ = build_test_directory(tmp_path, num_manifests=3)
+    full_path = tmp_path / 'full.jsonl'
+    events_path = tmp_path / 'events.jsonl'
+    manifest_path = tmp_path / 'manifest.jsonl'
+    poll = my_watching.DirectoryWatcher.poll
+    calls = []
+    written = []
+
+    def poll_once(watcher, timeout=None):
+        calls.append(timeout)
+        if len(calls) > 1:
+            written.append(manifest_path.read_text())
+            raise KeyboardInterrupt()
+        (tmp_path / 'root-dir' / 'added.txt').write_text('added')
+        return poll(watcher, 5)
+
+    monkeypatch.setattr(my_watching.DirectoryWatcher, 'poll', poll_once)
+    assert 0 == my_cli.main([
+        'watch', '--polling', '--poll-interval', '0.1', '--debounce', '0.05', '-o', str(events_path),
+        '--manifest', str(manifest_path), root_directory_path])
+    events = [json.loads(line) for line in events_path.read_text().splitlines()]
+    assert [('added', ['', 'added.txt'], 5)] == [
+        (event['event'], event['relative_path'], event['manifest']['size']) for event in events]
+    assert 0 == my_cli.main(['-o', str(full_path), root_directory_path])
+    assert full_path.read_bytes() == manifest_path.read_bytes()
+    # The manifest file is only written again once the interval passed, or on exit
+    assert 'added.txt' not in written[0]
+    assert 0 < calls[1] <= my_watching.DEFAULT_WRITE_INTERVAL
+
+    with pytest.raises(SystemExit):
+        my_cli.main(['watch', '--debounce', '0', root_directory_path])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_serve_command(tmp_path, monkeypatch):
+    """Test that the serve command answers lookups from an inspection or a loaded manifest file until interrupted"""
+    _LOGGER.debug("Begin test")
+
+    root_directory_path, _ = build_test_directory(tmp_path, num_manifests=3)
+    full_path = tmp_path / 'full.jsonl'
+    socket_path = str(tmp_path / 'serve.sock')
+    assert 0 == my_cli.main(['--format', 'binary', '-o', str(full_path), root_directory_path])
+    answers = []
+
+    def request(url):
+        client = http.client.HTTPConnection('localhost')
+        client.sock = socket.socket(socket.AF_UNIX)
+        client.sock.connect(socket_path)
+        client.request('GET', url)
+        response = client.getresponse()
+        answers.append((response.status, response.read()))
+        client.close()
+
+    def serve_once(server):
+        thread = threading.Thread(target=request, args=('/prefix?path=',))
+        thread.start()
+        server.handle_request()
+        thread.join()
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(my_serving._UnixServer, 'serve_forever', serve_once)
+    assert 0 == my_cli.main(['serve', '--revalidate', '--socket', socket_path, root_directory_path])
+    assert 0 == my_cli.main(['serve', '--socket', socket_path, '--manifest', str(full_path), root_directory_path])
+    assert 0 == my_cli.main(['-o', str(full_path), root_directory_path])
+    assert [(200, full_path.read_bytes())] * 2 == answers
+
+    # A file rewritten with the same size while a long inspection ran is hashed again from a loaded manifest file
+    (tmp_path / 'root-dir' / 'test-1.txt').write_text("HELLO WORLD 1")
+    written_at_ns = int(time.time() * 1e9) + 2 * 10 ** 9
+    os.utime(str(full_path), ns=(written_at_ns, written_at_ns))
+    assert 0 == my_cli.main(['serve', '--revalidate', '--socket', socket_path, '--manifest', str(full_path),
+                             root_directory_path])
+    assert 0 == my_cli.main(['-o', str(full_path), root_directory_path])
+    assert (200, full_path.read_bytes()) == answers[-1]
+
+    with pytest.raises(SystemExit):
+        my_cli.main(['serve', root_directory_path])
+
+    _LOGGER.debug("Finished test")
@@ -3,17 +3,22 @@ Integration tests for core module
 """
 
 # Core python imports
+import asyncio
 import logging
 import os
+import threading
+import time
 
 # 3rd party imports
 import pytest
 import testfixtures
 
 # Imports of code-under-test
+import rudi_dire_insp.caching as my_caching
 import rudi_dire_insp.exceptions as my_exceptions
 import rudi_dire_insp.core as my_core
 import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.stats as my_stats
 
 # Module variables
 _LOGGER = logging.getLogger(__name__)
@@ -70,3 +75,253 @@ def test_directory(tmp_path):
     assert counter == len(file_names)
 
     _LOGGER.debug("Finished test")
+
+
+def test_directory_w_threaded_hashing(tmp_path):
+    """Verify that threaded hashing doesn't change the manifests produced for a directory"""
+    _LOGGER.debug("Begin test")
+
+    for index in range(0, 3):
+        (tmp_path / "test{}.bin".format(index)).write_bytes(os.urandom(1000 * (index + 1)))
+
+    def _inspect(**kwargs):
+        inspector = my_core.DirectoryInspector(**kwargs)
+        return sorted(
+            (manifest.relative_path, manifest.raw_manifest.size, manifest.raw_manifest.hashes)
+            for manifest in inspector.inspect(str(tmp_path)))
+
+    testfixtures.compare(_inspect(), _inspect(chunk_size=100, threaded_hashing=True))
+
+    _LOGGER.debug("Finished test")
+
+
+def _build_tree(root_path, num_dirs: int, num_files: int):
+    """Populate a directory tree with a number of sub directories, each holding a number of small files"""
+    for dir_index in range(0, num_dirs):
+        dir_path = root_path / "dir-{}".format(dir_index)
+        dir_path.mkdir()
+        for file_index in range(0, num_files):
+            (dir_path / "file-{}.txt".format(file_index)).write_text("data {} {}".format(dir_index, file_index))
+
+
+@pytest.mark.parametrize('use_processes', [False, True])
+def test_directory_w_workers(tmp_path, use_processes):
+    """Verify that inspecting on a pool of workers produces the same manifests, in walk order when ordered"""
+    _LOGGER.debug("Begin test")
+    _build_tree(tmp_path, num_dirs=4, num_files=10)
+
+    def _inspect(**kwargs):
+        inspector = my_core.DirectoryInspector(**kwargs)
+        return [
+            (manifest.relative_path, manifest.raw_manifest.size, manifest.raw_manifest.hashes)
+            for manifest in inspector.inspect(str(tmp_path))]
+
+    expected = _inspect()
+    assert len(expected) == 40
+    testfixtures.compare(expected, _inspect(workers=3, use_processes=use_processes))
+    testfixtures.compare(sorted(expected), sorted(_inspect(workers=3, use_processes=use_processes, ordered=False)))
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('inspector_options', [{}, {'workers': 3}, {'workers': 3, 'use_processes': True}])
+def test_directory_w_stats(tmp_path, inspector_options):
+    """Verify that stats are collected for every file and directory, as far as the workers allow"""
+    _LOGGER.debug("Begin test")
+    _build_tree(tmp_path, num_dirs=3, num_files=4)
+
+    stats = my_stats.InspectionStats(slowest_count=2)
+    inspector = my_core.DirectoryInspector(algorithms=['md5', 'sha1'], stats=stats, **inspector_options)
+    manifests = list(inspector.inspect(str(tmp_path)))
+    assert stats is inspector.stats
+
+    assert 12 == stats.files
+    assert 4 == stats.directories
+    assert 0.0 < stats.stage_seconds['walk']
+    if inspector_options.get('use_processes'):
+        assert [] == stats.slowest_files
+        assert 0 == stats.bytes_read
+    else:
+        assert sum(manifest.raw_manifest.size for manifest in manifests) == stats.bytes_read
+        assert {'md5', 'sha1'} == set(stats.hash_seconds)
+        assert 2 == len(stats.slowest_files)
+        assert 0.0 < stats.stage_seconds['open']
+
+    _LOGGER.debug("Finished test")
+
+
+def test_directory_w_workers_error(tmp_path):
+    """Verify that an error inspecting a file on a worker reaches the consumer of the manifests"""
+    _LOGGER.debug("Begin test")
+    outside_path = tmp_path / "outside.txt"
+    outside_path.write_text("not under the root")
+    root_path = tmp_path / "root"
+    root_path.mkdir()
+    _build_tree(root_path, num_dirs=1, num_files=5)
+    (root_path / "link.txt").symlink_to(outside_path)
+
+    inspector = my_core.DirectoryInspector(workers=2)
+    with pytest.raises(my_exceptions.FileInspectionError):
+        for _ in inspector.inspect(str(root_path)):
+            pass
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('inspector_options', [{}, {'workers': 2}, {'workers': 2, 'use_processes': True}])
+def test_directory_w_cache(tmp_path, monkeypatch, inspector_options):
+    """Verify that a hash cache avoids reading unchanged files, and forgets deleted ones"""
+    _LOGGER.debug("Begin test")
+    monkeypatch.setattr(my_caching, '_RACY_WINDOW_NS', 0)
+    root_path = tmp_path / "root"
+    root_path.mkdir()
+    _build_tree(root_path, num_dirs=2, num_files=3)
+
+    def _inspect(cache):
+        inspector = my_core.DirectoryInspector(cache=cache, **inspector_options)
+        return sorted(
+            (manifest.relative_path, manifest.raw_manifest.size, manifest.raw_manifest.hashes)
+            for manifest in inspector.inspect(str(root_path)))
+
+    expected = _inspect(cache=None)
+    with my_caching.HashCache(str(tmp_path / "cache.sqlite")) as cache:
+        testfixtures.compare(expected, _inspect(cache))
+        assert (0, 6) == (cache.hits, cache.misses)
+
+        testfixtures.compare(expected, _inspect(cache))
+        assert (6, 6) == (cache.hits, cache.misses)
+
+        # Change one file and delete another
+        (root_path / "dir-0" / "file-0.txt").write_text("changed content")
+        (root_path / "dir-1" / "file-2.txt").unlink()
+        found = _inspect(cache)
+        assert 5 == len(found)
+        assert (10, 7) == (cache.hits, cache.misses)
+        assert 1 == cache.evictions
+
+    _LOGGER.debug("Finished test")
+
+
+def _run_async(coroutine):
+    """Run a coroutine to completion on a fresh event loop"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize('max_pending', [1, 3])
+def test_directory_async(tmp_path, monkeypatch, max_pending):
+    """Verify the async generator produces the same manifests, with a bounded number of files in progress"""
+    _LOGGER.debug("Begin test")
+    _build_tree(tmp_path, num_dirs=3, num_files=7)
+
+    in_progress = []
+    max_in_progress = []
+    original_inspect_entry = my_core._FileInspector.inspect_entry
+
+    def _tracking_inspect_entry(self, file_entry):
+        in_progress.append(file_entry)
+        max_in_progress.append(len(in_progress))
+        try:
+            time.sleep(0.001)
+            return original_inspect_entry(self, file_entry)
+        finally:
+            in_progress.remove(file_entry)
+
+    monkeypatch.setattr(my_core._FileInspector, 'inspect_entry', _tracking_inspect_entry)
+
+    async def _collect():
+        inspector = my_core.DirectoryInspector()
+        return [manifest async for manifest in inspector.ainspect(str(tmp_path), max_pending=max_pending)]
+
+    found = _run_async(_collect())
+    expected = list(my_core.DirectoryInspector().inspect(str(tmp_path)))
+    testfixtures.compare(
+        sorted((manifest.relative_path, manifest.raw_manifest.hashes) for manifest in expected),
+        sorted((manifest.relative_path, manifest.raw_manifest.hashes) for manifest in found))
+    assert max(max_in_progress) <= max_pending
+
+    _LOGGER.debug("Finished test")
+
+
+def test_directory_async_cancel(tmp_path, monkeypatch):
+    """Verify that stopping the consumer early abandons the files that haven't been inspected yet"""
+    _LOGGER.debug("Begin test")
+    _build_tree(tmp_path, num_dirs=5, num_files=20)
+
+    started = []
+    original_inspect_entry = my_core._FileInspector.inspect_entry
+
+    def _slow_inspect_entry(self, file_entry):
+        started.append(file_entry)
+        time.sleep(0.01)
+        return original_inspect_entry(self, file_entry)
+
+    monkeypatch.setattr(my_core._FileInspector, 'inspect_entry', _slow_inspect_entry)
+
+    async def _take_one():
+        manifests = my_core.DirectoryInspector().ainspect(str(tmp_path), max_pending=2)
+        manifest = await manifests.__anext__()
+        await manifests.aclose()
+        return manifest
+
+    assert isinstance(_run_async(_take_one()), my_manifests.FileManifest)
+    time.sleep(0.05)
+    assert len(started) <= 4
+
+    _LOGGER.debug("Finished test")
+
+
+def test_directory_async_close(tmp_path, monkeypatch):
+    """Verify that stopping the consumer early waits for the work in progress and leaks no file descriptors"""
+    _LOGGER.debug("Begin test")
+    _build_tree(tmp_path, num_dirs=5, num_files=20)
+
+    started = []
+    in_progress = []
+    original_inspect_entry = my_core._FileInspector.inspect_entry
+
+    def _slow_inspect_entry(self, file_entry):
+        # Only the first file is quick, the others are still being read when the consumer stops
+        started.append(file_entry)
+        in_progress.append(file_entry)
+        try:
+            time.sleep(0.0 if len(started) == 1 else 0.1)
+            return original_inspect_entry(self, file_entry)
+        finally:
+            in_progress.remove(file_entry)
+
+    monkeypatch.setattr(my_core._FileInspector, 'inspect_entry', _slow_inspect_entry)
+
+    async def _take_one():
+        manifests = my_core.DirectoryInspector().ainspect(str(tmp_path), max_pending=4)
+        async for manifest in manifests:
+            break
+        await manifests.aclose()
+        return manifest
+
+    fd_count = len(os.listdir('/proc/self/fd'))
+    assert isinstance(_run_async(_take_one()), my_manifests.FileManifest)
+    assert not in_progress
+    assert fd_count == len(os.listdir('/proc/self/fd'))
+
+    _LOGGER.debug("Finished test")
+
+
+def test_cancellable_reader(tmp_path):
+    """Verify that reads from a file inspector stop once its cancel event is set"""
+    _LOGGER.debug("Begin test")
+    file_path = tmp_path / "test.txt"
+    file_path.write_text("hello world")
+
+    cancel_event = threading.Event()
+    inspector = my_core._FileInspector(str(tmp_path), cancel_event=cancel_event)
+    assert 11 == inspector.inspect(str(file_path)).raw_manifest.size
+
+    cancel_event.set()
+    with pytest.raises(my_exceptions.HashError):
+        inspector.inspect(str(file_path))
+
+    _LOGGER.debug("Finished test")
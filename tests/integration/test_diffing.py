@@ -0,0 +1,111 @@
+"""
+Integration tests for diffing module
+"""
+
+# Core python imports
+import logging
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.caching as my_caching
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.diffing as my_diffing
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.serializing as my_serializing
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.integration
+
+
+def _build_tree(root_path):
+    """Create a small directory tree and return its manifests"""
+    (root_path / 'sub').mkdir()
+    for (name, content) in [('kept.txt', 'kept'), ('removed.txt', 'removed'), ('sub/same-size.txt', 'abcd'),
+                            ('sub/resized.txt', 'short')]:
+        (root_path / name).write_text(content)
+    return list(my_core.DirectoryInspector(algorithms=['md5', 'sha256']).inspect(str(root_path)))
+
+
+def test_verify_directory(tmp_path, monkeypatch):
+    """Verify that a live directory is checked against stored manifests, hashing only files of unchanged size"""
+    _LOGGER.debug("Begin test")
+
+    manifests = _build_tree(tmp_path)
+    assert [] == list(my_diffing.verify_directory(str(tmp_path), manifests))
+
+    (tmp_path / 'removed.txt').unlink()
+    (tmp_path / 'added.txt').write_text('added')
+    (tmp_path / 'sub' / 'same-size.txt').write_text('dcba')
+    (tmp_path / 'sub' / 'resized.txt').write_text('much longer')
+
+    hashed_paths = []
+    original_inspect_entry = my_core._FileInspector.inspect_entry
+
+    def _recording_inspect_entry(self, file_entry):
+        hashed_paths.append(file_entry.relative_path)
+        return original_inspect_entry(self, file_entry)
+
+    monkeypatch.setattr(my_core._FileInspector, 'inspect_entry', _recording_inspect_entry)
+    differences = list(my_diffing.verify_directory(str(tmp_path), manifests))
+
+    found = [(difference.kind, difference.relative_path, difference.new is not None) for difference in differences]
+    assert [
+        (my_diffing.DiffKind.ADDED, ('', 'added.txt'), False),
+        (my_diffing.DiffKind.REMOVED, ('', 'removed.txt'), False),
+        (my_diffing.DiffKind.CHANGED, ('sub', 'resized.txt'), False),
+        (my_diffing.DiffKind.CHANGED, ('sub', 'same-size.txt'), True),
+    ] == found
+    assert [('', 'kept.txt'), ('sub', 'same-size.txt')] == hashed_paths
+    assert ('sha256',) == differences[-1].new.raw_manifest.hashes.names
+
+    with pytest.raises(my_exceptions.DiffError):
+        list(my_diffing.verify_directory(str(tmp_path), manifests, algorithms=['sha512']))
+
+    _LOGGER.debug("Finished test")
+
+
+def test_verify_directory_w_cache(tmp_path, monkeypatch):
+    """Test that verifying with a hash cache starts a run, so the entries it uses stay current"""
+    _LOGGER.debug("Begin test")
+
+    monkeypatch.setattr(my_caching, '_RACY_WINDOW_NS', 0)
+    root_path = tmp_path / 'root'
+    root_path.mkdir()
+    manifests = _build_tree(root_path)
+    with my_caching.HashCache(str(tmp_path / 'cache.sqlite')) as cache:
+        list(my_core.DirectoryInspector(algorithms=['md5', 'sha256'], cache=cache).inspect(str(root_path)))
+        assert [] == list(my_diffing.verify_directory(str(root_path), manifests, cache=cache))
+        assert len(manifests) == cache.hits
+        generations = [row[0] for row in cache._connection.execute("SELECT generation FROM file_hashes")]
+        assert [2] * len(manifests) == generations
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('output_format', ['jsonl', 'binary'])
+def test_open_manifests(tmp_path, output_format):
+    """Verify that stored manifests are read back in path order whatever their format"""
+    _LOGGER.debug("Begin test")
+
+    root_path = tmp_path / 'root'
+    root_path.mkdir()
+    manifests = _build_tree(root_path)
+    manifest_path = tmp_path / 'manifests.out'
+    with open(str(manifest_path), 'wb') as manifest_file:
+        if output_format == 'binary':
+            writer = my_serializing.BinaryManifestWriter(manifest_file, ['md5', 'sha256'])
+        else:
+            writer = my_serializing.JsonLinesWriter(manifest_file)
+        with writer:
+            for manifest in manifests:
+                writer.write(manifest)
+
+    with my_diffing.open_manifests(str(manifest_path)) as stored_manifests:
+        assert [str(manifest) for manifest in manifests] == [str(manifest) for manifest in stored_manifests]
+    with my_diffing.open_manifests(str(manifest_path)) as stored_manifests:
+        assert [] == list(my_diffing.diff_manifests(manifests, stored_manifests))
+
+    _LOGGER.debug("Finished test")
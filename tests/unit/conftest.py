@@ -6,4 +6,6 @@ import logging
 
 import pytest
 
+from tests.unit.fixtures import build_tree, summarize_manifests
+
 _LOGGER = logging.getLogger(__name__)
@@ -7,3 +7,38 @@ import logging
 import pytest
 
 _LOGGER = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def build_tree():
+    """Get a function that populates a directory from the contents of its files, keyed by relative path.
+
+    Contents are written as bytes or text according to their type, and a relative path with None for contents is
+    made an empty directory.  Parent directories, the root included, are made as needed.
+    """
+
+    def _build_tree(root_path, contents):
+        for (rel_path, content) in contents.items():
+            path = root_path / rel_path
+            if content is None:
+                path.mkdir(parents=True, exist_ok=True)
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(content, bytes):
+                path.write_bytes(content)
+            else:
+                path.write_text(content)
+
+    return _build_tree
+
+
+@pytest.fixture
+def summarize_manifests():
+    """Get a function that reduces manifests to tuples of their relative path, size and hashes, to compare them"""
+
+    def _summarize_manifests(manifests):
+        return [
+            (manifest.relative_path, manifest.raw_manifest.size, manifest.raw_manifest.hashes)
+            for manifest in manifests]
+
+    return _summarize_manifests
@@ -0,0 +1,113 @@
+"""
+Unit tests for the rudi_dire_insp.archives module.
+"""
+
+# Core python imports
+import logging
+import os
+import tarfile
+import zipfile
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.archives as my_archives
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.stats as my_stats
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+
+# Files of a few sizes over nested sub directories
+_TREE = {
+    os.path.join(dir_name, 'file-{}.bin'.format(index)): os.urandom(index * 5000)
+    for dir_name in ('', 'a', os.path.join('a', 'b'), 'c') for index in range(3)}
+
+
+def test_inspect_archives_like_directory(tmp_path, build_tree, summarize_manifests):
+    """Verify that tar, compressed tar and zip archives give the manifests of the directory they were made from"""
+    _LOGGER.debug("Begin test")
+
+    tree_path = tmp_path / 'tree'
+    tree_path.mkdir()
+    build_tree(tree_path, _TREE)
+    expected = summarize_manifests(my_core.DirectoryInspector().inspect(str(tree_path)))
+
+    for mode in ('w', 'w:gz', 'w:bz2'):
+        archive_path = tmp_path / 'tree.tar.{}'.format(mode[2:])
+        with tarfile.open(str(archive_path), mode) as tar_file:
+            tar_file.add(str(tree_path), arcname='.')
+        assert expected == summarize_manifests(my_archives.ArchiveInspector().inspect(str(archive_path)))
+
+    zip_path = tmp_path / 'tree.zip'
+    with zipfile.ZipFile(str(zip_path), 'w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for (dir_path, _, file_names) in os.walk(str(tree_path)):
+            zip_file.write(dir_path, os.path.relpath(dir_path, str(tree_path)))
+            for file_name in file_names:
+                file_path = os.path.join(dir_path, file_name)
+                zip_file.write(file_path, os.path.relpath(file_path, str(tree_path)))
+    stats = my_stats.InspectionStats()
+    inspector = my_archives.ArchiveInspector(stats=stats, chunk_size=1024)
+    assert expected == summarize_manifests(inspector.inspect(str(zip_path)))
+    assert len(expected) == stats.files
+
+    unordered = summarize_manifests(my_archives.ArchiveInspector(ordered=False).inspect(str(zip_path)))
+    assert sorted(expected) == sorted(unordered)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_inspect_tar_links_and_duplicates(tmp_path):
+    """Test that hard links reuse the manifest of their target, symbolic links are skipped and the last copy wins"""
+    _LOGGER.debug("Begin test")
+
+    (tmp_path / 'first.txt').write_text('first')
+    (tmp_path / 'second.txt').write_text('second')
+    os.link(str(tmp_path / 'first.txt'), str(tmp_path / 'link.txt'))
+    os.symlink('first.txt', str(tmp_path / 'symlink.txt'))
+    archive_path = tmp_path / 'links.tar'
+    with tarfile.open(str(archive_path), 'w') as tar_file:
+        for name in ('first.txt', 'link.txt', 'symlink.txt', 'second.txt'):
+            tar_file.add(str(tmp_path / name), arcname=name)
+        tar_file.add(str(tmp_path / 'second.txt'), arcname='first.txt')
+
+    manifests = {
+        manifest.relative_path: manifest for manifest in my_archives.ArchiveInspector().inspect(str(archive_path))}
+    assert [('', 'first.txt'), ('', 'link.txt'), ('', 'second.txt')] == list(manifests)
+    assert 5 == manifests[('', 'link.txt')].raw_manifest.size
+    assert manifests[('', 'first.txt')].raw_manifest.hashes == manifests[('', 'second.txt')].raw_manifest.hashes
+
+    unordered = list(my_archives.ArchiveInspector(ordered=False).inspect(str(archive_path)))
+    assert 4 == len(unordered)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_archive_errors(tmp_path):
+    """Test that unsafe member paths and unreadable archives are rejected"""
+    _LOGGER.debug("Begin test")
+
+    assert ('a/b', 'c.txt') == my_archives.member_relative_path('/./a/b//c.txt')
+    for name in ('../c.txt', 'a/../../c.txt', '/', '.'):
+        with pytest.raises(my_exceptions.ArchiveError):
+            my_archives.member_relative_path(name)
+
+    not_archive_path = tmp_path / 'not-an-archive.txt'
+    not_archive_path.write_text('Not an archive')
+    for path in (not_archive_path, tmp_path / 'missing.tar'):
+        with pytest.raises(my_exceptions.ArchiveError):
+            list(my_archives.ArchiveInspector().inspect(str(path)))
+
+    truncated_path = tmp_path / 'truncated.tar.gz'
+    with tarfile.open(str(truncated_path), 'w:gz') as tar_file:
+        (tmp_path / 'large.bin').write_bytes(os.urandom(100000))
+        tar_file.add(str(tmp_path / 'large.bin'), arcname='large.bin')
+    truncated_path.write_bytes(truncated_path.read_bytes()[:50000])
+    with pytest.raises(my_exceptions.ArchiveError):
+        list(my_archives.ArchiveInspector().inspect(str(truncated_path)))
+
+    _LOGGER.debug("Finished test")
@@ -0,0 +1,128 @@
+"""
+Unit tests for the rudi_dire_insp.caching module.
+"""
+
+# Core python imports
+import logging
+import os
+import pickle
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.caching as my_caching
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def no_racy_window(monkeypatch):
+    """Let freshly written test files be cached"""
+    monkeypatch.setattr(my_caching, '_RACY_WINDOW_NS', 0)
+
+
+def _stat_with(stat_result: os.stat_result, **changes) -> os.stat_result:
+    """Copy a stat result, replacing some of its fields"""
+    fields = {
+        'st_dev': stat_result.st_dev,
+        'st_ino': stat_result.st_ino,
+        'st_size': stat_result.st_size,
+        'st_mtime_ns': stat_result.st_mtime_ns,
+        'st_ctime_ns': stat_result.st_ctime_ns,
+    }
+    fields.update(changes)
+    return type('FakeStat', (), fields)()
+
+
+def test_lookup_and_store(tmp_path, no_racy_window):
+    """Verify hits and misses as files are stored and change"""
+    _LOGGER.debug("Begin test")
+
+    file_path = tmp_path / "test.txt"
+    file_path.write_text("hello world")
+    stat_result = os.stat(str(file_path))
+    hashes = my_hashing.Hashes(md5='ab', sha256='cd')
+
+    with my_caching.HashCache(str(tmp_path / "cache.sqlite")) as cache:
+        cache.begin_run()
+        assert cache.lookup(stat_result, ['sha256']) is None
+        cache.store(stat_result, hashes, str(tmp_path))
+
+        assert my_hashing.Hashes(sha256='cd') == cache.lookup(stat_result, ['sha256'])
+        assert hashes == cache.lookup(stat_result, ['md5', 'sha256'])
+        assert cache.lookup(stat_result, ['sha256', 'sha512']) is None
+        assert cache.lookup(_stat_with(stat_result, st_size=1), ['sha256']) is None
+        assert cache.lookup(_stat_with(stat_result, st_mtime_ns=1), ['sha256']) is None
+        assert cache.lookup(_stat_with(stat_result, st_ctime_ns=1), ['sha256']) is None
+        assert 2 == cache.hits
+        assert 5 == cache.misses
+
+    # The entries survive closing the cache
+    with my_caching.HashCache(str(tmp_path / "cache.sqlite")) as cache:
+        assert hashes == cache.lookup(stat_result, ['md5', 'sha256'])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_racy_files_not_stored(tmp_path):
+    """Verify that files modified too recently to be safely cached are not stored"""
+    _LOGGER.debug("Begin test")
+
+    file_path = tmp_path / "test.txt"
+    file_path.write_text("hello world")
+    stat_result = os.stat(str(file_path))
+
+    with my_caching.HashCache(str(tmp_path / "cache.sqlite")) as cache:
+        cache.begin_run()
+        cache.store(stat_result, my_hashing.Hashes(sha256='cd'), str(tmp_path))
+        assert cache.lookup(stat_result, ['sha256']) is None
+
+    _LOGGER.debug("Finished test")
+
+
+def test_evict_unused(tmp_path, no_racy_window):
+    """Verify that only entries for the given root which weren't used in the current run are evicted"""
+    _LOGGER.debug("Begin test")
+
+    stat_results = []
+    for index in range(0, 3):
+        file_path = tmp_path / "test-{}.txt".format(index)
+        file_path.write_text("hello world {}".format(index))
+        stat_results.append(os.stat(str(file_path)))
+    hashes = my_hashing.Hashes(sha256='cd')
+
+    with my_caching.HashCache(str(tmp_path / "cache.sqlite")) as cache:
+        cache.begin_run()
+        cache.store(stat_results[0], hashes, 'root-a')
+        cache.store(stat_results[1], hashes, 'root-a')
+        cache.store(stat_results[2], hashes, 'root-b')
+
+        cache.begin_run()
+        assert hashes == cache.lookup(stat_results[0], ['sha256'])
+        assert 1 == cache.evict_unused('root-a')
+        assert 1 == cache.evictions
+
+        assert hashes == cache.lookup(stat_results[0], ['sha256'])
+        assert cache.lookup(stat_results[1], ['sha256']) is None
+        assert hashes == cache.lookup(stat_results[2], ['sha256'])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_errors(tmp_path):
+    """Test error handling for unusable cache paths and attempts to pickle the cache"""
+    _LOGGER.debug("Begin test")
+
+    with pytest.raises(my_exceptions.CacheError):
+        my_caching.HashCache(str(tmp_path / "no-such-dir" / "cache.sqlite"))
+
+    with my_caching.HashCache(str(tmp_path / "cache.sqlite")) as cache:
+        with pytest.raises(TypeError):
+            pickle.dumps(cache)
+
+    _LOGGER.debug("Finished test")
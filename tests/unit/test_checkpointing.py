@@ -0,0 +1,94 @@
+"""
+Unit tests for the rudi_dire_insp.checkpointing module.
+"""
+
+# Core python imports
+import json
+import logging
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.checkpointing as my_checkpointing
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+_OPTIONS = {'algorithms': ['sha256'], 'sampled': False}
+
+
+def _inspect(root_path):
+    """Build a few files under the root path and return their manifests"""
+    for index in range(5):
+        (root_path / 'file-{}.txt'.format(index)).write_text('content {}'.format(index))
+    return list(my_core.DirectoryInspector(algorithms=['sha256']).inspect(str(root_path)))
+
+
+def test_checkpoint_writer(tmp_path):
+    """Verify that a checkpoint is written once per interval, recording the synced output, and removed on completion"""
+    _LOGGER.debug("Begin test")
+
+    (tmp_path / 'root').mkdir()
+    manifests = _inspect(tmp_path / 'root')
+    output_path = tmp_path / 'out.jsonl'
+    checkpoint_path = my_checkpointing.checkpoint_path_for(str(output_path))
+
+    with output_path.open('w+b') as output_file:
+        with my_checkpointing.CheckpointWriter(output_file, checkpoint_path, _OPTIONS, interval=2) as writer:
+            writer.write(manifests[0])
+            assert my_checkpointing.read_checkpoint(checkpoint_path) is None
+            for manifest in manifests[1:]:
+                writer.write(manifest)
+            checkpoint = my_checkpointing.read_checkpoint(checkpoint_path)
+            assert manifests[3].relative_path == checkpoint.relative_path
+            assert 4 == checkpoint.count
+            assert _OPTIONS == checkpoint.options
+            assert 4 == output_path.read_bytes()[:checkpoint.offset].count(b'\n')
+            writer.complete()
+    assert my_checkpointing.read_checkpoint(checkpoint_path) is None
+    assert 5 == len(output_path.read_bytes().splitlines())
+
+    _LOGGER.debug("Finished test")
+
+
+def test_open_resumed_output(tmp_path):
+    """Verify that resuming cuts the output back to the checkpoint, with the same options only"""
+    _LOGGER.debug("Begin test")
+
+    output_path = tmp_path / 'out.jsonl'
+    output_path.write_bytes(b'line 1\nline 2\npartial li')
+    checkpoint = my_checkpointing.Checkpoint(('', 'file.txt'), len(b'line 1\nline 2\n'), 2, _OPTIONS)
+
+    with pytest.raises(my_exceptions.CheckpointError):
+        my_checkpointing.open_resumed_output(str(output_path), checkpoint, dict(_OPTIONS, sampled=True))
+    with my_checkpointing.open_resumed_output(str(output_path), checkpoint, dict(_OPTIONS)) as output_file:
+        output_file.write(b'line 3\n')
+    assert b'line 1\nline 2\nline 3\n' == output_path.read_bytes()
+
+    output_path.write_bytes(b'line 1\n')
+    with pytest.raises(my_exceptions.CheckpointError):
+        my_checkpointing.open_resumed_output(str(output_path), checkpoint, _OPTIONS)
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('content', [
+    'not json',
+    json.dumps({'version': 99, 'relative_path': ['', 'a'], 'offset': 0, 'count': 0, 'options': {}}),
+    json.dumps({'version': 1, 'relative_path': ['', 'a'], 'offset': -1, 'count': 0, 'options': {}}),
+    json.dumps({'version': 1, 'offset': 0, 'count': 0, 'options': {}}),
+])
+def test_read_bad_checkpoint(tmp_path, content):
+    """Test error handling for checkpoint files that can't be resumed from"""
+    _LOGGER.debug("Begin test")
+
+    checkpoint_path = tmp_path / 'out.jsonl.checkpoint'
+    checkpoint_path.write_text(content)
+    with pytest.raises(my_exceptions.CheckpointError):
+        my_checkpointing.read_checkpoint(str(checkpoint_path))
+
+    _LOGGER.debug("Finished test")
@@ -6,6 +6,7 @@ Unit tests for the rudi_dire_insp.core module.
 import hashlib
 import io
 import logging
+import os
 
 # 3rd party imports
 import pytest
@@ -13,6 +14,10 @@ import pytest
 # Imports of code-under-test
 import rudi_dire_insp.exceptions as my_exceptions
 import rudi_dire_insp.core as my_core
+import rudi_dire_insp.files as my_files
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.stats as my_stats
+import rudi_dire_insp.walking as my_walking
 
 # Module variables
 _LOGGER = logging.getLogger(__name__)
@@ -108,3 +113,166 @@ def test_w_file_thats_not_a_file(tmp_path):
         inspector.inspect(str(file_path))
     assert "Path does not point to a file" in str(error_1)
     _LOGGER.debug("Finished")
+
+
+def test_w_bad_chunk_size(tmp_path):
+    """Test error handling when the inspectors are given a chunk size that can't be used for hashing"""
+    _LOGGER.debug("Begin")
+
+    with pytest.raises(my_exceptions.HashError) as error_1:
+        my_core._FileInspector(str(tmp_path), chunk_size=0)
+    assert "Chunk size must be a positive integer" in str(error_1)
+
+    with pytest.raises(my_exceptions.HashError) as error_2:
+        my_core.DirectoryInspector(chunk_size=-1)
+    assert "Chunk size must be a positive integer" in str(error_2)
+
+    _LOGGER.debug("Finished")
+
+
+@pytest.mark.parametrize('workers', [0, -2, 1.5, True])
+def test_w_bad_workers(workers):
+    """Test error handling when the directory inspector is given a number of workers that can't size a pool"""
+    _LOGGER.debug("Begin")
+
+    with pytest.raises(my_exceptions.DirInspectionError) as error:
+        my_core.DirectoryInspector(workers=workers)
+    assert "Number of workers must be a positive integer" in str(error)
+
+    _LOGGER.debug("Finished")
+
+
+def test_map_ordered_and_unordered():
+    """Verify the helpers for mapping work onto a pool keep or relax ordering as advertised, with bounded pending"""
+    _LOGGER.debug("Begin")
+
+    items = list(range(0, 50))
+    with my_core.concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        submit = lambda item: executor.submit(lambda: item * 2)
+        ordered_results = list(my_core._map_ordered(submit, iter(items), 3))
+        unordered_results = list(my_core._map_unordered(submit, iter(items), 3))
+
+    assert [item * 2 for item in items] == ordered_results
+    assert sorted(unordered_results) == ordered_results
+
+    _LOGGER.debug("Finished")
+
+
+@pytest.mark.parametrize('hard_links', [True, False])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_hard_links_read_once(tmp_path, hard_links, workers):
+    """Verify that each hard link gets a manifest, but the file is only read once when hard links are tracked"""
+    _LOGGER.debug("Begin test")
+
+    content = b'linked content'
+    (tmp_path / 'a.txt').write_bytes(content)
+    (tmp_path / 'sub').mkdir()
+    os.link(str(tmp_path / 'a.txt'), str(tmp_path / 'sub' / 'b.txt'))
+    os.link(str(tmp_path / 'a.txt'), str(tmp_path / 'sub' / 'c.txt'))
+    (tmp_path / 'other.txt').write_bytes(content)
+
+    stats = my_stats.InspectionStats()
+    inspector = my_core.DirectoryInspector(algorithms=['sha256'], workers=workers, stats=stats, hard_links=hard_links)
+    manifests = list(inspector.inspect(str(tmp_path)))
+
+    assert [('', 'a.txt'), ('', 'other.txt'), ('sub', 'b.txt'), ('sub', 'c.txt')] == [
+        manifest.relative_path for manifest in manifests]
+    assert 1 == len({manifest.raw_manifest.hashes for manifest in manifests})
+    expected_reads = 2 if hard_links else 4
+    assert expected_reads * len(content) == stats.bytes_read
+
+    _LOGGER.debug("Finished test")
+
+
+def test_small_files(tmp_path, monkeypatch):
+    """Verify that files of up to one chunk are read whole without chunks, giving the same manifests"""
+    _LOGGER.debug("Begin test")
+
+    (tmp_path / 'empty.txt').write_bytes(b'')
+    (tmp_path / 'chunk.txt').write_bytes(b'c' * 64)
+    (tmp_path / 'large.txt').write_bytes(b'large' * 100)
+
+    def inspect(inspector):
+        return [(manifest.relative_path, manifest.raw_manifest.size, manifest.raw_manifest.hashes)
+                for manifest in inspector.inspect(str(tmp_path))]
+
+    expected = [
+        (('', name), len(content), my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(content))[0])
+        for (name, content) in (('chunk.txt', b'c' * 64), ('empty.txt', b''), ('large.txt', b'large' * 100))]
+    read_sizes = []
+    original_read = os.read
+    max_read_sizes = []
+
+    def _recording_read(file_descriptor, size):
+        read_sizes.append(size)
+        return original_read(file_descriptor, min([size] + max_read_sizes))
+
+    monkeypatch.setattr(my_files.os, 'read', _recording_read)
+    stats = my_stats.InspectionStats()
+    assert expected == inspect(my_core.DirectoryInspector(chunk_size=64, stats=stats))
+    # Only an empty read marks the end of a file
+    assert [65, 1, 1] == read_sizes
+    assert 564 == stats.bytes_read
+    assert 3 == stats.files
+
+    # Short reads before the end of a file are followed by more reads
+    read_sizes.clear()
+    max_read_sizes.append(40)
+    assert expected == inspect(my_core.DirectoryInspector(chunk_size=64))
+    assert [65, 25, 1, 1] == read_sizes
+    max_read_sizes.clear()
+
+    # A file that grew since it was found is read in chunks instead
+    read_sizes.clear()
+    inspector = my_core._FileInspector(str(tmp_path), chunk_size=64)
+    file_entry = my_walking._FileEntry(
+        str(tmp_path / 'chunk.txt'), ('', 'chunk.txt'), stat_result=os.stat(str(tmp_path / 'empty.txt')))
+    manifest = inspector.inspect_entry(file_entry)
+    assert expected[0] == (manifest.relative_path, manifest.raw_manifest.size, manifest.raw_manifest.hashes)
+    assert [1] == read_sizes
+
+    _LOGGER.debug("Finished test")
+
+
+def test_mmap_threshold(tmp_path):
+    """Verify that files at or above the threshold are hashed through a mapping, and the rest are read as usual"""
+    _LOGGER.debug("Begin test")
+
+    (tmp_path / 'empty.txt').write_bytes(b'')
+    (tmp_path / 'small.txt').write_bytes(b'small')
+    (tmp_path / 'large.txt').write_bytes(b'large' * 1000)
+
+    def inspect(inspector):
+        return [(manifest.relative_path, manifest.raw_manifest.size, manifest.raw_manifest.hashes)
+                for manifest in inspector.inspect(str(tmp_path))]
+
+    expected = inspect(my_core.DirectoryInspector())
+
+    mapped_sizes = []
+    original_map_file = my_files.map_file
+
+    def _recording_map_file(input_file):
+        mapped_sizes.append(os.fstat(input_file.fileno()).st_size)
+        return original_map_file(input_file)
+
+    inspector = my_core.DirectoryInspector(chunk_size=64, mmap_threshold=5)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(my_files, 'map_file', _recording_map_file)
+        assert expected == inspect(inspector)
+    assert [5000, 5] == mapped_sizes
+
+    # Files that can't be mapped are read instead
+    with (tmp_path / 'small.txt').open('rb') as input_file, pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(my_files.mmap, 'mmap', _refuse_mmap)
+        assert my_files.map_file(input_file) is None
+        assert expected == inspect(inspector)
+
+    with pytest.raises(my_exceptions.DirInspectionError):
+        my_core.DirectoryInspector(mmap_threshold=0)
+
+    _LOGGER.debug("Finished test")
+
+
+def _refuse_mmap(*args, **kwargs):
+    """Stand in for mmap.mmap on a file system that refuses to map files"""
+    raise OSError("Refused")
@@ -0,0 +1,161 @@
+"""
+Unit tests for the rudi_dire_insp.diffing module.
+"""
+
+# Core python imports
+import io
+import logging
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.diffing as my_diffing
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+
+def _manifest(relative_path, content: bytes, algorithm_names=('md5', 'sha256')) -> my_manifests.FileManifest:
+    """Build the manifest of a file with the given content"""
+    algorithms = my_hashing._HashAlgorithm.from_names(algorithm_names)
+    (hashes, size) = my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(content), algorithms=algorithms)
+    return my_manifests.FileManifest(relative_path, my_manifests.RawBytesManifest(hashes, size))
+
+
+def _summarize(differences):
+    """Reduce differences to comparable tuples"""
+    return [
+        (difference.kind.value, difference.relative_path,
+         None if difference.old is None else difference.old.relative_path,
+         None if difference.new is None else difference.new.relative_path)
+        for difference in differences
+    ]
+
+
+_OLD_MANIFESTS = [
+    _manifest(('', 'kept.txt'), b'kept'),
+    _manifest(('', 'moved-from.txt'), b'moved'),
+    _manifest(('', 'removed.txt'), b'removed'),
+    _manifest(('a', 'changed.txt'), b'before'),
+    _manifest(('a', 'resized.txt'), b'short'),
+]
+
+_NEW_MANIFESTS = [
+    _manifest(('', 'added.txt'), b'added'),
+    _manifest(('', 'kept.txt'), b'kept'),
+    _manifest(('a', 'changed.txt'), b'after!'),
+    _manifest(('a', 'resized.txt'), b'longer'),
+    _manifest(('b', 'moved-to.txt'), b'moved'),
+]
+
+
+def test_diff_manifests():
+    """Verify that each kind of difference is found, with moves paired up by content"""
+    _LOGGER.debug("Begin test")
+
+    found = _summarize(my_diffing.diff_manifests(_OLD_MANIFESTS, _NEW_MANIFESTS))
+    assert [
+        ('changed', ('a', 'changed.txt'), ('a', 'changed.txt'), ('a', 'changed.txt')),
+        ('changed', ('a', 'resized.txt'), ('a', 'resized.txt'), ('a', 'resized.txt')),
+        ('moved', ('b', 'moved-to.txt'), ('', 'moved-from.txt'), ('b', 'moved-to.txt')),
+        ('added', ('', 'added.txt'), None, ('', 'added.txt')),
+        ('removed', ('', 'removed.txt'), ('', 'removed.txt'), None),
+    ] == found
+
+    assert [] == list(my_diffing.diff_manifests(_OLD_MANIFESTS, _OLD_MANIFESTS))
+
+    _LOGGER.debug("Finished test")
+
+
+def test_diff_manifests_wo_moves():
+    """Verify that without move detection, files only on one side are reported in path order"""
+    _LOGGER.debug("Begin test")
+
+    found = _summarize(my_diffing.diff_manifests(_OLD_MANIFESTS, _NEW_MANIFESTS, detect_moves=False))
+    assert [
+        ('added', ('', 'added.txt'), None, ('', 'added.txt')),
+        ('removed', ('', 'moved-from.txt'), ('', 'moved-from.txt'), None),
+        ('removed', ('', 'removed.txt'), ('', 'removed.txt'), None),
+        ('changed', ('a', 'changed.txt'), ('a', 'changed.txt'), ('a', 'changed.txt')),
+        ('changed', ('a', 'resized.txt'), ('a', 'resized.txt'), ('a', 'resized.txt')),
+        ('added', ('b', 'moved-to.txt'), None, ('b', 'moved-to.txt')),
+    ] == found
+
+    _LOGGER.debug("Finished test")
+
+
+def test_diff_manifests_w_other_hashes():
+    """Verify that contents are compared by the hashes both sides have, and not at all without any"""
+    _LOGGER.debug("Begin test")
+
+    old_manifests = [_manifest(('', 'same.txt'), b'same', ['md5', 'sha1'])]
+    new_manifests = [_manifest(('', 'same.txt'), b'same', ['sha1', 'sha512'])]
+    assert [] == list(my_diffing.diff_manifests(old_manifests, new_manifests))
+
+    new_manifests = [_manifest(('', 'same.txt'), b'same', ['sha512'])]
+    with pytest.raises(my_exceptions.DiffError):
+        list(my_diffing.diff_manifests(old_manifests, new_manifests))
+
+    _LOGGER.debug("Finished test")
+
+
+def test_diff_manifests_rejects_unsorted():
+    """Verify that manifests out of path order are rejected, rather than giving a wrong answer"""
+    _LOGGER.debug("Begin test")
+
+    with pytest.raises(my_exceptions.ManifestFormatError):
+        list(my_diffing.diff_manifests(list(reversed(_OLD_MANIFESTS)), _NEW_MANIFESTS))
+
+    _LOGGER.debug("Finished test")
+
+
+def test_diff_directories(tmp_path, monkeypatch):
+    """Test that trees are compared by their directory manifests, without descending into unchanged subtrees"""
+    _LOGGER.debug("Begin test")
+
+    for side in ('old', 'new'):
+        for index in range(20):
+            (tmp_path / side / 'same' / str(index)).mkdir(parents=True)
+            (tmp_path / side / 'same' / str(index) / 'file.txt').write_text('same {}'.format(index))
+        (tmp_path / side / 'changed' / 'deep').mkdir(parents=True)
+        (tmp_path / side / 'changed' / 'deep' / 'file.txt').write_text('{} content'.format(side))
+    (tmp_path / 'old' / 'gone').mkdir()
+    (tmp_path / 'old' / 'gone' / 'file.txt').write_text('gone')
+    (tmp_path / 'old' / 'moving').mkdir()
+    (tmp_path / 'old' / 'moving' / 'file.txt').write_text('moving')
+    (tmp_path / 'new' / 'moved').mkdir()
+    (tmp_path / 'new' / 'moved' / 'file.txt').write_text('moving')
+    inspector = my_core.DirectoryInspector(algorithms=['sha256'])
+    (old, new) = [
+        [manifest for manifest in inspector.inspect_tree(str(tmp_path / side))
+         if isinstance(manifest, my_manifests.DirectoryManifest)] for side in ('old', 'new')]
+
+    compared = []
+    original_same_directory = my_diffing._same_directory
+
+    def _counting_same_directory(old_directory, new_directory):
+        compared.append(old_directory.relative_path)
+        return original_same_directory(old_directory, new_directory)
+
+    monkeypatch.setattr(my_diffing, '_same_directory', _counting_same_directory)
+    assert [
+        ('changed', '', '', ''),
+        ('changed', 'changed', 'changed', 'changed'),
+        ('changed', 'changed/deep', 'changed/deep', 'changed/deep'),
+        ('removed', 'gone', 'gone', None),
+        ('moved', 'moved', 'moving', 'moved'),
+    ] == _summarize(my_diffing.diff_directories(old, new))
+    # Only the root, its sub directories on both sides and the changed path were compared
+    assert ['', 'changed', 'changed/deep', 'same'] == sorted(compared)
+
+    assert [('added', 'moved', None, 'moved'), ('removed', 'moving', 'moving', None)] == _summarize(
+        my_diffing.diff_directories(old, new, detect_moves=False))[-2:]
+    assert [] == list(my_diffing.diff_directories(old, old))
+
+    _LOGGER.debug("Finished test")
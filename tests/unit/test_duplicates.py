@@ -0,0 +1,106 @@
+"""
+Unit tests for the rudi_dire_insp.duplicates module.
+"""
+
+# Core python imports
+import logging
+import os
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.duplicates as my_duplicates
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.stats as my_stats
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+_SAMPLE_SIZE = 16
+
+
+# Duplicates, and files that are only told apart at each stage
+_LARGE = b'x' * 100
+_TREE = {
+    'empty-1.txt': b'',
+    'empty-2.txt': b'',
+    'unique-size.txt': b'y' * 1000,
+    'small-1.txt': b'small',
+    'small-2.txt': b'small',
+    'small-other.txt': b'other',
+    os.path.join('a', 'large-1.txt'): _LARGE,
+    os.path.join('b', 'large-2.txt'): _LARGE,
+    os.path.join('b', 'other-head.txt'): b'z' + _LARGE[1:],
+    os.path.join('b', 'other-middle.txt'): _LARGE[:50] + b'z' + _LARGE[51:],
+}
+
+
+def test_find_duplicates(tmp_path, build_tree):
+    """Verify that only files with the same content are grouped, largest first"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path, _TREE)
+    stats = my_stats.InspectionStats()
+    groups = list(my_duplicates.find_duplicates(str(tmp_path), sample_size=_SAMPLE_SIZE, stats=stats))
+
+    expected_groups = [
+        (100, (('a', 'large-1.txt'), ('b', 'large-2.txt'))),
+        (5, (('', 'small-1.txt'), ('', 'small-2.txt'))),
+    ]
+    assert expected_groups == [(group.size, group.relative_paths) for group in groups]
+    assert ('sha256',) == groups[0].hashes.names
+    assert 100 == groups[0].wasted_size
+
+    # The file of unique size is never read, the one with a different head only sampled
+    assert 6 == stats.files
+    assert 3 * 100 + 3 * 5 + 4 * _SAMPLE_SIZE * 2 == stats.bytes_read
+
+    _LOGGER.debug("Finished test")
+
+
+def test_find_duplicates_w_options(tmp_path, build_tree):
+    """Verify that the minimum size and the algorithms are honored"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path, _TREE)
+    groups = list(my_duplicates.find_duplicates(
+        str(tmp_path), algorithms=['md5', 'sha1'], sample_size=_SAMPLE_SIZE, min_size=0))
+    assert [100, 5, 0] == [group.size for group in groups]
+    assert ('md5', 'sha1') == groups[0].hashes.names
+
+    groups = list(my_duplicates.find_duplicates(str(tmp_path), sample_size=_SAMPLE_SIZE, min_size=6))
+    assert [100] == [group.size for group in groups]
+
+    _LOGGER.debug("Finished test")
+
+
+def test_find_duplicates_hard_links(tmp_path):
+    """Verify that hard links to the same file are only reported along with copies held elsewhere"""
+    _LOGGER.debug("Begin test")
+
+    (tmp_path / 'a.txt').write_bytes(b'linked')
+    os.link(str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt'))
+    assert [] == list(my_duplicates.find_duplicates(str(tmp_path)))
+
+    (tmp_path / 'c.txt').write_bytes(b'linked')
+    stats = my_stats.InspectionStats()
+    groups = list(my_duplicates.find_duplicates(str(tmp_path), stats=stats))
+    assert [(('', 'a.txt'), ('', 'b.txt'), ('', 'c.txt'))] == [group.relative_paths for group in groups]
+    assert 2 == groups[0].file_count
+    assert 6 == groups[0].wasted_size
+    assert 2 == stats.files
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('options', [{'sample_size': 0}, {'min_size': -1}, {'sample_size': True}])
+def test_find_duplicates_bad_options(tmp_path, options):
+    """Verify that bad sizes are rejected before anything is read"""
+    _LOGGER.debug("Begin test")
+
+    with pytest.raises(my_exceptions.DirInspectionError):
+        list(my_duplicates.find_duplicates(str(tmp_path), **options))
+
+    _LOGGER.debug("Finished test")
@@ -0,0 +1,56 @@
+"""
+Unit tests for the rudi_dire_insp.files module.
+"""
+
+# Core python imports
+import logging
+import os
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.files as my_files
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+
+def test_hard_link_map_is_bounded(tmp_path):
+    """Verify that files are forgotten once all of their links were looked up, or when there are too many"""
+    _LOGGER.debug("Begin test")
+
+    (tmp_path / 'a.txt').write_bytes(b'a')
+    os.link(str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt'))
+    (tmp_path / 'c.txt').write_bytes(b'c')
+    os.link(str(tmp_path / 'c.txt'), str(tmp_path / 'd.txt'))
+    (tmp_path / 'single.txt').write_bytes(b's')
+    stat_a = os.stat(str(tmp_path / 'a.txt'))
+    stat_c = os.stat(str(tmp_path / 'c.txt'))
+    manifest = object()
+
+    # The first lookup claims the file, and the next one gets the future that releasing it resolves
+    hard_links = my_files.HardLinkMap(max_entries=1)
+    assert hard_links.lookup(stat_a) is None
+    future = hard_links.lookup(stat_a)
+    assert not future.done()
+    hard_links.release(stat_a, manifest)
+    assert manifest is future.result()
+    assert 0 == len(hard_links)
+
+    # Only one file is remembered, but claims are resolved even once forgotten
+    assert hard_links.lookup(stat_a) is None
+    assert hard_links.lookup(stat_c) is None
+    assert 1 == len(hard_links)
+    future = hard_links.lookup(stat_a)
+    hard_links.release(stat_a, None)
+    assert future.result() is None
+    hard_links.release(stat_c, manifest)
+    assert manifest is hard_links.lookup(stat_c).result()
+
+    # Files without other links are never remembered
+    assert hard_links.lookup(os.stat(str(tmp_path / 'single.txt'))) is None
+    assert 0 == len(hard_links)
+
+    _LOGGER.debug("Finished test")
@@ -0,0 +1,89 @@
+"""
+Unit tests for the rudi_dire_insp.filtering module.
+"""
+
+# Core python imports
+import logging
+import os
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.filtering as my_filtering
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+
+@pytest.mark.parametrize('rules, relative_path, expected', [
+    ({}, ('a/b', 'c.txt'), True),
+    ({'exclude': ['*.tmp']}, ('a/b', 'c.tmp'), False),
+    ({'exclude': ['*.tmp']}, ('a/b', 'c.txt'), True),
+    ({'exclude': ['a/*.txt']}, ('a', 'c.txt'), False),
+    ({'exclude': ['a/*.txt']}, ('b', 'c.txt'), True),
+    ({'include': ['*.txt', '*.md']}, ('', 'README.md'), True),
+    ({'include': ['*.txt', '*.md']}, ('', 'setup.py'), False),
+    ({'include': ['*.txt'], 'exclude': ['secret*']}, ('', 'secret.txt'), False),
+    ({'include_regex': [r'^docs/']}, ('docs', 'index.rst'), True),
+    ({'include_regex': [r'^docs/']}, ('src/docs', 'index.rst'), False),
+    ({'exclude_regex': [r'\.(pyc|pyo)$']}, ('pkg', 'mod.pyc'), False),
+])
+def test_matches_path(rules, relative_path, expected):
+    """Verify which files are matched by glob and regex rules"""
+    _LOGGER.debug("Begin test")
+
+    assert expected == my_filtering.PathFilter(**rules).matches_path(relative_path)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_prunes_dir():
+    """Verify that only exclusion rules prune directories, by name at any depth or by relative path"""
+    _LOGGER.debug("Begin test")
+
+    path_filter = my_filtering.PathFilter(
+        include=['*.py'], exclude=['node_modules', 'build/tmp'], exclude_regex=[r'(^|/)\.git$'])
+    assert path_filter.prunes_dir('', 'node_modules')
+    assert path_filter.prunes_dir('web/app', 'node_modules')
+    assert path_filter.prunes_dir('build', 'tmp')
+    assert not path_filter.prunes_dir('src/build', 'tmp')
+    assert path_filter.prunes_dir('sub', '.git')
+    assert not path_filter.prunes_dir('sub', '.github')
+    assert not path_filter.prunes_dir('', 'src')
+
+    _LOGGER.debug("Finished test")
+
+
+def test_matches_stat(tmp_path):
+    """Verify that sizes are matched inclusively, and modification times from the start of their range only"""
+    _LOGGER.debug("Begin test")
+
+    file_path = tmp_path / 'file.txt'
+    file_path.write_bytes(b'x' * 10)
+    os.utime(str(file_path), (1000, 1000))
+    stat_result = os.stat(str(file_path))
+
+    assert not my_filtering.PathFilter().needs_stat
+    assert my_filtering.PathFilter(min_size=10, max_size=10).matches_stat(stat_result)
+    assert not my_filtering.PathFilter(min_size=11).matches_stat(stat_result)
+    assert not my_filtering.PathFilter(max_size=9).matches_stat(stat_result)
+    assert my_filtering.PathFilter(modified_after=1000, modified_before=1001).matches_stat(stat_result)
+    assert not my_filtering.PathFilter(modified_after=1001).matches_stat(stat_result)
+    assert my_filtering.PathFilter(modified_before=1000).needs_stat
+    assert not my_filtering.PathFilter(modified_before=1000).matches_stat(stat_result)
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('rules', [{'include_regex': ['(']}, {'min_size': -1}, {'max_size': 1.5}])
+def test_bad_rules(rules):
+    """Test error handling for rules that can't be used"""
+    _LOGGER.debug("Begin test")
+
+    with pytest.raises(my_exceptions.DirInspectionError):
+        my_filtering.PathFilter(**rules)
+
+    _LOGGER.debug("Finished test")
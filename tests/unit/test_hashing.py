@@ -3,9 +3,11 @@ Unit tests for the rudi_dire_insp.hashing module.
 """
 
 # Core python imports
+import copy
 import hashlib
 import io
 import logging
+import pickle
 
 # 3rd party imports
 import pytest
@@ -13,6 +15,7 @@ import pytest
 # Imports of code-under-test
 import rudi_dire_insp.exceptions as my_exceptions
 import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.stats as my_stats
 
 # Module variables
 _LOGGER = logging.getLogger(__name__)
@@ -61,3 +64,296 @@ def test_which_algorithm():
     assert expected_size == size
 
     _LOGGER.debug("Finished test")
+
+
+class _RecordingStream(io.BytesIO):
+    """A byte stream that records the size of every buffer it was asked to fill"""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.requested_sizes = []
+
+    def readinto(self, buffer):
+        self.requested_sizes.append(len(buffer))
+        return super().readinto(buffer)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 11, 4096])
+def test_chunked_hashing(chunk_size):
+    """Verify that hashing in chunks gives the same results as hashing everything at once, with bounded reads"""
+    _LOGGER.debug("Begin test")
+
+    test_data = b'hello world' * 1000
+    expected_hashes = my_hashing.Hashes(**{
+        algorithm_name: _calculate_hash_hex(algorithm_name, test_data)
+        for algorithm_name in ['md5', 'sha1', 'sha256', 'sha384', 'sha512']
+    })
+
+    test_stream = _RecordingStream(test_data)
+    (hashes, size) = my_hashing._HashAlgorithm.calculate_hashes(test_stream, chunk_size=chunk_size)
+
+    assert expected_hashes == hashes
+    assert len(test_data) == size
+    assert set(test_stream.requested_sizes) == {chunk_size}
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('chunk_size', [0, -1, 1.5, None])
+def test_bad_chunk_size(chunk_size):
+    """Test error handling for chunk sizes that can't be used to read a stream"""
+    _LOGGER.debug("Begin test")
+
+    with pytest.raises(my_exceptions.HashError) as error:
+        my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(b'hello world'), chunk_size=chunk_size)
+    assert "Chunk size must be a positive integer" in str(error)
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096, 1024 * 1024])
+def test_threaded_hashing(chunk_size):
+    """Verify that updating the digests on their own threads gives the same results as doing it on one thread"""
+    _LOGGER.debug("Begin test")
+
+    test_data = b'hello world' * 1000
+    expected = my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(test_data), chunk_size=chunk_size)
+    found = my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(test_data), chunk_size=chunk_size, threaded=True)
+    assert expected == found
+
+    _LOGGER.debug("Finished test")
+
+
+class _FailingStream(io.BytesIO):
+    """A byte stream that fails after a number of reads"""
+
+    def __init__(self, data: bytes, num_good_reads: int):
+        super().__init__(data)
+        self._num_good_reads = num_good_reads
+
+    def readinto(self, buffer):
+        if self._num_good_reads <= 0:
+            raise IOError("Simulated read failure")
+        self._num_good_reads -= 1
+        return super().readinto(buffer)
+
+
+def test_threaded_hashing_error():
+    """Test error handling when the stream fails part way through a threaded hashing run"""
+    _LOGGER.debug("Begin test")
+
+    test_stream = _FailingStream(b'hello world' * 1000, num_good_reads=3)
+    with pytest.raises(my_exceptions.HashError):
+        my_hashing._HashAlgorithm.calculate_hashes(test_stream, chunk_size=16, threaded=True)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_all_algorithms():
+    """Verify that every selectable algorithm is wired up to the matching hashlib algorithm"""
+    _LOGGER.debug("Begin test")
+
+    test_data = b'hello world'
+    algorithms = my_hashing._HashAlgorithm.from_names(my_hashing.ALGORITHM_NAMES)
+    (hashes, _) = my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(test_data), algorithms=algorithms)
+
+    assert my_hashing.ALGORITHM_NAMES == hashes.names
+    for algorithm_name in my_hashing.ALGORITHM_NAMES:
+        assert _calculate_hash_hex(algorithm_name, test_data) == getattr(hashes, algorithm_name)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_selected_algorithms_only(monkeypatch):
+    """Verify that only the requested algorithms have digests created, and only they appear in the results"""
+    _LOGGER.debug("Begin test")
+
+    created = []
+    for algorithm in my_hashing._HashAlgorithm:
+        def _constructor(algorithm=algorithm, original=algorithm._digest_constructor):
+            created.append(algorithm.algorithm_name)
+            return original()
+        monkeypatch.setattr(algorithm, '_digest_constructor', _constructor)
+
+    algorithms = my_hashing._HashAlgorithm.from_names(['BLAKE2B', 'sha256', 'sha256'])
+    (hashes, _) = my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(b'hello world'), algorithms=algorithms)
+
+    assert ['sha256', 'blake2b'] == sorted(created, reverse=True)
+    assert ('sha256', 'blake2b') == hashes.names
+    assert {'sha256', 'blake2b'} == set(hashes._asdict().keys())
+    with pytest.raises(AttributeError):
+        _ = hashes.md5
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('names', [['sha256', 'whirlpool'], []])
+def test_bad_algorithm_names(names):
+    """Test error handling when asking for algorithms that aren't supported"""
+    _LOGGER.debug("Begin test")
+
+    with pytest.raises(my_exceptions.HashError):
+        my_hashing._HashAlgorithm.from_names(names)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_hashes_value_semantics():
+    """Smoke test equality, immutability and pickling of the Hashes class"""
+    _LOGGER.debug("Begin test")
+
+    hashes = my_hashing.Hashes(sha256='ab', md5='cd')
+    assert ('md5', 'sha256') == hashes.names
+    assert my_hashing.Hashes(md5='cd', sha256='ab') == hashes
+    assert my_hashing.Hashes(md5='cd') != hashes
+    assert hash(my_hashing.Hashes(md5='cd', sha256='ab')) == hash(hashes)
+    assert hashes == pickle.loads(pickle.dumps(hashes))
+    assert copy.copy(hashes) is hashes
+    assert ('ab', 'cd') == hashes.values_for(['sha256', 'md5'])
+    with pytest.raises(AttributeError):
+        hashes.md5 = 'ef'
+    with pytest.raises(my_exceptions.HashError):
+        my_hashing.Hashes()
+
+    _LOGGER.debug("Finished test")
+
+
+def test_hashes_tuple_compatibility():
+    """Test that the values of the default algorithms can be given positionally and indexed, as in a named tuple"""
+    _LOGGER.debug("Begin test")
+
+    values = ('01', '02', '03', '04', '05')
+    hashes = my_hashing.Hashes(*values)
+    assert my_hashing.Hashes(**dict(zip(my_hashing.DEFAULT_ALGORITHM_NAMES, values))) == hashes
+    assert my_hashing.Hashes('01', '02', sha512='05', sha384='04', sha256='03') == hashes
+    assert '01' == hashes[0]
+    assert '05' == hashes[-1]
+    assert ('02', '03') == hashes[1:3]
+    assert values == tuple(hashes)
+    (md5, *_) = hashes
+    assert hashes.md5 == md5
+    with pytest.raises(IndexError):
+        hashes[5]  # pylint: disable=pointless-statement
+    with pytest.raises(TypeError):
+        my_hashing.Hashes(*values, '06')
+    with pytest.raises(TypeError):
+        my_hashing.Hashes('01', md5='01')
+
+    _LOGGER.debug("Finished test")
+
+
+def test_hashes_raw_digests():
+    """Verify that calculated hashes hold the raw digests and decode to the same hex values"""
+    _LOGGER.debug("Begin test")
+
+    test_data = b'hello world'
+    algorithms = my_hashing._HashAlgorithm.from_names(['sha256', 'md5'])
+    (hashes, _) = my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(test_data), algorithms=algorithms)
+    expected = {name: hashlib.new(name, test_data).digest() for name in ('md5', 'sha256')}
+    assert my_hashing.Hashes(**{name: digest.hex() for (name, digest) in expected.items()}) == hashes
+    assert (expected['sha256'], expected['md5']) == hashes.digests_for(['sha256', 'md5'])
+    assert expected['md5'].hex() == hashes.md5
+    assert not hasattr(hashes, '__dict__')
+    with pytest.raises(my_exceptions.HashError):
+        my_hashing.Hashes(md5='not hex')
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('threaded', [False, True])
+def test_hashing_stats(threaded):
+    """Verify that collecting stats doesn't change the hashes, and times reading and each digest"""
+    _LOGGER.debug("Begin test")
+
+    test_data = b'hello world' * 1000
+    algorithms = my_hashing._HashAlgorithm.from_names(['md5', 'sha256'])
+    (expected_hashes, _) = my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(test_data), algorithms=algorithms)
+
+    stats = my_stats.InspectionStats()
+    (hashes, size) = my_hashing._HashAlgorithm.calculate_hashes(
+        io.BytesIO(test_data), chunk_size=1024, threaded=threaded, algorithms=algorithms, stats=stats)
+    assert expected_hashes == hashes
+    assert len(test_data) == size == stats.bytes_read
+    assert {'md5', 'sha256'} == set(stats.hash_seconds)
+    assert 0.0 < stats.stage_seconds['read']
+    assert sum(stats.hash_seconds.values()) == pytest.approx(stats.stage_seconds['hash'])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_sampled_hashes():
+    """Verify that sampled fingerprints only read fixed blocks of large content, and see changes in them"""
+    _LOGGER.debug("Begin test")
+
+    block_size = my_hashing.SAMPLE_BLOCK_SIZE
+    num_blocks = my_hashing.SAMPLE_BLOCKS + 2
+    algorithms = my_hashing._HashAlgorithm.from_names(['sha256'])
+
+    def fingerprint(data):
+        return my_hashing._HashAlgorithm.calculate_sampled_hashes(io.BytesIO(data), len(data), algorithms)
+
+    # Small content is read in full, after its size
+    small_data = b'small'
+    assert len(small_data).to_bytes(8, 'little') + small_data == my_hashing._read_samples(
+        io.BytesIO(small_data), len(small_data))
+
+    # Large content only has its head, tail and evenly spaced blocks read
+    large_data = bytearray(block_size * num_blocks * 10)
+    samples = my_hashing._read_samples(io.BytesIO(bytes(large_data)), len(large_data))
+    assert 8 + block_size * num_blocks == len(samples)
+    expected_hashes = fingerprint(bytes(large_data))
+    assert fingerprint(bytes(large_data)) == expected_hashes
+    assert hashlib.sha256(bytes(large_data)).hexdigest() != expected_hashes.sha256
+
+    large_data[-1] = 1
+    assert fingerprint(bytes(large_data)) != expected_hashes
+    large_data[-1] = 0
+    large_data[block_size] = 1
+    assert fingerprint(bytes(large_data)) == expected_hashes
+    assert fingerprint(bytes(large_data) + b'\0') != expected_hashes
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('threaded', [False, True])
+@pytest.mark.parametrize('test_data', [b'', b'hello world', b'hello world' * 1000])
+def test_mapped_hashes(threaded, test_data):
+    """Verify that hashing a buffer in place gives the same results as reading it as a stream"""
+    _LOGGER.debug("Begin test")
+
+    algorithms = my_hashing._HashAlgorithm.from_names(['md5', 'sha256'])
+    expected = my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(test_data), algorithms=algorithms)
+
+    stats = my_stats.InspectionStats()
+    found = my_hashing._HashAlgorithm.calculate_mapped_hashes(
+        test_data, chunk_size=64, threaded=threaded, algorithms=algorithms, stats=stats)
+    assert expected == found
+    assert len(test_data) == stats.bytes_read
+    assert {'md5', 'sha256'} == set(stats.hash_seconds)
+
+    with pytest.raises(my_exceptions.HashError):
+        my_hashing._HashAlgorithm.calculate_mapped_hashes(test_data, chunk_size=0)
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('test_data', [b'', b'hello world', b'hello world' * 1000])
+def test_digest_templates(test_data):
+    """Verify that hashing from template digests gives the same results as reading a stream, and survives pickling"""
+    _LOGGER.debug("Begin test")
+
+    algorithms = my_hashing._HashAlgorithm.from_names(['sha256', 'md5', 'blake2b'])
+    (expected, _) = my_hashing._HashAlgorithm.calculate_hashes(io.BytesIO(test_data), algorithms=algorithms)
+    templates = my_hashing._DigestTemplates(algorithms)
+    assert expected == templates.calculate_hashes(test_data)
+    # Templates are never fed anything, so they can be used again
+    assert expected == templates.calculate_hashes(test_data)
+    assert expected == pickle.loads(pickle.dumps(templates)).calculate_hashes(test_data)
+
+    stats = my_stats.InspectionStats()
+    assert expected == templates.calculate_hashes(test_data, stats)
+    assert len(test_data) == stats.bytes_read
+    assert {'md5', 'sha256', 'blake2b'} == set(stats.hash_seconds)
+    assert my_hashing.DEFAULT_ALGORITHM_NAMES == my_hashing._DigestTemplates().calculate_hashes(test_data).names
+
+    _LOGGER.debug("Finished test")
@@ -14,6 +14,7 @@ import pytest
 import rudi_dire_insp.exceptions as my_exceptions
 import rudi_dire_insp.hashing as my_hashing
 import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
 
 # Module variables
 _LOGGER = logging.getLogger(__name__)
@@ -56,3 +57,41 @@ def test_file_manifest_props():
     manifest = my_manifests.FileManifest(input_path, input_raw_manifest)
     assert expected_path == manifest.relative_path
     assert str(expected_raw_manifest) == str(manifest.raw_manifest)
+
+
+def test_binary_reader_rejects_bad_files(tmp_path):
+    """Verify that files which aren't complete binary manifest files are rejected when opened"""
+    _LOGGER.debug("Begin test")
+
+    manifest_buffer = io.BytesIO()
+    with my_serializing.BinaryManifestWriter(manifest_buffer, ['sha256']):
+        pass
+    complete_bytes = manifest_buffer.getvalue()
+    complete_path = tmp_path / 'complete.bin'
+    complete_path.write_bytes(complete_bytes)
+    with my_manifests.BinaryManifestReader(str(complete_path)) as reader:
+        assert 0 == len(reader)
+        assert reader.find_path(('', 'missing')) is None
+
+    for (name, data) in [('empty', b''), ('json', b'{"hashes": {}}\n' * 10), ('truncated', complete_bytes[:-1])]:
+        bad_path = tmp_path / name
+        bad_path.write_bytes(data)
+        with pytest.raises(my_exceptions.ManifestFormatError):
+            my_manifests.BinaryManifestReader(str(bad_path))
+
+    _LOGGER.debug("Finished test")
+
+
+def test_binary_writer_leaves_failed_output_incomplete(tmp_path):
+    """Verify that output of a failed run can't be opened as a binary manifest file"""
+    _LOGGER.debug("Begin test")
+
+    manifest_path = tmp_path / 'failed.bin'
+    with pytest.raises(RuntimeError):
+        with open(str(manifest_path), 'wb') as manifest_file:
+            with my_serializing.BinaryManifestWriter(manifest_file, ['sha256']):
+                raise RuntimeError("Inspection failed")
+    with pytest.raises(my_exceptions.ManifestFormatError):
+        my_manifests.BinaryManifestReader(str(manifest_path))
+
+    _LOGGER.debug("Finished test")
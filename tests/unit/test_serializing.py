@@ -0,0 +1,194 @@
+"""
+Unit tests for the rudi_dire_insp.serializing module.
+"""
+
+# Core python imports
+import io
+import json
+import logging
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.hashing as my_hashing
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
+import rudi_dire_insp.walking as my_walking
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+_TRICKY_PATHS = [
+    ('', 'plain.txt'),
+    ('sub/dir', 'quote"back\\slash.txt'),
+    ('ünïcödé', 'emoji-\U0001F600.txt'),
+    ('control\x01\x1f\x7f', 'tab\tnewline\n.txt'),
+    ('surrogate-\udcff', 'slash/percent%s%d.txt'),
+    ('sub/dir', 'second-in-same-dir.txt'),
+    ('one', 'two', 'three'),
+]
+
+
+def _reference_json_line(manifest: my_manifests.FileManifest) -> bytes:
+    """Serialize a manifest the way the command line tool always has"""
+    data = {
+        'relative_path': manifest.relative_path,
+        'size': manifest.raw_manifest.size,
+        'hashes': manifest.raw_manifest.hashes._asdict(),
+    }
+    return (json.dumps(data, sort_keys=True) + '\n').encode('utf-8')
+
+
+def _build_manifests(algorithm_names):
+    """Build a manifest for each of the tricky paths"""
+    algorithms = my_hashing._HashAlgorithm.from_names(algorithm_names)
+    manifests = []
+    for index, relative_path in enumerate(_TRICKY_PATHS):
+        (hashes, size) = my_hashing._HashAlgorithm.calculate_hashes(
+            io.BytesIO(b'x' * index), algorithms=algorithms)
+        manifests.append(my_manifests.FileManifest(relative_path, my_manifests.RawBytesManifest(hashes, size)))
+    return manifests
+
+
+@pytest.mark.parametrize('algorithm_names', [None, ['sha3_256', 'blake2b', 'md5']])
+def test_identical_output(algorithm_names):
+    """Verify that the JSON Lines writer produces exactly the same bytes as json.dumps with sorted keys"""
+    _LOGGER.debug("Begin test")
+
+    manifests = _build_manifests(algorithm_names)
+    expected_bytes = b''.join(_reference_json_line(manifest) for manifest in manifests)
+
+    found_buffer = io.BytesIO()
+    with my_serializing.JsonLinesWriter(found_buffer, buffer_size=100) as writer:
+        for manifest in manifests:
+            writer.write(manifest)
+
+    assert expected_bytes == found_buffer.getvalue()
+    assert len(manifests) == writer.count
+
+    _LOGGER.debug("Finished test")
+
+
+def test_batched_writes():
+    """Verify that output is collected into batches before being written to the stream"""
+    _LOGGER.debug("Begin test")
+
+    class _CountingBuffer(io.BytesIO):
+        """A byte stream that counts writes"""
+        num_writes = 0
+
+        def write(self, data):
+            self.num_writes += 1
+            return super().write(data)
+
+    manifests = _build_manifests(None) * 20
+    found_buffer = _CountingBuffer()
+    writer = my_serializing.JsonLinesWriter(found_buffer, buffer_size=4096)
+    for manifest in manifests:
+        writer.write(manifest)
+    assert 0 < found_buffer.num_writes < len(manifests) // 4
+
+    writer.flush()
+    assert b''.join(_reference_json_line(manifest) for manifest in manifests) == found_buffer.getvalue()
+
+    _LOGGER.debug("Finished test")
+
+
+def _manifest_strings(manifests):
+    """Represent manifests as comparable strings"""
+    return [str(manifest) for manifest in manifests]
+
+
+@pytest.mark.parametrize('algorithm_names', [None, ['sha3_256', 'blake2b', 'md5']])
+def test_binary_round_trip(tmp_path, algorithm_names):
+    """Verify that manifests written in the binary format are read back unchanged, whatever order they came in"""
+    _LOGGER.debug("Begin test")
+
+    manifests = _build_manifests(algorithm_names)
+    expected_names = my_hashing.DEFAULT_ALGORITHM_NAMES if algorithm_names is None else ('md5', 'blake2b', 'sha3_256')
+    manifest_path = str(tmp_path / 'manifests.bin')
+    with open(manifest_path, 'wb') as manifest_file:
+        with my_serializing.BinaryManifestWriter(manifest_file, expected_names, buffer_size=100) as writer:
+            for manifest in manifests:
+                writer.write(manifest)
+    assert len(manifests) == writer.count
+
+    sorted_manifests = sorted(manifests, key=lambda item: my_walking.relative_path_key(item.relative_path))
+    assert sorted_manifests != manifests
+    with my_manifests.BinaryManifestReader(manifest_path) as reader:
+        assert expected_names == reader.algorithm_names
+        assert len(manifests) == len(reader)
+        assert _manifest_strings(manifests) == _manifest_strings(reader)
+        assert str(manifests[-1]) == str(reader[-1])
+        assert _manifest_strings(sorted_manifests) == _manifest_strings(reader.iter_by_path())
+        for manifest in manifests:
+            assert str(manifest) == str(reader.find_path(manifest.relative_path))
+        assert reader.find_path(('sub', 'dir/missing.txt')) is None
+
+    _LOGGER.debug("Finished test")
+
+
+def test_binary_digest_lookup(tmp_path):
+    """Verify that files are found by SHA256 digest, including files sharing their contents"""
+    _LOGGER.debug("Begin test")
+
+    manifests = _build_manifests(None)
+    duplicate = my_manifests.FileManifest(('zz', 'copy'), manifests[3].raw_manifest)
+    manifest_buffer = io.BytesIO()
+    with my_serializing.BinaryManifestWriter(manifest_buffer, my_hashing.DEFAULT_ALGORITHM_NAMES) as writer:
+        for manifest in manifests + [duplicate]:
+            writer.write(manifest)
+    manifest_path = tmp_path / 'manifests.bin'
+    manifest_path.write_bytes(manifest_buffer.getvalue())
+
+    with my_manifests.BinaryManifestReader(str(manifest_path)) as reader:
+        assert 'sha256' == reader.indexed_algorithm_name
+        for manifest in manifests:
+            sha256 = manifest.raw_manifest.hashes.sha256
+            expected = [manifest, duplicate] if manifest is manifests[3] else [manifest]
+            assert _manifest_strings(expected) == _manifest_strings(reader.find_digest(sha256))
+            assert _manifest_strings(expected) == _manifest_strings(reader.find_digest(bytes.fromhex(sha256)))
+        assert [] == reader.find_digest('00' * 32)
+        for digest in ('zz', 'abc'):
+            with pytest.raises(my_exceptions.ManifestFormatError):
+                reader.find_digest(digest)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_binary_rejects_mismatched_hashes():
+    """Verify that every manifest written in the binary format must hold the same hashes"""
+    _LOGGER.debug("Begin test")
+
+    writer = my_serializing.BinaryManifestWriter(io.BytesIO(), ['sha256'])
+    with pytest.raises(my_exceptions.ManifestFormatError):
+        writer.write(_build_manifests(None)[0])
+
+    _LOGGER.debug("Finished test")
+
+
+def test_sampled_fingerprints():
+    """Verify that sampled fingerprints are marked in JSON Lines, read back as such, and refused by the binary format"""
+    _LOGGER.debug("Begin test")
+
+    hashes = my_hashing.Hashes(sha256='ab' * 32)
+    manifest = my_manifests.FileManifest(('', 'big.bin'), my_manifests.RawBytesManifest(hashes, 10, sampled=True))
+    line = my_serializing.JsonLinesEncoder().encode(manifest)
+    expected_data = json.loads(_reference_json_line(manifest).decode('ascii'))
+    expected_data['sampled'] = True
+    assert json.dumps(expected_data, sort_keys=True) + '\n' == line
+
+    (read_manifest,) = my_serializing.read_json_lines(io.BytesIO(line.encode('ascii')))
+    assert read_manifest.raw_manifest.sampled
+    assert hashes == read_manifest.raw_manifest.hashes
+
+    with pytest.raises(my_exceptions.ManifestFormatError):
+        list(my_serializing.read_json_lines(io.BytesIO(line.replace('true', '1').encode('ascii'))))
+    writer = my_serializing.BinaryManifestWriter(io.BytesIO(), ['sha256'])
+    with pytest.raises(my_exceptions.ManifestFormatError):
+        writer.write(manifest)
+
+    _LOGGER.debug("Finished test")
@@ -0,0 +1,159 @@
+"""
+Unit tests for the rudi_dire_insp.serving module.
+"""
+
+# Core python imports
+import http.client
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.serving as my_serving
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+
+# Nested files, two of them with the same content
+_TREE = {
+    'top.txt': 'same',
+    os.path.join('a', 'one.txt'): 'one',
+    os.path.join('a', 'b', 'two.txt'): 'same',
+    os.path.join('a-x', 'three.txt'): 'three',
+}
+
+
+def _paths(manifests):
+    """Reduce manifests to their joined relative paths"""
+    return [os.path.join(*manifest.relative_path) for manifest in manifests]
+
+
+def test_lookups(tmp_path, build_tree):
+    """Verify lookups by path, prefix and digest, in walk order"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path, _TREE)
+    index = my_serving.ManifestIndex(my_core.DirectoryInspector().inspect(str(tmp_path)))
+    assert 4 == len(index)
+    manifest = index.lookup_path(os.path.join('a', 'b', 'two.txt'))
+    assert (os.path.join('a', 'b'), 'two.txt') == manifest.relative_path
+    assert index.lookup_path('missing.txt') is None
+
+    assert [os.path.join('a', 'one.txt'), os.path.join('a', 'b', 'two.txt')] == _paths(index.lookup_prefix('a'))
+    assert [os.path.join('a', 'b', 'two.txt')] == _paths(index.lookup_prefix(os.path.join('a', 'b', '')))
+    assert 4 == len(index.lookup_prefix(''))
+    assert [] == index.lookup_prefix('a-')
+
+    for hex_value in (manifest.raw_manifest.hashes.sha256, manifest.raw_manifest.hashes.md5):
+        assert ['top.txt', os.path.join('a', 'b', 'two.txt')] == _paths(index.lookup_digest(hex_value))
+    assert [] == index.lookup_digest('00' * 32)
+    with pytest.raises(ValueError):
+        index.lookup_digest('not hex')
+    with pytest.raises(my_exceptions.FileInspectionError):
+        index.lookup_path('top.txt', revalidate=True)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_revalidate(tmp_path, monkeypatch, build_tree):
+    """Test that revalidated entries are only hashed again once their file's status changed"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path, _TREE)
+    manifests = list(my_core.DirectoryInspector().inspect(str(tmp_path)))
+    time.sleep(0.01)
+    index = my_serving.ManifestIndex(manifests, str(tmp_path), time.time_ns() + 2 * 10 ** 9)
+    indexes = [index]
+    hashed = []
+    inspect_entry = my_core._FileInspector.inspect_entry
+
+    def counting_inspect_entry(file_inspector, file_entry):
+        # Files are hashed again without holding up other lookups
+        assert not any(checked_index._lock.locked() for checked_index in indexes)
+        hashed.append(file_entry.relative_path)
+        return inspect_entry(file_inspector, file_entry)
+
+    monkeypatch.setattr(my_core._FileInspector, 'inspect_entry', counting_inspect_entry)
+    same = index.lookup_path('top.txt').raw_manifest.hashes.sha256
+    assert 2 == len(index.lookup_digest(same, revalidate=True))
+    assert [] == hashed
+
+    (tmp_path / 'top.txt').write_text('changed')
+    os.remove(str(tmp_path / 'a' / 'one.txt'))
+    assert 7 == index.lookup_path('top.txt', revalidate=True).raw_manifest.size
+    assert [('', 'top.txt')] == hashed
+    assert index.lookup_path('top.txt', revalidate=True) is not None
+    assert [('', 'top.txt')] == hashed
+    assert [os.path.join('a', 'b', 'two.txt')] == _paths(index.lookup_digest(same))
+    assert [os.path.join('a', 'b', 'two.txt')] == _paths(index.lookup_prefix('a', revalidate=True))
+    assert 3 == len(index)
+
+    # Without a time the manifests were current at, every entry is hashed on its first revalidation
+    unknown = my_serving.ManifestIndex(my_core.DirectoryInspector().inspect(str(tmp_path)), str(tmp_path))
+    indexes.append(unknown)
+    hashed.clear()
+    assert 3 == len(unknown.lookup_prefix('', revalidate=True))
+    assert 3 == len(hashed)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_serve_http(tmp_path, monkeypatch, build_tree):
+    """Test the lookups served on a localhost port and on a Unix socket"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path / 'tree', _TREE)
+    unreadable_path = str(tmp_path / 'tree' / 'a-x' / 'three.txt')
+    stat = os.stat
+
+    def _fail_stat(path, *args, **kwargs):
+        if path == unreadable_path:
+            raise PermissionError(13, "Permission denied", path)
+        return stat(path, *args, **kwargs)
+
+    index = my_serving.ManifestIndex(
+        my_core.DirectoryInspector().inspect(str(tmp_path / 'tree')), str(tmp_path / 'tree'), time.time_ns())
+    with pytest.raises(ValueError):
+        my_serving.make_server(index)
+    socket_path = str(tmp_path / 'index.sock')
+    monkeypatch.setattr(my_serving.os, 'stat', _fail_stat)
+    for (server, connection) in (
+            (my_serving.make_server(index, port=0), None),
+            (my_serving.make_server(index, socket_path=socket_path, revalidate=True), socket_path)):
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            if connection is None:
+                client = http.client.HTTPConnection(*server.server_address)
+            else:
+                client = http.client.HTTPConnection('localhost')
+                client.sock = socket.socket(socket.AF_UNIX)
+                client.sock.connect(connection)
+            answers = []
+            for url in ('/path?path=a/b/two.txt', '/prefix?path=a', '/path?path=missing', '/digest?value=zz', '/',
+                        '/path?path=a-x/three.txt&revalidate=1'):
+                client.request('GET', url)
+                response = client.getresponse()
+                answers.append((response.status, [json.loads(line) for line in response.read().splitlines()]))
+            assert [200, 200, 404, 400, 400, 500] == [status for (status, _) in answers]
+            assert "Permission denied" in answers[-1][1][0]['error']
+            assert [['a/b', 'two.txt']] == [data['relative_path'] for data in answers[0][1]]
+            assert [['a', 'one.txt'], ['a/b', 'two.txt']] == [data['relative_path'] for data in answers[1][1]]
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+    assert not os.path.exists(socket_path)
+
+    _LOGGER.debug("Finished test")
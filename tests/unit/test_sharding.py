@@ -0,0 +1,100 @@
+"""
+Unit tests for the rudi_dire_insp.sharding module.
+"""
+
+# Core python imports
+import logging
+import os
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.sharding as my_sharding
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+_NUM_SHARDS = 3
+
+
+# Enough files over a few sub directories to land in every shard
+_TREE = {
+    os.path.join(dir_name, 'file-{}.txt'.format(index)): '{} {}'.format(dir_name, index)
+    for dir_name in ('', 'a', 'b') for index in range(10)}
+
+
+def test_shards_split_and_merge(tmp_path, build_tree):
+    """Verify that the shards of a directory are disjoint, and merge back into the inspection of all of it"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path, _TREE)
+    expected = [
+        (manifest.relative_path, manifest.raw_manifest.hashes)
+        for manifest in my_core.DirectoryInspector().inspect(str(tmp_path))]
+
+    shard_manifests = [
+        list(my_core.DirectoryInspector(shard=my_sharding.Shard(index, _NUM_SHARDS)).inspect(str(tmp_path)))
+        for index in range(_NUM_SHARDS)]
+    assert all(shard_manifests)
+    assert len(expected) == sum(len(manifests) for manifests in shard_manifests)
+    assert len(expected) == len(list(my_core.DirectoryInspector(shard=my_sharding.Shard(0, 1)).inspect(str(tmp_path))))
+
+    # Shards can be given in any order
+    merged = my_sharding.merge_shards(list(reversed(shard_manifests)), count=_NUM_SHARDS)
+    assert expected == [(manifest.relative_path, manifest.raw_manifest.hashes) for manifest in merged]
+
+    _LOGGER.debug("Finished test")
+
+
+def test_merge_shards_errors(tmp_path, build_tree):
+    """Test that missing, repeated and unsorted shards are rejected"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path, _TREE)
+    shard_manifests = [
+        list(my_core.DirectoryInspector(shard=my_sharding.Shard(index, _NUM_SHARDS)).inspect(str(tmp_path)))
+        for index in range(_NUM_SHARDS)]
+
+    # A missing shard makes the others look like they mix or repeat shards
+    with pytest.raises(my_exceptions.ShardError):
+        list(my_sharding.merge_shards(shard_manifests[:-1]))
+    with pytest.raises(my_exceptions.ShardError):
+        list(my_sharding.merge_shards(shard_manifests[:-1], count=_NUM_SHARDS))
+    with pytest.raises(my_exceptions.ShardError) as error:
+        list(my_sharding.merge_shards(shard_manifests[:1] + shard_manifests[:-1]))
+    assert "both hold shard" in str(error)
+    with pytest.raises(my_exceptions.ManifestFormatError):
+        list(my_sharding.merge_shards([list(reversed(shard_manifests[0]))] + shard_manifests[1:]))
+    with pytest.raises(my_exceptions.ShardError):
+        list(my_sharding.merge_shards([]))
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('text, expected', [('1/1', (0, 1)), ('2/4', (1, 4)), ('4/4', (3, 4))])
+def test_shard_parse(text, expected):
+    """Verify that shards are parsed counting from one, and keep their index stable"""
+    _LOGGER.debug("Begin test")
+
+    shard = my_sharding.Shard.parse(text)
+    assert expected == (shard.index, shard.count)
+    assert text == str(shard)
+    assert my_sharding.Shard(*expected) == shard
+    assert my_sharding.shard_index(('sub', 'file.txt'), 4) == my_sharding.shard_index(('sub', 'file.txt'), 4)
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('text', ['0/4', '5/4', '1/0', '1', 'a/b', '1/2/3'])
+def test_shard_parse_errors(text):
+    """Test error handling for shards that don't exist or can't be parsed"""
+    _LOGGER.debug("Begin test")
+
+    with pytest.raises(my_exceptions.ShardError):
+        my_sharding.Shard.parse(text)
+
+    _LOGGER.debug("Finished test")
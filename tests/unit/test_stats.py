@@ -0,0 +1,57 @@
+"""
+Unit tests for the rudi_dire_insp.stats module.
+"""
+
+# Core python imports
+import json
+import logging
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.stats as my_stats
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+
+def test_slowest_files():
+    """Verify that only the slowest files are remembered, slowest first"""
+    _LOGGER.debug("Begin test")
+
+    stats = my_stats.InspectionStats(slowest_count=3)
+    for (index, seconds) in enumerate([0.5, 0.1, 0.9, 0.3, 0.7, 0.2]):
+        stats.add_file(('', 'file-{}'.format(index)), seconds)
+    stats.add_file(('', 'untimed'))
+
+    assert 7 == stats.files
+    assert [(('', 'file-2'), 0.9), (('', 'file-4'), 0.7), (('', 'file-0'), 0.5)] == stats.slowest_files
+
+    _LOGGER.debug("Finished test")
+
+
+def test_timings_and_counters():
+    """Verify that timings add up per stage and per algorithm, and come out as JSON compatible data"""
+    _LOGGER.debug("Begin test")
+
+    stats = my_stats.InspectionStats()
+    stats.add_hashing(0.25, 100, {'md5': 0.5, 'sha256': 1.0})
+    stats.add_hashing(0.25, 50, {'sha256': 1.0})
+    stats.add_stage_time('open', 0.125)
+    stats.add_directory()
+
+    assert 150 == stats.bytes_read
+    assert 1 == stats.directories
+    assert {'md5': 0.5, 'sha256': 2.0} == stats.hash_seconds
+    assert {'walk': 0.0, 'cache': 0.0, 'open': 0.125, 'read': 0.5, 'hash': 2.5, 'serialize': 0.0} == \
+        stats.stage_seconds
+
+    assert [1, 2, 3] == list(stats.timed('walk', [1, 2, 3]))
+    assert 0.0 < stats.stage_seconds['walk']
+
+    data = json.loads(json.dumps(stats.as_dict()))
+    assert {'files', 'directories', 'bytes_read', 'stage_seconds', 'hash_seconds', 'slowest_files'} == set(data)
+
+    _LOGGER.debug("Finished test")
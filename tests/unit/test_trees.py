@@ -0,0 +1,120 @@
+"""
+Unit tests for the rudi_dire_insp.trees module.
+"""
+
+# Core python imports
+import io
+import logging
+import os
+import shutil
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.manifests as my_manifests
+import rudi_dire_insp.serializing as my_serializing
+import rudi_dire_insp.trees as my_trees
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+
+# A walk that interleaves sub trees, with an empty directory and one holding only another
+_TREE = {
+    'top.txt': 'content of top',
+    os.path.join('a', 'one.txt'): 'content of one',
+    os.path.join('a', 'b', 'two.txt'): 'content of two',
+    os.path.join('a-x', 'three.txt'): 'content of three',
+    os.path.join('only', 'sub', 'four.txt'): 'content of four',
+    'empty': None,
+}
+
+
+def _directories(manifests):
+    """Keep only the directory manifests, by relative path"""
+    return {
+        manifest.relative_path: manifest for manifest in manifests
+        if isinstance(manifest, my_manifests.DirectoryManifest)}
+
+
+def test_inspect_tree(tmp_path, build_tree):
+    """Verify that each directory holding files gets a manifest, once everything under it has been yielded"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path, _TREE)
+    manifests = list(my_core.DirectoryInspector().inspect_tree(str(tmp_path)))
+    file_manifests = [manifest for manifest in manifests if isinstance(manifest, my_manifests.FileManifest)]
+    assert 5 == len(file_manifests)
+
+    directories = _directories(manifests)
+    assert {'', 'a', os.path.join('a', 'b'), 'a-x', 'only', os.path.join('only', 'sub')} == set(directories)
+    assert manifests[-1] is directories['']
+    assert (5, sum(manifest.raw_manifest.size for manifest in file_manifests)) == (
+        directories[''].file_count, directories[''].size)
+    assert 2 == directories['a'].file_count
+    for (position, manifest) in enumerate(manifests):
+        if isinstance(manifest, my_manifests.DirectoryManifest) and manifest.relative_path:
+            later_paths = [
+                os.path.join(*other.relative_path) if isinstance(other, my_manifests.FileManifest)
+                else other.relative_path for other in manifests[position + 1:]]
+            assert not [path for path in later_paths if path.startswith(manifest.relative_path + os.sep)]
+
+    # A pool of workers in walk order gives the same manifests, and the JSON Lines round trip keeps them
+    pooled = _directories(my_core.DirectoryInspector(workers=3).inspect_tree(str(tmp_path)))
+    assert [(path, manifest.hashes) for (path, manifest) in sorted(directories.items())] == [
+        (path, manifest.hashes) for (path, manifest) in sorted(pooled.items())]
+    encoded = ''.join(my_serializing.encode_directory_manifest(manifest) for manifest in directories.values())
+    decoded = list(my_serializing.read_directory_json_lines(io.BytesIO(encoded.encode('ascii'))))
+    assert [(manifest.relative_path, manifest.hashes, manifest.size, manifest.file_count)
+            for manifest in directories.values()] == [
+        (manifest.relative_path, manifest.hashes, manifest.size, manifest.file_count) for manifest in decoded]
+
+    with pytest.raises(my_exceptions.DirInspectionError):
+        my_core.DirectoryInspector(workers=2, ordered=False).inspect_tree(str(tmp_path))
+
+    _LOGGER.debug("Finished test")
+
+
+def test_directory_hashes(tmp_path, build_tree):
+    """Test that directory hashes only depend on what is under them, wherever they are"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path / 'tree', _TREE)
+    shutil.copytree(str(tmp_path / 'tree' / 'a'), str(tmp_path / 'tree' / 'copy' / 'a'))
+    before = _directories(my_core.DirectoryInspector().inspect_tree(str(tmp_path / 'tree')))
+    assert before['a'].hashes == before[os.path.join('copy', 'a')].hashes
+    assert before['a'].hashes != before['a-x'].hashes
+
+    (tmp_path / 'tree' / 'a' / 'b' / 'two.txt').write_text('changed')
+    after = _directories(my_core.DirectoryInspector().inspect_tree(str(tmp_path / 'tree')))
+    for path in ('', 'a', os.path.join('a', 'b')):
+        assert before[path].hashes != after[path].hashes
+    for path in ('a-x', 'only', os.path.join('copy', 'a')):
+        assert before[path].hashes == after[path].hashes
+
+    # Renaming a file changes its directory, even with the same content
+    os.rename(str(tmp_path / 'tree' / 'a-x' / 'three.txt'), str(tmp_path / 'tree' / 'a-x' / 'renamed.txt'))
+    renamed = _directories(my_core.DirectoryInspector().inspect_tree(str(tmp_path / 'tree')))
+    assert after['a-x'].hashes != renamed['a-x'].hashes
+    assert after['a-x'].size == renamed['a-x'].size
+
+    _LOGGER.debug("Finished test")
+
+
+def test_aggregator_rejects_unsorted(tmp_path, build_tree):
+    """Test that file manifests out of walk order are rejected"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path, _TREE)
+    manifests = list(my_core.DirectoryInspector().inspect(str(tmp_path)))
+    single = list(my_trees.aggregate_directories(manifests[:1]))
+    assert ['', 1] == [single[-1].relative_path, single[-1].file_count]
+    with pytest.raises(my_exceptions.ManifestFormatError):
+        list(my_trees.aggregate_directories(reversed(manifests)))
+    assert [] == my_trees.DirectoryAggregator().finish()
+
+    _LOGGER.debug("Finished test")
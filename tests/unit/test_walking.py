@@ -0,0 +1,183 @@
+"""
+Unit tests for the rudi_dire_insp.walking module.
+"""
+
+# Core python imports
+import logging
+import os
+import pickle
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.filtering as my_filtering
+import rudi_dire_insp.stats as my_stats
+import rudi_dire_insp.walking as my_walking
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+
+def _make_files(root_path, relative_paths):
+    """Create a file at each of the relative paths under the root path"""
+    for relative_path in relative_paths:
+        file_path = root_path.joinpath(*relative_path.split('/'))
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(relative_path)
+
+
+def test_walk_order(tmp_path):
+    """Verify that files are yielded sorted by their relative path keys, whatever the directory layout"""
+    _LOGGER.debug("Begin test")
+
+    _make_files(tmp_path, ['z.txt', 'a/b/c.txt', 'a-x/y.txt', 'a/z.txt', 'a/b-c/d.txt', 'a.txt', 'b/a.txt'])
+    relative_paths = [file_entry.relative_path for file_entry in my_walking.walk_files(str(tmp_path))]
+
+    assert [
+        ('', 'a.txt'),
+        ('', 'z.txt'),
+        ('a', 'z.txt'),
+        ('a-x', 'y.txt'),
+        ('a/b', 'c.txt'),
+        ('a/b-c', 'd.txt'),
+        ('b', 'a.txt'),
+    ] == relative_paths
+    assert sorted(relative_paths, key=my_walking.relative_path_key) == relative_paths
+
+    _LOGGER.debug("Finished test")
+
+
+def test_walk_resume(tmp_path):
+    """Verify that a resumed walk yields the files after the one resumed after, without listing finished directories"""
+    _LOGGER.debug("Begin test")
+
+    _make_files(
+        tmp_path, ['z.txt', 'a/b/c.txt', 'a-x/y.txt', 'a/z.txt', 'a/b-c/d.txt', 'a.txt', 'b/a.txt', 'b/c/d.txt'])
+    relative_paths = [file_entry.relative_path for file_entry in my_walking.walk_files(str(tmp_path))]
+
+    for (index, resume_after) in enumerate(relative_paths):
+        resumed_paths = [
+            file_entry.relative_path for file_entry in my_walking.walk_files(str(tmp_path), resume_after=resume_after)]
+        assert relative_paths[index + 1:] == resumed_paths
+
+    # Files that are gone by the time the walk resumes still mark where it resumes
+    resumed_paths = [
+        file_entry.relative_path for file_entry in my_walking.walk_files(str(tmp_path), resume_after=('a', 'y.txt'))]
+    assert relative_paths[relative_paths.index(('a', 'z.txt')):] == resumed_paths
+
+    # Only the root, the directory resumed in and the one after it are listed, not a, a-x, a/b or a/b-c
+    stats = my_stats.InspectionStats()
+    list(my_walking.walk_files(str(tmp_path), stats, resume_after=('b', 'a.txt')))
+    assert 3 == stats.directories
+
+    _LOGGER.debug("Finished test")
+
+
+def test_walk_w_filter(tmp_path):
+    """Verify that pruned directories are never listed, and only matching files are yielded"""
+    _LOGGER.debug("Begin test")
+
+    _make_files(tmp_path, ['a.txt', 'a.tmp', 'node_modules/x/y.txt', 'src/b.txt', 'src/node_modules/c.txt'])
+    (tmp_path / 'src' / 'big.txt').write_bytes(b'x' * 100)
+    path_filter = my_filtering.PathFilter(exclude=['node_modules', '*.tmp'], max_size=50)
+
+    stats = my_stats.InspectionStats()
+    relative_paths = [
+        file_entry.relative_path for file_entry in my_walking.walk_files(str(tmp_path), stats, path_filter=path_filter)]
+    assert [('', 'a.txt'), ('src', 'b.txt')] == relative_paths
+    assert 2 == stats.directories
+
+    _LOGGER.debug("Finished test")
+
+
+def test_walk_entries(tmp_path):
+    """Verify the paths and status information of the entries, including after pickling"""
+    _LOGGER.debug("Begin test")
+
+    _make_files(tmp_path, ['sub/test.txt'])
+    (file_entry,) = list(my_walking.walk_files(str(tmp_path)))
+
+    assert str(tmp_path / 'sub' / 'test.txt') == file_entry.path
+    assert ('sub', 'test.txt') == file_entry.relative_path
+    assert len('sub/test.txt') == file_entry.stat().st_size
+
+    copied_entry = pickle.loads(pickle.dumps(file_entry))
+    assert file_entry.path == copied_entry.path
+    assert file_entry.relative_path == copied_entry.relative_path
+    assert file_entry.stat().st_ino == copied_entry.stat().st_ino
+
+    _LOGGER.debug("Finished test")
+
+
+def test_walk_symlinks(tmp_path):
+    """Verify that links to files under the root are yielded, and links to directories are skipped"""
+    _LOGGER.debug("Begin test")
+
+    root_path = tmp_path / "root"
+    _make_files(root_path, ['sub/test.txt'])
+    (root_path / 'file-link.txt').symlink_to(root_path / 'sub' / 'test.txt')
+    (root_path / 'dir-link').symlink_to(root_path / 'sub')
+
+    relative_paths = [file_entry.relative_path for file_entry in my_walking.walk_files(str(root_path))]
+    assert [('', 'file-link.txt'), ('sub', 'test.txt')] == relative_paths
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('link_target,expected_message', [
+    ('outside.txt', 'not a child of the root directory path'),
+    ('root-other/test.txt', 'not a child of the root directory path'),
+    ('i-dont-exist.txt', 'File at path does not exist'),
+])
+def test_walk_bad_symlinks(tmp_path, link_target, expected_message):
+    """Test error handling for links to files that aren't under the root, or that don't exist"""
+    _LOGGER.debug("Begin test")
+
+    _make_files(tmp_path, ['outside.txt', 'root-other/test.txt', 'root/test.txt'])
+    (tmp_path / 'root' / 'link.txt').symlink_to(tmp_path / link_target)
+
+    with pytest.raises(my_exceptions.FileInspectionError) as error:
+        for _ in my_walking.walk_files(str(tmp_path / 'root')):
+            pass
+    assert expected_message in str(error)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_walk_special_file(tmp_path):
+    """Test error handling for entries that are neither files nor directories"""
+    _LOGGER.debug("Begin test")
+
+    os.mkfifo(str(tmp_path / 'fifo'))
+    with pytest.raises(my_exceptions.FileInspectionError) as error:
+        for _ in my_walking.walk_files(str(tmp_path)):
+            pass
+    assert "Path does not point to a file" in str(error)
+
+    _LOGGER.debug("Finished test")
+
+
+def test_walk_unreadable_dir(tmp_path, monkeypatch):
+    """Verify that directories that can't be listed are skipped, as os.walk does"""
+    _LOGGER.debug("Begin test")
+
+    _make_files(tmp_path, ['a.txt', 'b/c.txt', 'd/e.txt'])
+    unreadable_path = str(tmp_path / 'b')
+    scandir = os.scandir
+
+    def _fail_scandir(path):
+        if path == unreadable_path:
+            raise PermissionError(13, "Permission denied", path)
+        return scandir(path)
+
+    monkeypatch.setattr(my_walking.os, 'scandir', _fail_scandir)
+    stats = my_stats.InspectionStats()
+    relative_paths = [file_entry.relative_path for file_entry in my_walking.walk_files(str(tmp_path), stats)]
+
+    assert [('', 'a.txt'), ('d', 'e.txt')] == relative_paths
+    assert 2 == stats.directories
+
+    _LOGGER.debug("Finished test")
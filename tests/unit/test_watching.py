@@ -0,0 +1,139 @@
+"""
+Unit tests for the rudi_dire_insp.watching module.
+"""
+
+# Core python imports
+import logging
+import os
+import shutil
+import time
+
+# 3rd party imports
+import pytest
+
+# Imports of code-under-test
+import rudi_dire_insp.core as my_core
+import rudi_dire_insp.exceptions as my_exceptions
+import rudi_dire_insp.watching as my_watching
+
+# Module variables
+_LOGGER = logging.getLogger(__name__)
+pytestmark = pytest.mark.unit
+
+
+# A few files over a sub directory
+_TREE = {
+    'top.txt': 'top',
+    os.path.join('sub', 'nested.txt'): 'nested',
+}
+
+
+def _collect_events(watcher, seconds):
+    """Poll a watcher for a while, and reduce the events to comparable tuples"""
+    events = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        events.extend(watcher.poll(0.1))
+    return [
+        (event.kind.value, event.relative_path, None if event.manifest is None else event.manifest.raw_manifest.size)
+        for event in events]
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_watch_changes(tmp_path, use_inotify, build_tree, summarize_manifests):
+    """Verify that additions, modifications, removals and moved directories give events and keep the index current"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path, _TREE)
+    with my_watching.DirectoryWatcher(
+            str(tmp_path), debounce_seconds=0.05, poll_interval=0.1, use_inotify=use_inotify) as watcher:
+        watcher.start()
+        assert watcher.notifier_name in ('inotify', 'polling')
+        if not use_inotify:
+            assert 'polling' == watcher.notifier_name
+        expected = summarize_manifests(my_core.DirectoryInspector().inspect(str(tmp_path)))
+        assert expected == summarize_manifests(watcher.manifests())
+
+        (tmp_path / 'top.txt').write_text('modified')
+        (tmp_path / 'added.txt').write_text('added')
+        os.rename(str(tmp_path / 'sub'), str(tmp_path / 'moved'))
+        (tmp_path / 'new' / 'deeper').mkdir(parents=True)
+        (tmp_path / 'new' / 'deeper' / 'file.txt').write_text('file')
+        assert sorted([
+            ('added', ('', 'added.txt'), 5),
+            ('modified', ('', 'top.txt'), 8),
+            ('added', ('moved', 'nested.txt'), 6),
+            ('added', (os.path.join('new', 'deeper'), 'file.txt'), 4),
+            ('removed', ('sub', 'nested.txt'), None)]) == sorted(_collect_events(watcher, 1))
+        expected = summarize_manifests(my_core.DirectoryInspector().inspect(str(tmp_path)))
+        assert expected == summarize_manifests(watcher.manifests())
+
+        # Touching a file or writing the same content back gives no event
+        os.utime(str(tmp_path / 'added.txt'))
+        (tmp_path / 'top.txt').write_text('modified')
+        shutil.rmtree(str(tmp_path / 'new'))
+        assert [('removed', (os.path.join('new', 'deeper'), 'file.txt'), None)] == _collect_events(watcher, 1)
+
+    _LOGGER.debug("Finished test")
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_watch_dir_replaced_by_file(tmp_path, use_inotify, build_tree, summarize_manifests):
+    """Test that the files of a directory moved away are removed when a file is created at its path"""
+    _LOGGER.debug("Begin test")
+
+    root_path = tmp_path / 'root'
+    build_tree(root_path, _TREE)
+    with my_watching.DirectoryWatcher(
+            str(root_path), debounce_seconds=0.05, poll_interval=0.1, use_inotify=use_inotify) as watcher:
+        watcher.start()
+        os.rename(str(root_path / 'sub'), str(tmp_path / 'elsewhere'))
+        (root_path / 'sub').write_text('now a file')
+        assert sorted([
+            ('added', ('', 'sub'), 10),
+            ('removed', ('sub', 'nested.txt'), None)]) == sorted(_collect_events(watcher, 1))
+        expected = summarize_manifests(my_core.DirectoryInspector().inspect(str(root_path)))
+        assert expected == summarize_manifests(watcher.manifests())
+
+    _LOGGER.debug("Finished test")
+
+
+def test_watch_debounces(tmp_path, monkeypatch, build_tree):
+    """Test that a file rewritten in a burst is only hashed again once it settles"""
+    _LOGGER.debug("Begin test")
+
+    build_tree(tmp_path, _TREE)
+    with my_watching.DirectoryWatcher(str(tmp_path), debounce_seconds=0.3) as watcher:
+        watcher.start()
+        hashed = []
+        inspect_entry = watcher._file_inspector.inspect_entry
+
+        def counting_inspect_entry(file_entry):
+            hashed.append(file_entry.relative_path)
+            return inspect_entry(file_entry)
+
+        monkeypatch.setattr(watcher._file_inspector, 'inspect_entry', counting_inspect_entry)
+        for index in range(10):
+            (tmp_path / 'top.txt').write_text('version {}'.format(index))
+            assert [] == watcher.poll(0.02)
+        events = watcher.poll(5)
+        assert [('', 'top.txt')] == [event.relative_path for event in events]
+        assert 9 == events[0].manifest.raw_manifest.size
+        assert [('', 'top.txt')] == hashed
+
+    _LOGGER.debug("Finished test")
+
+
+def test_watch_errors(tmp_path):
+    """Test that watchers reject bad settings and polling before being started"""
+    _LOGGER.debug("Begin test")
+
+    for options in ({'debounce_seconds': 0}, {'poll_interval': -1}, {'debounce_seconds': True}):
+        with pytest.raises(my_exceptions.DirInspectionError):
+            my_watching.DirectoryWatcher(str(tmp_path), **options)
+    watcher = my_watching.DirectoryWatcher(str(tmp_path))
+    assert watcher.notifier_name is None
+    with pytest.raises(my_exceptions.WatchError):
+        watcher.poll(0)
+
+    _LOGGER.debug("Finished test")